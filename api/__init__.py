@@ -1,4 +1,14 @@
 # api package initializer
-from .api_simulation import api_register, api_login, api_get_transactions, api_post_transaction, api_get_monthly_summary
+# Exports load on first use so `import api.api_server` or `api.metrics` doesn't import the rest of the package.
+from utils.lazy import lazy_exports
 
-__all__ = ["api_register", "api_login", "api_get_transactions", "api_post_transaction", "api_get_monthly_summary"]
+_EXPORTS = {
+    "api_register": ".api_simulation",
+    "api_login": ".api_simulation",
+    "api_get_transactions": ".api_simulation",
+    "api_post_transaction": ".api_simulation",
+    "api_get_monthly_summary": ".api_simulation",
+}
+__getattr__ = lazy_exports(__name__, _EXPORTS)
+
+__all__ = list(_EXPORTS)
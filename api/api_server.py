@@ -3,12 +3,17 @@ FastAPI server exposing CRUD endpoints for transactions.
 Run separately from Streamlit UI on port 8000.
 
 Usage:
-  uvicorn api_server:app --reload
+  uvicorn api.api_server:app --reload      (development, one process)
+  python -m api.launcher --workers 4       (production, see api/launcher.py)
 """
 
-from fastapi import FastAPI, HTTPException
+from fastapi import FastAPI, Header, HTTPException, Request
+from fastapi.responses import FileResponse, PlainTextResponse, StreamingResponse
 from pydantic import BaseModel
-from typing import Optional
+from typing import List, Optional
+import gc
+import hmac
+import sys
 
 from api.api_simulation import (
     api_register,
@@ -20,17 +25,78 @@ from api.api_simulation import (
     api_get_monthly_summary,
     api_get_categories,
     api_get_balance,
-    api_export_csv
+    api_export_csv,
+    api_add_recurring_rule,
+    api_get_recurring_rules,
+    api_delete_recurring_rule,
+    api_get_balance_projection,
+    api_get_category_totals,
+    api_get_transaction_changes,
+    api_submit_export_job,
+    api_get_job,
+    api_cancel_job,
+    api_get_anomalies,
+    api_bulk_update_transactions,
+    api_bulk_delete_transactions,
+    api_post_transactions,
+    api_add_category_rule,
+    api_get_category_rules,
+    api_delete_category_rule,
+    api_get_fleet_analytics
 )
 from database.db import init_db
-
+from database.models import TransactionFilter
+from finance.currency import load_rates_from_file
+from finance import jobs
+from config import settings
+from api.metrics import MetricsMiddleware, render_metrics, CONTENT_TYPE as METRICS_CONTENT_TYPE
+from api.compression import CompressionMiddleware
+from api.ratelimit import RateLimitMiddleware
+from api.encoding import encode, negotiate, parse_fields, UnsupportedFormat
+
+# Building the routes allocates enough to trigger a full collection over everything
+# imported so far (~30 ms); pause the collector until the module is done. The launcher
+# freezes the finished heap before forking (api.launcher._prepare).
+_gc_was_enabled = gc.isenabled()
+gc.disable()
 
 app = FastAPI(title="Personal Finance Tracker API")
-
-
-# @app.on_event("startup")
-# def startup_event():
-#     init_db()
+if settings.COMPRESSION_MIN_BYTES > 0:
+    app.add_middleware(CompressionMiddleware)
+if settings.RATE_LIMIT_ENABLED:
+    app.add_middleware(RateLimitMiddleware)
+if settings.METRICS_ENABLED:
+    app.add_middleware(MetricsMiddleware)
+
+
+@app.on_event("startup")
+def startup_event():
+    # recurring_rules (and the transactions.recurring_id column) must exist
+    # before the scheduler's first run. Under api.launcher the parent process
+    # has done this once before forking the workers.
+    if settings.INIT_DB_ON_STARTUP:
+        init_db()
+        load_rates_from_file()
+    if settings.BACKGROUND_TASKS:
+        # Imported here so workers without background tasks never load them
+        from finance.recurring import start_scheduler
+        from finance.sync import start_compactor
+        from database.backup import start_backups
+        from database.maintenance import start_maintenance
+
+        start_scheduler()
+        start_compactor()
+        start_backups()
+        start_maintenance()
+    jobs.recover()
+
+
+@app.on_event("shutdown")
+def shutdown_event():
+    jobs.shutdown(wait=False)
+    analytics = sys.modules.get("database.analytics")  # loaded by the first fleet report, if any
+    if analytics is not None:
+        analytics.shutdown(wait=False)
 
 
 # ============ Request/Response Models ============
@@ -51,9 +117,14 @@ class LoginRequest(BaseModel):
 class TransactionRequest(BaseModel):
     date_iso: str
     amount: float
-    category: str
+    category: Optional[str] = None  # None = pick one with the user's categorization rules
     ttype: str  # "income" or "expense"
     description: Optional[str] = None
+    currency: Optional[str] = None  # defaults to settings.DEFAULT_CURRENCY
+
+
+class TransactionBatchRequest(BaseModel):
+    transactions: List[TransactionRequest]
 
 
 class TransactionUpdateRequest(BaseModel):
@@ -62,12 +133,64 @@ class TransactionUpdateRequest(BaseModel):
     category: str
     ttype: str
     description: Optional[str] = None
+    currency: Optional[str] = None  # None keeps the stored currency
+
+
+class TransactionFilterRequest(BaseModel):
+    start_date: Optional[str] = None
+    end_date: Optional[str] = None
+    category: Optional[str] = None
+    ttype: Optional[str] = None
+    description: Optional[str] = None  # case-insensitive substring
+
+    def to_filter(self) -> TransactionFilter:
+        return TransactionFilter(**self.model_dump())
+
+
+class BulkChanges(BaseModel):
+    category: Optional[str] = None
+    ttype: Optional[str] = None
+    description: Optional[str] = None  # sending null clears the description
+
+
+class BulkUpdateRequest(BaseModel):
+    filter: TransactionFilterRequest
+    set: BulkChanges
+    dry_run: bool = False
+
+
+class BulkDeleteRequest(BaseModel):
+    filter: TransactionFilterRequest
+    dry_run: bool = False
 
 
 class CategoriesRequest(BaseModel):
     ttype: str
 
 
+class RecurringRuleRequest(BaseModel):
+    amount: float
+    category: str
+    ttype: str
+    frequency: str  # "daily", "weekly", "monthly" or "cron"
+    start_date: str
+    interval: int = 1
+    cron: Optional[str] = None  # e.g. "1 * *" = first day of every month
+    end_date: Optional[str] = None
+    description: Optional[str] = None
+    currency: Optional[str] = None
+
+
+class CategoryRuleRequest(BaseModel):
+    category: str
+    pattern: Optional[str] = None  # None = match on type and amount only
+    match: str = "substring"  # "substring" (case-insensitive) or "regex"
+    ttype: Optional[str] = None
+    min_amount: Optional[float] = None
+    max_amount: Optional[float] = None
+    priority: int = 0  # higher wins
+
+
 # ============ Auth Endpoints ============
 
 @app.post("/auth/register")
@@ -91,12 +214,42 @@ def login(req: LoginRequest):
 # ============ Transaction CRUD Endpoints ============
 
 @app.get("/transactions")
-def get_transactions(user_id: int):
-    """Get all transactions for a user"""
-    result = api_get_transactions(user_id)
+def get_transactions(request: Request, user_id: int, fields: Optional[str] = None, layout: Optional[str] = None, format: Optional[str] = None):
+    """
+    Get all transactions for a user.
+    fields: comma-separated subset of columns. The Accept header (or layout=rows|columns,
+    format=json|msgpack) selects row or columnar JSON, or MessagePack.
+    """
+    try:
+        names = parse_fields(fields)
+        layout, encoding = negotiate(request.headers.get("accept"), layout, format)
+    except UnsupportedFormat as e:
+        raise HTTPException(status_code=406, detail=str(e))
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    result = api_get_transactions(user_id, fields=names, layout=layout)
     if not result["success"]:
         raise HTTPException(status_code=401, detail=result["message"])
-    return result
+    return encode(result, encoding, layout)
+
+
+@app.get("/transactions/changes")
+def get_transaction_changes(request: Request, user_id: int, since: int = 0, limit: int = 1000, fields: Optional[str] = None, format: Optional[str] = None):
+    """
+    Delta sync: transactions changed after the `since` watermark, deleted ids and the new
+    watermark. Start with since=0; a response with full=true replaces the client's list.
+    """
+    try:
+        names = parse_fields(fields)
+        _, encoding = negotiate(request.headers.get("accept"), None, format)
+    except UnsupportedFormat as e:
+        raise HTTPException(status_code=406, detail=str(e))
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    result = api_get_transaction_changes(user_id, since, limit, names)
+    if not result["success"]:
+        raise HTTPException(status_code=401, detail=result["message"])
+    return encode(result, encoding)
 
 
 @app.post("/transactions")
@@ -108,13 +261,23 @@ def create_transaction(user_id: int, req: TransactionRequest):
         amount=req.amount,
         category=req.category,
         ttype=req.ttype,
-        description=req.description
+        description=req.description,
+        currency=req.currency
     )
     if not result["success"]:
         raise HTTPException(status_code=400, detail=result["message"])
     return result
 
 
+@app.post("/transactions/batch")
+def create_transactions(user_id: int, req: TransactionBatchRequest):
+    """Create many transactions in one commit, categorizing those without a category"""
+    result = api_post_transactions(user_id, [t.model_dump() for t in req.transactions])
+    if not result["success"]:
+        raise HTTPException(status_code=400, detail=result["message"])
+    return result
+
+
 @app.put("/transactions/{tx_id}")
 def update_transaction(user_id: int, tx_id: int, req: TransactionUpdateRequest):
     """Update an existing transaction (UPDATE)"""
@@ -125,7 +288,8 @@ def update_transaction(user_id: int, tx_id: int, req: TransactionUpdateRequest):
         amount=req.amount,
         category=req.category,
         ttype=req.ttype,
-        description=req.description
+        description=req.description,
+        currency=req.currency
     )
     if not result["success"]:
         raise HTTPException(status_code=400, detail=result["message"])
@@ -141,12 +305,48 @@ def delete_transaction(user_id: int, tx_id: int):
     return result
 
 
+@app.post("/transactions/bulk-update")
+def bulk_update_transactions(user_id: int, req: BulkUpdateRequest):
+    """Set category/ttype/description on all matching transactions in one statement (dry_run previews)"""
+    result = api_bulk_update_transactions(user_id, req.filter.to_filter(), req.set.model_dump(exclude_unset=True), req.dry_run)
+    if not result["success"]:
+        raise HTTPException(status_code=400, detail=result["message"])
+    return result
+
+
+@app.post("/transactions/bulk-delete")
+def bulk_delete_transactions(user_id: int, req: BulkDeleteRequest):
+    """Delete all matching transactions in one statement (dry_run previews)"""
+    result = api_bulk_delete_transactions(user_id, req.filter.to_filter(), req.dry_run)
+    if not result["success"]:
+        raise HTTPException(status_code=400, detail=result["message"])
+    return result
+
+
+@app.get("/anomalies")
+def get_anomalies(user_id: int, limit: int = 100):
+    """Expenses flagged as unusual for their category, most recent first"""
+    result = api_get_anomalies(user_id, limit)
+    if not result["success"]:
+        raise HTTPException(status_code=401, detail=result["message"])
+    return result
+
+
 # ============ Summary Endpoints ============
 
 @app.get("/monthly-summary")
-def get_monthly_summary(user_id: int):
-    """Get monthly income/expense summary"""
-    result = api_get_monthly_summary(user_id)
+def get_monthly_summary(user_id: int, currency: Optional[str] = None):
+    """Get monthly income/expense summary in a reporting currency"""
+    result = api_get_monthly_summary(user_id, currency)
+    if not result["success"]:
+        raise HTTPException(status_code=401, detail=result["message"])
+    return result
+
+
+@app.get("/category-totals")
+def get_category_totals(user_id: int, ttype: str = "expense", month: Optional[str] = None, currency: Optional[str] = None):
+    """Get totals per category (optionally for one YYYY-MM month) in a reporting currency"""
+    result = api_get_category_totals(user_id, ttype, month, currency)
     if not result["success"]:
         raise HTTPException(status_code=401, detail=result["message"])
     return result
@@ -160,9 +360,9 @@ def get_categories_endpoint(ttype: str):
 
 
 @app.get("/balance")
-def get_balance(user_id: int):
-    """Get current balance"""
-    result = api_get_balance(user_id)
+def get_balance(user_id: int, currency: Optional[str] = None):
+    """Get current balance in a reporting currency"""
+    result = api_get_balance(user_id, currency)
     if not result["success"]:
         raise HTTPException(status_code=401, detail=result["message"])
     return result
@@ -174,12 +374,214 @@ def export_csv(user_id: int):
     result = api_export_csv(user_id)
     if not result["success"]:
         raise HTTPException(status_code=401, detail=result["message"])
+    return encode(result)
+
+
+# ============ Background Jobs ============
+
+@app.post("/jobs/export", status_code=202)
+def submit_export_job(user_id: int):
+    """Queue a CSV export; poll GET /jobs/{job_id} and download GET /jobs/{job_id}/result"""
+    result = api_submit_export_job(user_id)
+    if not result["success"]:
+        raise HTTPException(status_code=401, detail=result["message"])
+    return result
+
+
+@app.get("/jobs/{job_id}")
+def get_job(user_id: int, job_id: str):
+    """Job status: queued, running, retrying, succeeded, failed, cancelled or expired"""
+    result = api_get_job(user_id, job_id)
+    if not result["success"]:
+        raise HTTPException(status_code=404, detail=result["message"])
     return result
 
 
+@app.get("/jobs/{job_id}/result")
+def get_job_result(user_id: int, job_id: str):
+    """Stream the result file of a succeeded job"""
+    result = api_get_job(user_id, job_id)
+    if not result["success"]:
+        raise HTTPException(status_code=404, detail=result["message"])
+    job = result["job"]
+    path = jobs.result_path(job)
+    if path is None:
+        status = 410 if job["status"] in ("expired", "failed", "cancelled") else 409
+        raise HTTPException(status_code=status, detail=f"Job is {job['status']}")
+    return FileResponse(path, media_type=job["media_type"], filename=job["filename"])
+
+
+@app.delete("/jobs/{job_id}")
+def cancel_job(user_id: int, job_id: str):
+    """Cancel a job that hasn't finished"""
+    result = api_cancel_job(user_id, job_id)
+    if not result["success"]:
+        status = 404 if result["message"] == "Job not found" else 409
+        raise HTTPException(status_code=status, detail=result["message"])
+    return result
+
+
+# ============ Recurring Endpoints ============
+
+@app.post("/recurring")
+def create_recurring_rule(user_id: int, req: RecurringRuleRequest):
+    """Create a recurring transaction rule"""
+    result = api_add_recurring_rule(
+        user_id=user_id,
+        amount=req.amount,
+        category=req.category,
+        ttype=req.ttype,
+        frequency=req.frequency,
+        start_date=req.start_date,
+        interval=req.interval,
+        cron=req.cron,
+        end_date=req.end_date,
+        description=req.description,
+        currency=req.currency
+    )
+    if not result["success"]:
+        raise HTTPException(status_code=400, detail=result["message"])
+    return result
+
+
+@app.get("/recurring")
+def get_recurring_rules(user_id: int):
+    """List recurring transaction rules"""
+    result = api_get_recurring_rules(user_id)
+    if not result["success"]:
+        raise HTTPException(status_code=401, detail=result["message"])
+    return result
+
+
+@app.delete("/recurring/{rule_id}")
+def delete_recurring_rule(user_id: int, rule_id: int):
+    """Delete a recurring rule (already created transactions are kept)"""
+    result = api_delete_recurring_rule(user_id=user_id, rule_id=rule_id)
+    if not result["success"]:
+        raise HTTPException(status_code=400, detail=result["message"])
+    return result
+
+
+@app.get("/balance/projection")
+def get_balance_projection(user_id: int, until: str, currency: Optional[str] = None):
+    """Balance including recurring occurrences up to a future date"""
+    result = api_get_balance_projection(user_id, until, currency)
+    if not result["success"]:
+        raise HTTPException(status_code=400, detail=result["message"])
+    return result
+
+
+# ============ Categorization Rule Endpoints ============
+
+@app.post("/category-rules")
+def create_category_rule(user_id: int, req: CategoryRuleRequest):
+    """Create a rule that categorizes transactions added without a category"""
+    result = api_add_category_rule(user_id, **req.model_dump())
+    if not result["success"]:
+        raise HTTPException(status_code=400, detail=result["message"])
+    return result
+
+
+@app.get("/category-rules")
+def get_category_rules(user_id: int):
+    """List categorization rules in the order they are tried"""
+    result = api_get_category_rules(user_id)
+    if not result["success"]:
+        raise HTTPException(status_code=401, detail=result["message"])
+    return result
+
+
+@app.delete("/category-rules/{rule_id}")
+def delete_category_rule(user_id: int, rule_id: int):
+    """Delete a categorization rule (categories already assigned are kept)"""
+    result = api_delete_category_rule(user_id=user_id, rule_id=rule_id)
+    if not result["success"]:
+        raise HTTPException(status_code=400, detail=result["message"])
+    return result
+
+
+# ============ Change Events ============
+
+@app.get("/events")
+def get_events(request: Request, user_id: int):
+    """
+    Server-sent events: "ready" with the balance, then "changes" (changed rows, deleted ids,
+    new balance) whenever the user's transactions change, or "resync" to reload.
+    Reconnecting with Last-Event-ID resumes where the stream left off.
+    """
+    if not user_id:
+        raise HTTPException(status_code=401, detail="Auth required")
+    from api import events  # the bus and its change-log tailer start with the first stream
+
+    if events.bus.full():
+        raise HTTPException(status_code=503, detail="Too many event streams, retry later")
+    return StreamingResponse(
+        events.stream(user_id, request.headers.get("last-event-id")),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
+# ============ Admin Endpoints ============
+
+def _require_admin(token: Optional[str]) -> None:
+    if not settings.ADMIN_TOKEN:
+        raise HTTPException(status_code=403, detail="Admin endpoints are disabled (set FINANCE_ADMIN_TOKEN)")
+    if token is None or not hmac.compare_digest(token.encode("utf-8"), settings.ADMIN_TOKEN.encode("utf-8")):
+        raise HTTPException(status_code=401, detail="Invalid admin token")
+
+
+@app.get("/admin/analytics")
+def get_fleet_analytics(start_month: Optional[str] = None, end_month: Optional[str] = None, currency: Optional[str] = None,
+                        x_admin_token: Optional[str] = Header(None)):
+    """Volume per month/category/type and active users across all users (X-Admin-Token required)"""
+    _require_admin(x_admin_token)
+    result = api_get_fleet_analytics(start_month, end_month, currency)
+    if not result["success"]:
+        raise HTTPException(status_code=400, detail=result["message"])
+    return result
+
+
+@app.post("/admin/profile")
+def profile_requests(seconds: float = 10, interval_ms: Optional[float] = None, format: str = "json",
+                     x_admin_token: Optional[str] = Header(None)):
+    """
+    Sample this process's request threads for `seconds` and return stacks per route in
+    collapsed-stack format (format=collapsed: plain text for flame graph tools)
+    """
+    _require_admin(x_admin_token)
+    if not 0 < seconds <= settings.PROFILE_MAX_SECONDS:
+        raise HTTPException(status_code=400, detail=f"seconds must be between 0 and {settings.PROFILE_MAX_SECONDS}")
+    if interval_ms is not None and interval_ms < 1:
+        raise HTTPException(status_code=400, detail="interval_ms must be at least 1")
+    if format not in ("json", "collapsed"):
+        raise HTTPException(status_code=400, detail="format must be json or collapsed")
+    from api import profiling
+
+    try:
+        result = profiling.profile(app, seconds, interval_ms, exclude_routes=("POST /admin/profile",))
+    except profiling.ProfilerBusy as e:
+        raise HTTPException(status_code=409, detail=str(e))
+    if format == "collapsed":
+        return PlainTextResponse(result["collapsed"] + "\n" if result["collapsed"] else "")
+    return {"success": True, **result}
+
+
+# ============ Metrics ============
+
+@app.get("/metrics", response_class=PlainTextResponse)
+def metrics():
+    """Request, SQL and cache metrics in Prometheus text format"""
+    return PlainTextResponse(render_metrics(), media_type=METRICS_CONTENT_TYPE)
+
+
 # ============ Root ============
 
 @app.get("/")
 def root():
     """API health check"""
     return {"message": "Personal Finance Tracker API is running", "version": "1.0"}
+
+
+if _gc_was_enabled:
+    gc.enable()
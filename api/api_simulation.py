@@ -1,12 +1,20 @@
+from dataclasses import asdict
 
 
-from typing import Tuple, Dict, Any, List
+from typing import Tuple, Dict, Any, List, Sequence
 from auth import register_user, login_user, current_user_safe
-from finance.finance_service import add_transaction_validated, get_transactions_filtered, update_transaction_validated, delete_transaction, calculate_balance, export_transactions_csv
+from finance.finance_service import add_transaction_checked, add_transactions_checked, get_transactions_filtered, update_transaction_checked, delete_transaction, calculate_balance, export_transactions_csv, bulk_update_transactions, bulk_delete_transactions
 from finance.categories import get_categories
-from database.db import get_monthly_summary
-from database.models import Transaction
+from database.db import get_monthly_summary, get_category_totals, get_recurring_rules, delete_recurring_rule, get_anomalies, get_category_rules
+from finance.recurring import add_recurring_rule_validated, project_balance
+from finance.categorize import add_rule_validated as add_category_rule_validated, delete_rule as delete_category_rule
+from finance.currency import normalize_currency
+from finance.sync import changes_since
+from finance import jobs
+from config import settings
+from database.models import Transaction, TransactionFilter
 from auth.auth_utils import validate_username_password
+from api.encoding import TRANSACTION_FIELDS, rows, columns
 
 
 def api_register(username: str, password: str) -> Dict[str, Any]:
@@ -24,30 +32,62 @@ def api_login(username: str, password: str) -> Dict[str, Any]:
     return {"success": False, "message": "Invalid credentials"}
 
 
-def api_get_transactions(user_id: int, **filters) -> Dict[str, Any]:
+def api_get_transactions(user_id: int, fields: Sequence[str] = TRANSACTION_FIELDS, layout: str = "rows", **filters) -> Dict[str, Any]:
+    """
+    Transactions projected to `fields`, as a list of dicts (layout="rows") or one list per field (layout="columns").
+    """
     if not user_id:
         return {"success": False, "message": "Auth required"}
     txs: List[Transaction] = get_transactions_filtered(user_id, **filters)
-    
-    serialized = [
-        {"id": t.id, "user_id": t.user_id, "date": t.date, "amount": t.amount, "category": t.category, "ttype": t.ttype, "description": t.description}
-        for t in txs
-    ]
-    return {"success": True, "transactions": serialized}
+    if layout == "columns":
+        return {"success": True, "count": len(txs), "fields": list(fields), "transactions": columns(txs, fields)}
+    return {"success": True, "transactions": rows(txs, fields)}
 
 
-def api_post_transaction(user_id: int, date_iso: str, amount: float, category: str, ttype: str, description: str = None) -> Dict[str, Any]:
+def api_get_transaction_changes(user_id: int, since: int = 0, limit: int = 1000, fields: Sequence[str] = TRANSACTION_FIELDS) -> Dict[str, Any]:
+    """
+    Delta sync: transactions changed after `since`, deleted ids and the next watermark.
+    full=True means `upserts` is the user's complete list and replaces the client's copy.
+    """
     if not user_id:
         return {"success": False, "message": "Auth required"}
-    success, msg = add_transaction_validated(user_id, date_iso, amount, category, ttype, description)
-    return {"success": success, "message": msg}
+    changes = changes_since(user_id, since, limit)
+    return {
+        "success": True,
+        "full": changes["full"],
+        "watermark": changes["watermark"],
+        "more": changes["more"],
+        "upserts": rows(changes["upserts"], fields),
+        "deletes": changes["deletes"],
+    }
 
 
-def api_update_transaction(user_id: int, tx_id: int, date_iso: str, amount: float, category: str, ttype: str, description: str = None) -> Dict[str, Any]:
+def api_post_transaction(user_id: int, date_iso: str, amount: float, category: str, ttype: str, description: str = None, currency: str = None) -> Dict[str, Any]:
     if not user_id:
         return {"success": False, "message": "Auth required"}
-    success, msg = update_transaction_validated(user_id, tx_id, date_iso, amount, category, ttype, description)
-    return {"success": success, "message": msg}
+    success, msg, anomaly = add_transaction_checked(user_id, date_iso, amount, category, ttype, description, currency)
+    return {"success": success, "message": msg, "anomaly": anomaly}
+
+
+def api_post_transactions(user_id: int, items: List[Dict[str, Any]]) -> Dict[str, Any]:
+    """
+    Insert a batch of transactions in one commit; items without a category are categorized
+    by the user's rules. `anomalies` lists the flagged expenses of the batch.
+    """
+    if not user_id:
+        return {"success": False, "message": "Auth required"}
+    success, msg, ids, categories, checks = add_transactions_checked(user_id, items)
+    if not success:
+        return {"success": False, "message": msg}
+    flagged = [{"id": tx_id, **check} for tx_id, check in zip(ids, checks) if check and check["anomaly"]]
+    return {"success": True, "message": msg, "ids": ids, "categories": categories, "anomalies": flagged}
+
+
+def api_update_transaction(user_id: int, tx_id: int, date_iso: str, amount: float, category: str, ttype: str, description: str = None, currency: str = None) -> Dict[str, Any]:
+    if not user_id:
+        return {"success": False, "message": "Auth required"}
+    success, msg, anomaly = update_transaction_checked(user_id, tx_id, date_iso, amount, category, ttype, description, currency)
+    return {"success": success, "message": msg, "anomaly": anomaly}
 
 
 def api_delete_transaction(user_id: int, tx_id: int) -> Dict[str, Any]:
@@ -57,11 +97,45 @@ def api_delete_transaction(user_id: int, tx_id: int) -> Dict[str, Any]:
     return {"success": success, "message": msg}
 
 
-def api_get_monthly_summary(user_id: int) -> Dict[str, Any]:
+def _bulk_result(success: bool, msg: str, count: int, preview: List[Transaction], dry_run: bool) -> Dict[str, Any]:
+    if not success or not dry_run:
+        return {"success": success, "message": msg, "dry_run": False, "affected": count}
+    return {"success": True, "message": msg, "dry_run": True, "matched": count, "preview": rows(preview, TRANSACTION_FIELDS)}
+
+
+def api_bulk_update_transactions(user_id: int, flt: TransactionFilter, changes: Dict[str, Any], dry_run: bool = False) -> Dict[str, Any]:
+    if not user_id:
+        return {"success": False, "message": "Auth required"}
+    return _bulk_result(*bulk_update_transactions(user_id, flt, changes, dry_run), dry_run)
+
+
+def api_bulk_delete_transactions(user_id: int, flt: TransactionFilter, dry_run: bool = False) -> Dict[str, Any]:
     if not user_id:
         return {"success": False, "message": "Auth required"}
-    summary = get_monthly_summary(user_id)
-    return {"success": True, "summary": summary}
+    return _bulk_result(*bulk_delete_transactions(user_id, flt, dry_run), dry_run)
+
+
+def api_get_anomalies(user_id: int, limit: int = 100) -> Dict[str, Any]:
+    if not user_id:
+        return {"success": False, "message": "Auth required"}
+    flagged = get_anomalies(user_id, max(1, min(limit, 1000)))
+    return {"success": True, "count": len(flagged), "anomalies": [asdict(a) for a in flagged]}
+
+
+def api_get_monthly_summary(user_id: int, currency: str = None) -> Dict[str, Any]:
+    if not user_id:
+        return {"success": False, "message": "Auth required"}
+    currency = normalize_currency(currency) or settings.DEFAULT_CURRENCY
+    summary = get_monthly_summary(user_id, currency)
+    return {"success": True, "summary": summary, "currency": currency}
+
+
+def api_get_category_totals(user_id: int, ttype: str = "expense", month: str = None, currency: str = None) -> Dict[str, Any]:
+    if not user_id:
+        return {"success": False, "message": "Auth required"}
+    currency = normalize_currency(currency) or settings.DEFAULT_CURRENCY
+    totals = get_category_totals(user_id, ttype, month, currency)
+    return {"success": True, "totals": totals, "currency": currency}
 
 
 def api_get_categories(ttype: str) -> Dict[str, Any]:
@@ -69,11 +143,12 @@ def api_get_categories(ttype: str) -> Dict[str, Any]:
     return {"success": True, "categories": categories}
 
 
-def api_get_balance(user_id: int) -> Dict[str, Any]:
+def api_get_balance(user_id: int, currency: str = None) -> Dict[str, Any]:
     if not user_id:
         return {"success": False, "message": "Auth required"}
-    balance = calculate_balance(user_id)
-    return {"success": True, "balance": balance}
+    currency = normalize_currency(currency) or settings.DEFAULT_CURRENCY
+    balance = calculate_balance(user_id, currency)
+    return {"success": True, "balance": balance, "currency": currency}
 
 
 def api_export_csv(user_id: int) -> Dict[str, Any]:
@@ -89,3 +164,100 @@ def api_export_csv(user_id: int) -> Dict[str, Any]:
         except:
             return {"success": False, "message": "Error reading CSV"}
     return {"success": False, "message": path_or_err}
+
+
+def api_submit_export_job(user_id: int) -> Dict[str, Any]:
+    if not user_id:
+        return {"success": False, "message": "Auth required"}
+    return {"success": True, "job": jobs.submit("export_csv", user_id)}
+
+
+def api_get_job(user_id: int, job_id: str) -> Dict[str, Any]:
+    if not user_id:
+        return {"success": False, "message": "Auth required"}
+    job = jobs.get_job(job_id, user_id)
+    if job is None:
+        return {"success": False, "message": "Job not found"}
+    return {"success": True, "job": job}
+
+
+def api_cancel_job(user_id: int, job_id: str) -> Dict[str, Any]:
+    if not user_id:
+        return {"success": False, "message": "Auth required"}
+    job = jobs.cancel(job_id, user_id)
+    if job is None:
+        return {"success": False, "message": "Job not found"}
+    if job["status"] != "cancelled":
+        return {"success": False, "message": f"Job already {job['status']}"}
+    return {"success": True, "job": job}
+
+
+def api_add_recurring_rule(user_id: int, amount: float, category: str, ttype: str, frequency: str, start_date: str, interval: int = 1, cron: str = None, end_date: str = None, description: str = None, currency: str = None) -> Dict[str, Any]:
+    if not user_id:
+        return {"success": False, "message": "Auth required"}
+    success, msg = add_recurring_rule_validated(user_id, amount, category, ttype, frequency, start_date, interval, cron, end_date, description, currency)
+    return {"success": success, "message": msg}
+
+
+def api_get_recurring_rules(user_id: int) -> Dict[str, Any]:
+    if not user_id:
+        return {"success": False, "message": "Auth required"}
+    rules = [
+        {"id": r.id, "amount": r.amount, "category": r.category, "ttype": r.ttype, "description": r.description,
+         "frequency": r.frequency, "interval": r.interval, "cron": r.cron,
+         "start_date": r.start_date, "end_date": r.end_date, "next_due": r.next_due, "currency": r.currency}
+        for r in get_recurring_rules(user_id)
+    ]
+    return {"success": True, "rules": rules}
+
+
+def api_delete_recurring_rule(user_id: int, rule_id: int) -> Dict[str, Any]:
+    if not user_id:
+        return {"success": False, "message": "Auth required"}
+    success, msg = delete_recurring_rule(rule_id, user_id)
+    return {"success": success, "message": msg}
+
+
+def api_add_category_rule(user_id: int, category: str, pattern: str = None, match: str = "substring", ttype: str = None, min_amount: float = None, max_amount: float = None, priority: int = 0) -> Dict[str, Any]:
+    if not user_id:
+        return {"success": False, "message": "Auth required"}
+    success, msg = add_category_rule_validated(user_id, category, pattern, match, ttype, min_amount, max_amount, priority)
+    return {"success": success, "message": msg}
+
+
+def api_get_category_rules(user_id: int) -> Dict[str, Any]:
+    if not user_id:
+        return {"success": False, "message": "Auth required"}
+    rules = [asdict(r) for r in get_category_rules(user_id)]
+    return {"success": True, "rules": rules}
+
+
+def api_delete_category_rule(user_id: int, rule_id: int) -> Dict[str, Any]:
+    if not user_id:
+        return {"success": False, "message": "Auth required"}
+    success, msg = delete_category_rule(user_id, rule_id)
+    return {"success": success, "message": msg}
+
+
+def api_get_balance_projection(user_id: int, until: str, currency: str = None) -> Dict[str, Any]:
+    if not user_id:
+        return {"success": False, "message": "Auth required"}
+    currency = normalize_currency(currency) or settings.DEFAULT_CURRENCY
+    try:
+        balance = project_balance(user_id, until, currency)
+    except ValueError:
+        return {"success": False, "message": "Invalid date format. Use YYYY-MM-DD."}
+    return {"success": True, "until": until, "balance": balance, "currency": currency}
+
+
+def api_get_fleet_analytics(start_month: str = None, end_month: str = None, currency: str = None) -> Dict[str, Any]:
+    """
+    Cross-user volume and active-user report (see database.analytics); callers check admin rights.
+    """
+    from database.analytics import fleet_report, AnalyticsError  # admin-only, loaded on first use
+
+    try:
+        report = fleet_report(start_month, end_month, currency)
+    except AnalyticsError as e:
+        return {"success": False, "message": str(e)}
+    return {"success": True, **report}
@@ -0,0 +1,78 @@
+"""
+ASGI middleware compressing response bodies of at least
+settings.COMPRESSION_MIN_BYTES with brotli (when the `brotli` package is
+installed and the client accepts it) or gzip.
+
+Only complete bodies are compressed: streamed responses (a first chunk with
+more_body) and bodies that already carry a Content-Encoding pass through.
+"""
+
+import gzip
+
+from config import settings
+
+try:
+    import brotli
+except ImportError:  # optional: gzip only
+    brotli = None
+
+GZIP_LEVEL = 6
+BROTLI_QUALITY = 4  # close to gzip's ratio at a fraction of the CPU of the default (11)
+
+
+def _accepted_encodings(scope) -> set:
+    for name, value in scope.get("headers", ()):
+        if name == b"accept-encoding":
+            return {part.split(";", 1)[0].strip().lower() for part in value.decode("latin-1").split(",")}
+    return set()
+
+
+class CompressionMiddleware:
+    def __init__(self, app, minimum_size: int = None):
+        self.app = app
+        self.minimum_size = settings.COMPRESSION_MIN_BYTES if minimum_size is None else minimum_size
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        accepted = _accepted_encodings(scope)
+        if "br" in accepted and brotli is not None:
+            coding = "br"
+        elif "gzip" in accepted:
+            coding = "gzip"
+        else:
+            await self.app(scope, receive, send)
+            return
+
+        start = {}
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start":
+                start.update(message)  # held back until we know the body
+                return
+            if message["type"] != "http.response.body" or not start:
+                await send(message)
+                return
+
+            headers = start.get("headers", [])
+            body = message.get("body", b"")
+            passthrough = (
+                message.get("more_body", False)
+                or len(body) < self.minimum_size
+                or any(name.lower() == b"content-encoding" for name, _ in headers)
+            )
+            if not passthrough:
+                body = brotli.compress(body, quality=BROTLI_QUALITY) if coding == "br" else gzip.compress(body, GZIP_LEVEL)
+                headers = [(n, v) for n, v in headers if n.lower() != b"content-length"]
+                headers += [
+                    (b"content-encoding", coding.encode("ascii")),
+                    (b"content-length", str(len(body)).encode("ascii")),
+                    (b"vary", b"Accept-Encoding"),
+                ]
+                message = {**message, "body": body}
+            await send({**start, "headers": headers})
+            start.clear()
+            await send(message)
+
+        await self.app(scope, receive, send_wrapper)
@@ -0,0 +1,99 @@
+"""
+Response encodings for large payloads.
+
+Transaction lists can be returned as
+  rows     [{"id": ..., "date": ...}, ...]          (default, application/json)
+  columns  {"id": [...], "date": [...], ...}        (application/vnd.finance.columnar+json)
+and encoded as JSON or MessagePack (application/msgpack). The Accept header
+picks the format; `layout=` / `format=` query parameters override it.
+
+JSON is encoded with orjson when it is installed (the stdlib json module
+otherwise) and bypasses FastAPI's generic jsonable_encoder pass.
+"""
+
+import json
+from operator import attrgetter
+from typing import Dict, List, Optional, Sequence, Tuple
+
+TRANSACTION_FIELDS = ("id", "user_id", "date", "amount", "category", "ttype", "description", "currency")
+
+JSON = "application/json"
+COLUMNAR_JSON = "application/vnd.finance.columnar+json"
+MSGPACK = "application/msgpack"
+_MSGPACK_TYPES = (MSGPACK, "application/x-msgpack", "application/vnd.msgpack")
+
+try:
+    import orjson
+except ImportError:  # optional: fall back to the stdlib encoder
+    orjson = None
+
+try:
+    import msgpack
+except ImportError:  # optional: MessagePack is then not offered
+    msgpack = None
+
+
+class UnsupportedFormat(ValueError):
+    pass
+
+
+def parse_fields(fields: Optional[str], allowed: Sequence[str] = TRANSACTION_FIELDS) -> Tuple[str, ...]:
+    """
+    "id,date,amount" -> ("id", "date", "amount"); None/empty means every field.
+    Raises ValueError on unknown names.
+    """
+    if not fields:
+        return tuple(allowed)
+    names = tuple(dict.fromkeys(f.strip() for f in fields.split(",") if f.strip()))
+    unknown = [n for n in names if n not in allowed]
+    if unknown:
+        raise ValueError(f"Unknown field(s): {', '.join(unknown)}. Allowed: {', '.join(allowed)}")
+    return names or tuple(allowed)
+
+
+def rows(items, fields: Sequence[str]) -> List[Dict]:
+    getter = attrgetter(*fields)
+    if len(fields) == 1:
+        return [{fields[0]: getter(item)} for item in items]
+    return [dict(zip(fields, getter(item))) for item in items]
+
+
+def columns(items, fields: Sequence[str]) -> Dict[str, List]:
+    return {f: [getattr(item, f) for item in items] for f in fields}
+
+
+def negotiate(accept: Optional[str], layout: Optional[str] = None, fmt: Optional[str] = None) -> Tuple[str, str]:
+    """
+    (layout, encoding) for a request: layout is "rows" or "columns", encoding "json" or "msgpack".
+    Explicit query parameters win over the Accept header. Raises UnsupportedFormat.
+    """
+    accepted = [part.split(";", 1)[0].strip().lower() for part in (accept or "").split(",")]
+    encoding = fmt.lower() if fmt else ("msgpack" if any(a in _MSGPACK_TYPES for a in accepted) else "json")
+    if encoding not in ("json", "msgpack"):
+        raise UnsupportedFormat(f"Unknown format {fmt!r} (expected json or msgpack)")
+    if encoding == "msgpack" and msgpack is None:
+        raise UnsupportedFormat("MessagePack is not available on this server (pip install msgpack)")
+    if layout:
+        layout = layout.lower()
+        if layout not in ("rows", "columns"):
+            raise UnsupportedFormat(f"Unknown layout {layout!r} (expected rows or columns)")
+    else:
+        layout = "columns" if COLUMNAR_JSON in accepted else "rows"
+    return layout, encoding
+
+
+def dumps(payload) -> bytes:
+    if orjson is not None:
+        return orjson.dumps(payload)
+    return json.dumps(payload, separators=(",", ":"), ensure_ascii=False).encode("utf-8")
+
+
+def encode(payload, encoding: str = "json", layout: str = "rows") -> "Response":
+    """
+    Response carrying `payload` in the negotiated encoding.
+    """
+    from fastapi import Response
+
+    if encoding == "msgpack":
+        return Response(content=msgpack.packb(payload, use_bin_type=True), media_type=MSGPACK)
+    return Response(content=dumps(payload), media_type=COLUMNAR_JSON if layout == "columns" else JSON)
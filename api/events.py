@@ -0,0 +1,220 @@
+"""
+Push of transaction changes to clients over server-sent events (GET /events).
+
+Each open stream is a bounded asyncio.Queue in a per-user set, so an idle
+connection costs one queue and one suspended generator. One tailer task per
+process (running only while someone is subscribed) follows the transaction
+change log of every shard and, for the subscribed users whose transactions
+changed, publishes one event with the changed rows, deleted ids and the new
+balance:
+
+  event: changes
+  id: <user's change-feed watermark>
+  data: {"watermark": ..., "more": ..., "upserts": [...], "deletes": [...], "balance": ..., "currency": ...}
+
+Writes made through database.db in this process wake the tailer at once (see
+db.add_write_listener); writes handled by other launcher workers are picked up
+within settings.EVENTS_POLL_SECONDS. A client that reconnects with Last-Event-ID
+gets what it missed first; a "resync" event means the client should reload
+its list (it fell too far behind, or the change log was compacted past it).
+"""
+
+import asyncio
+import json
+import logging
+from typing import AsyncIterator, Dict, List, Optional, Set, Tuple
+
+from config import settings
+from database.db import add_write_listener, get_balance, get_change_watermark, ledger_shards, tail_transaction_changes
+from finance.sync import changes_since
+from api.encoding import TRANSACTION_FIELDS, rows
+from utils import metrics
+
+logger = logging.getLogger(__name__)
+
+TAIL_PAGE = 1000
+MAX_EVENT_ROWS = 500  # beyond this an event says more=true and the client pages /transactions/changes
+
+EVENTS_SENT = metrics.counter("finance_sse_events_total", "Server-sent events queued for clients", ["type"])
+
+
+def _format(event: Dict) -> bytes:
+    lines = f"event: {event['type']}\n"
+    if event.get("watermark") is not None:
+        lines += f"id: {event['watermark']}\n"
+    return (lines + "data: " + json.dumps(event, separators=(",", ":")) + "\n\n").encode("utf-8")
+
+
+def _changes_event(user_id: int, since: int, changes: Dict) -> Dict:
+    # A full list after since=0 is exactly the changes (the log starts with this user's write)
+    if changes["full"] and since > 0:
+        return {"type": "resync", "watermark": changes["watermark"]}
+    return {
+        "type": "changes",
+        "watermark": changes["watermark"],
+        "more": changes["more"],
+        "upserts": rows(changes["upserts"], TRANSACTION_FIELDS),
+        "deletes": changes["deletes"],
+        "balance": get_balance(user_id, settings.DEFAULT_CURRENCY),
+        "currency": settings.DEFAULT_CURRENCY,
+    }
+
+
+class EventBus:
+    """
+    Per-user fan-out of change events. Everything but notify() runs on the event loop.
+    """
+
+    def __init__(self, queue_size: int = None, max_connections: int = None, poll_seconds: float = None):
+        self.queue_size = settings.EVENTS_QUEUE_SIZE if queue_size is None else queue_size
+        self.max_connections = settings.EVENTS_MAX_CONNECTIONS if max_connections is None else max_connections
+        self.poll_seconds = settings.EVENTS_POLL_SECONDS if poll_seconds is None else poll_seconds
+        self.connections = 0
+        self._subscribers: Dict[int, Set[asyncio.Queue]] = {}
+        self._watermarks: Optional[Dict[Optional[int], int]] = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._dirty: Optional[asyncio.Event] = None
+        self._started: Optional[asyncio.Event] = None
+        self._tailer: Optional[asyncio.Task] = None
+
+    # ---- subscriptions ----
+    def full(self) -> bool:
+        return self.connections >= self.max_connections
+
+    def subscribe(self, user_id: int) -> asyncio.Queue:
+        """
+        A queue receiving the user's events; every change after `await started()` is delivered.
+        """
+        self.connections += 1
+        queue: asyncio.Queue = asyncio.Queue(self.queue_size)
+        self._subscribers.setdefault(user_id, set()).add(queue)
+        if self._tailer is None:
+            self._loop = asyncio.get_running_loop()
+            self._dirty = asyncio.Event()
+            self._started = asyncio.Event()
+            self._tailer = asyncio.ensure_future(self._run())
+        return queue
+
+    async def started(self) -> None:
+        """
+        Wait until the tailer knows where the change log ends.
+        """
+        await self._started.wait()
+
+    def unsubscribe(self, user_id: int, queue: asyncio.Queue) -> None:
+        queues = self._subscribers.get(user_id)
+        if queues is not None and queue in queues:
+            self.connections -= 1
+            queues.discard(queue)
+            if not queues:
+                del self._subscribers[user_id]
+
+    def publish(self, user_id: int, event: Dict) -> None:
+        """
+        Queue an event for every stream of the user. A stream whose queue is full
+        loses its backlog and gets a single resync instead.
+        """
+        for queue in self._subscribers.get(user_id, ()):
+            try:
+                queue.put_nowait(event)
+            except asyncio.QueueFull:
+                while not queue.empty():
+                    queue.get_nowait()
+                queue.put_nowait({"type": "resync"})
+                EVENTS_SENT.inc("resync")
+                continue
+            EVENTS_SENT.inc(event["type"])
+
+    def notify(self, user_id: int) -> None:
+        """
+        A write of the user's transactions committed (called from any thread).
+        """
+        if user_id in self._subscribers and self._loop is not None:
+            self._loop.call_soon_threadsafe(self._dirty.set)
+
+    # ---- change-log tailer ----
+    async def _run(self) -> None:
+        try:
+            while self._subscribers:
+                if self._watermarks is None:
+                    # Start from the current end of the log: older changes are the subscribers' initial state
+                    try:
+                        self._watermarks = await asyncio.to_thread(lambda: {shard: get_change_watermark(shard) for shard in ledger_shards()})
+                    except Exception:
+                        logger.exception("Change event tailer failed")
+                        await asyncio.sleep(self.poll_seconds)
+                        continue
+                    self._started.set()
+                try:
+                    await asyncio.wait_for(self._dirty.wait(), self.poll_seconds)
+                except asyncio.TimeoutError:
+                    pass
+                self._dirty.clear()
+                if not self._subscribers:
+                    break
+                try:
+                    events = await asyncio.to_thread(self._poll, set(self._subscribers))
+                except Exception:
+                    logger.exception("Change event tailer failed")
+                    continue
+                for user_id, event in events:
+                    self.publish(user_id, event)
+        finally:
+            self._tailer = None
+            self._watermarks = None
+
+    def _poll(self, users: Set[int]) -> List[Tuple[int, Dict]]:
+        """
+        Advance the per-shard watermarks; one event per subscribed user whose transactions changed.
+        """
+        first_seq: Dict[int, int] = {}
+        for shard, since in list(self._watermarks.items()):
+            while True:
+                entries = tail_transaction_changes(since, TAIL_PAGE, shard)
+                for seq, user_id in entries:
+                    if user_id in users and user_id not in first_seq:
+                        first_seq[user_id] = seq
+                if entries:
+                    since = entries[-1][0]
+                if len(entries) < TAIL_PAGE:
+                    break
+            self._watermarks[shard] = since
+        return [
+            (user_id, _changes_event(user_id, seq - 1, changes_since(user_id, seq - 1, MAX_EVENT_ROWS)))
+            for user_id, seq in first_seq.items()
+        ]
+
+
+bus = EventBus()
+add_write_listener(bus.notify)
+metrics.gauge("finance_sse_connections", "Open server-sent event streams", callback=lambda: bus.connections)
+
+
+async def stream(user_id: int, last_event_id: Optional[str] = None, keepalive_seconds: float = None) -> AsyncIterator[bytes]:
+    """
+    The event stream of one client: a "ready" event with the balance (or, when resuming
+    from Last-Event-ID, the changes missed since), then changes as they happen.
+    Check bus.full() before opening one.
+    """
+    keepalive_seconds = settings.EVENTS_KEEPALIVE_SECONDS if keepalive_seconds is None else keepalive_seconds
+    queue = bus.subscribe(user_id)
+    try:
+        await bus.started()
+        if last_event_id is not None and last_event_id.isdigit() and int(last_event_id) > 0:
+            since = int(last_event_id)
+            first = await asyncio.to_thread(lambda: _changes_event(user_id, since, changes_since(user_id, since, MAX_EVENT_ROWS)))
+        else:
+            first = await asyncio.to_thread(
+                lambda: {"type": "ready", "balance": get_balance(user_id, settings.DEFAULT_CURRENCY), "currency": settings.DEFAULT_CURRENCY}
+            )
+        EVENTS_SENT.inc(first["type"])
+        yield b"retry: 3000\n" + _format(first)
+        while True:
+            try:
+                event = await asyncio.wait_for(queue.get(), keepalive_seconds)
+            except asyncio.TimeoutError:
+                yield b": keepalive\n\n"
+                continue
+            yield _format(event)
+    finally:
+        bus.unsubscribe(user_id, queue)
@@ -0,0 +1,213 @@
+"""
+Pre-forking production launcher for the API.
+
+  python -m api.launcher [--workers N] [--host H] [--port P]
+
+The parent process initializes the schema and loads exchange rates once,
+imports the app and opens the listening socket, then forks the workers. The
+imported code and data are shared copy-on-write (gc.freeze keeps the collector
+from touching, and so copying, those pages). Every worker serves the shared
+socket with uvicorn and exits gracefully after API_MAX_REQUESTS requests (plus
+a random jitter so workers don't recycle together); the parent then forks a
+replacement. Only worker 0 runs the recurring scheduler, the change-log
+compactor and scheduled backups.
+
+Signals to the parent: SIGTERM/SIGINT stop all workers gracefully, SIGHUP
+restarts them one at a time.
+
+Defaults come from config/settings.py (API_HOST, API_PORT, API_WORKERS, ...),
+which reads them from FINANCE_API_* environment variables.
+"""
+
+import argparse
+import gc
+import os
+import signal
+import socket
+import sys
+import time
+from typing import Dict
+
+from config import settings
+
+_CRASH_BACKOFF_SECONDS = 1.0  # delay before replacing a worker that died right after starting
+
+
+def _open_socket(host: str, port: int) -> socket.socket:
+    sock = socket.create_server((host, port), backlog=2048)
+    # Accepted connections inherit it; without it every keep-alive response written
+    # in two parts waits out the client's delayed ACK (~40 ms)
+    sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+    sock.set_inheritable(True)
+    return sock
+
+
+def _prepare() -> object:
+    """
+    One-time setup in the parent: schema, exchange rates, app import. Returns the app.
+    """
+    from database.db import init_db
+    from database.storage import get_backend
+    from finance.currency import load_rates_from_file
+
+    init_db()
+    load_rates_from_file()
+    get_backend().dispose()  # no pooled connection may be shared across fork
+    settings.INIT_DB_ON_STARTUP = False
+
+    from api.api_server import app
+    gc.collect()
+    gc.freeze()
+    return app
+
+
+def _server_options(args) -> dict:
+    """
+    Recycling and shutdown options for uvicorn.Config, minus any this uvicorn predates.
+    """
+    import inspect
+    import uvicorn
+
+    options = {
+        "limit_max_requests": args.max_requests or None,
+        "limit_max_requests_jitter": args.max_requests_jitter if args.max_requests else 0,
+        "timeout_graceful_shutdown": args.graceful_timeout,
+    }
+    accepted = inspect.signature(uvicorn.Config).parameters
+    for name in [name for name in options if name not in accepted]:
+        print(f"Warning: uvicorn {uvicorn.__version__} has no {name} option; ignoring it", file=sys.stderr)
+        del options[name]
+    return options
+
+
+def _run_worker(app, sock: socket.socket, index: int, args, options: dict) -> None:
+    import uvicorn
+
+    signal.signal(signal.SIGINT, signal.SIG_DFL)
+    signal.signal(signal.SIGTERM, signal.SIG_DFL)
+    signal.signal(signal.SIGHUP, signal.SIG_DFL)
+    settings.BACKGROUND_TASKS = settings.BACKGROUND_TASKS and index == 0
+    config = uvicorn.Config(
+        app,
+        lifespan="on",
+        access_log=False,
+        log_level=args.log_level,
+        **options,
+    )
+    uvicorn.Server(config).run(sockets=[sock])
+
+
+class Supervisor:
+    def __init__(self, app, sock: socket.socket, args):
+        self.app = app
+        self.sock = sock
+        self.args = args
+        self.options = _server_options(args)
+        self.workers: Dict[int, tuple] = {}  # pid -> (index, started at)
+        self.stopping = False
+        self.reload_pending = []
+
+    def spawn(self, index: int) -> None:
+        pid = os.fork()
+        if pid == 0:
+            code = 0
+            try:
+                _run_worker(self.app, self.sock, index, self.args, self.options)
+            except BaseException as e:
+                print(f"[worker {index}] {e!r}", file=sys.stderr)
+                code = 1
+            finally:
+                os._exit(code)
+        self.workers[pid] = (index, time.monotonic())
+
+    def _on_stop(self, signum, frame) -> None:
+        self.stopping = True
+
+    def _on_hup(self, signum, frame) -> None:
+        self.reload_pending = list(self.workers)
+
+    def run(self) -> int:
+        signal.signal(signal.SIGTERM, self._on_stop)
+        signal.signal(signal.SIGINT, self._on_stop)
+        signal.signal(signal.SIGHUP, self._on_hup)
+        for index in range(self.args.workers):
+            self.spawn(index)
+        print(f"Serving on http://{self.args.host}:{self.args.port} with {self.args.workers} worker(s) (parent pid {os.getpid()})")
+
+        while not self.stopping:
+            self._reap(respawn=True)
+            if self.reload_pending:
+                self._restart_next()
+            time.sleep(0.2)
+        self._shutdown()
+        return 0
+
+    def _reap(self, respawn: bool) -> None:
+        while self.workers:
+            try:
+                pid, status = os.waitpid(-1, os.WNOHANG)
+            except ChildProcessError:
+                self.workers.clear()
+                return
+            if pid == 0:
+                return
+            index, started = self.workers.pop(pid, (None, 0.0))
+            if index is None or not respawn or self.stopping:
+                continue
+            code = os.waitstatus_to_exitcode(status)
+            if code != 0 and time.monotonic() - started < _CRASH_BACKOFF_SECONDS:
+                time.sleep(_CRASH_BACKOFF_SECONDS)
+            self.spawn(index)
+
+    def _restart_next(self) -> None:
+        # Rolling restart: signal one old worker, wait until its replacement is up
+        pid = self.reload_pending.pop(0)
+        if pid not in self.workers:
+            return
+        index = self.workers[pid][0]
+        os.kill(pid, signal.SIGTERM)
+        deadline = time.monotonic() + self.args.graceful_timeout + 5
+        while pid in self.workers and time.monotonic() < deadline and not self.stopping:
+            self._reap(respawn=True)
+            time.sleep(0.1)
+        if pid in self.workers:
+            os.kill(pid, signal.SIGKILL)
+        print(f"Restarted worker {index}")
+
+    def _shutdown(self) -> None:
+        for pid in list(self.workers):
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except ProcessLookupError:
+                pass
+        deadline = time.monotonic() + self.args.graceful_timeout + 5
+        while self.workers and time.monotonic() < deadline:
+            self._reap(respawn=False)
+            time.sleep(0.1)
+        for pid in list(self.workers):
+            os.kill(pid, signal.SIGKILL)
+            os.waitpid(pid, 0)
+        self.workers.clear()
+        self.sock.close()
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Run the API with several worker processes")
+    parser.add_argument("--host", default=settings.API_HOST)
+    parser.add_argument("--port", type=int, default=settings.API_PORT)
+    parser.add_argument("--workers", type=int, default=settings.API_WORKERS, help="worker processes (default: CPU count)")
+    parser.add_argument("--max-requests", type=int, default=settings.API_MAX_REQUESTS, help="recycle a worker after this many requests (0 = never)")
+    parser.add_argument("--max-requests-jitter", type=int, default=settings.API_MAX_REQUESTS_JITTER)
+    parser.add_argument("--graceful-timeout", type=int, default=settings.API_GRACEFUL_TIMEOUT, help="seconds in-flight requests get on shutdown")
+    parser.add_argument("--log-level", default="warning")
+    args = parser.parse_args(argv)
+    if args.workers < 1:
+        parser.error("--workers must be at least 1")
+
+    app = _prepare()
+    sock = _open_socket(args.host, args.port)
+    return Supervisor(app, sock, args).run()
+
+
+if __name__ == "__main__":
+    sys.exit(main())
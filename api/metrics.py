@@ -0,0 +1,50 @@
+"""
+ASGI middleware recording per-route request latency, plus the /metrics payload.
+
+Routes are labelled with their path template ("/transactions/{tx_id}"), never
+the raw path, so label cardinality stays bounded.
+"""
+
+import time
+
+from utils import metrics
+
+REQUEST_SECONDS = metrics.histogram(
+    "finance_http_request_seconds", "HTTP request latency by method, route and status", ["method", "route", "status"]
+)
+REQUESTS_IN_FLIGHT = metrics.gauge("finance_http_requests_in_flight", "HTTP requests currently being handled")
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+
+class MetricsMiddleware:
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        status = [500]
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start":
+                status[0] = message["status"]
+            await send(message)
+
+        REQUESTS_IN_FLIGHT.inc()
+        start = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            elapsed = time.perf_counter() - start
+            REQUESTS_IN_FLIGHT.dec()
+            # The router stores the matched route in the scope while dispatching
+            route = scope.get("route")
+            template = getattr(route, "path", None) or "unmatched"
+            REQUEST_SECONDS.observe(elapsed, scope["method"], template, str(status[0]))
+
+
+def render_metrics() -> str:
+    return metrics.render()
@@ -0,0 +1,121 @@
+"""
+On-demand sampling profiler for a live API process (POST /admin/profile).
+
+While a session runs, a daemon thread samples the stack of every thread each
+`interval_ms` (sys._current_frames) and keeps the samples of threads that are
+inside an endpoint function, attributed to that endpoint's route
+("GET /monthly-summary"). Stacks are aggregated from the endpoint frame down
+and returned in collapsed-stack format, one "route;frame;frame... count" line
+per distinct stack, ready for flamegraph.pl or speedscope.
+
+Nothing is installed between sessions: no middleware, no tracing hook, no
+thread, so an idle profiler costs nothing. Sampling never runs code in the
+request threads; its cost is the sampler thread's share of the GIL, set by
+the interval. Each process profiles only its own requests (under api.launcher,
+the worker that answers the profile request).
+"""
+
+import os
+import sys
+import threading
+import time
+from collections import Counter
+from typing import Dict, List, Tuple
+
+from config import settings
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+_session_lock = threading.Lock()
+
+
+class ProfilerBusy(Exception):
+    pass
+
+
+def _route_codes(app) -> Dict[object, str]:
+    """
+    Endpoint code object -> "METHOD /path template" for every API route.
+    """
+    codes = {}
+    for route in app.routes:
+        code = getattr(getattr(route, "endpoint", None), "__code__", None)
+        if code is not None and getattr(route, "methods", None):
+            methods = ",".join(sorted(m for m in route.methods if m != "HEAD"))
+            codes[code] = f"{methods} {route.path}"
+    return codes
+
+
+def _frame_name(code, names: Dict[object, str]) -> str:
+    name = names.get(code)
+    if name is None:
+        path = code.co_filename
+        if path.startswith(REPO_DIR + os.sep):
+            module = os.path.splitext(os.path.relpath(path, REPO_DIR))[0].replace(os.sep, ".")
+        else:
+            module = os.path.splitext(os.path.basename(path))[0]
+        name = names[code] = f"{module}:{code.co_name}"
+    return name
+
+
+def _sample(routes: Dict[object, str], skip: set, stacks: Counter, names: Dict[object, str]) -> None:
+    for thread_id, frame in sys._current_frames().items():
+        if thread_id in skip:
+            continue
+        path: List[object] = []
+        route = None
+        while frame is not None:
+            code = frame.f_code
+            route = routes.get(code)
+            if route is not None:
+                break
+            path.append(code)
+            frame = frame.f_back
+        if route is None:
+            continue  # idle worker, event loop, background task
+        stacks[(route, tuple(_frame_name(c, names) for c in reversed(path)))] += 1
+
+
+def profile(app, seconds: float, interval_ms: float = None, exclude_routes: Tuple[str, ...] = ()) -> Dict:
+    """
+    Sample the process for `seconds`. Returns {"seconds", "interval_ms", "samples",
+    "routes": {route: samples}, "collapsed": "..."}. Raises ProfilerBusy if another
+    session is running.
+    """
+    interval_ms = settings.PROFILE_INTERVAL_MS if interval_ms is None else interval_ms
+    if not _session_lock.acquire(blocking=False):
+        raise ProfilerBusy("A profiling session is already running")
+    try:
+        routes = {code: route for code, route in _route_codes(app).items() if route not in exclude_routes}
+        stacks: Counter = Counter()
+        names: Dict[object, str] = {}
+        done = threading.Event()
+        sampler_ids = set()
+
+        def _run():
+            sampler_ids.add(threading.get_ident())
+            while not done.wait(interval_ms / 1000.0):
+                _sample(routes, sampler_ids, stacks, names)
+
+        sampler = threading.Thread(target=_run, name="profiler", daemon=True)
+        started = time.perf_counter()
+        sampler.start()
+        time.sleep(seconds)
+        done.set()
+        sampler.join()
+        elapsed = time.perf_counter() - started
+    finally:
+        _session_lock.release()
+
+    per_route: Counter = Counter()
+    lines = []
+    for (route, frames), count in sorted(stacks.items(), key=lambda item: -item[1]):
+        per_route[route] += count
+        lines.append(";".join((route,) + frames) + f" {count}")
+    return {
+        "seconds": round(elapsed, 3),
+        "interval_ms": interval_ms,
+        "samples": sum(per_route.values()),
+        "routes": dict(per_route.most_common()),
+        "collapsed": "\n".join(lines),
+    }
@@ -0,0 +1,159 @@
+"""
+Admission control for the API: per-user token buckets and load shedding.
+
+Every request belongs to a route class:
+  heavy   CSV exports and fleet analytics
+  report  summaries and projections over a user's history
+  write   POST/PUT/DELETE
+  read    everything else
+and draws one token from the bucket of (client, class), where the client is the
+`user_id` query parameter or, without one, the peer address. Buckets refill at
+settings.RATE_LIMITS[class] = (tokens per second, burst); an empty bucket is
+answered with 429 and a Retry-After telling when the next token is due.
+
+On top of that, at most settings.MAX_CONCURRENT_REQUESTS requests (and at most
+settings.MAX_CONCURRENT_HEAVY heavy ones) are handled at once; excess requests
+are shed immediately with 503 instead of queueing in the thread pool. Event
+streams (STREAM_ROUTES) stay open indefinitely while idle, so they take a read
+token but don't count against these caps (see settings.EVENTS_MAX_CONNECTIONS).
+
+State is a bounded LRU dict of buckets touched only from the event loop, so a
+request costs a couple of dict operations and no locking.
+"""
+
+import math
+import time
+from collections import OrderedDict
+from typing import Dict, Optional, Tuple
+from urllib.parse import parse_qsl
+
+from config import settings
+from utils import metrics
+
+HEAVY_ROUTES = frozenset({"/export-csv", "/admin/analytics"})
+REPORT_ROUTES = frozenset({"/monthly-summary", "/category-totals", "/balance/projection"})
+STREAM_ROUTES = frozenset({"/events"})
+EXEMPT_ROUTES = frozenset({"/", "/metrics", "/docs", "/redoc", "/openapi.json"})
+WRITE_METHODS = frozenset({"POST", "PUT", "PATCH", "DELETE"})
+
+REJECTED = metrics.counter(
+    "finance_http_rejected_total", "Requests refused by admission control", ["reason", "route_class"]
+)
+IN_FLIGHT = metrics.gauge("finance_http_admitted_in_flight", "Admitted requests currently being handled", ["route_class"])
+
+
+def route_class(method: str, path: str) -> Optional[str]:
+    """
+    "read", "write", "report" or "heavy"; None for routes that are never limited.
+    """
+    if path in EXEMPT_ROUTES:
+        return None
+    if path in HEAVY_ROUTES:
+        return "heavy"
+    if path in REPORT_ROUTES:
+        return "report"
+    if method in WRITE_METHODS:
+        return "write"
+    return "read"
+
+
+def _client_key(scope) -> str:
+    for name, value in parse_qsl(scope.get("query_string", b"").decode("latin-1")):
+        if name == "user_id":
+            return "user:" + value
+    client = scope.get("client")
+    return "addr:" + (client[0] if client else "unknown")
+
+
+class TokenBuckets:
+    """
+    Token buckets keyed by (client, route class); the least recently used are
+    dropped beyond `max_keys` (a dropped bucket simply starts full again).
+    """
+
+    def __init__(self, limits: Dict[str, Tuple[float, float]], max_keys: int):
+        self.limits = limits
+        self.max_keys = max_keys
+        self._buckets: "OrderedDict[Tuple[str, str], list]" = OrderedDict()
+
+    def __len__(self) -> int:
+        return len(self._buckets)
+
+    def take(self, key: str, cls: str, now: Optional[float] = None) -> float:
+        """
+        Draw one token. Returns 0.0 when admitted, otherwise seconds until a token is available.
+        """
+        rate, burst = self.limits[cls]
+        now = time.monotonic() if now is None else now
+        bucket = self._buckets.get((key, cls))
+        if bucket is None:
+            bucket = self._buckets[(key, cls)] = [float(burst), now]
+            if len(self._buckets) > self.max_keys:
+                self._buckets.popitem(last=False)
+        else:
+            self._buckets.move_to_end((key, cls))
+            bucket[0] = min(float(burst), bucket[0] + (now - bucket[1]) * rate)
+            bucket[1] = now
+        if bucket[0] >= 1.0:
+            bucket[0] -= 1.0
+            return 0.0
+        return (1.0 - bucket[0]) / rate if rate > 0 else math.inf
+
+
+async def _reject(send, status: int, retry_after: float, detail: str) -> None:
+    retry = str(max(1, math.ceil(retry_after)) if retry_after != math.inf else 3600)
+    body = ('{"detail":"%s"}' % detail).encode("utf-8")
+    await send({
+        "type": "http.response.start",
+        "status": status,
+        "headers": [
+            (b"content-type", b"application/json"),
+            (b"content-length", str(len(body)).encode("ascii")),
+            (b"retry-after", retry.encode("ascii")),
+        ],
+    })
+    await send({"type": "http.response.body", "body": body})
+
+
+class RateLimitMiddleware:
+    def __init__(self, app, limits: Dict[str, Tuple[float, float]] = None, max_concurrent: int = None, max_heavy: int = None):
+        self.app = app
+        self.buckets = TokenBuckets(limits or settings.RATE_LIMITS, settings.RATE_LIMIT_MAX_KEYS)
+        self.max_concurrent = settings.MAX_CONCURRENT_REQUESTS if max_concurrent is None else max_concurrent
+        self.max_heavy = settings.MAX_CONCURRENT_HEAVY if max_heavy is None else max_heavy
+        self.in_flight = 0
+        self.heavy_in_flight = 0
+        metrics.gauge("finance_rate_limit_buckets", "Token buckets currently tracked", callback=lambda: len(self.buckets))
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        cls = route_class(scope["method"], scope["path"])
+        if cls is None:
+            await self.app(scope, receive, send)
+            return
+
+        wait = self.buckets.take(_client_key(scope), cls)
+        if wait:
+            REJECTED.inc("rate_limited", cls)
+            await _reject(send, 429, wait, f"Rate limit exceeded for {cls} requests")
+            return
+        if scope["path"] in STREAM_ROUTES:
+            await self.app(scope, receive, send)
+            return
+        heavy = cls == "heavy"
+        if self.in_flight >= self.max_concurrent or (heavy and self.heavy_in_flight >= self.max_heavy):
+            REJECTED.inc("overloaded", cls)
+            await _reject(send, 503, 1, "Server busy, retry later")
+            return
+
+        self.in_flight += 1
+        self.heavy_in_flight += heavy
+        IN_FLIGHT.inc(cls)
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            self.in_flight -= 1
+            self.heavy_in_flight -= heavy
+            IN_FLIGHT.dec(cls)
@@ -0,0 +1,79 @@
+"""
+Fleet analytics scaling with worker processes.
+
+Generates a synthetic ledger (see benchmarks.synthetic) in a temporary
+directory and times database.analytics.fleet_report with 1, 2, 4, ... worker
+processes, reporting wall-clock seconds and the speedup over one worker.
+Every run must produce the same report.
+
+Usage:
+  python -m benchmarks.analytics --users 2000 --rows-per-user 500 --workers 1,2,4,8 --output analytics.json
+"""
+
+import argparse
+import json
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Fleet analytics scaling with worker processes")
+    parser.add_argument("--users", type=int, default=2000)
+    parser.add_argument("--rows-per-user", type=int, default=500)
+    parser.add_argument("--workers", default="1,2,4", help="comma-separated worker counts")
+    parser.add_argument("--repeat", type=int, default=3, help="runs per worker count (the fastest counts)")
+    parser.add_argument("--output", default=None, help="write results JSON here")
+    args = parser.parse_args(argv)
+    counts = [int(c) for c in args.workers.split(",")]
+
+    from config import settings
+    from benchmarks.synthetic import generate_ledger
+    from database import analytics
+
+    workdir = tempfile.mkdtemp(prefix="finance-analytics-")
+    previous = (settings.DB_PATH, settings.SHARD_COUNT, settings.STORAGE_BACKEND)
+    try:
+        settings.DB_PATH = os.path.join(workdir, "finance.db")
+        settings.SHARD_COUNT = 0
+        settings.STORAGE_BACKEND = "sqlite"
+        started = time.perf_counter()
+        info = generate_ledger(settings.DB_PATH, users=args.users, rows_per_user=args.rows_per_user)
+        print(f"Generated {info['rows']:,} rows in {time.perf_counter() - started:.1f}s", file=sys.stderr)
+
+        runs = []
+        reference = None
+        for count in counts:
+            best = None
+            for _ in range(args.repeat):
+                report = analytics.fleet_report(workers=count)
+                # Pool start-up is part of every CLI run, so it is part of the timing
+                best = report["seconds"] if best is None else min(best, report["seconds"])
+            body = {k: report[k] for k in ("active_users", "months", "categories")}
+            if reference is None:
+                reference = body
+            elif body != reference:
+                print(f"Report with {count} workers differs from the one with {counts[0]}", file=sys.stderr)
+                return 1
+            runs.append({"workers": count, "ranges": report["ranges"], "seconds": best})
+            print(f"{count} worker(s): {best:.3f}s over {report['ranges']} ranges", file=sys.stderr)
+    finally:
+        settings.DB_PATH, settings.SHARD_COUNT, settings.STORAGE_BACKEND = previous
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    base = runs[0]["seconds"]
+    for run in runs:
+        run["speedup"] = round(base / run["seconds"], 2) if run["seconds"] else None
+    payload = {"users": args.users, "rows": info["rows"], "cpu_count": os.cpu_count(), "runs": runs}
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(payload, f, indent=2)
+    else:
+        print(json.dumps(payload, indent=2))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,159 @@
+"""
+Request latency while an online backup runs.
+
+Seeds a database, then keeps client threads issuing the API's typical calls
+(list transactions, balance, insert) through database.db while measuring each
+call's latency, in three phases: no backup, a throttled backup
+(settings.BACKUP_PAGES_PER_STEP / BACKUP_STEP_SLEEP_MS) and an unthrottled
+one-step backup. Reports p50/p99/max latency per phase, the p99 added by each
+kind of backup, and how long the backups took.
+
+Usage:
+  python -m benchmarks.backup --transactions 200000 --clients 8 --output backup.json
+"""
+
+import argparse
+import json
+import os
+import random
+import shutil
+import sys
+import tempfile
+import threading
+import time
+from typing import Dict, List, Optional
+
+
+def _percentile(values: List[float], q: float) -> float:
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+
+def _seed(db, users: int, transactions: int) -> None:
+    from database.storage import get_backend
+
+    for u in range(users):
+        db.create_user(f"bench_{u}", "benchmark")
+    rng = random.Random(0)
+    conn = get_backend().connection()
+    conn.executemany(
+        "INSERT INTO transactions (user_id, date, amount, category, ttype, description, currency) VALUES (?, ?, ?, ?, ?, ?, ?)",
+        [
+            (rng.randint(1, users), f"202{rng.randint(3, 6)}-{rng.randint(1, 12):02d}-{rng.randint(1, 28):02d}",
+             round(rng.uniform(1, 500), 2), rng.choice(["Food", "Rent", "Travel", "Fun"]), "expense", "benchmark row " * 4, "USD")
+            for _ in range(transactions)
+        ]
+    )
+    conn.commit()
+    conn.close()
+
+
+def _client(db, users: int, seed: int, stop, samples: List[float]) -> None:
+    rng = random.Random(seed)
+    while not stop.is_set():
+        user_id = rng.randint(1, users)
+        op = rng.random()
+        started = time.perf_counter()
+        if op < 0.6:
+            db.get_transactions_by_user(user_id, limit=50)
+        elif op < 0.8:
+            db.get_balance(user_id)
+        else:
+            db.add_transaction(user_id, "2026-01-01", 9.99, "Food", "expense", "benchmark")
+        samples.append(time.perf_counter() - started)
+
+
+def _phase(db, users: int, clients: int, seconds: float, backup: Optional[Dict]) -> Dict:
+    from database import backup as backup_module
+
+    stop = threading.Event()
+    samples: List[List[float]] = [[] for _ in range(clients)]
+    threads = [threading.Thread(target=_client, args=(db, users, i, stop, samples[i])) for i in range(clients)]
+    for t in threads:
+        t.start()
+    manifest = None
+    started = time.perf_counter()
+    if backup is None:
+        time.sleep(seconds)
+    else:
+        manifest = backup_module.create_backup(**backup)
+    elapsed = time.perf_counter() - started
+    stop.set()
+    for t in threads:
+        t.join()
+    latencies = [s for per_client in samples for s in per_client]
+    result = {
+        "requests": len(latencies),
+        "seconds": round(elapsed, 3),
+        "p50_ms": round(_percentile(latencies, 0.50) * 1000, 3),
+        "p99_ms": round(_percentile(latencies, 0.99) * 1000, 3),
+        "max_ms": round(max(latencies, default=0.0) * 1000, 3),
+    }
+    if manifest is not None:
+        result["backup_restarts"] = sum(f["restarts"] for f in manifest["files"])
+        result["backup_bytes"] = sum(f["bytes"] for f in manifest["files"])
+    return result
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Request latency during online backups")
+    parser.add_argument("--transactions", type=int, default=200000, help="rows seeded before measuring")
+    parser.add_argument("--users", type=int, default=50)
+    parser.add_argument("--clients", type=int, default=8, help="concurrent client threads")
+    parser.add_argument("--baseline-seconds", type=float, default=5.0)
+    parser.add_argument("--output", default=None, help="write results JSON here")
+    args = parser.parse_args(argv)
+
+    from config import settings
+
+    workdir = tempfile.mkdtemp(prefix="finance_backup_bench_")
+    previous = (settings.DB_PATH, settings.DATA_DIR, settings.SHARD_COUNT, settings.SLOW_QUERY_MS, settings.BACKUP_DIR, settings.ANOMALY_DETECTION)
+    settings.DB_PATH = os.path.join(workdir, "finance.db")
+    settings.DATA_DIR = workdir
+    settings.SHARD_COUNT = 0
+    settings.SLOW_QUERY_MS = 0
+    settings.BACKUP_DIR = os.path.join(workdir, "backups")
+    settings.ANOMALY_DETECTION = False
+    try:
+        from database import db, write_queue
+
+        db.init_db()
+        _seed(db, args.users, args.transactions)
+        phases = {
+            "no backup": None,
+            "throttled backup": {},
+            "one-step backup": {"pages_per_step": -1, "step_sleep_ms": 0},
+        }
+        results = {}
+        for label, backup in phases.items():
+            r = _phase(db, args.users, args.clients, args.baseline_seconds, backup)
+            results[label] = r
+            print(f"{label:<17} p50 {r['p50_ms']:8.2f} ms  p99 {r['p99_ms']:8.2f} ms  max {r['max_ms']:8.2f} ms  "
+                  f"({r['requests']} requests in {r['seconds']:.2f}s)", file=sys.stderr)
+        write_queue.close_all()
+    finally:
+        settings.DB_PATH, settings.DATA_DIR, settings.SHARD_COUNT, settings.SLOW_QUERY_MS, settings.BACKUP_DIR, settings.ANOMALY_DETECTION = previous
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    base = results["no backup"]["p99_ms"]
+    for label in ("throttled backup", "one-step backup"):
+        results[label]["added_p99_ms"] = round(results[label]["p99_ms"] - base, 3)
+        print(f"{label}: +{results[label]['added_p99_ms']:.2f} ms p99", file=sys.stderr)
+
+    payload = {
+        "transactions": args.transactions, "clients": args.clients,
+        "pages_per_step": settings.BACKUP_PAGES_PER_STEP, "step_sleep_ms": settings.BACKUP_STEP_SLEEP_MS,
+        "results": results,
+    }
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(payload, f, indent=2)
+    else:
+        print(json.dumps(payload, indent=2))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
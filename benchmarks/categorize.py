@@ -0,0 +1,151 @@
+"""
+Categorization rule throughput.
+
+Builds a synthetic rule set (mostly substring rules, plus regex and amount-range
+rules at different priorities) and a batch of merchant-like descriptions, then
+times finance.categorize.RuleMatcher against trying every rule in order for
+each description. Reports compile time and descriptions per second; exits 1
+when the compiled matcher stays below --min-rate.
+
+Usage:
+  python -m benchmarks.categorize --rules 300 --descriptions 100000 --output categorize.json
+"""
+
+import argparse
+import json
+import random
+import re
+import sys
+import time
+from typing import List, Optional, Tuple
+
+from database.models import CategoryRule
+
+CATEGORIES = ["Food", "Transport", "Rent", "Entertainment", "Utilities", "Travel", "Health", "Shopping"]
+WORDS = ["market", "coffee", "fuel", "taxi", "cinema", "pharmacy", "hotel", "grocer", "bakery", "power",
+         "water", "metro", "airline", "books", "sports", "pizza", "garden", "clinic", "stream", "parking"]
+BRANDS = ["acme", "nordic", "sunrise", "bluebird", "urban", "golden", "corner", "royal", "green", "silver",
+          "harbor", "summit", "maple", "orbit", "pioneer", "crown", "atlas", "lotus", "falcon", "meadow"]
+CITIES = ["LONDON", "BERLIN", "PARIS", "MADRID", "ROME", "VIENNA", "OSLO", "LISBON", "DUBLIN", "PRAGUE"]
+
+
+def make_rules(count: int, seed: int = 0) -> List[CategoryRule]:
+    """
+    `count` rules: 80% substring (merchant names), 10% regex (a keyword and a reference number),
+    10% amount ranges without a pattern.
+    """
+    rng = random.Random(seed)
+    rules = []
+    for i in range(count):
+        category = rng.choice(CATEGORIES)
+        kind = i % 10
+        if kind == 9:
+            low = rng.choice([500.0, 1000.0, 2000.0])
+            rules.append(CategoryRule(i + 1, 1, category, None, "substring", "expense", low, low * 2, -1))
+        elif kind == 8:
+            pattern = rf"\b{rng.choice(WORDS)}\s*#?\d{{{rng.randint(2, 4)}}}\b"
+            rules.append(CategoryRule(i + 1, 1, category, pattern, "regex", None, None, None, rng.randint(0, 3)))
+        else:
+            pattern = f"{rng.choice(BRANDS)} {rng.choice(BRANDS)}{i}"
+            low = rng.choice([None, None, None, 10.0])
+            rules.append(CategoryRule(i + 1, 1, category, pattern, "substring", None, low, None, rng.randint(0, 3)))
+    return rules
+
+
+def make_descriptions(rules: List[CategoryRule], count: int, seed: int = 1) -> List[Tuple[str, float, str]]:
+    """
+    Bank-statement-like (description, amount, ttype) items: about half name a merchant from
+    the substring rules, a tenth carry a reference the regex rules look for.
+    """
+    rng = random.Random(seed)
+    words = [r.pattern for r in rules if r.pattern and r.match == "substring"]
+    items = []
+    for _ in range(count):
+        parts = [f"CARD PAYMENT {rng.randint(1000, 9999)}", rng.choice(CITIES)]
+        if words and rng.random() < 0.5:
+            parts.insert(1, rng.choice(words).upper())
+        elif rng.random() < 0.2:
+            parts.insert(1, f"{rng.choice(WORDS)} #{rng.randint(10, 9999)}")
+        items.append((" ".join(parts), round(rng.uniform(1, 3000), 2), "expense" if rng.random() < 0.9 else "income"))
+    return items
+
+
+def _naive(rules: List[CategoryRule]):
+    """
+    Baseline: every rule tried in priority order for every description.
+    """
+    ordered = sorted(rules, key=lambda r: (-r.priority, r.id))
+    compiled = [(r, re.compile(r.pattern, re.IGNORECASE) if r.pattern and r.match == "regex" else None) for r in ordered]
+
+    def categorize(items) -> List[Optional[str]]:
+        result = []
+        for description, amount, ttype in items:
+            lowered = description.lower()
+            found = None
+            for r, regex in compiled:
+                if r.ttype is not None and r.ttype != ttype:
+                    continue
+                if (r.min_amount is not None and amount < r.min_amount) or (r.max_amount is not None and amount > r.max_amount):
+                    continue
+                if r.pattern is None or (regex.search(description) if regex else r.pattern.lower() in lowered):
+                    found = r.category
+                    break
+            result.append(found)
+        return result
+    return categorize
+
+
+def _timed(fn, *args):
+    started = time.perf_counter()
+    result = fn(*args)
+    return result, time.perf_counter() - started
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Categorization rule throughput")
+    parser.add_argument("--rules", type=int, default=300)
+    parser.add_argument("--descriptions", type=int, default=100000)
+    parser.add_argument("--min-rate", type=float, default=100000, help="descriptions per second the matcher must reach")
+    parser.add_argument("--output", default=None, help="write results JSON here")
+    args = parser.parse_args(argv)
+
+    from finance.categorize import RuleMatcher
+
+    rules = make_rules(args.rules)
+    items = make_descriptions(rules, args.descriptions)
+
+    matcher, compile_seconds = _timed(RuleMatcher, rules)
+    compiled, compiled_seconds = _timed(matcher.categorize, items)
+    naive, naive_seconds = _timed(_naive(rules), items)
+    mismatches = sum(a != b for a, b in zip(compiled, naive))
+
+    rate = len(items) / compiled_seconds
+    payload = {
+        "rules": args.rules,
+        "descriptions": len(items),
+        "matched": sum(c is not None for c in compiled),
+        "compile_ms": round(compile_seconds * 1000, 3),
+        "compiled_per_second": round(rate),
+        "naive_per_second": round(len(items) / naive_seconds),
+        "speedup": round(naive_seconds / compiled_seconds, 2),
+        "mismatches": mismatches,
+    }
+    print(f"compiled: {payload['compiled_per_second']:,} descriptions/s (compile {payload['compile_ms']:.1f} ms), "
+          f"naive: {payload['naive_per_second']:,}/s, speedup {payload['speedup']}x", file=sys.stderr)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(payload, f, indent=2)
+    else:
+        print(json.dumps(payload, indent=2))
+
+    if mismatches:
+        print(f"{mismatches} description(s) categorized differently from the baseline", file=sys.stderr)
+        return 1
+    if rate < args.min_rate:
+        print(f"Below the required {args.min_rate:,.0f} descriptions/s", file=sys.stderr)
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
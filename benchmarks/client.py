@@ -0,0 +1,165 @@
+"""
+Client SDK throughput against a local server.
+
+Seeds a temporary database, starts `api.launcher` on localhost (rate limiting
+disabled unless --rate-limit) and measures calls per second for:
+
+  reads: GET /transactions with a new connection per call (what main.py
+         used to do), through a pooled FinanceClient, and through an
+         AsyncFinanceClient with --concurrency calls in flight;
+  adds:  one POST /transactions per add (AsyncFinanceClient with batching
+         off) against the same concurrent adds batched automatically into
+         POST /transactions/batch.
+
+Usage:
+  python -m benchmarks.client --calls 2000 --adds 5000 --concurrency 32 --output client.json
+  # with the configured RATE_LIMITS, as a real client would see them
+  python -m benchmarks.client --calls 200 --adds 2000 --rate-limit
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+from typing import Dict
+
+from .loadtest import PASSWORD, _seed
+from .workers import REPO_DIR, _SERVER, _free_port, _wait_ready
+
+
+def _rate(calls: int, errors: int, seconds: float) -> Dict:
+    # Failures (requests still refused after the client's retries with --rate-limit) don't count
+    ok = calls - errors
+    return {"calls": ok, "errors": errors, "seconds": round(seconds, 3), "calls_per_second": round(ok / seconds, 1) if seconds else None}
+
+
+def _unpooled(base_url: str, user_id: int, calls: int) -> Dict:
+    import httpx
+
+    errors = 0
+    started = time.perf_counter()
+    for _ in range(calls):
+        errors += httpx.get(f"{base_url}/transactions", params={"user_id": user_id}).status_code >= 400
+    return _rate(calls, errors, time.perf_counter() - started)
+
+
+def _pooled(base_url: str, user_id: int, calls: int) -> Dict:
+    from client import ClientError, FinanceClient
+
+    errors = 0
+    with FinanceClient(base_url) as api:
+        started = time.perf_counter()
+        for _ in range(calls):
+            try:
+                api.transactions(user_id)
+            except ClientError:
+                errors += 1
+        return _rate(calls, errors, time.perf_counter() - started)
+
+
+async def _async_reads(base_url: str, user_id: int, calls: int, concurrency: int) -> Dict:
+    from client import AsyncFinanceClient, ClientError
+
+    errors = 0
+    async with AsyncFinanceClient(base_url, pool_size=concurrency) as api:
+        async def _worker(n: int):
+            nonlocal errors
+            for _ in range(n):
+                try:
+                    await api.transactions(user_id)
+                except ClientError:
+                    errors += 1
+
+        started = time.perf_counter()
+        await asyncio.gather(*(_worker(calls // concurrency) for _ in range(concurrency)))
+        return _rate(calls // concurrency * concurrency, errors, time.perf_counter() - started)
+
+
+async def _async_adds(base_url: str, user_id: int, adds: int, concurrency: int, batch_window_ms: float) -> Dict:
+    from client import AsyncFinanceClient, ClientError
+
+    errors = 0
+    async with AsyncFinanceClient(base_url, pool_size=concurrency, batch_window_ms=batch_window_ms) as api:
+        async def _worker(w: int, n: int):
+            nonlocal errors
+            for i in range(n):
+                try:
+                    await api.add_transaction(user_id, f"2026-{i % 12 + 1:02d}-{w % 28 + 1:02d}", 10.0 + i % 90, "expense", "Food", "client bench")
+                except ClientError:
+                    errors += 1
+
+        started = time.perf_counter()
+        await asyncio.gather(*(_worker(w, adds // concurrency) for w in range(concurrency)))
+        seconds = time.perf_counter() - started
+    return _rate(adds // concurrency * concurrency, errors, seconds)
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Client SDK throughput against a local server")
+    parser.add_argument("--calls", type=int, default=1000, help="GET /transactions calls per read scenario")
+    parser.add_argument("--adds", type=int, default=2000, help="transactions added per add scenario")
+    parser.add_argument("--concurrency", type=int, default=32, help="calls in flight for the async scenarios")
+    parser.add_argument("--batch-window-ms", type=float, default=5.0)
+    parser.add_argument("--transactions", type=int, default=200, help="seeded transactions of the reading user")
+    parser.add_argument("--workers", type=int, default=1, help="API worker processes")
+    parser.add_argument("--rate-limit", action="store_true", help="keep the server's configured rate limits")
+    parser.add_argument("--output", default=None, help="write results JSON here")
+    args = parser.parse_args(argv)
+
+    workdir = tempfile.mkdtemp(prefix="finance_client_bench_")
+    server = None
+    try:
+        # bench_0_0 reads its seeded ledger, bench_0_1 receives the adds
+        db_path = _seed(workdir, 2, args.transactions, 0)
+        port = _free_port()
+        code = _SERVER.format(data_dir=workdir, db_path=db_path, port=port, workers=args.workers)
+        env = {**os.environ, "FINANCE_RATE_LIMIT_ENABLED": "1" if args.rate_limit else "0"}
+        server = subprocess.Popen([sys.executable, "-c", code], cwd=REPO_DIR, env=env, stdout=subprocess.DEVNULL)
+        _wait_ready(port)
+        base_url = f"http://127.0.0.1:{port}"
+
+        from client import FinanceClient
+
+        with FinanceClient(base_url) as api:
+            reader = api.login("bench_0_0", PASSWORD)["id"]
+            writer = api.login("bench_0_1", PASSWORD)["id"]
+
+        reads = {
+            "new_connection_per_call": _unpooled(base_url, reader, args.calls),
+            "pooled_sync": _pooled(base_url, reader, args.calls),
+            "pooled_async": asyncio.run(_async_reads(base_url, reader, args.calls, args.concurrency)),
+        }
+        adds = {
+            "single": asyncio.run(_async_adds(base_url, writer, args.adds, args.concurrency, 0)),
+            "auto_batched": asyncio.run(_async_adds(base_url, writer, args.adds, args.concurrency, args.batch_window_ms)),
+        }
+    finally:
+        if server is not None:
+            server.terminate()
+            server.wait(timeout=60)
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    for group in (reads, adds):
+        first = next(iter(group.values()))["calls_per_second"]
+        for name, r in group.items():
+            r["speedup"] = round(r["calls_per_second"] / first, 2) if first else None
+            print(f"{name:<24} {r['calls_per_second']:10.1f} calls/s  x{r['speedup']}  errors {r['errors']}", file=sys.stderr)
+    payload = {
+        "cpu_count": os.cpu_count(), "workers": args.workers, "concurrency": args.concurrency, "rate_limit": args.rate_limit,
+        "batch_window_ms": args.batch_window_ms, "reads": reads, "adds": adds,
+    }
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(payload, f, indent=2)
+    else:
+        print(json.dumps(payload, indent=2))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
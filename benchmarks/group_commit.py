@@ -0,0 +1,112 @@
+"""
+Group-commit benchmark.
+
+Runs concurrent writer threads in one process (the API's thread pool case)
+that each insert, update and delete transactions through database.db, once
+with settings.GROUP_COMMIT off (one commit per write) and once with it on,
+and reports sustained write throughput for both.
+
+Usage:
+  python -m benchmarks.group_commit --threads 32 --writes 200 --output group_commit.json
+"""
+
+import argparse
+import json
+import os
+import random
+import shutil
+import sys
+import tempfile
+import threading
+import time
+from typing import Dict, List
+
+
+def _writer(db, user_id: int, writes: int, seed: int, start_event, errors: List[int]) -> None:
+    rng = random.Random(seed)
+    failed = 0
+    start_event.wait()
+    for i in range(writes):
+        ok, _msg = db.add_transaction(user_id, "2026-01-01", round(rng.uniform(1, 100), 2), "Food", "expense", "bench")
+        failed += not ok
+        # Every tenth write is an update of the row just written, every 20th a delete
+        if i % 10 == 9:
+            tx = db.get_transactions_by_user(user_id, limit=1)
+            if tx:
+                if i % 20 == 19:
+                    ok, _msg = db.delete_transaction(tx[0].id, user_id)
+                else:
+                    ok, _msg = db.update_transaction(tx[0].id, user_id, "2026-01-02", 5.0, "Food", "expense", "bench")
+                failed += not ok
+    errors.append(failed)
+
+
+def run(group_commit: bool, threads: int, writes: int) -> Dict:
+    from config import settings
+
+    workdir = tempfile.mkdtemp(prefix="finance_group_commit_bench_")
+    previous = (settings.DB_PATH, settings.SHARD_COUNT, settings.SLOW_QUERY_MS, settings.GROUP_COMMIT)
+    settings.DB_PATH = os.path.join(workdir, "finance.db")
+    settings.SHARD_COUNT = 0
+    settings.SLOW_QUERY_MS = 0
+    settings.GROUP_COMMIT = group_commit
+    try:
+        from database import db, write_queue
+
+        db.init_db()
+        for u in range(threads):
+            db.create_user(f"writer_{u}", "benchmark")
+
+        start_event = threading.Event()
+        errors: List[int] = []
+        workers = [
+            threading.Thread(target=_writer, args=(db, u + 1, writes, u, start_event, errors))
+            for u in range(threads)
+        ]
+        for t in workers:
+            t.start()
+        started = time.perf_counter()
+        start_event.set()
+        for t in workers:
+            t.join()
+        elapsed = time.perf_counter() - started
+        write_queue.close_all()
+
+        total = threads * (writes + writes // 10)
+        failed = sum(errors)
+        return {
+            "group_commit": group_commit, "threads": threads, "writes": total, "errors": failed,
+            "seconds": elapsed, "writes_per_second": (total - failed) / elapsed,
+        }
+    finally:
+        settings.DB_PATH, settings.SHARD_COUNT, settings.SLOW_QUERY_MS, settings.GROUP_COMMIT = previous
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Write throughput with and without group commit")
+    parser.add_argument("--threads", type=int, default=32, help="concurrent writer threads")
+    parser.add_argument("--writes", type=int, default=200, help="inserts per thread")
+    parser.add_argument("--output", default=None, help="write results JSON here")
+    args = parser.parse_args(argv)
+
+    results: List[Dict] = []
+    for enabled in (False, True):
+        r = run(enabled, args.threads, args.writes)
+        results.append(r)
+        label = "on " if enabled else "off"
+        print(f"group commit {label} {r['writes_per_second']:9.0f} writes/s  ({r['errors']} errors, {r['seconds']:.2f}s)", file=sys.stderr)
+    if results[0]["writes_per_second"] > 0:
+        print(f"speedup: {results[1]['writes_per_second'] / results[0]['writes_per_second']:.1f}x", file=sys.stderr)
+
+    payload = {"threads": args.threads, "writes_per_thread": args.writes, "results": results}
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(payload, f, indent=2)
+    else:
+        print(json.dumps(payload, indent=2))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,289 @@
+"""
+Load test that replays the Streamlit client's traffic against the API.
+
+Every virtual user logs in once and then repeats what one rerun of main.py
+requests -- GET /transactions, /balance, /categories, /transactions again and
+/monthly-summary -- adding a transaction on a fraction of reruns
+(--add-ratio) and exporting CSV on fewer (--export-ratio), with an
+exponentially distributed think time between reruns. Virtual users are
+asyncio tasks sharing a keep-alive connection pool (httpx), split over
+--client-procs processes so the client isn't the bottleneck.
+
+By default a seeded temporary database is served by `api.launcher` on
+localhost (rate limiting disabled); --url targets a running server instead,
+whose users bench_<seed>_<n> (password "benchmark") must exist. Results --
+throughput, p50/p95/p99 latency and error rate per endpoint -- are printed or
+written as JSON; --compare fails when p99 or throughput of an endpoint
+regressed beyond --threshold against an earlier run.
+
+Usage:
+  python -m benchmarks.loadtest --vus 2000 --duration 60 --workers 4 --output load.json
+  python -m benchmarks.loadtest --vus 2000 --duration 60 --workers 4 --compare load.json
+"""
+
+import argparse
+import asyncio
+import json
+import multiprocessing
+import os
+import platform
+import random
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+from collections import defaultdict
+from datetime import datetime
+from typing import Dict, List, Optional
+
+from .workers import REPO_DIR, _SERVER, _free_port, _wait_ready
+
+PASSWORD = "benchmark"
+EXPENSE_CATEGORIES = ["Food", "Transport", "Rent", "Entertainment", "Utilities", "Other"]
+MIN_COMPARE_SAMPLES = 50  # percentiles of rarer endpoints are too noisy to compare
+
+
+# ----------------- Virtual users -----------------
+class _Recorder:
+    def __init__(self):
+        self.latencies: Dict[str, List[float]] = defaultdict(list)
+        self.errors: Dict[str, int] = defaultdict(int)
+        self.statuses: Dict[str, int] = defaultdict(int)
+
+    async def call(self, client, name: str, method: str, path: str, **kwargs):
+        started = time.perf_counter()
+        try:
+            resp = await client.request(method, path, **kwargs)
+            status = str(resp.status_code)
+        except Exception as e:  # connection refused/reset, timeout
+            resp, status = None, type(e).__name__
+        self.latencies[name].append(time.perf_counter() - started)
+        self.statuses[status] += 1
+        if resp is None or resp.status_code >= 400:
+            self.errors[name] += 1
+            return None
+        return resp
+
+
+async def _virtual_user(client, rec: _Recorder, username: str, rng: random.Random, deadline: float, args) -> None:
+    resp = await rec.call(client, "POST /auth/login", "POST", "/auth/login", json={"username": username, "password": PASSWORD})
+    if resp is None:
+        return
+    params = {"user_id": resp.json()["user"]["id"]}
+    while time.monotonic() < deadline:
+        await rec.call(client, "GET /transactions", "GET", "/transactions", params=params)
+        await rec.call(client, "GET /balance", "GET", "/balance", params=params)
+        await rec.call(client, "GET /categories", "GET", "/categories", params={"ttype": "expense"})
+        if rng.random() < args.add_ratio:
+            await rec.call(client, "POST /transactions", "POST", "/transactions", params=params, json={
+                "date_iso": datetime.utcnow().strftime("%Y-%m-%d"), "amount": round(rng.lognormvariate(3.5, 1.0), 2) or 0.01,
+                "category": rng.choice(EXPENSE_CATEGORIES), "ttype": "expense", "description": "load test",
+            })
+        await rec.call(client, "GET /transactions", "GET", "/transactions", params=params)
+        await rec.call(client, "GET /monthly-summary", "GET", "/monthly-summary", params=params)
+        if rng.random() < args.export_ratio:
+            await rec.call(client, "GET /export-csv", "GET", "/export-csv", params=params)
+        if args.think_ms > 0:
+            await asyncio.sleep(rng.expovariate(1000.0 / args.think_ms))
+
+
+async def _run_vus(base_url: str, vu_ids: List[int], start_at: float, args) -> _Recorder:
+    import httpx
+
+    rec = _Recorder()
+    limits = httpx.Limits(max_connections=args.connections, max_keepalive_connections=args.connections)
+    async with httpx.AsyncClient(base_url=base_url, limits=limits, timeout=args.timeout) as client:
+        await asyncio.sleep(max(0.0, start_at - time.time()))
+        deadline = time.monotonic() + args.duration
+
+        async def _start(vu: int):
+            # spread logins over the ramp-up instead of a thundering herd
+            await asyncio.sleep(args.ramp_up * vu / max(args.vus, 1))
+            await _virtual_user(client, rec, f"bench_{args.seed}_{vu % args.users}", random.Random(args.seed * 100003 + vu), deadline, args)
+
+        await asyncio.gather(*(_start(vu) for vu in vu_ids))
+    return rec
+
+
+def _client_proc(base_url: str, vu_ids: List[int], start_at: float, args, out) -> None:
+    rec = asyncio.run(_run_vus(base_url, vu_ids, start_at, args))
+    out.put((dict(rec.latencies), dict(rec.errors), dict(rec.statuses)))
+
+
+# ----------------- Report -----------------
+def _percentile(ordered: List[float], q: float) -> float:
+    return ordered[min(len(ordered) - 1, int(q * len(ordered)))] if ordered else 0.0
+
+
+def summarize(parts, seconds: float) -> Dict:
+    latencies: Dict[str, List[float]] = defaultdict(list)
+    errors: Dict[str, int] = defaultdict(int)
+    statuses: Dict[str, int] = defaultdict(int)
+    for lat, err, st in parts:
+        for name, values in lat.items():
+            latencies[name].extend(values)
+        for name, n in err.items():
+            errors[name] += n
+        for status, n in st.items():
+            statuses[status] += n
+
+    endpoints = {}
+    for name in sorted(latencies):
+        ordered = sorted(latencies[name])
+        endpoints[name] = {
+            "requests": len(ordered),
+            "errors": errors[name],
+            "error_rate": round(errors[name] / len(ordered), 5),
+            "requests_per_second": round(len(ordered) / seconds, 2),
+            "p50_ms": round(_percentile(ordered, 0.50) * 1000, 3),
+            "p95_ms": round(_percentile(ordered, 0.95) * 1000, 3),
+            "p99_ms": round(_percentile(ordered, 0.99) * 1000, 3),
+            "max_ms": round(ordered[-1] * 1000, 3),
+        }
+    everything = sorted(v for values in latencies.values() for v in values)
+    total_errors = sum(errors.values())
+    return {
+        "totals": {
+            "requests": len(everything),
+            "errors": total_errors,
+            "error_rate": round(total_errors / len(everything), 5) if everything else 0.0,
+            "requests_per_second": round(len(everything) / seconds, 2),
+            "p50_ms": round(_percentile(everything, 0.50) * 1000, 3),
+            "p95_ms": round(_percentile(everything, 0.95) * 1000, 3),
+            "p99_ms": round(_percentile(everything, 0.99) * 1000, 3),
+        },
+        "endpoints": endpoints,
+        "status_codes": dict(sorted(statuses.items())),
+    }
+
+
+def compare(current: Dict, baseline: Dict, threshold: float) -> List[str]:
+    """
+    One message per endpoint whose p99 grew, or whose throughput or error rate got worse,
+    by more than `threshold` (0.2 = 20%) against the baseline run. Endpoints with fewer than
+    MIN_COMPARE_SAMPLES requests in either run are skipped.
+    """
+    regressions = []
+    for name, r in current["endpoints"].items():
+        b = baseline.get("endpoints", {}).get(name)
+        if not b or min(b["requests"], r["requests"]) < MIN_COMPARE_SAMPLES:
+            continue
+        if b["p99_ms"] > 0 and r["p99_ms"] > b["p99_ms"] * (1 + threshold):
+            regressions.append(f"{name}: p99 {b['p99_ms']:.1f} ms -> {r['p99_ms']:.1f} ms")
+        if b["requests_per_second"] > 0 and r["requests_per_second"] < b["requests_per_second"] * (1 - threshold):
+            regressions.append(f"{name}: {b['requests_per_second']:.0f} -> {r['requests_per_second']:.0f} req/s")
+        if r["error_rate"] > b["error_rate"] + threshold / 100:
+            regressions.append(f"{name}: error rate {b['error_rate']:.2%} -> {r['error_rate']:.2%}")
+    return regressions
+
+
+# ----------------- Runner -----------------
+def _seed(workdir: str, users: int, rows_per_user: int, seed: int) -> str:
+    from .synthetic import generate_ledger
+
+    db_path = os.path.join(workdir, "finance.db")
+    generate_ledger(db_path, users=users, rows_per_user=rows_per_user, seed=seed)
+    return db_path
+
+
+def run(base_url: str, args) -> Dict:
+    procs_n = max(1, min(args.client_procs, args.vus))
+    start_at = time.time() + 1.0
+    out = multiprocessing.Queue()
+    procs = [
+        multiprocessing.Process(target=_client_proc, args=(base_url, list(range(i, args.vus, procs_n)), start_at, args, out))
+        for i in range(procs_n)
+    ]
+    for p in procs:
+        p.start()
+    parts = [out.get() for _ in procs]
+    for p in procs:
+        p.join()
+    return summarize(parts, args.duration)
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Replay the Streamlit client's API traffic with many virtual users")
+    parser.add_argument("--vus", type=int, default=1000, help="virtual users")
+    parser.add_argument("--users", type=int, default=200, help="distinct accounts the virtual users log in as")
+    parser.add_argument("--transactions", type=int, default=500, help="seeded transactions per account")
+    parser.add_argument("--duration", type=float, default=30.0, help="seconds of load")
+    parser.add_argument("--ramp-up", type=float, default=5.0, help="seconds over which virtual users start")
+    parser.add_argument("--think-ms", type=float, default=1000.0, help="mean pause between reruns")
+    parser.add_argument("--add-ratio", type=float, default=0.1, help="share of reruns that add a transaction")
+    parser.add_argument("--export-ratio", type=float, default=0.02, help="share of reruns that export CSV")
+    parser.add_argument("--connections", type=int, default=100, help="keep-alive connections per client process")
+    parser.add_argument("--client-procs", type=int, default=max(1, min(8, (os.cpu_count() or 2) // 2)))
+    parser.add_argument("--timeout", type=float, default=30.0, help="per-request timeout in seconds")
+    parser.add_argument("--workers", type=int, default=1, help="API worker processes of the local server")
+    parser.add_argument("--url", default=None, help="load a running server instead of starting one")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--output", default=None, help="write results JSON here")
+    parser.add_argument("--compare", default=None, help="earlier results JSON to compare against")
+    parser.add_argument("--threshold", type=float, default=0.2, help="allowed regression before failing (0.2 = 20%%)")
+    args = parser.parse_args(argv)
+
+    workdir: Optional[str] = None
+    server = None
+    base_url = args.url
+    try:
+        if base_url is None:
+            workdir = tempfile.mkdtemp(prefix="finance_loadtest_")
+            db_path = _seed(workdir, args.users, args.transactions, args.seed)
+            port = _free_port()
+            code = _SERVER.format(data_dir=workdir, db_path=db_path, port=port, workers=args.workers)
+            env = {**os.environ, "FINANCE_RATE_LIMIT_ENABLED": "0"}
+            server = subprocess.Popen([sys.executable, "-c", code], cwd=REPO_DIR, env=env, stdout=subprocess.DEVNULL)
+            _wait_ready(port)
+            base_url = f"http://127.0.0.1:{port}"
+        print(f"{args.vus} virtual users against {base_url} for {args.duration:.0f}s ...", file=sys.stderr)
+        report = run(base_url, args)
+    finally:
+        if server is not None:
+            server.terminate()
+            server.wait(timeout=60)
+        if workdir is not None:
+            shutil.rmtree(workdir, ignore_errors=True)
+
+    report = {
+        "meta": {
+            "created_at": datetime.utcnow().isoformat(),
+            "python": platform.python_version(),
+            "cpus": os.cpu_count(),
+            "url": args.url, "workers": None if args.url else args.workers,
+            "vus": args.vus, "users": args.users, "transactions_per_user": args.transactions,
+            "duration": args.duration, "think_ms": args.think_ms, "add_ratio": args.add_ratio,
+            "export_ratio": args.export_ratio, "connections": args.connections, "client_procs": args.client_procs,
+            "seed": args.seed,
+        },
+        **report,
+    }
+    for name, r in report["endpoints"].items():
+        print(f"{name:<20} {r['requests_per_second']:8.1f} req/s  p50 {r['p50_ms']:8.1f}  p95 {r['p95_ms']:8.1f}  "
+              f"p99 {r['p99_ms']:8.1f} ms  errors {r['error_rate']:.2%}", file=sys.stderr)
+    t = report["totals"]
+    print(f"{'total':<20} {t['requests_per_second']:8.1f} req/s  p50 {t['p50_ms']:8.1f}  p95 {t['p95_ms']:8.1f}  "
+          f"p99 {t['p99_ms']:8.1f} ms  errors {t['error_rate']:.2%}", file=sys.stderr)
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+    elif not args.compare:
+        print(json.dumps(report, indent=2))
+
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as f:
+            baseline = json.load(f)
+        regressions = compare(report, baseline, args.threshold)
+        if regressions:
+            print(f"{len(regressions)} regression(s) beyond {args.threshold:.0%}:", file=sys.stderr)
+            for r in regressions:
+                print("  " + r, file=sys.stderr)
+            return 1
+        print(f"No regressions beyond {args.threshold:.0%}", file=sys.stderr)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,211 @@
+"""
+Benchmark suite for the database, service and chart functions.
+
+Each size builds a synthetic ledger (see benchmarks/synthetic.py) in a
+temporary directory and times every scenario against it. Results are written
+as JSON; compare mode fails when a stored baseline regresses.
+
+Usage:
+  python -m benchmarks.run --sizes 10k,100k,1m --output bench.json
+  python -m benchmarks.run --sizes 10k --compare baseline.json --threshold 0.25
+  python -m benchmarks.run --input bench.json --compare baseline.json
+"""
+
+import argparse
+import json
+import os
+import platform
+import shutil
+import sqlite3
+import statistics
+import sys
+import tempfile
+import time
+from datetime import datetime
+from typing import Callable, Dict, List, Optional, Tuple
+
+from config import settings
+from database import sharding
+from .synthetic import generate_ledger
+
+
+def parse_size(text: str) -> int:
+    """
+    "10k" -> 10000, "1m" -> 1000000, "2500" -> 2500
+    """
+    text = text.strip().lower()
+    factor = 1
+    if text.endswith("k"):
+        factor, text = 1000, text[:-1]
+    elif text.endswith("m"):
+        factor, text = 1000000, text[:-1]
+    return int(float(text) * factor)
+
+
+def time_call(fn: Callable, repeat: int) -> Dict:
+    """
+    Run fn `repeat` times (after one untimed warm-up) and return timing stats in seconds.
+    """
+    fn()
+    samples = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        samples.append(time.perf_counter() - start)
+    return {
+        "repeat": repeat,
+        "min_s": min(samples),
+        "median_s": statistics.median(samples),
+        "max_s": max(samples),
+    }
+
+
+def _scenarios(user_id: int) -> List[Tuple[str, Callable[[], object]]]:
+    from database import db
+    from finance import finance_service
+
+    return [
+        ("db.get_transactions_by_user", lambda: db.get_transactions_by_user(user_id)),
+        ("db.get_transactions_by_user[limit=10000]", lambda: db.get_transactions_by_user(user_id, limit=10000)),
+        ("db.get_balance", lambda: db.get_balance(user_id)),
+        ("db.get_monthly_summary", lambda: db.get_monthly_summary(user_id)),
+        ("db.get_category_totals", lambda: db.get_category_totals(user_id)),
+        ("finance.get_transactions_filtered", lambda: finance_service.get_transactions_filtered(user_id, category="Food")),
+        ("finance.export_transactions_csv", lambda: finance_service.export_transactions_csv(user_id)),
+    ]
+
+
+def _chart_scenarios(user_id: int) -> List[Tuple[str, Callable[[], object]]]:
+    import matplotlib
+    matplotlib.use("Agg")
+    import matplotlib.pyplot as plt
+    from database import db
+    from visualization import charts
+
+    txs = db.get_transactions_by_user(user_id, limit=10000)
+    summary = db.get_monthly_summary(user_id)
+
+    def _closing(fn, *args):
+        def run():
+            fig = fn(*args)
+            plt.close(fig)
+        return run
+
+    return [
+        ("charts.plot_monthly_summary", _closing(charts.plot_monthly_summary, summary)),
+        ("charts.pie_expense_by_category", _closing(charts.pie_expense_by_category, txs)),
+        ("charts.plot_income_vs_expense_bars", _closing(charts.plot_income_vs_expense_bars, summary)),
+        ("charts.plot_category_income_expense", _closing(charts.plot_category_income_expense, txs)),
+        ("charts.plot_cumulative_balance", _closing(charts.plot_cumulative_balance, txs)),
+    ]
+
+
+def run_suite(sizes: List[int], users: int, category_skew: float, days: int, repeat: int, seed: int,
+              charts: bool = True, only: Optional[str] = None) -> Dict:
+    results = []
+    for size in sizes:
+        workdir = tempfile.mkdtemp(prefix="finance_bench_")
+        db_path = os.path.join(workdir, "finance.db")
+        shard_dir = os.path.join(workdir, "shards")
+        previous = (settings.DB_PATH, settings.DATA_DIR, settings.SHARD_DIR)
+        try:
+            started = time.perf_counter()
+            info = generate_ledger(db_path, users=users, rows_per_user=max(size // users, 1),
+                                   category_skew=category_skew, days=days, seed=seed, shard_dir=shard_dir)
+            print(f"[{size:>9,} rows] generated in {time.perf_counter() - started:.1f}s", file=sys.stderr)
+            settings.DB_PATH, settings.DATA_DIR, settings.SHARD_DIR = db_path, workdir, shard_dir
+            paths = [sharding.shard_path(i) for i in range(settings.SHARD_COUNT)] if sharding.enabled() else [db_path]
+            for path in paths:
+                with sqlite3.connect(path) as conn:
+                    conn.execute("ANALYZE")
+
+            user_id = info["user_ids"][0]
+            scenarios = _scenarios(user_id)
+            if charts:
+                scenarios += _chart_scenarios(user_id)
+            for name, fn in scenarios:
+                if only and only not in name:
+                    continue
+                stats = time_call(fn, repeat)
+                results.append({"scenario": name, "size": size, **stats})
+                print(f"[{size:>9,} rows] {name:<45} median {stats['median_s'] * 1000:9.2f} ms", file=sys.stderr)
+        finally:
+            settings.DB_PATH, settings.DATA_DIR, settings.SHARD_DIR = previous
+            shutil.rmtree(workdir, ignore_errors=True)
+
+    return {
+        "meta": {
+            "created_at": datetime.utcnow().isoformat(),
+            "python": platform.python_version(),
+            "sqlite": sqlite3.sqlite_version,
+            "platform": platform.platform(),
+            "users": users, "category_skew": category_skew, "days": days, "repeat": repeat, "seed": seed,
+        },
+        "results": results,
+    }
+
+
+def compare(current: Dict, baseline: Dict, threshold: float) -> List[str]:
+    """
+    Return one message per scenario whose median is more than `threshold` (0.2 = 20%) slower than the baseline.
+    Scenarios missing from either side are ignored.
+    """
+    base = {(r["scenario"], r["size"]): r for r in baseline.get("results", [])}
+    regressions = []
+    for r in current.get("results", []):
+        b = base.get((r["scenario"], r["size"]))
+        if not b or b["median_s"] <= 0:
+            continue
+        ratio = r["median_s"] / b["median_s"]
+        if ratio > 1 + threshold:
+            regressions.append(
+                f"{r['scenario']} @ {r['size']:,} rows: {b['median_s'] * 1000:.2f} ms -> {r['median_s'] * 1000:.2f} ms ({ratio:.2f}x)"
+            )
+    return regressions
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Personal Finance Tracker benchmarks")
+    parser.add_argument("--sizes", default="10k,100k,1m", help="comma-separated total row counts (e.g. 10k,100k,1m)")
+    parser.add_argument("--users", type=int, default=100)
+    parser.add_argument("--category-skew", type=float, default=1.0)
+    parser.add_argument("--days", type=int, default=3 * 365, help="date span of generated transactions")
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--no-charts", action="store_true", help="skip matplotlib scenarios")
+    parser.add_argument("--only", default=None, help="run only scenarios whose name contains this text")
+    parser.add_argument("--output", default=None, help="write results JSON here")
+    parser.add_argument("--input", default=None, help="use an existing results JSON instead of running")
+    parser.add_argument("--compare", default=None, help="baseline results JSON to compare against")
+    parser.add_argument("--threshold", type=float, default=0.2, help="allowed slowdown before failing (0.2 = 20%%)")
+    args = parser.parse_args(argv)
+
+    if args.input:
+        with open(args.input, encoding="utf-8") as f:
+            current = json.load(f)
+    else:
+        sizes = [parse_size(s) for s in args.sizes.split(",") if s.strip()]
+        current = run_suite(sizes, args.users, args.category_skew, args.days, args.repeat, args.seed,
+                            charts=not args.no_charts, only=args.only)
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(current, f, indent=2)
+    elif not args.input:
+        print(json.dumps(current, indent=2))
+
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as f:
+            baseline = json.load(f)
+        regressions = compare(current, baseline, args.threshold)
+        if regressions:
+            print(f"{len(regressions)} regression(s) beyond {args.threshold:.0%}:", file=sys.stderr)
+            for line in regressions:
+                print("  " + line, file=sys.stderr)
+            return 1
+        print(f"No regressions beyond {args.threshold:.0%}", file=sys.stderr)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
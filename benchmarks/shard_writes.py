@@ -0,0 +1,106 @@
+"""
+Concurrent-writer benchmark for sharding.
+
+Starts several writer processes that each insert transactions one by one
+through database.db.add_transaction (one commit per write, as the API does)
+for random users, and reports total write throughput for each shard count.
+
+Usage:
+  python -m benchmarks.shard_writes --shards 0,1,2,4,8 --writers 8 --writes 500 --output shard_writes.json
+"""
+
+import argparse
+import json
+import multiprocessing
+import os
+import random
+import shutil
+import sys
+import tempfile
+import time
+from typing import Dict, List
+
+
+def _configure(workdir: str, shards: int) -> None:
+    from config import settings
+
+    settings.DB_PATH = os.path.join(workdir, "finance.db")
+    settings.SHARD_COUNT = shards
+    settings.SHARD_DIR = os.path.join(workdir, "shards")
+    settings.SLOW_QUERY_MS = 0
+
+
+def _writer(workdir: str, shards: int, users: int, writes: int, seed: int, start_event, result_queue) -> None:
+    _configure(workdir, shards)
+    from database import db
+
+    rng = random.Random(seed)
+    errors = 0
+    start_event.wait()
+    for _ in range(writes):
+        ok, _msg = db.add_transaction(rng.randint(1, users), "2026-01-01", 9.99, "Food", "expense", "bench")
+        if not ok:
+            errors += 1
+    result_queue.put(errors)
+
+
+def run(shards: int, writers: int, writes: int, users: int) -> Dict:
+    workdir = tempfile.mkdtemp(prefix="finance_shard_bench_")
+    try:
+        _configure(workdir, shards)
+        from database import db
+
+        db.init_db()
+        for u in range(users):
+            db.create_user(f"writer_{u}", "benchmark")
+
+        start_event = multiprocessing.Event()
+        results = multiprocessing.Queue()
+        procs = [
+            multiprocessing.Process(target=_writer, args=(workdir, shards, users, writes, seed, start_event, results))
+            for seed in range(writers)
+        ]
+        for p in procs:
+            p.start()
+        time.sleep(0.5)  # let every writer import and reach the start line
+        started = time.perf_counter()
+        start_event.set()
+        errors = sum(results.get() for _ in procs)
+        elapsed = time.perf_counter() - started
+        for p in procs:
+            p.join()
+        total = writers * writes
+        return {
+            "shards": shards, "writers": writers, "writes": total, "errors": errors,
+            "seconds": elapsed, "writes_per_second": (total - errors) / elapsed,
+        }
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Concurrent write throughput by shard count")
+    parser.add_argument("--shards", default="0,1,2,4,8", help="comma-separated shard counts (0 = single file)")
+    parser.add_argument("--writers", type=int, default=8, help="concurrent writer processes")
+    parser.add_argument("--writes", type=int, default=300, help="writes per writer")
+    parser.add_argument("--users", type=int, default=256)
+    parser.add_argument("--output", default=None, help="write results JSON here")
+    args = parser.parse_args(argv)
+
+    results: List[Dict] = []
+    for n in [int(s) for s in args.shards.split(",") if s.strip()]:
+        r = run(n, args.writers, args.writes, args.users)
+        results.append(r)
+        print(f"shards={n:<3} {r['writes_per_second']:9.0f} writes/s  ({r['errors']} errors, {r['seconds']:.2f}s)", file=sys.stderr)
+
+    payload = {"writers": args.writers, "writes_per_writer": args.writes, "results": results}
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(payload, f, indent=2)
+    else:
+        print(json.dumps(payload, indent=2))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
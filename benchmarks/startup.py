@@ -0,0 +1,123 @@
+"""
+Cold-start benchmark for the API entry point and CLI tools.
+
+Imports each entry point in a fresh interpreter under `python -X importtime`
+and reports the median of several runs:
+  total     cumulative import time of the entry point
+  own       time spent in this project's modules (self time, dependencies excluded)
+  heavy     heavy optional dependencies that got imported (should be none)
+
+With --check the budgets below are enforced (exit status 1 when one is exceeded
+or a heavy dependency is imported), so it can run as a CI gate:
+  python -m benchmarks.startup --check
+  python -m benchmarks.startup --runs 10 --output startup.json
+"""
+
+import argparse
+import json
+import os
+import re
+import statistics
+import subprocess
+import sys
+from typing import Dict, List
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+FIRST_PARTY = {"api", "auth", "config", "database", "finance", "utils", "visualization"}
+# Loaded on first use only; an entry point importing one of these is a regression
+HEAVY = ("matplotlib", "pandas", "dateutil", "sqlalchemy", "streamlit")
+
+# entry point -> (total budget ms, own-code budget ms). The total is dominated by
+# fastapi/pydantic for the API and leaves headroom for slower machines.
+BUDGETS: Dict[str, tuple] = {
+    "api.api_server": (1500.0, 100.0),
+    "finance.recurring": (300.0, 60.0),
+    "finance.currency": (300.0, 60.0),
+    "database.sharding": (300.0, 60.0),
+    "database.plan_guard": (300.0, 60.0),
+}
+
+_LINE_RE = re.compile(r"^import time:\s+(\d+) \|\s+(\d+) \| (\s*)(\S+)$")
+
+
+def measure_once(module: str) -> Dict:
+    proc = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        cwd=REPO_DIR, capture_output=True, text=True, env={**os.environ, "PYTHONDONTWRITEBYTECODE": "1"},
+    )
+    if proc.returncode != 0:
+        raise RuntimeError(f"importing {module} failed:\n{proc.stderr[-2000:]}")
+    total_us = own_us = 0
+    loaded = set()
+    for line in proc.stderr.splitlines():
+        m = _LINE_RE.match(line)
+        if not m:
+            continue
+        self_us, cumulative_us, indent, name = int(m.group(1)), int(m.group(2)), m.group(3), m.group(4)
+        root = name.split(".", 1)[0]
+        loaded.add(root)
+        if root in FIRST_PARTY:
+            own_us += self_us
+        if name == module and not indent:
+            total_us = cumulative_us
+    return {
+        "total_ms": total_us / 1000.0,
+        "own_ms": own_us / 1000.0,
+        "heavy": sorted(h for h in HEAVY if h in loaded),
+    }
+
+
+def measure(module: str, runs: int) -> Dict:
+    samples = [measure_once(module) for _ in range(runs)]
+    return {
+        "module": module,
+        "total_ms": statistics.median(s["total_ms"] for s in samples),
+        "own_ms": statistics.median(s["own_ms"] for s in samples),
+        "heavy": sorted(set().union(*(s["heavy"] for s in samples))),
+    }
+
+
+def check(result: Dict) -> List[str]:
+    total_budget, own_budget = BUDGETS[result["module"]]
+    problems = []
+    if result["total_ms"] > total_budget:
+        problems.append(f"{result['module']}: total {result['total_ms']:.0f}ms > {total_budget:.0f}ms")
+    if result["own_ms"] > own_budget:
+        problems.append(f"{result['module']}: own code {result['own_ms']:.0f}ms > {own_budget:.0f}ms")
+    if result["heavy"]:
+        problems.append(f"{result['module']}: imports {', '.join(result['heavy'])} at startup")
+    return problems
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Import-time cost of the API and CLI entry points")
+    parser.add_argument("--modules", default=",".join(BUDGETS), help="comma-separated entry points")
+    parser.add_argument("--runs", type=int, default=5, help="fresh interpreters per entry point (median is reported)")
+    parser.add_argument("--check", action="store_true", help="exit 1 if a budget is exceeded")
+    parser.add_argument("--output", default=None, help="write results JSON here")
+    args = parser.parse_args(argv)
+
+    results, problems = [], []
+    for module in [m.strip() for m in args.modules.split(",") if m.strip()]:
+        r = measure(module, args.runs)
+        results.append(r)
+        heavy = f"  heavy: {', '.join(r['heavy'])}" if r["heavy"] else ""
+        print(f"{module:<22} total {r['total_ms']:7.1f}ms  own {r['own_ms']:6.1f}ms{heavy}", file=sys.stderr)
+        if module in BUDGETS:
+            problems.extend(check(r))
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump({"runs": args.runs, "results": results}, f, indent=2)
+    if args.check:
+        if problems:
+            print(f"{len(problems)} startup budget violation(s):")
+            for p in problems:
+                print("  " + p)
+            return 1
+        print(f"OK: {len(results)} entry points within their startup budgets")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
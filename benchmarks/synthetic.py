@@ -0,0 +1,116 @@
+"""
+Deterministic synthetic ledger generator for benchmarks.
+
+The same parameters (and seed) always produce the same database, so timings
+from different runs or branches are comparable.
+"""
+
+import random
+import sqlite3
+from datetime import date, timedelta
+from typing import Dict, List, Optional
+
+from database.db import init_db, _hash_password
+
+EXPENSE_CATEGORIES = ["Food", "Transport", "Rent", "Entertainment", "Utilities", "Other"]
+INCOME_CATEGORIES = ["Salary", "Freelance", "Gift", "Investment"]
+DESCRIPTIONS = ["Groceries", "Coffee", "Bus ticket", "Monthly rent", "Cinema", "Electricity", "Misc", None]
+
+
+def zipf_weights(n: int, skew: float) -> List[float]:
+    """
+    Weights for n ranked items: item k gets 1 / k**skew (skew 0 = uniform).
+    """
+    return [1.0 / (k ** skew) for k in range(1, n + 1)]
+
+
+def generate_ledger(db_path: str, users: int = 10, rows_per_user: int = 1000, category_skew: float = 1.0,
+                    start_date: str = "2022-01-01", days: int = 3 * 365, income_ratio: float = 0.1,
+                    seed: int = 42, batch_size: int = 50000, shard_dir: Optional[str] = None) -> Dict:
+    """
+    Create (or extend) the database at db_path with `users` users holding `rows_per_user`
+    transactions each, spread uniformly over `days` days from start_date.
+    Categories follow a Zipf distribution with exponent `category_skew`.
+    With sharding on (settings.SHARD_COUNT > 0) the users go into the directory database
+    and each user's transactions into their shard, under shard_dir (default settings.SHARD_DIR).
+    Returns a dict describing what was generated.
+    """
+    from config import settings
+    from database import sharding
+
+    shard_dir = shard_dir or settings.SHARD_DIR
+    previous = (settings.DB_PATH, settings.SHARD_DIR)
+    settings.DB_PATH, settings.SHARD_DIR = db_path, shard_dir
+    try:
+        init_db()
+    finally:
+        settings.DB_PATH, settings.SHARD_DIR = previous
+
+    rng = random.Random(seed)
+    first = date.fromisoformat(start_date)
+    day_strings = [(first + timedelta(days=i)).isoformat() for i in range(days)]
+    exp_weights = zipf_weights(len(EXPENSE_CATEGORIES), category_skew)
+    inc_weights = zipf_weights(len(INCOME_CATEGORIES), category_skew)
+    pw_hash = _hash_password("benchmark")
+
+    def ledger_path(user_id: int) -> str:
+        if not sharding.enabled():
+            return db_path
+        return sharding.shard_path(sharding.shard_for_user(user_id), shard_dir)
+
+    conn = sqlite3.connect(sharding.directory_path(shard_dir) if sharding.enabled() else db_path)
+    cur = conn.cursor()
+    user_ids = []
+    for u in range(users):
+        cur.execute(
+            "INSERT INTO users (username, password_hash, created_at) VALUES (?, ?, ?)",
+            (f"bench_{seed}_{u}", pw_hash, start_date)
+        )
+        user_ids.append(cur.lastrowid)
+    conn.commit()
+    conn.close()
+
+    ledgers: Dict[str, sqlite3.Connection] = {}
+    batches: Dict[str, List[tuple]] = {}
+
+    def flush(path: str) -> int:
+        if path not in ledgers:
+            ledgers[path] = sqlite3.connect(path)
+        ledgers[path].executemany(
+            "INSERT INTO transactions (user_id, date, amount, category, ttype, description) VALUES (?, ?, ?, ?, ?, ?)",
+            batches[path]
+        )
+        count = len(batches[path])
+        batches[path] = []
+        return count
+
+    total = 0
+    for user_id in user_ids:
+        path = ledger_path(user_id)
+        batch = batches.setdefault(path, [])
+        for _ in range(rows_per_user):
+            if rng.random() < income_ratio:
+                ttype = "income"
+                category = rng.choices(INCOME_CATEGORIES, inc_weights)[0]
+                amount = round(rng.uniform(500, 5000), 2)
+            else:
+                ttype = "expense"
+                category = rng.choices(EXPENSE_CATEGORIES, exp_weights)[0]
+                amount = round(rng.lognormvariate(3.5, 1.0), 2) or 0.01
+            batch.append((user_id, rng.choice(day_strings), amount, category, ttype, rng.choice(DESCRIPTIONS)))
+            if len(batch) >= batch_size:
+                total += flush(path)
+                batch = batches[path]
+    for path, batch in batches.items():
+        if batch:
+            total += flush(path)
+    for ledger in ledgers.values():
+        ledger.commit()
+        ledger.close()
+
+    return {
+        "db_path": db_path, "shard_dir": shard_dir if sharding.enabled() else None,
+        "users": users, "rows_per_user": rows_per_user, "rows": total,
+        "category_skew": category_skew, "start_date": start_date, "days": days, "seed": seed,
+        "user_ids": user_ids,
+    }
@@ -0,0 +1,169 @@
+"""
+API throughput by worker count.
+
+Seeds a temporary database, starts `api.launcher` with 1, 2, 4, ... workers
+and drives GET /transactions from several client processes over keep-alive
+connections for a fixed time, reporting requests per second and the speedup
+over one worker. Rate limiting is disabled for the run.
+
+Usage:
+  python -m benchmarks.workers --workers 1,2,4 --concurrency 32 --seconds 10
+"""
+
+import argparse
+import http.client
+import json
+import multiprocessing
+import os
+import shutil
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+from typing import Dict, List
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+_SERVER = """
+import sys
+from config import settings
+settings.DATA_DIR = {data_dir!r}
+settings.DB_PATH = {db_path!r}
+settings.SLOW_QUERY_MS = 0
+from api import launcher
+sys.exit(launcher.main(["--port", "{port}", "--workers", "{workers}", "--max-requests", "0"]))
+"""
+
+
+def _free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def _seed(workdir: str, users: int, per_user: int) -> str:
+    from config import settings
+
+    previous = (settings.DB_PATH, settings.SHARD_COUNT)
+    settings.DB_PATH = os.path.join(workdir, "finance.db")
+    settings.SHARD_COUNT = 0
+    try:
+        from database import db, write_queue
+
+        db.init_db()
+        for u in range(users):
+            db.create_user(f"bench_{u}", "benchmark")
+            for i in range(per_user):
+                db.add_transaction(u + 1, f"2026-{i % 12 + 1:02d}-{i % 28 + 1:02d}", 10.0 + i % 90, "Food", "expense", "bench")
+        write_queue.close_all()
+        return settings.DB_PATH
+    finally:
+        settings.DB_PATH, settings.SHARD_COUNT = previous
+
+
+def _wait_ready(port: int, timeout: float = 30.0) -> None:
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            conn = http.client.HTTPConnection("127.0.0.1", port, timeout=2)
+            conn.request("GET", "/")
+            if conn.getresponse().status == 200:
+                return
+        except OSError:
+            time.sleep(0.2)
+    raise RuntimeError(f"server on port {port} did not start")
+
+
+def _client(port: int, connections: int, users: int, seconds: float, start_at: float, out) -> None:
+    import threading
+
+    counts = []
+
+    def _loop(n: int) -> None:
+        conn = http.client.HTTPConnection("127.0.0.1", port, timeout=30)
+        ok = errors = 0
+        while time.time() < start_at:
+            time.sleep(0.001)
+        end = start_at + seconds
+        while time.time() < end:
+            try:
+                conn.request("GET", f"/transactions?user_id={n % users + 1}")
+                resp = conn.getresponse()
+                resp.read()
+                ok += resp.status == 200
+                errors += resp.status != 200
+            except (OSError, http.client.HTTPException):
+                errors += 1
+                conn.close()
+                conn = http.client.HTTPConnection("127.0.0.1", port, timeout=30)
+        counts.append((ok, errors))
+
+    threads = [threading.Thread(target=_loop, args=(os.getpid() + i,)) for i in range(connections)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    out.put((sum(c[0] for c in counts), sum(c[1] for c in counts)))
+
+
+def run(workers: int, db_path: str, concurrency: int, client_procs: int, users: int, seconds: float) -> Dict:
+    port = _free_port()
+    code = _SERVER.format(data_dir=os.path.dirname(db_path), db_path=db_path, port=port, workers=workers)
+    env = {**os.environ, "FINANCE_RATE_LIMIT_ENABLED": "0", "FINANCE_COMPRESSION_MIN_BYTES": "0"}
+    server = subprocess.Popen([sys.executable, "-c", code], cwd=REPO_DIR, env=env, stdout=subprocess.DEVNULL)
+    try:
+        _wait_ready(port)
+        out = multiprocessing.Queue()
+        start_at = time.time() + 1.0
+        per_proc = [concurrency // client_procs + (i < concurrency % client_procs) for i in range(client_procs)]
+        procs = [
+            multiprocessing.Process(target=_client, args=(port, n, users, seconds, start_at, out))
+            for n in per_proc if n
+        ]
+        for p in procs:
+            p.start()
+        results = [out.get() for _ in procs]
+        for p in procs:
+            p.join()
+    finally:
+        server.terminate()
+        server.wait(timeout=60)
+    ok = sum(r[0] for r in results)
+    return {"workers": workers, "requests": ok, "errors": sum(r[1] for r in results), "requests_per_second": ok / seconds}
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="API throughput with 1..N worker processes")
+    parser.add_argument("--workers", default="1,2,4", help="comma-separated worker counts")
+    parser.add_argument("--concurrency", type=int, default=32, help="concurrent keep-alive connections")
+    parser.add_argument("--client-procs", type=int, default=max(1, min(8, (os.cpu_count() or 2) // 2)))
+    parser.add_argument("--seconds", type=float, default=10.0)
+    parser.add_argument("--users", type=int, default=20)
+    parser.add_argument("--transactions", type=int, default=200, help="transactions per user")
+    parser.add_argument("--output", default=None, help="write results JSON here")
+    args = parser.parse_args(argv)
+
+    workdir = tempfile.mkdtemp(prefix="finance_workers_bench_")
+    results: List[Dict] = []
+    try:
+        db_path = _seed(workdir, args.users, args.transactions)
+        for n in [int(w) for w in args.workers.split(",") if w.strip()]:
+            r = run(n, db_path, args.concurrency, args.client_procs, args.users, args.seconds)
+            results.append(r)
+            speedup = r["requests_per_second"] / results[0]["requests_per_second"] if results[0]["requests_per_second"] else 0.0
+            print(f"{n:>3} worker(s) {r['requests_per_second']:9.0f} req/s  x{speedup:.2f}  ({r['errors']} errors)", file=sys.stderr)
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    payload = {"cpus": os.cpu_count(), "concurrency": args.concurrency, "seconds": args.seconds, "results": results}
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(payload, f, indent=2)
+    else:
+        print(json.dumps(payload, indent=2))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,23 @@
+"""
+Python client for the finance API (api.api_server): FinanceClient for blocking
+code, AsyncFinanceClient for asyncio. Both keep connections alive, retry
+refused and failed-to-connect requests with backoff, and decode transactions
+into database.models.Transaction.
+"""
+
+from .base import AddResult, ApiError, BatchResult, ClientError, NewTransaction, RetryPolicy, TransportError
+from .sync import FinanceClient, TransactionBatch
+from .aio import AsyncFinanceClient
+
+__all__ = [
+    "FinanceClient",
+    "AsyncFinanceClient",
+    "TransactionBatch",
+    "RetryPolicy",
+    "NewTransaction",
+    "AddResult",
+    "BatchResult",
+    "ClientError",
+    "ApiError",
+    "TransportError",
+]
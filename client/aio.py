@@ -0,0 +1,248 @@
+"""
+asyncio client for the finance API.
+
+Besides the calls of FinanceClient, add_transaction batches automatically:
+adds for the same user that arrive within `batch_window_ms` of each other
+(typically from concurrent tasks) go to POST /transactions/batch together,
+one commit instead of one per add, and each caller still gets its own result
+or error. A lone add goes to POST /transactions as usual.
+"""
+
+import asyncio
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+import httpx
+
+from database.models import Transaction
+from . import base
+from .base import AddResult, ApiError, BatchResult, NewTransaction, RetryPolicy
+
+_Pending = List[Tuple[NewTransaction, "asyncio.Future[AddResult]"]]
+
+
+class AsyncFinanceClient:
+    """
+    One keep-alive connection pool per client; use one client for the whole program.
+
+        async with AsyncFinanceClient("http://localhost:8001") as api:
+            results = await asyncio.gather(*(api.add_transaction(uid, d, a, "expense") for d, a in rows))
+
+    batch_window_ms=0 turns automatic batching off.
+    """
+
+    def __init__(self, base_url: str, timeout: float = base.DEFAULT_TIMEOUT, pool_size: int = base.DEFAULT_POOL_SIZE,
+                 retry: Optional[RetryPolicy] = None, batch_window_ms: float = 5.0, batch_max: int = base.BATCH_MAX,
+                 transport: Optional[httpx.AsyncBaseTransport] = None):
+        self.retry = retry or RetryPolicy()
+        self.batch_window = batch_window_ms / 1000.0
+        self.batch_max = min(batch_max, base.BATCH_MAX)
+        self._http = httpx.AsyncClient(
+            base_url=base_url,
+            timeout=timeout,
+            limits=httpx.Limits(max_connections=pool_size, max_keepalive_connections=pool_size),
+            transport=transport,
+        )
+        self._pending: Dict[int, _Pending] = {}
+        self._timers: Dict[int, asyncio.TimerHandle] = {}
+        self._senders: Dict[int, "asyncio.Task[None]"] = {}
+        self._flushes: set = set()
+
+    async def aclose(self) -> None:
+        """
+        Send the adds still waiting for their batch, then close the connections.
+        """
+        await self.flush()
+        await self._http.aclose()
+
+    async def __aenter__(self) -> "AsyncFinanceClient":
+        return self
+
+    async def __aexit__(self, *exc) -> None:
+        await self.aclose()
+
+    async def _call(self, method: str, path: str, decode: Callable[[Dict], Any], **kwargs) -> Any:
+        attempt = 0
+        while True:
+            response, error = None, None
+            try:
+                response = await self._http.request(method, path, **kwargs)
+                if response.status_code < 400:
+                    return decode(response.json())
+            except httpx.TransportError as e:
+                error = e
+            delay = base.retry_delay(self.retry, attempt, method, response, error)
+            if delay is None:
+                raise base.transport_error(error) if error is not None else base.api_error(response)
+            attempt += 1
+            await asyncio.sleep(delay)
+
+    # ----------------- Auth -----------------
+    async def register(self, username: str, password: str) -> str:
+        return await self._call("POST", "/auth/register", lambda b: b["message"], json={"username": username, "password": password})
+
+    async def login(self, username: str, password: str) -> Dict[str, Any]:
+        """
+        The user ({"id", "username", ...}); ApiError 401 on bad credentials.
+        """
+        return await self._call("POST", "/auth/login", lambda b: b["user"], json={"username": username, "password": password})
+
+    # ----------------- Transactions -----------------
+    async def transactions(self, user_id: int) -> List[Transaction]:
+        return await self._call("GET", "/transactions", base.transactions, params={"user_id": user_id})
+
+    async def changes(self, user_id: int, since: int = 0, limit: int = 1000) -> Dict[str, Any]:
+        """
+        Delta sync page: {"full", "watermark", "more", "upserts": [Transaction], "deletes": [id]}.
+        """
+        return await self._call("GET", "/transactions/changes", base.changes, params={"user_id": user_id, "since": since, "limit": limit})
+
+    async def add_transaction(self, user_id: int, date_iso: str, amount: float, ttype: str, category: Optional[str] = None,
+                              description: Optional[str] = None, currency: Optional[str] = None) -> AddResult:
+        """
+        Add one transaction, batched with concurrent adds for the same user. A batched
+        result carries the new id and category; its anomaly is set only when flagged.
+        """
+        item = NewTransaction(date_iso, amount, ttype, category, description, currency)
+        if self.batch_window <= 0:
+            return await self._add_one(user_id, item)
+        future = asyncio.get_running_loop().create_future()
+        pending = self._pending.setdefault(user_id, [])
+        pending.append((item, future))
+        if len(pending) >= self.batch_max:
+            self._start_flush(user_id)
+        elif user_id not in self._timers:
+            self._timers[user_id] = asyncio.get_running_loop().call_later(self.batch_window, self._start_flush, user_id)
+        return await future
+
+    async def add_transactions(self, user_id: int, items: List[NewTransaction]) -> BatchResult:
+        """
+        Add transactions in one commit per base.BATCH_MAX items (all or nothing per request).
+        """
+        results = [
+            await self._call("POST", "/transactions/batch", base.batch_result, params={"user_id": user_id},
+                             json={"transactions": [item.to_json() for item in items[i:i + base.BATCH_MAX]]})
+            for i in range(0, len(items), base.BATCH_MAX)
+        ]
+        return BatchResult(
+            "; ".join(r.message for r in results),
+            [i for r in results for i in r.ids],
+            [c for r in results for c in r.categories],
+            [a for r in results for a in r.anomalies],
+        )
+
+    async def update_transaction(self, user_id: int, tx_id: int, date_iso: str, amount: float, category: str, ttype: str,
+                                 description: Optional[str] = None, currency: Optional[str] = None) -> AddResult:
+        body = {"date_iso": date_iso, "amount": amount, "category": category, "ttype": ttype, "description": description, "currency": currency}
+        return await self._call("PUT", f"/transactions/{tx_id}", base.add_result, params={"user_id": user_id}, json=body)
+
+    async def delete_transaction(self, user_id: int, tx_id: int) -> str:
+        return await self._call("DELETE", f"/transactions/{tx_id}", lambda b: b["message"], params={"user_id": user_id})
+
+    # ----------------- Reports -----------------
+    async def categories(self, ttype: str) -> List[str]:
+        return await self._call("GET", "/categories", lambda b: b["categories"], params={"ttype": ttype})
+
+    async def balance(self, user_id: int, currency: Optional[str] = None) -> float:
+        return await self._call("GET", "/balance", lambda b: float(b["balance"]), params=_params(user_id, currency))
+
+    async def monthly_summary(self, user_id: int, currency: Optional[str] = None) -> List[Dict[str, Any]]:
+        """
+        [{"month": "YYYY-MM", "income": ..., "expense": ...}] in `currency`.
+        """
+        return await self._call("GET", "/monthly-summary", lambda b: b["summary"], params=_params(user_id, currency))
+
+    async def export_csv(self, user_id: int) -> Tuple[str, str]:
+        """
+        (CSV content, file name).
+        """
+        return await self._call("GET", "/export-csv", lambda b: (b["csv"], b["filename"]), params={"user_id": user_id})
+
+    # ----------------- Automatic batching -----------------
+    async def flush(self) -> None:
+        """
+        Send every waiting add now and wait until all sends have finished.
+        """
+        for user_id in list(self._pending):
+            self._start_flush(user_id)
+        while self._flushes:
+            await asyncio.gather(*self._flushes, return_exceptions=True)
+
+    def _start_flush(self, user_id: int) -> None:
+        timer = self._timers.pop(user_id, None)
+        if timer is not None:
+            timer.cancel()
+        if user_id in self._senders or not self._pending.get(user_id):
+            return  # the running sender takes whatever is waiting once its batch is done
+        task = asyncio.get_running_loop().create_task(self._drain(user_id))
+        self._senders[user_id] = task
+        self._flushes.add(task)
+        task.add_done_callback(self._flushes.discard)
+
+    async def _drain(self, user_id: int) -> None:
+        # One batch in flight per user: adds arriving meanwhile (e.g. while a batch waits
+        # out a 429's Retry-After) go out together in the next one instead of each
+        # spending a request on its own
+        try:
+            while self._pending.get(user_id):
+                timer = self._timers.pop(user_id, None)
+                if timer is not None:
+                    timer.cancel()
+                pending = self._pending.pop(user_id)
+                if len(pending) > self.batch_max:
+                    pending, self._pending[user_id] = pending[:self.batch_max], pending[self.batch_max:]
+                await self._send(user_id, pending)
+        finally:
+            del self._senders[user_id]
+
+    async def _add_one(self, user_id: int, item: NewTransaction) -> AddResult:
+        return await self._call("POST", "/transactions", base.add_result, params={"user_id": user_id}, json=item.to_json())
+
+    async def _send(self, user_id: int, pending: _Pending) -> None:
+        while pending:
+            if len(pending) == 1:
+                item, future = pending[0]
+                await _settle(future, self._add_one(user_id, item))
+                return
+            try:
+                result = await self._call("POST", "/transactions/batch", base.batch_result, params={"user_id": user_id},
+                                          json={"transactions": [item.to_json() for item, _ in pending]})
+            except ApiError as e:
+                # A rejected batch names its first invalid item: fail that add alone, retry the rest
+                failed = base.failed_item(e, len(pending))
+                if failed is None:
+                    _fail_all(pending, e)
+                    return
+                index, message = failed
+                _, future = pending.pop(index)
+                if not future.done():
+                    future.set_exception(ApiError(e.status_code, message))
+                continue
+            except Exception as e:
+                _fail_all(pending, e)
+                return
+            flagged = {a["id"]: a for a in result.anomalies}
+            for (_, future), tx_id, category in zip(pending, result.ids, result.categories):
+                if not future.done():
+                    future.set_result(AddResult("Saved", flagged.get(tx_id), tx_id, category))
+            return
+
+
+async def _settle(future: "asyncio.Future", call) -> None:
+    try:
+        result = await call
+    except Exception as e:
+        if not future.done():
+            future.set_exception(e)
+    else:
+        if not future.done():
+            future.set_result(result)
+
+
+def _fail_all(pending: _Pending, error: Exception) -> None:
+    for _, future in pending:
+        if not future.done():
+            future.set_exception(error)
+
+
+def _params(user_id: int, currency: Optional[str]) -> Dict[str, Any]:
+    return {"user_id": user_id, "currency": currency} if currency else {"user_id": user_id}
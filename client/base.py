@@ -0,0 +1,163 @@
+"""
+Pieces shared by the sync and asyncio clients: errors, the retry policy,
+request/response models and decoding.
+"""
+
+import random
+from dataclasses import dataclass, asdict
+from typing import Any, Dict, List, Optional, Tuple
+
+import httpx
+
+from database.models import Transaction
+
+DEFAULT_TIMEOUT = 10.0  # seconds, per request attempt
+DEFAULT_POOL_SIZE = 10  # keep-alive connections
+BATCH_MAX = 500  # transactions per POST /transactions/batch (the server accepts up to settings.BATCH_MAX_TRANSACTIONS)
+
+IDEMPOTENT_METHODS = frozenset({"GET", "HEAD", "PUT", "DELETE"})
+# Refused by admission control before the request was handled: safe to retry any method
+REFUSED_STATUSES = frozenset({429, 503})
+# The request may have been handled: retried for idempotent methods only
+GATEWAY_STATUSES = frozenset({502, 504})
+
+
+class ClientError(Exception):
+    pass
+
+
+class TransportError(ClientError):
+    """
+    The server could not be reached or didn't answer in time (after retries).
+    """
+
+
+class ApiError(ClientError):
+    """
+    The server answered with an error status; `detail` is its message.
+    """
+
+    def __init__(self, status_code: int, detail: str):
+        super().__init__(f"{status_code}: {detail}")
+        self.status_code = status_code
+        self.detail = detail
+
+
+@dataclass
+class RetryPolicy:
+    attempts: int = 3  # including the first
+    backoff: float = 0.2  # seconds before the first retry, doubled per attempt
+    max_backoff: float = 5.0
+
+    def delay(self, attempt: int, retry_after: Optional[str] = None) -> float:
+        """
+        Seconds to wait before retry number `attempt` + 1: full-jitter exponential backoff,
+        but never less than the server's Retry-After.
+        """
+        wait = random.uniform(0, min(self.max_backoff, self.backoff * (2 ** attempt)))
+        if retry_after:
+            try:
+                wait = max(wait, float(retry_after))
+            except ValueError:
+                pass
+        return wait
+
+
+def retry_delay(policy: RetryPolicy, attempt: int, method: str, response: Optional[httpx.Response],
+                error: Optional[Exception]) -> Optional[float]:
+    """
+    Seconds to wait before retrying a failed attempt, or None when it must not be retried.
+    """
+    if attempt + 1 >= policy.attempts:
+        return None
+    if error is not None:
+        # Connecting failed: the request never left, so even a POST can go again
+        sent = not isinstance(error, (httpx.ConnectError, httpx.ConnectTimeout, httpx.PoolTimeout))
+        if sent and method not in IDEMPOTENT_METHODS:
+            return None
+        return policy.delay(attempt)
+    status = response.status_code
+    if status in REFUSED_STATUSES or (status in GATEWAY_STATUSES and method in IDEMPOTENT_METHODS):
+        return policy.delay(attempt, response.headers.get("retry-after"))
+    return None
+
+
+def api_error(response: httpx.Response) -> ApiError:
+    try:
+        detail = response.json().get("detail", response.text)
+    except ValueError:
+        detail = response.text
+    return ApiError(response.status_code, detail if isinstance(detail, str) else str(detail))
+
+
+def transport_error(error: Exception) -> TransportError:
+    return TransportError(str(error) or type(error).__name__)
+
+
+# ----------------- Models -----------------
+@dataclass
+class NewTransaction:
+    """
+    A transaction to add. Without a category the user's categorization rules pick one.
+    """
+    date_iso: str
+    amount: float
+    ttype: str  # "income" or "expense"
+    category: Optional[str] = None
+    description: Optional[str] = None
+    currency: Optional[str] = None
+
+    def to_json(self) -> Dict[str, Any]:
+        return asdict(self)
+
+
+@dataclass
+class AddResult:
+    message: str
+    anomaly: Optional[Dict] = None  # {"anomaly": bool, "score": ..., ...} for expenses
+    id: Optional[int] = None  # known when the add went through the batch endpoint
+    category: Optional[str] = None  # the category it was stored with, likewise
+
+
+@dataclass
+class BatchResult:
+    message: str
+    ids: List[int]
+    categories: List[str]
+    anomalies: List[Dict]  # flagged expenses only, with their "id"
+
+
+def transaction(row: Dict[str, Any]) -> Transaction:
+    return Transaction(
+        id=row["id"], user_id=row["user_id"], date=row["date"], amount=float(row["amount"]),
+        category=row["category"], ttype=row["ttype"], description=row.get("description"),
+        currency=row.get("currency"),
+    )
+
+
+def transactions(body: Dict[str, Any]) -> List[Transaction]:
+    return [transaction(row) for row in body["transactions"]]
+
+
+def add_result(body: Dict[str, Any]) -> AddResult:
+    return AddResult(body.get("message", ""), body.get("anomaly"))
+
+
+def batch_result(body: Dict[str, Any]) -> BatchResult:
+    return BatchResult(body.get("message", ""), body["ids"], body["categories"], body.get("anomalies", []))
+
+
+def changes(body: Dict[str, Any]) -> Dict[str, Any]:
+    return {**body, "upserts": [transaction(row) for row in body["upserts"]]}
+
+
+def failed_item(error: ApiError, size: int) -> Optional[Tuple[int, str]]:
+    """
+    (index, message) of the item a rejected batch names ("Transaction 3: ..."), if any.
+    """
+    if error.status_code != 400 or not error.detail.startswith("Transaction "):
+        return None
+    number, _, message = error.detail[len("Transaction "):].partition(": ")
+    if not number.isdigit() or not 1 <= int(number) <= size:
+        return None
+    return int(number) - 1, message
@@ -0,0 +1,173 @@
+"""
+Blocking client for the finance API.
+"""
+
+import time
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+import httpx
+
+from database.models import Transaction
+from . import base
+from .base import AddResult, BatchResult, NewTransaction, RetryPolicy
+
+
+class FinanceClient:
+    """
+    One keep-alive connection pool per client; share a client between threads
+    instead of creating one per call.
+
+        with FinanceClient("http://localhost:8001") as api:
+            user = api.login("alice", "secret")
+            txs = api.transactions(user["id"])
+    """
+
+    def __init__(self, base_url: str, timeout: float = base.DEFAULT_TIMEOUT, pool_size: int = base.DEFAULT_POOL_SIZE,
+                 retry: Optional[RetryPolicy] = None, transport: Optional[httpx.BaseTransport] = None):
+        self.retry = retry or RetryPolicy()
+        self._http = httpx.Client(
+            base_url=base_url,
+            timeout=timeout,
+            limits=httpx.Limits(max_connections=pool_size, max_keepalive_connections=pool_size),
+            transport=transport,
+        )
+
+    def close(self) -> None:
+        self._http.close()
+
+    def __enter__(self) -> "FinanceClient":
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.close()
+
+    def _call(self, method: str, path: str, decode: Callable[[Dict], Any], **kwargs) -> Any:
+        attempt = 0
+        while True:
+            response, error = None, None
+            try:
+                response = self._http.request(method, path, **kwargs)
+                if response.status_code < 400:
+                    return decode(response.json())
+            except httpx.TransportError as e:
+                error = e
+            delay = base.retry_delay(self.retry, attempt, method, response, error)
+            if delay is None:
+                raise base.transport_error(error) if error is not None else base.api_error(response)
+            attempt += 1
+            time.sleep(delay)
+
+    # ----------------- Auth -----------------
+    def register(self, username: str, password: str) -> str:
+        return self._call("POST", "/auth/register", lambda b: b["message"], json={"username": username, "password": password})
+
+    def login(self, username: str, password: str) -> Dict[str, Any]:
+        """
+        The user ({"id", "username", ...}); ApiError 401 on bad credentials.
+        """
+        return self._call("POST", "/auth/login", lambda b: b["user"], json={"username": username, "password": password})
+
+    # ----------------- Transactions -----------------
+    def transactions(self, user_id: int) -> List[Transaction]:
+        return self._call("GET", "/transactions", base.transactions, params={"user_id": user_id})
+
+    def changes(self, user_id: int, since: int = 0, limit: int = 1000) -> Dict[str, Any]:
+        """
+        Delta sync page: {"full", "watermark", "more", "upserts": [Transaction], "deletes": [id]}.
+        """
+        return self._call("GET", "/transactions/changes", base.changes, params={"user_id": user_id, "since": since, "limit": limit})
+
+    def add_transaction(self, user_id: int, date_iso: str, amount: float, ttype: str, category: Optional[str] = None,
+                        description: Optional[str] = None, currency: Optional[str] = None) -> AddResult:
+        item = NewTransaction(date_iso, amount, ttype, category, description, currency)
+        return self._call("POST", "/transactions", base.add_result, params={"user_id": user_id}, json=item.to_json())
+
+    def add_transactions(self, user_id: int, items: List[NewTransaction]) -> BatchResult:
+        """
+        Add transactions in one commit per base.BATCH_MAX items (all or nothing per request).
+        """
+        results = [
+            self._call("POST", "/transactions/batch", base.batch_result, params={"user_id": user_id},
+                       json={"transactions": [item.to_json() for item in items[i:i + base.BATCH_MAX]]})
+            for i in range(0, len(items), base.BATCH_MAX)
+        ]
+        return BatchResult(
+            "; ".join(r.message for r in results),
+            [i for r in results for i in r.ids],
+            [c for r in results for c in r.categories],
+            [a for r in results for a in r.anomalies],
+        )
+
+    def batch(self, user_id: int, max_size: int = base.BATCH_MAX) -> "TransactionBatch":
+        return TransactionBatch(self, user_id, max_size)
+
+    def update_transaction(self, user_id: int, tx_id: int, date_iso: str, amount: float, category: str, ttype: str,
+                           description: Optional[str] = None, currency: Optional[str] = None) -> AddResult:
+        body = {"date_iso": date_iso, "amount": amount, "category": category, "ttype": ttype, "description": description, "currency": currency}
+        return self._call("PUT", f"/transactions/{tx_id}", base.add_result, params={"user_id": user_id}, json=body)
+
+    def delete_transaction(self, user_id: int, tx_id: int) -> str:
+        return self._call("DELETE", f"/transactions/{tx_id}", lambda b: b["message"], params={"user_id": user_id})
+
+    # ----------------- Reports -----------------
+    def categories(self, ttype: str) -> List[str]:
+        return self._call("GET", "/categories", lambda b: b["categories"], params={"ttype": ttype})
+
+    def balance(self, user_id: int, currency: Optional[str] = None) -> float:
+        return self._call("GET", "/balance", lambda b: float(b["balance"]), params=_params(user_id, currency))
+
+    def monthly_summary(self, user_id: int, currency: Optional[str] = None) -> List[Dict[str, Any]]:
+        """
+        [{"month": "YYYY-MM", "income": ..., "expense": ...}] in `currency`.
+        """
+        return self._call("GET", "/monthly-summary", lambda b: b["summary"], params=_params(user_id, currency))
+
+    def export_csv(self, user_id: int) -> Tuple[str, str]:
+        """
+        (CSV content, file name).
+        """
+        return self._call("GET", "/export-csv", lambda b: (b["csv"], b["filename"]), params={"user_id": user_id})
+
+
+def _params(user_id: int, currency: Optional[str]) -> Dict[str, Any]:
+    return {"user_id": user_id, "currency": currency} if currency else {"user_id": user_id}
+
+
+class TransactionBatch:
+    """
+    Collects adds and sends them to POST /transactions/batch max_size at a time; the
+    rest goes on leaving the `with` block (or flush()). `ids` grows as batches are sent.
+
+        with api.batch(user_id) as batch:
+            for row in rows:
+                batch.add(row.date, row.amount, "expense", description=row.text)
+    """
+
+    def __init__(self, client: FinanceClient, user_id: int, max_size: int = base.BATCH_MAX):
+        self.client = client
+        self.user_id = user_id
+        self.max_size = min(max_size, base.BATCH_MAX)
+        self.ids: List[int] = []
+        self.categories: List[str] = []
+        self._pending: List[NewTransaction] = []
+
+    def add(self, date_iso: str, amount: float, ttype: str, category: Optional[str] = None,
+            description: Optional[str] = None, currency: Optional[str] = None) -> None:
+        self._pending.append(NewTransaction(date_iso, amount, ttype, category, description, currency))
+        if len(self._pending) >= self.max_size:
+            self.flush()
+
+    def flush(self) -> None:
+        if not self._pending:
+            return
+        items, self._pending = self._pending, []
+        result = self.client.add_transactions(self.user_id, items)
+        self.ids += result.ids
+        self.categories += result.categories
+
+    def __enter__(self) -> "TransactionBatch":
+        return self
+
+    def __exit__(self, exc_type, exc, tb) -> None:
+        if exc_type is None:
+            self.flush()
@@ -6,7 +6,153 @@ DATA_DIR = os.path.join(BASE_DIR, "data")
 os.makedirs(DATA_DIR, exist_ok=True)
 
 DB_PATH = os.path.join(DATA_DIR, "finance.db")
+
+# Sharding: 0 keeps everything in DB_PATH. With N > 0, users live in
+# SHARD_DIR/directory.db and each user's data in one of N shard files.
+# Use `python -m database.sharding migrate` to split an existing DB_PATH.
+SHARD_COUNT = int(os.environ.get("FINANCE_SHARD_COUNT", "0"))
+SHARD_DIR = os.environ.get("FINANCE_SHARD_DIR", os.path.join(DATA_DIR, "shards"))
+
+# Storage backend behind database.db: "sqlite" (sqlite3 on DB_PATH, with sharding and
+# group commit) or "sqlalchemy" (SQLAlchemy Core on DATABASE_URL, e.g. a server database).
+STORAGE_BACKEND = os.environ.get("FINANCE_STORAGE_BACKEND", "sqlite")
+DATABASE_URL = os.environ.get("FINANCE_DATABASE_URL")  # None = sqlite:///DB_PATH
+DB_POOL_SIZE = int(os.environ.get("FINANCE_DB_POOL_SIZE", "5"))
+DB_POOL_RECYCLE = int(os.environ.get("FINANCE_DB_POOL_RECYCLE", "1800"))  # seconds, -1 = never
+DB_STATEMENT_CACHE_SIZE = int(os.environ.get("FINANCE_DB_STATEMENT_CACHE_SIZE", "500"))
 DEFAULT_CURRENCY = "USD"
+# Local exchange-rate file (date,currency,rate per line); rates are the value
+# of one unit of the currency in DEFAULT_CURRENCY. Loaded on API startup.
+EXCHANGE_RATES_FILE = os.path.join(DATA_DIR, "exchange_rates.csv")
+
+# Recurring transactions: how often the API process materializes due
+# occurrences (seconds, 0 disables the in-process scheduler) and how much
+# work a single run may do.
+RECURRING_INTERVAL_SECONDS = 3600
+RECURRING_BATCH_SIZE = 500
+RECURRING_MAX_PER_RULE = 366
+
+# Instrumentation: request/SQL timings and gauges exposed at GET /metrics.
+METRICS_ENABLED = os.environ.get("FINANCE_METRICS_ENABLED", "1") == "1"
+
+# Slow-query log: statements slower than this (milliseconds, 0 disables) are
+# logged with their shape, parameter types and query plan.
+SLOW_QUERY_MS = float(os.environ.get("FINANCE_SLOW_QUERY_MS", "200"))
+SLOW_QUERY_LOG_SIZE = 500
+SLOW_QUERY_LOG_FILE = os.environ.get("FINANCE_SLOW_QUERY_LOG", os.path.join(DATA_DIR, "slow_queries.log"))
+
+# Transaction change feed (GET /transactions/changes): tombstones of deleted
+# transactions are kept this long; clients that sync less often get a full reload.
+CHANGE_LOG_RETENTION_DAYS = int(os.environ.get("FINANCE_CHANGE_LOG_RETENTION_DAYS", "30"))
+CHANGE_LOG_COMPACT_INTERVAL_SECONDS = int(os.environ.get("FINANCE_CHANGE_LOG_COMPACT_INTERVAL_SECONDS", str(6 * 3600)))  # 0 disables the background compactor
+
+# Cold storage (python -m database.archive, sqlite backend): transactions older than
+# the horizon move to compressed per-year files in ARCHIVE_DIR (default: an
+# "archive" directory next to DB_PATH); reports read their daily rollups instead.
+ARCHIVE_DIR = os.environ.get("FINANCE_ARCHIVE_DIR")
+ARCHIVE_HORIZON_DAYS = int(os.environ.get("FINANCE_ARCHIVE_HORIZON_DAYS", "730"))
+
+# Online backups (python -m database.backup): snapshots go to BACKUP_DIR (None =
+# DATA_DIR/backups), copied BACKUP_PAGES_PER_STEP pages at a time with a pause
+# between steps so live requests keep their latency. BACKUP_INTERVAL_SECONDS > 0
+# also takes them from the API process; the newest BACKUP_RETAIN are kept.
+BACKUP_DIR = os.environ.get("FINANCE_BACKUP_DIR")
+BACKUP_PAGES_PER_STEP = int(os.environ.get("FINANCE_BACKUP_PAGES_PER_STEP", "256"))  # -1 = whole file in one step
+BACKUP_STEP_SLEEP_MS = int(os.environ.get("FINANCE_BACKUP_STEP_SLEEP_MS", "20"))
+BACKUP_MAX_RESTARTS = int(os.environ.get("FINANCE_BACKUP_MAX_RESTARTS", "3"))
+BACKUP_RETAIN = int(os.environ.get("FINANCE_BACKUP_RETAIN", "7"))
+BACKUP_INTERVAL_SECONDS = int(os.environ.get("FINANCE_BACKUP_INTERVAL_SECONDS", "0"))
+
+# Database maintenance (python -m database.maintenance, sqlite backend): every
+# MAINTENANCE_INTERVAL_SECONDS (0 disables) the API process runs PRAGMA optimize,
+# incremental vacuum in steps of MAINTENANCE_VACUUM_PAGES pages, a passive WAL
+# checkpoint and an integrity check ("quick", "full" or "off") on each file,
+# stopping once MAINTENANCE_BUDGET_MS of a file's time budget is spent.
+MAINTENANCE_INTERVAL_SECONDS = int(os.environ.get("FINANCE_MAINTENANCE_INTERVAL_SECONDS", "3600"))
+MAINTENANCE_BUDGET_MS = int(os.environ.get("FINANCE_MAINTENANCE_BUDGET_MS", "2000"))
+MAINTENANCE_VACUUM_PAGES = int(os.environ.get("FINANCE_MAINTENANCE_VACUUM_PAGES", "256"))
+MAINTENANCE_STEP_SLEEP_MS = int(os.environ.get("FINANCE_MAINTENANCE_STEP_SLEEP_MS", "20"))
+MAINTENANCE_INTEGRITY_CHECK = os.environ.get("FINANCE_MAINTENANCE_INTEGRITY_CHECK", "quick")
+
+# Production launcher (python -m api.launcher): worker processes forked from a parent
+# that initializes the schema once; each worker is recycled after API_MAX_REQUESTS
+# (+ up to API_MAX_REQUESTS_JITTER) requests, 0 = never.
+API_HOST = os.environ.get("FINANCE_API_HOST", "127.0.0.1")
+API_PORT = int(os.environ.get("FINANCE_API_PORT", "8000"))
+API_WORKERS = int(os.environ.get("FINANCE_API_WORKERS", str(os.cpu_count() or 1)))
+API_MAX_REQUESTS = int(os.environ.get("FINANCE_API_MAX_REQUESTS", "10000"))
+API_MAX_REQUESTS_JITTER = int(os.environ.get("FINANCE_API_MAX_REQUESTS_JITTER", "1000"))
+API_GRACEFUL_TIMEOUT = int(os.environ.get("FINANCE_API_GRACEFUL_TIMEOUT", "30"))
+# Set by the launcher in its workers: the parent already ran init_db/loaded rates,
+# and only one worker runs the background tasks (recurring scheduler, change-log
+# compactor, backups, database maintenance).
+INIT_DB_ON_STARTUP = True
+BACKGROUND_TASKS = True
+
+# Background jobs (finance.jobs): heavy exports run on a process pool; records and
+# results live in JOBS_DIR (None = DATA_DIR/jobs). Results are deleted after the TTL.
+JOBS_DIR = os.environ.get("FINANCE_JOBS_DIR")
+JOB_WORKERS = int(os.environ.get("FINANCE_JOB_WORKERS", "2"))
+JOB_MAX_ATTEMPTS = 3
+JOB_RESULT_TTL_SECONDS = int(os.environ.get("FINANCE_JOB_RESULT_TTL_SECONDS", str(24 * 3600)))
+
+# Fleet analytics (python -m database.analytics, GET /admin/analytics): user_id ranges are
+# aggregated on ANALYTICS_WORKERS processes (0 = one per CPU). Admin endpoints need the
+# X-Admin-Token header to equal ADMIN_TOKEN and are disabled while it is unset.
+ANALYTICS_WORKERS = int(os.environ.get("FINANCE_ANALYTICS_WORKERS", "0"))
+ADMIN_TOKEN = os.environ.get("FINANCE_ADMIN_TOKEN")
+# Sampling profiler (POST /admin/profile): stack sample interval and longest session.
+PROFILE_INTERVAL_MS = float(os.environ.get("FINANCE_PROFILE_INTERVAL_MS", "5"))
+PROFILE_MAX_SECONDS = int(os.environ.get("FINANCE_PROFILE_MAX_SECONDS", "60"))
+
+# Admission control (api.ratelimit): token buckets per user and route class,
+# (requests per second, burst), plus a cap on concurrently handled requests.
+# Requests over a budget get 429, requests over the concurrency caps 503.
+RATE_LIMIT_ENABLED = os.environ.get("FINANCE_RATE_LIMIT_ENABLED", "1") == "1"
+RATE_LIMITS = {
+    "read": (20.0, 40),
+    "write": (10.0, 20),
+    "report": (2.0, 20),  # summaries the UI loads on every rerun
+    "heavy": (0.5, 3),  # CSV exports and fleet analytics
+}
+RATE_LIMIT_MAX_KEYS = 100_000
+MAX_CONCURRENT_REQUESTS = int(os.environ.get("FINANCE_MAX_CONCURRENT_REQUESTS", "64"))
+MAX_CONCURRENT_HEAVY = int(os.environ.get("FINANCE_MAX_CONCURRENT_HEAVY", "4"))
+
+# Expense anomaly detection (finance.anomalies): an expense is flagged when its category
+# has at least ANOMALY_MIN_SAMPLES expenses and the amount is ANOMALY_Z_THRESHOLD standard
+# deviations above the category mean or ANOMALY_RATIO_THRESHOLD times its median.
+ANOMALY_DETECTION = os.environ.get("FINANCE_ANOMALY_DETECTION", "1") == "1"
+ANOMALY_MIN_SAMPLES = 10
+ANOMALY_Z_THRESHOLD = 3.0
+ANOMALY_RATIO_THRESHOLD = 5.0
+
+# Categorization rules (finance.categorize): transactions added without a category get one
+# from the user's rules. Compiled rules are cached for CATEGORY_RULE_CACHE_SIZE users per process.
+MAX_CATEGORY_RULES = int(os.environ.get("FINANCE_MAX_CATEGORY_RULES", "1000"))
+CATEGORY_RULE_CACHE_SIZE = int(os.environ.get("FINANCE_CATEGORY_RULE_CACHE_SIZE", "1024"))
+# Largest batch POST /transactions/batch accepts
+BATCH_MAX_TRANSACTIONS = int(os.environ.get("FINANCE_BATCH_MAX_TRANSACTIONS", "1000"))
+
+# Server-sent events (GET /events, api.events): each process tails the change log every
+# EVENTS_POLL_SECONDS (its own writes are pushed at once), idle streams get a comment
+# every EVENTS_KEEPALIVE_SECONDS, and a client more than EVENTS_QUEUE_SIZE events behind
+# is told to resync. At most EVENTS_MAX_CONNECTIONS streams per process.
+EVENTS_POLL_SECONDS = float(os.environ.get("FINANCE_EVENTS_POLL_SECONDS", "1.0"))
+EVENTS_KEEPALIVE_SECONDS = float(os.environ.get("FINANCE_EVENTS_KEEPALIVE_SECONDS", "15"))
+EVENTS_QUEUE_SIZE = int(os.environ.get("FINANCE_EVENTS_QUEUE_SIZE", "100"))
+EVENTS_MAX_CONNECTIONS = int(os.environ.get("FINANCE_EVENTS_MAX_CONNECTIONS", "10000"))
+
+# API responses with bodies of at least this many bytes are gzip/brotli-compressed
+# for clients that accept it (0 disables compression).
+COMPRESSION_MIN_BYTES = int(os.environ.get("FINANCE_COMPRESSION_MIN_BYTES", "1024"))
+
+# Group commit: transaction writes are batched by one writer thread per database file.
+# A batch is committed once it holds GROUP_COMMIT_MAX_BATCH writes or GROUP_COMMIT_WINDOW_MS
+# after its first write arrived.
+GROUP_COMMIT = os.environ.get("FINANCE_GROUP_COMMIT", "1") == "1"
+GROUP_COMMIT_WINDOW_MS = float(os.environ.get("FINANCE_GROUP_COMMIT_WINDOW_MS", "3"))
+GROUP_COMMIT_MAX_BATCH = int(os.environ.get("FINANCE_GROUP_COMMIT_MAX_BATCH", "64"))
 
 # Simple salt for password hashing (ok for school project).
 # For production, use a secure per-user salt and a proper password hashing library.
@@ -1,10 +1,10 @@
 # database package initializer
 from .db import init_db, get_connection, create_user, get_user_by_username, verify_user, \
-    add_transaction, get_transactions_by_user, get_balance, get_monthly_summary
+    add_transaction, get_transactions_by_user, get_balance, get_monthly_summary, get_category_totals
 from .models import User, Transaction
 
 __all__ = [
     "init_db", "get_connection", "create_user", "get_user_by_username", "verify_user",
-    "add_transaction", "get_transactions_by_user", "get_balance", "get_monthly_summary",
+    "add_transaction", "get_transactions_by_user", "get_balance", "get_monthly_summary", "get_category_totals",
     "User", "Transaction"
 ]
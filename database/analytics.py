@@ -0,0 +1,245 @@
+"""
+Fleet-wide reports for operators (sqlite backend).
+
+  python -m database.analytics [--start-month YYYY-MM] [--end-month YYYY-MM] [--currency EUR] [--workers N]
+
+Aggregates every user's transactions into volume per (month, category, type)
+and active users per month, in a reporting currency. Instead of one thread
+scanning the whole transactions table, each ledger file (DB_PATH, or every
+shard) is split into user_id ranges that are aggregated in parallel on a
+process pool, each task with its own read-only connection; the partial results
+are merged here. A user lives in exactly one range, so per-range distinct user
+counts simply add up.
+
+Archived periods are read from the daily rollups (see database.archive), and
+amounts are converted inside the query with the exchange_rates table every
+ledger carries, like the per-user reports.
+"""
+
+import math
+import multiprocessing
+import os
+import sqlite3
+import sys
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+from typing import Dict, List, Optional, Tuple
+
+from config import settings
+from . import sharding
+from .sqlite_backend import _conversion_params, _converted_amount_sql, _report_sources, _HOT
+
+RANGES_PER_WORKER = 4  # more ranges than workers, so one dense range doesn't leave the others idle
+
+
+class AnalyticsError(Exception):
+    pass
+
+
+def _ledger_paths() -> List[str]:
+    if sharding.enabled():
+        return [sharding.shard_path(i) for i in range(settings.SHARD_COUNT)]
+    return [settings.DB_PATH]
+
+
+def _open_ro(path: str) -> sqlite3.Connection:
+    conn = sqlite3.connect(f"file:{path}?mode=ro", uri=True, timeout=30)
+    conn.row_factory = sqlite3.Row
+    return conn
+
+
+def _user_bounds(path: str) -> Optional[Tuple[int, int]]:
+    conn = _open_ro(path)
+    try:
+        cur = conn.cursor()
+        low, high = None, None
+        for table in _report_sources(cur):
+            # One MIN or MAX per query is answered from the user_id-leading index; both at once scan
+            a = cur.execute(f"SELECT MIN(user_id) FROM {table}").fetchone()[0]
+            b = cur.execute(f"SELECT MAX(user_id) FROM {table}").fetchone()[0]
+            if a is not None:
+                low, high = min(a, low if low is not None else a), max(b, high if high is not None else b)
+        return None if low is None else (low, high)
+    finally:
+        conn.close()
+
+
+def _split(low: int, high: int, count: int) -> List[Tuple[int, int]]:
+    """
+    [low, high] cut into at most `count` contiguous ranges of (nearly) equal width.
+    """
+    width = max(1, math.ceil((high - low + 1) / count))
+    return [(start, min(start + width - 1, high)) for start in range(low, high + 1, width)]
+
+
+# ----------------- Range task (runs in the worker processes) -----------------
+def _aggregate_range(path: str, low: int, high: int, start: Optional[str], end: Optional[str], params: Dict) -> Dict:
+    """
+    Partial report of users low..high in one ledger file: volume per (month, category, ttype)
+    and active users per month, plus the distinct users of the range.
+    """
+    where = "user_id BETWEEN :low AND :high"
+    args = {"low": low, "high": high, **params}
+    if start:
+        where += " AND date >= :start"
+        args["start"] = start + "-01"
+    if end:
+        where += " AND date < :end"
+        args["end"] = end + "-32"  # sorts after every day of the month
+    conn = _open_ro(path)
+    try:
+        cur = conn.cursor()
+        tables = _report_sources(cur, start)
+        volume: Dict[Tuple[str, str, str], List] = {}
+        for table in tables:
+            count = "SUM(count)" if table != _HOT else "COUNT(*)"
+            cur.execute(f"""
+            SELECT substr(date,1,7) AS month, category, ttype, {count} AS n, SUM({_converted_amount_sql(table)}) AS total
+            FROM {table}
+            WHERE {where}
+            GROUP BY month, category, ttype
+            """, args)
+            for r in cur.fetchall():
+                entry = volume.setdefault((r["month"], r["category"], r["ttype"]), [0, 0.0])
+                entry[0] += r["n"]
+                entry[1] += float(r["total"] or 0.0)
+        # A user counts once per month even with both archived and hot transactions that month
+        active_sql = " UNION ".join(f"SELECT DISTINCT user_id, substr(date,1,7) AS month FROM {table} WHERE {where}" for table in tables)
+        cur.execute(f"SELECT month, COUNT(*) AS users FROM ({active_sql}) GROUP BY month", args)
+        active = {r["month"]: r["users"] for r in cur.fetchall()}
+        cur.execute(f"SELECT COUNT(DISTINCT user_id) FROM ({active_sql})", args)
+        users = cur.fetchone()[0]
+    finally:
+        conn.close()
+    return {"volume": volume, "active": active, "users": users}
+
+
+# ----------------- Pool -----------------
+_lock = threading.Lock()
+_pool: Optional[ProcessPoolExecutor] = None
+
+
+def _workers() -> int:
+    return settings.ANALYTICS_WORKERS or os.cpu_count() or 1
+
+
+def _get_pool() -> ProcessPoolExecutor:
+    """
+    The shared pool the API uses ("spawn", see finance.jobs); created on first use.
+    """
+    global _pool
+    with _lock:
+        if _pool is None:
+            _pool = ProcessPoolExecutor(max_workers=_workers(), mp_context=multiprocessing.get_context("spawn"))
+        return _pool
+
+
+def shutdown(wait: bool = True) -> None:
+    global _pool
+    with _lock:
+        pool, _pool = _pool, None
+    if pool is not None:
+        pool.shutdown(wait=wait, cancel_futures=True)
+
+
+def _check_month(value: Optional[str], name: str) -> None:
+    if value is None:
+        return
+    try:
+        if len(value) != 7:
+            raise ValueError(value)
+        datetime.strptime(value, "%Y-%m")
+    except ValueError:
+        raise AnalyticsError(f"{name} must be a YYYY-MM month")
+
+
+def fleet_report(start_month: Optional[str] = None, end_month: Optional[str] = None, currency: Optional[str] = None,
+                 workers: Optional[int] = None) -> Dict:
+    """
+    Volume per (month, category, type) and active users per month across all users, for
+    start_month..end_month (inclusive, None = unbounded) in `currency` (default
+    DEFAULT_CURRENCY). `workers` runs on a dedicated pool of that size instead of the shared one.
+    Raises AnalyticsError on invalid arguments or another storage backend.
+    """
+    if settings.STORAGE_BACKEND != "sqlite":
+        raise AnalyticsError("Fleet analytics read the SQLite files directly; not available on the sqlalchemy backend")
+    _check_month(start_month, "start_month")
+    _check_month(end_month, "end_month")
+    currency = (currency or settings.DEFAULT_CURRENCY).upper()
+    if len(currency) != 3 or not currency.isalpha():
+        raise AnalyticsError("Currency must be a 3-letter code.")
+    params = _conversion_params(currency)
+    size = workers or _workers()
+
+    started = time.perf_counter()
+    paths = [p for p in _ledger_paths() if os.path.exists(p)]
+    per_file = max(1, math.ceil(size * RANGES_PER_WORKER / max(len(paths), 1)))
+    tasks = []
+    for path in paths:
+        bounds = _user_bounds(path)
+        if bounds is not None:
+            tasks += [(path, low, high) for low, high in _split(bounds[0], bounds[1], per_file)]
+
+    pool = ProcessPoolExecutor(max_workers=size, mp_context=multiprocessing.get_context("spawn")) if workers else _get_pool()
+    try:
+        futures = [pool.submit(_aggregate_range, path, low, high, start_month, end_month, params) for path, low, high in tasks]
+        parts = [f.result() for f in futures]
+    finally:
+        if workers:
+            pool.shutdown()
+
+    volume: Dict[Tuple[str, str, str], List] = {}
+    months: Dict[str, Dict] = {}
+    for part in parts:
+        for key, (count, total) in part["volume"].items():
+            entry = volume.setdefault(key, [0, 0.0])
+            entry[0] += count
+            entry[1] += total
+            m = months.setdefault(key[0], {"month": key[0], "active_users": 0, "transactions": 0, "income": 0.0, "expense": 0.0})
+            m["transactions"] += count
+            m[key[2]] += total
+        for month, users in part["active"].items():
+            months[month]["active_users"] += users
+    for m in months.values():
+        m["income"], m["expense"] = round(m["income"], 2), round(m["expense"], 2)
+    return {
+        "currency": currency,
+        "start_month": start_month,
+        "end_month": end_month,
+        "active_users": sum(part["users"] for part in parts),
+        "months": [months[k] for k in sorted(months)],
+        "categories": [
+            {"month": k[0], "category": k[1], "ttype": k[2], "transactions": v[0], "total": round(v[1], 2)}
+            for k, v in sorted(volume.items())
+        ],
+        "ranges": len(tasks),
+        "workers": size,
+        "seconds": round(time.perf_counter() - started, 3),
+    }
+
+
+def main(argv=None) -> int:
+    import argparse
+    import json
+
+    parser = argparse.ArgumentParser(description="Fleet-wide volume and active-user report")
+    parser.add_argument("--start-month", default=None, metavar="YYYY-MM")
+    parser.add_argument("--end-month", default=None, metavar="YYYY-MM")
+    parser.add_argument("--currency", default=None, help="reporting currency (default: settings.DEFAULT_CURRENCY)")
+    parser.add_argument("--workers", type=int, default=None, help="worker processes (default: settings.ANALYTICS_WORKERS or the CPU count)")
+    args = parser.parse_args(argv)
+
+    try:
+        report = fleet_report(args.start_month, args.end_month, args.currency, args.workers or _workers())
+    except AnalyticsError as e:
+        print(e, file=sys.stderr)
+        return 1
+    print(json.dumps(report, indent=2))
+    print(f"{report['ranges']} range(s) on {report['workers']} worker(s) in {report['seconds']}s", file=sys.stderr)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,180 @@
+"""
+Cold storage for old transactions (sqlite backend).
+
+`python -m database.archive` moves transactions dated before the horizon
+(settings.ARCHIVE_HORIZON_DAYS, or --before DATE) out of the ledger:
+
+  archive files   settings.ARCHIVE_DIR/<year>.db, one zlib-compressed JSON
+                  payload per (user, month) -- the rows themselves, for listings
+                  and searches that reach back that far
+  rollups         archived_daily_totals in the ledger: per (user, day, category,
+                  type, currency) sums, so balances and summaries still convert
+                  each day's amounts at that day's rate without opening archives
+
+The ledger's archive_meta.archived_through records the cutoff. Reads consult
+the archive only when they need rows (or totals) from before it; the hot
+transactions table keeps just the recent horizon. A full delta sync
+(changes since 0) includes the archived rows too.
+
+Archived transactions are read-only: the rows and their rollups would have to
+change together across files, so updating or deleting one fails with an
+explicit message (see find()), and bulk changes only touch the hot rows.
+
+Archive files are shared by all shards (payloads are keyed by user), so
+resharding leaves them in place. Payload writes are idempotent: rows are merged
+by id, so a run interrupted between writing the archive and deleting the hot
+rows is repaired by the next one.
+"""
+
+import json
+import os
+import re
+import sqlite3
+import sys
+import zlib
+from datetime import datetime
+from typing import Dict, Iterator, List, Optional, Tuple
+
+from config import settings
+from .models import Transaction
+
+_YEAR_FILE = re.compile(r"^(\d{4})\.db$")
+COMPRESSION_LEVEL = 6
+
+
+def archive_dir() -> str:
+    return settings.ARCHIVE_DIR or os.path.join(os.path.dirname(settings.DB_PATH), "archive")
+
+
+def year_path(year: int) -> str:
+    return os.path.join(archive_dir(), f"{year}.db")
+
+
+def archived_years() -> List[int]:
+    """
+    Years with an archive file, newest first.
+    """
+    try:
+        names = os.listdir(archive_dir())
+    except FileNotFoundError:
+        return []
+    return sorted((int(m.group(1)) for m in map(_YEAR_FILE.match, names) if m), reverse=True)
+
+
+def _open(year: int) -> sqlite3.Connection:
+    os.makedirs(archive_dir(), exist_ok=True)
+    conn = sqlite3.connect(year_path(year), timeout=30)
+    conn.execute("""
+    CREATE TABLE IF NOT EXISTS archived_months (
+        user_id INTEGER NOT NULL,
+        month TEXT NOT NULL,
+        row_count INTEGER NOT NULL,
+        payload BLOB NOT NULL,
+        PRIMARY KEY (user_id, month)
+    ) WITHOUT ROWID
+    """)
+    return conn
+
+
+def _pack(rows: List[Tuple]) -> bytes:
+    return zlib.compress(json.dumps(rows, separators=(",", ":")).encode("utf-8"), COMPRESSION_LEVEL)
+
+
+def _unpack(payload: bytes) -> List[List]:
+    return json.loads(zlib.decompress(payload))
+
+
+def write(rows: List[Tuple]) -> int:
+    """
+    Merge transaction rows (id, user_id, date, amount, category, ttype, description, currency)
+    into the yearly archive files. Returns the number of (user, month) payloads written.
+    """
+    by_year: Dict[int, Dict[Tuple[int, str], List[Tuple]]] = {}
+    for row in rows:
+        year = int(row[2][:4])
+        by_year.setdefault(year, {}).setdefault((row[1], row[2][:7]), []).append(tuple(row))
+
+    written = 0
+    for year, months in sorted(by_year.items()):
+        conn = _open(year)
+        try:
+            conn.execute("BEGIN IMMEDIATE")
+            for (user_id, month), new_rows in months.items():
+                found = conn.execute(
+                    "SELECT payload FROM archived_months WHERE user_id = ? AND month = ?", (user_id, month)
+                ).fetchone()
+                merged = {r[0]: list(r) for r in (_unpack(found[0]) if found else [])}
+                merged.update((r[0], list(r)) for r in new_rows)
+                ordered = sorted(merged.values(), key=lambda r: (r[2], r[0]))
+                conn.execute(
+                    "INSERT OR REPLACE INTO archived_months (user_id, month, row_count, payload) VALUES (?, ?, ?, ?)",
+                    (user_id, month, len(ordered), _pack(ordered))
+                )
+                written += 1
+            conn.commit()
+        finally:
+            conn.close()
+    return written
+
+
+def read(user_id: int, before: str, start_date: Optional[str] = None, end_date: Optional[str] = None) -> Iterator[Transaction]:
+    """
+    The user's archived transactions dated before `before` (and within start_date..end_date,
+    inclusive), newest first. Files are opened lazily, so a consumer that stops early
+    only decompresses the months it needed.
+    """
+    upper = min(before, end_date + "~") if end_date else before  # "~" sorts after any date: end_date is kept
+    for year in archived_years():
+        if str(year) > upper[:4] or (start_date and str(year) < start_date[:4]):
+            continue
+        conn = sqlite3.connect(f"file:{year_path(year)}?mode=ro", uri=True, timeout=30)
+        try:
+            payloads = conn.execute(
+                "SELECT payload FROM archived_months WHERE user_id = ? AND month >= ? AND month <= ? ORDER BY month DESC",
+                (user_id, start_date[:7] if start_date else "", upper[:7])
+            ).fetchall()
+        except sqlite3.OperationalError:  # file created by a run that hasn't written yet
+            payloads = []
+        finally:
+            conn.close()
+        for (payload,) in payloads:
+            for r in sorted(_unpack(payload), key=lambda r: (r[2], r[0]), reverse=True):
+                if r[2] < upper and (start_date is None or r[2] >= start_date):
+                    yield Transaction.from_row(tuple(r))
+
+
+def find(user_id: int, tx_id: int, before: str) -> Optional[Transaction]:
+    """
+    The user's archived transaction `tx_id`, or None. Reads every archived month of the
+    user, so it's only for the rare write that misses the hot table.
+    """
+    return next((t for t in read(user_id, before) if t.id == tx_id), None)
+
+
+def main(argv=None) -> int:
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Move old transactions into the compressed archive")
+    parser.add_argument("--horizon-days", type=int, default=None, help="archive transactions older than this (default: settings.ARCHIVE_HORIZON_DAYS)")
+    parser.add_argument("--before", default=None, metavar="DATE", help="archive transactions dated before this YYYY-MM-DD instead")
+    args = parser.parse_args(argv)
+    if args.before:
+        try:
+            datetime.strptime(args.before, "%Y-%m-%d")
+        except ValueError:
+            parser.error("--before must be a YYYY-MM-DD date")
+
+    from . import db  # db -> storage -> sqlite_backend imports this module
+    from .storage import get_backend
+
+    db.init_db()
+    if args.before:
+        moved = get_backend().archive_transactions(args.before)
+    else:
+        moved = db.archive_transactions(args.horizon_days)
+    print(f"Archived {moved} transactions into {archive_dir()}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
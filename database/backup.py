@@ -0,0 +1,378 @@
+"""
+Online backups of the SQLite databases.
+
+  python -m database.backup create
+  python -m database.backup list
+  python -m database.backup verify [SNAPSHOT]
+  python -m database.backup restore [SNAPSHOT]     # default: the newest snapshot
+
+A snapshot is a directory in settings.BACKUP_DIR (default data/backups) with a
+copy of every database file -- DB_PATH, or the shard directory and shards, and
+the archive files -- plus a manifest.json with their sizes and checksums.
+
+Files are copied with SQLite's online backup API while the API keeps serving:
+BACKUP_PAGES_PER_STEP pages per step with BACKUP_STEP_SLEEP_MS between steps.
+For WAL databases the copy reads one snapshot held open across all steps, and
+WAL readers never block writers. Without WAL (the archive files) each step is
+its own read and a write from another connection restarts the copy; after
+BACKUP_MAX_RESTARTS restarts the file is copied in one step instead. Every copy
+is switched to a rollback journal and checked with PRAGMA integrity_check
+before the snapshot counts; only the newest BACKUP_RETAIN snapshots are kept.
+
+Restore copies the files back with the same API, so the live databases'
+WAL files are handled by SQLite. Stop the API (and its workers) first.
+"""
+
+import hashlib
+import json
+import logging
+import os
+import re
+import shutil
+import sqlite3
+import sys
+import threading
+import time
+from datetime import datetime
+from typing import Dict, List, Optional, Tuple
+
+from config import settings
+from utils import metrics
+from . import archive, sharding
+
+logger = logging.getLogger(__name__)
+
+_SNAPSHOT_NAME = re.compile(r"^\d{8}T\d{6}(-\d+)?$")
+MANIFEST = "manifest.json"
+
+BACKUPS = metrics.counter("finance_backups_total", "Backup runs by outcome", ["status"])
+BACKUP_SECONDS = metrics.histogram(
+    "finance_backup_duration_seconds", "Wall time of a backup run", buckets=(1, 5, 15, 60, 300, 900, 3600)
+)
+LAST_SUCCESS = metrics.gauge("finance_backup_last_success_timestamp_seconds", "Unix time of the last verified backup")
+
+
+class BackupError(Exception):
+    pass
+
+
+class _Restarted(Exception):
+    pass
+
+
+def backup_dir() -> str:
+    return settings.BACKUP_DIR or os.path.join(settings.DATA_DIR, "backups")
+
+
+def _sources() -> List[Tuple[str, str]]:
+    """
+    (name in the snapshot, live path) of every database file.
+    """
+    if sharding.enabled():
+        files = [("directory.db", sharding.directory_path())]
+        files += [(os.path.basename(sharding.shard_path(i)), sharding.shard_path(i)) for i in range(settings.SHARD_COUNT)]
+    else:
+        files = [(os.path.basename(settings.DB_PATH), settings.DB_PATH)]
+    files += [(f"archive/{year}.db", archive.year_path(year)) for year in sorted(archive.archived_years())]
+    return [(name, path) for name, path in files if os.path.exists(path)]
+
+
+def _layout() -> str:
+    return f"{settings.SHARD_COUNT} shards" if sharding.enabled() else "single file"
+
+
+def _live_path(name: str) -> str:
+    if name.startswith("archive/"):
+        return archive.year_path(int(name[len("archive/"):-len(".db")]))
+    if sharding.enabled():
+        return os.path.join(settings.SHARD_DIR, name)
+    return settings.DB_PATH
+
+
+def _sha256(path: str) -> str:
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def _copy(src_path: str, dest_path: str, pages: int, sleep_seconds: float, max_restarts: int) -> Dict:
+    """
+    Online-backup src into dest. Returns {"pages", "steps", "restarts", "throttled"}.
+    """
+    stats = {"pages": 0, "steps": 0, "restarts": 0, "throttled": pages > 0}
+    src = sqlite3.connect(src_path, timeout=30, isolation_level=None)
+    try:
+        if stats["throttled"] and src.execute("PRAGMA journal_mode").fetchone()[0] == "wal":
+            # Pin one WAL snapshot across all steps: other connections keep writing
+            # (to the WAL) without restarting the copy. Checkpoints can't pass the
+            # snapshot until the copy ends, so the WAL grows meanwhile.
+            src.execute("BEGIN")
+            src.execute("SELECT COUNT(*) FROM sqlite_master").fetchone()
+        while True:
+            dest = sqlite3.connect(dest_path)
+            last_remaining = [None]
+
+            def progress(status, remaining, total):
+                stats["steps"] += 1
+                stats["pages"] = total
+                # remaining grows again when another connection's write restarted the copy
+                if last_remaining[0] is not None and remaining > last_remaining[0]:
+                    stats["restarts"] += 1
+                    if stats["restarts"] > max_restarts:
+                        raise _Restarted()
+                last_remaining[0] = remaining
+                if remaining and sleep_seconds > 0:
+                    time.sleep(sleep_seconds)
+
+            try:
+                if stats["throttled"]:
+                    src.backup(dest, pages=pages, progress=progress)
+                else:
+                    src.backup(dest)
+                dest.execute("PRAGMA journal_mode=DELETE")  # a snapshot is one self-contained file
+                return stats
+            except _Restarted:
+                stats["throttled"] = False  # too busy to finish in steps: copy in one read transaction
+            finally:
+                dest.close()
+    finally:
+        src.close()
+
+
+def _verify_file(path: str) -> Optional[str]:
+    """
+    None if the file passes PRAGMA integrity_check, otherwise the first problem reported.
+    """
+    conn = sqlite3.connect(f"file:{path}?mode=ro", uri=True)
+    try:
+        result = conn.execute("PRAGMA integrity_check").fetchone()[0]
+    except sqlite3.DatabaseError as e:
+        result = str(e)
+    finally:
+        conn.close()
+    return None if result == "ok" else result
+
+
+def create_backup(pages_per_step: Optional[int] = None, step_sleep_ms: Optional[int] = None) -> Dict:
+    """
+    Snapshot every database file into a new directory of backup_dir(), verify it and
+    prune old snapshots. Returns the manifest. Raises BackupError if a copy fails
+    verification (the partial snapshot is removed).
+    """
+    pages = settings.BACKUP_PAGES_PER_STEP if pages_per_step is None else pages_per_step
+    sleep_ms = settings.BACKUP_STEP_SLEEP_MS if step_sleep_ms is None else step_sleep_ms
+    started = time.monotonic()
+    now = datetime.utcnow()
+    name = now.strftime("%Y%m%dT%H%M%S")
+    path = os.path.join(backup_dir(), name)
+    suffix = 1
+    while os.path.exists(path):
+        suffix += 1
+        path = os.path.join(backup_dir(), f"{name}-{suffix}")
+    os.makedirs(os.path.join(path, "archive"))
+
+    manifest = {"id": os.path.basename(path), "created_at": now.strftime("%Y-%m-%d %H:%M:%S"), "layout": _layout(), "files": []}
+    try:
+        for file_name, live_path in _sources():
+            dest = os.path.join(path, file_name)
+            copy_started = time.monotonic()
+            stats = _copy(live_path, dest, pages, sleep_ms / 1000.0, settings.BACKUP_MAX_RESTARTS)
+            problem = _verify_file(dest)
+            if problem:
+                raise BackupError(f"{file_name}: integrity check failed: {problem}")
+            manifest["files"].append({
+                "name": file_name, "bytes": os.path.getsize(dest), "sha256": _sha256(dest),
+                "seconds": round(time.monotonic() - copy_started, 3), **stats,
+            })
+    except BaseException:
+        shutil.rmtree(path, ignore_errors=True)
+        BACKUPS.inc("failed")
+        raise
+    manifest["seconds"] = round(time.monotonic() - started, 3)
+    with open(os.path.join(path, MANIFEST), "w", encoding="utf-8") as f:
+        json.dump(manifest, f, indent=2)
+
+    BACKUPS.inc("succeeded")
+    BACKUP_SECONDS.observe(manifest["seconds"])
+    LAST_SUCCESS.set(time.time())
+    prune()
+    return manifest
+
+
+def list_backups() -> List[Dict]:
+    """
+    Manifests of the complete snapshots, newest first.
+    """
+    try:
+        names = os.listdir(backup_dir())
+    except FileNotFoundError:
+        return []
+    found = []
+    for name in sorted(filter(_SNAPSHOT_NAME.match, names), key=_snapshot_order, reverse=True):
+        manifest = _load_manifest(name)
+        if manifest is not None:
+            found.append(manifest)
+    return found
+
+
+def _snapshot_order(snapshot_id: str) -> Tuple[str, int]:
+    # "<timestamp>-N" is the Nth snapshot within the same second
+    stamp, _, n = snapshot_id.partition("-")
+    return stamp, int(n or 1)
+
+
+def _load_manifest(snapshot_id: str) -> Optional[Dict]:
+    if not _SNAPSHOT_NAME.match(snapshot_id):
+        return None
+    try:
+        with open(os.path.join(backup_dir(), snapshot_id, MANIFEST), "r", encoding="utf-8") as f:
+            return json.load(f)
+    except (FileNotFoundError, ValueError):
+        return None
+
+
+def prune(retain: Optional[int] = None) -> List[str]:
+    """
+    Delete all but the newest `retain` snapshots (default settings.BACKUP_RETAIN), and
+    directories of runs that never completed. Returns the deleted snapshot ids.
+    """
+    retain = settings.BACKUP_RETAIN if retain is None else retain
+    complete = [m["id"] for m in list_backups()]
+    doomed = complete[max(retain, 1):]
+    try:
+        names = os.listdir(backup_dir())
+    except FileNotFoundError:
+        names = []
+    newest = complete[0] if complete else None
+    # an incomplete directory older than the newest complete snapshot is a crashed run
+    doomed += [
+        n for n in names
+        if _SNAPSHOT_NAME.match(n) and n not in complete and newest and _snapshot_order(n) < _snapshot_order(newest)
+    ]
+    for snapshot_id in doomed:
+        shutil.rmtree(os.path.join(backup_dir(), snapshot_id), ignore_errors=True)
+    return doomed
+
+
+def _resolve(snapshot_id: Optional[str]) -> Dict:
+    if snapshot_id is None:
+        backups = list_backups()
+        if not backups:
+            raise BackupError(f"No backups in {backup_dir()}")
+        return backups[0]
+    manifest = _load_manifest(snapshot_id)
+    if manifest is None:
+        raise BackupError(f"No complete backup named {snapshot_id!r}")
+    return manifest
+
+
+def verify_backup(snapshot_id: Optional[str] = None) -> List[str]:
+    """
+    Check a snapshot's files against its manifest and with PRAGMA integrity_check.
+    Returns the problems found (empty list = restorable).
+    """
+    manifest = _resolve(snapshot_id)
+    root = os.path.join(backup_dir(), manifest["id"])
+    problems = []
+    for entry in manifest["files"]:
+        path = os.path.join(root, entry["name"])
+        if not os.path.exists(path):
+            problems.append(f"{entry['name']}: missing")
+        elif _sha256(path) != entry["sha256"]:
+            problems.append(f"{entry['name']}: checksum mismatch")
+        else:
+            problem = _verify_file(path)
+            if problem:
+                problems.append(f"{entry['name']}: {problem}")
+    return problems
+
+
+def restore_backup(snapshot_id: Optional[str] = None) -> Dict:
+    """
+    Replace the live databases with a verified snapshot (default: the newest). Files of
+    the current layout that the snapshot doesn't have are left alone. Returns the manifest.
+    """
+    manifest = _resolve(snapshot_id)
+    if manifest["layout"] != _layout():
+        raise BackupError(f"Backup {manifest['id']} was taken with {manifest['layout']}, the current layout is {_layout()}")
+    problems = verify_backup(manifest["id"])
+    if problems:
+        raise BackupError(f"Backup {manifest['id']} failed verification: " + "; ".join(problems))
+    root = os.path.join(backup_dir(), manifest["id"])
+    for entry in manifest["files"]:
+        live_path = _live_path(entry["name"])
+        os.makedirs(os.path.dirname(live_path), exist_ok=True)
+        src = sqlite3.connect(f"file:{os.path.join(root, entry['name'])}?mode=ro", uri=True)
+        dest = sqlite3.connect(live_path, timeout=30)
+        try:
+            src.backup(dest)
+        finally:
+            src.close()
+            dest.close()
+    return manifest
+
+
+def start_backups(interval_seconds: Optional[int] = None) -> Optional[threading.Thread]:
+    """
+    Run create_backup periodically in a daemon thread. Returns None when disabled.
+    """
+    interval_seconds = settings.BACKUP_INTERVAL_SECONDS if interval_seconds is None else interval_seconds
+    if interval_seconds <= 0:
+        return None
+    stop = threading.Event()
+
+    def _loop():
+        while not stop.wait(interval_seconds):
+            try:
+                create_backup()
+            except Exception:
+                logger.exception("Backup failed")
+
+    thread = threading.Thread(target=_loop, name="backup", daemon=True)
+    thread.stop_event = stop
+    thread.start()
+    return thread
+
+
+def main(argv=None) -> int:
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Online backups of the finance databases")
+    sub = parser.add_subparsers(dest="command", required=True)
+    create = sub.add_parser("create", help="take a snapshot now")
+    create.add_argument("--pages-per-step", type=int, default=None, help="pages copied per step (-1 = all at once)")
+    create.add_argument("--step-sleep-ms", type=int, default=None, help="pause between steps")
+    sub.add_parser("list", help="list snapshots, newest first")
+    for command in ("verify", "restore"):
+        p = sub.add_parser(command, help=f"{command} a snapshot (default: the newest)")
+        p.add_argument("snapshot", nargs="?", default=None)
+    args = parser.parse_args(argv)
+
+    try:
+        if args.command == "create":
+            manifest = create_backup(args.pages_per_step, args.step_sleep_ms)
+            size = sum(f["bytes"] for f in manifest["files"])
+            print(f"Backup {manifest['id']}: {len(manifest['files'])} file(s), {size} bytes in {manifest['seconds']}s")
+        elif args.command == "list":
+            for m in list_backups():
+                print(f"{m['id']}  {m['created_at']}  {len(m['files'])} file(s)  {sum(f['bytes'] for f in m['files'])} bytes")
+        elif args.command == "verify":
+            problems = verify_backup(args.snapshot)
+            for problem in problems:
+                print(problem)
+            if problems:
+                return 1
+            print("OK")
+        else:
+            manifest = restore_backup(args.snapshot)
+            print(f"Restored backup {manifest['id']} ({len(manifest['files'])} file(s))")
+    except BackupError as e:
+        print(e, file=sys.stderr)
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,50 +1,58 @@
 """
-Database helper using sqlite3.
+Database helper.
 Contains initialization and basic CRUD operations used by the Streamlit frontend.
+Every function delegates to the storage backend selected by settings.STORAGE_BACKEND
+(see database.storage): sqlite3 by default, SQLAlchemy Core for other databases.
 """
 
-import sqlite3
-from typing import List, Tuple, Optional, Dict
-from datetime import datetime
+from typing import Callable, List, Tuple, Optional, Dict
+from datetime import datetime, timedelta
 from config import settings
-from .models import User, Transaction
+from .models import User, Transaction, RecurringRule, CategoryRule, CategoryStats, Anomaly, TransactionFilter
+from .storage import StatsWriter, get_backend
 import hashlib
 
 
-def get_connection():
-    conn = sqlite3.connect(settings.DB_PATH, check_same_thread=False)
-    conn.row_factory = sqlite3.Row
-    return conn
+def get_connection(user_id: Optional[int] = None, shard: Optional[int] = None):
+    """
+    Connection to the database holding a user's data.
+    Without sharding everything lives in settings.DB_PATH. With settings.SHARD_COUNT > 0,
+    `user_id` (or an explicit `shard` index) selects a shard file and no argument
+    selects the directory database that holds the users table.
+    """
+    return get_backend().connection(user_id, shard)
+
+
+def ledger_shards() -> List[Optional[int]]:
+    """
+    Shard indexes to visit for cross-user work ([None] when sharding is off).
+    """
+    return get_backend().ledger_shards()
+
+
+# ----------------- Write notifications -----------------
+_write_listeners: List[Callable[[int], None]] = []
+
+
+def add_write_listener(listener: Callable[[int], None]) -> None:
+    """
+    Call listener(user_id) after each committed write to a user's transactions
+    in this process (see api.events). Listeners must be quick and must not raise.
+    """
+    _write_listeners.append(listener)
+
+
+def _notify(user_id: int) -> None:
+    for listener in _write_listeners:
+        listener(user_id)
 
 
 def init_db():
-    conn = get_connection()
-    cur = conn.cursor()
-
-    cur.execute("""
-    CREATE TABLE IF NOT EXISTS users (
-        id INTEGER PRIMARY KEY AUTOINCREMENT,
-        username TEXT UNIQUE NOT NULL,
-        password_hash TEXT NOT NULL,
-        created_at TEXT NOT NULL
-    );
-    """)
-
-    cur.execute("""
-    CREATE TABLE IF NOT EXISTS transactions (
-        id INTEGER PRIMARY KEY AUTOINCREMENT,
-        user_id INTEGER NOT NULL,
-        date TEXT NOT NULL,
-        amount REAL NOT NULL,
-        category TEXT NOT NULL,
-        ttype TEXT NOT NULL CHECK(ttype IN ('income','expense')),
-        description TEXT,
-        FOREIGN KEY(user_id) REFERENCES users(id)
-    );
-    """)
-
-    conn.commit()
-    conn.close()
+    get_backend().init_db()
+
+
+def _reporting_currency(currency: Optional[str]) -> str:
+    return (currency or settings.DEFAULT_CURRENCY).upper()
 
 
 # ----------------- User functions -----------------
@@ -57,31 +65,11 @@ def create_user(username: str, password: str) -> Tuple[bool, str]:
     """
     Returns (success, message)
     """
-    conn = get_connection()
-    cur = conn.cursor()
-    try:
-        pw_hash = _hash_password(password)
-        cur.execute(
-            "INSERT INTO users (username, password_hash, created_at) VALUES (?, ?, ?)",
-            (username, pw_hash, datetime.utcnow().isoformat())
-        )
-        conn.commit()
-        return True, "User created"
-    except sqlite3.IntegrityError:
-        return False, "Username already exists"
-    except Exception as e:
-        return False, f"Error: {e}"
-    finally:
-        conn.close()
+    return get_backend().create_user(username, _hash_password(password), datetime.utcnow().isoformat())
 
 
 def get_user_by_username(username: str) -> Optional[User]:
-    conn = get_connection()
-    cur = conn.cursor()
-    cur.execute("SELECT id, username, password_hash, created_at FROM users WHERE username = ?", (username,))
-    row = cur.fetchone()
-    conn.close()
-    return User.from_row(row)
+    return get_backend().get_user_by_username(username)
 
 
 def verify_user(username: str, password: str) -> Tuple[bool, Optional[User]]:
@@ -94,109 +82,291 @@ def verify_user(username: str, password: str) -> Tuple[bool, Optional[User]]:
 
 
 # ----------------- Transaction functions -----------------
-def add_transaction(user_id: int, date_iso: str, amount: float, category: str, ttype: str, description: str = None) -> Tuple[bool, str]:
-    try:
-        conn = get_connection()
-        cur = conn.cursor()
-        cur.execute(
-            "INSERT INTO transactions (user_id, date, amount, category, ttype, description) VALUES (?, ?, ?, ?, ?, ?)",
-            (user_id, date_iso, amount, category, ttype, description)
-        )
-        conn.commit()
-        return True, "Saved"
-    except Exception as e:
-        return False, f"Error: {e}"
-    finally:
-        conn.close()
+def add_transaction(user_id: int, date_iso: str, amount: float, category: str, ttype: str, description: str = None, currency: str = None) -> Tuple[bool, str]:
+    ok, msg, _tx_id = add_transaction_with_id(user_id, date_iso, amount, category, ttype, description, currency)
+    return ok, msg
+
+
+def add_transaction_with_id(user_id: int, date_iso: str, amount: float, category: str, ttype: str, description: str = None, currency: str = None,
+                            then: Optional[Callable[[StatsWriter, int], None]] = None) -> Tuple[bool, str, Optional[int]]:
+    """
+    Like add_transaction, plus the new transaction's id (None on failure). then(stats, new id)
+    updates expense statistics in the same write (see finance.anomalies); if it raises,
+    nothing is saved.
+    """
+    result = get_backend().add_transaction(user_id, date_iso, amount, category, ttype, description, currency or settings.DEFAULT_CURRENCY, then)
+    if result[0]:
+        _notify(user_id)
+    return result
+
+
+def add_transactions(user_id: int, rows: List[Tuple], then: Optional[Callable[[StatsWriter, List[int]], None]] = None) -> Tuple[bool, str, List[int]]:
+    """
+    Insert a batch of the user's transactions in one commit, all or nothing.
+    rows: (date, amount, category, ttype, description, currency) tuples; a None currency is
+    settings.DEFAULT_CURRENCY. Returns (ok, message, new ids in row order). then(stats, new ids)
+    runs in the same commit (see add_transaction_with_id).
+    """
+    rows = [(*row[:5], row[5] or settings.DEFAULT_CURRENCY) for row in rows]
+    result = get_backend().add_transactions(user_id, rows, then)
+    if result[0]:
+        _notify(user_id)
+    return result
 
 
 def get_transactions_by_user(user_id: int, limit: int = 200) -> List[Transaction]:
-    conn = get_connection()
-    cur = conn.cursor()
-    cur.execute(
-        "SELECT id, user_id, date, amount, category, ttype, description FROM transactions WHERE user_id = ? ORDER BY date DESC LIMIT ?",
-        (user_id, limit)
+    return get_backend().get_transactions_by_user(user_id, limit)
+
+
+def search_transactions(user_id: int, start_date: Optional[str] = None, end_date: Optional[str] = None, category: Optional[str] = None, limit: int = 500) -> List[Transaction]:
+    """
+    The user's transactions between start_date and end_date (inclusive, ISO dates), newest
+    first. Reaches into the archive only when the range extends past its cutoff.
+    """
+    return get_backend().search_transactions(user_id, start_date, end_date, category, limit)
+
+
+def get_transaction_by_id(tx_id: int, user_id: Optional[int] = None) -> Optional[Transaction]:
+    """
+    Look a transaction up by id. With sharding, pass user_id to avoid probing every shard
+    (ids are unique across shards, see sharding.reserve_id_range).
+    """
+    return get_backend().get_transaction_by_id(tx_id, user_id)
+
+
+def get_balance(user_id: int, currency: str = None) -> float:
+    """
+    Balance in `currency` (default: settings.DEFAULT_CURRENCY).
+    """
+    return get_backend().get_balance(user_id, _reporting_currency(currency))
+
+
+def get_monthly_summary(user_id: int, currency: str = None) -> List[Dict]:
+    """
+    Returns monthly totals grouped by YYYY-MM (list of dicts with 'month','income','expense'),
+    converted to `currency` (default: settings.DEFAULT_CURRENCY)
+    """
+    return get_backend().get_monthly_summary(user_id, _reporting_currency(currency))
+
+
+def get_category_totals(user_id: int, ttype: str = "expense", month: str = None, currency: str = None) -> List[Dict]:
+    """
+    Totals per category for one transaction type, optionally limited to a YYYY-MM month,
+    converted to `currency`. Largest first (list of dicts with 'category','total').
+    """
+    return get_backend().get_category_totals(user_id, ttype, month, _reporting_currency(currency))
+
+
+def get_exchange_rates() -> List[Tuple[str, str, float]]:
+    """
+    All stored rates as (currency, date, rate), ordered by currency then date.
+    """
+    return get_backend().get_exchange_rates()
+
+
+def save_exchange_rates(rates: List[Tuple[str, str, float]]) -> int:
+    """
+    Insert or replace (currency, date, rate) rows in every shard. Returns the number of rows written.
+    """
+    return get_backend().save_exchange_rates(rates)
+
+
+def update_transaction(tx_id: int, user_id: int, date_iso: str, amount: float, category: str, ttype: str, description: str = None, currency: str = None,
+                       then: Optional[Callable[[StatsWriter, Transaction], None]] = None) -> Tuple[bool, str]:
+    """
+    Update a transaction. A currency of None keeps the stored one. then(stats, the transaction
+    as it was) runs in the same write (see add_transaction_with_id).
+    """
+    result = get_backend().update_transaction(tx_id, user_id, date_iso, amount, category, ttype, description, currency, then)
+    if result[0]:
+        _notify(user_id)
+    return result
+
+
+def delete_transaction(tx_id: int, user_id: int, then: Optional[Callable[[StatsWriter, Transaction], None]] = None) -> Tuple[bool, str]:
+    """
+    Delete a transaction; then(stats, the deleted transaction) runs in the same write.
+    """
+    result = get_backend().delete_transaction(tx_id, user_id, then)
+    if result[0]:
+        _notify(user_id)
+    return result
+
+
+# ----------------- Bulk changes -----------------
+def preview_transactions(user_id: int, flt: TransactionFilter, limit: int = 20) -> Tuple[int, List[Transaction]]:
+    """
+    How many of the user's transactions match `flt`, and the newest `limit` of them.
+    """
+    return get_backend().preview_transactions(user_id, flt, limit)
+
+
+def bulk_update_transactions(user_id: int, flt: TransactionFilter, changes: Dict[str, Optional[str]],
+                             then: Optional[Callable[[StatsWriter], None]] = None) -> Tuple[bool, str, int]:
+    """
+    Set `changes` ({"category": ..., "ttype": ..., "description": ...}, any subset) on all
+    transactions matching `flt` in one statement. Returns (ok, message, rows changed).
+    When rows changed, then(stats) runs in the same write.
+    """
+    result = get_backend().bulk_update_transactions(user_id, flt, changes, then)
+    if result[0] and result[2]:
+        _notify(user_id)
+    return result
+
+
+def bulk_delete_transactions(user_id: int, flt: TransactionFilter, then: Optional[Callable[[StatsWriter], None]] = None) -> Tuple[bool, str, int]:
+    """
+    Delete all transactions matching `flt` in one statement. Returns (ok, message, rows deleted).
+    When rows were deleted, then(stats) runs in the same write.
+    """
+    result = get_backend().bulk_delete_transactions(user_id, flt, then)
+    if result[0] and result[2]:
+        _notify(user_id)
+    return result
+
+
+# ----------------- Change feed -----------------
+def get_transaction_changes(user_id: int, since: int = 0, limit: int = 1000) -> Dict:
+    """
+    Transactions changed after sequence number `since`, for delta sync. Returns a dict with
+    'upserts' (current Transaction rows), 'deletes' (ids), 'watermark' (pass as `since` next time)
+    and 'more' (another page is waiting). With since=0, or a `since` older than what compaction
+    kept, 'full' is True and 'upserts' holds every transaction of the user: replace, don't merge.
+    """
+    return get_backend().get_transaction_changes(user_id, since, limit)
+
+
+def get_change_watermark(shard: Optional[int] = None) -> int:
+    """
+    Highest change-log sequence number in a shard (see ledger_shards).
+    """
+    return get_backend().get_change_watermark(shard)
+
+
+def tail_transaction_changes(since: int, limit: int = 1000, shard: Optional[int] = None) -> List[Tuple[int, int]]:
+    """
+    (seq, user_id) of every user's changes after `since` in one shard, in seq order: which
+    users' transactions changed, for push notifications (see api.events).
+    """
+    return get_backend().tail_transaction_changes(since, limit, shard)
+
+
+def compact_transaction_changes(retention_days: Optional[int] = None) -> int:
+    """
+    Drop superseded change-log entries and tombstones older than `retention_days`
+    (default settings.CHANGE_LOG_RETENTION_DAYS). Returns the number of entries removed.
+    """
+    days = settings.CHANGE_LOG_RETENTION_DAYS if retention_days is None else retention_days
+    cutoff = (datetime.utcnow() - timedelta(days=days)).strftime("%Y-%m-%d %H:%M:%S")
+    return get_backend().compact_transaction_changes(cutoff)
+
+
+def archive_transactions(horizon_days: Optional[int] = None) -> int:
+    """
+    Move transactions older than `horizon_days` (default settings.ARCHIVE_HORIZON_DAYS)
+    into the compressed archive (see database.archive). Returns the number of rows moved.
+    """
+    days = settings.ARCHIVE_HORIZON_DAYS if horizon_days is None else horizon_days
+    before = (datetime.utcnow() - timedelta(days=days)).strftime("%Y-%m-%d")
+    return get_backend().archive_transactions(before)
+
+
+# ----------------- Expense statistics and anomalies -----------------
+def update_category_stats(user_id: int, category: str, update: Callable[[Optional[CategoryStats]], CategoryStats]) -> Tuple[bool, str]:
+    """
+    Atomically replace the user's statistics for `category` with update(current);
+    current is None for a category without statistics yet.
+    """
+    return get_backend().update_category_stats(user_id, category, update)
+
+
+def replace_category_stats(user_id: int, stats: List[CategoryStats]) -> Tuple[bool, str]:
+    """
+    Atomically replace all of the user's category statistics (see finance.anomalies.rebuild).
+    """
+    return get_backend().replace_category_stats(user_id, stats)
+
+
+def replace_anomaly(user_id: int, tx_id: int, anomaly: Optional[Anomaly] = None) -> Tuple[bool, str]:
+    """
+    Record `anomaly` for a transaction, replacing any earlier one; None just clears it.
+    """
+    return get_backend().replace_anomaly(user_id, tx_id, anomaly)
+
+
+def get_anomalies(user_id: int, limit: int = 100) -> List[Anomaly]:
+    """
+    The user's flagged transactions, most recently flagged first.
+    """
+    return get_backend().get_anomalies(user_id, limit)
+
+
+# ----------------- Recurring rule functions -----------------
+def add_recurring_rule(user_id: int, amount: float, category: str, ttype: str, description: Optional[str], frequency: str, interval: int, cron: Optional[str], start_date: str, end_date: Optional[str], next_due: Optional[str], currency: str = None) -> Tuple[bool, str]:
+    return get_backend().add_recurring_rule(
+        user_id, amount, category, ttype, description, frequency, interval, cron, start_date, end_date, next_due,
+        datetime.utcnow().isoformat(), currency or settings.DEFAULT_CURRENCY
     )
-    rows = cur.fetchall()
-    conn.close()
-    return [Transaction.from_row(tuple(r)) for r in rows]
 
 
-def get_transaction_by_id(tx_id: int) -> Optional[Transaction]:
-    conn = get_connection()
-    cur = conn.cursor()
-    cur.execute(
-        "SELECT id, user_id, date, amount, category, ttype, description FROM transactions WHERE id = ?",
-        (tx_id,)
+def get_recurring_rules(user_id: int) -> List[RecurringRule]:
+    return get_backend().get_recurring_rules(user_id)
+
+
+def delete_recurring_rule(rule_id: int, user_id: int) -> Tuple[bool, str]:
+    """
+    Delete a rule. Occurrences that were already materialized stay in the ledger.
+    """
+    return get_backend().delete_recurring_rule(rule_id, user_id)
+
+
+def get_due_recurring_rules(as_of: str, after_id: int = 0, limit: int = 500, shard: Optional[int] = None) -> List[RecurringRule]:
+    """
+    One page of rules (ordered by id, starting after `after_id`) with an occurrence due on or before `as_of`,
+    from one shard (see ledger_shards).
+    """
+    return get_backend().get_due_recurring_rules(as_of, after_id, limit, shard)
+
+
+def materialize_recurring(occurrences: List[Tuple], advances: List[Tuple[Optional[str], int, str]], shard: Optional[int] = None) -> int:
+    """
+    Insert a batch of recurring occurrences and move the rules' next_due forward, in one commit.
+    occurrences: (user_id, date, amount, category, ttype, description, currency, recurring_id) tuples
+    advances: (new_next_due, rule_id, old_next_due) tuples; a rule only advances if nobody else moved it first
+    All rules must come from `shard`.
+    Returns the number of newly inserted transactions (duplicates are ignored).
+    """
+    inserted = get_backend().materialize_recurring(occurrences, advances, shard)
+    if inserted:
+        for user_id in {o[0] for o in occurrences}:
+            _notify(user_id)
+    return inserted
+
+
+# ----------------- Categorization rule functions -----------------
+def add_category_rule(user_id: int, category: str, pattern: Optional[str], match: str = "substring", ttype: Optional[str] = None, min_amount: Optional[float] = None, max_amount: Optional[float] = None, priority: int = 0) -> Tuple[bool, str]:
+    return get_backend().add_category_rule(
+        user_id, category, pattern, match, ttype, min_amount, max_amount, priority, datetime.utcnow().isoformat()
     )
-    row = cur.fetchone()
-    conn.close()
-    return Transaction.from_row(tuple(row)) if row else None
-
-
-def get_balance(user_id: int) -> float:
-    conn = get_connection()
-    cur = conn.cursor()
-    cur.execute("SELECT SUM(CASE WHEN ttype='income' THEN amount ELSE -amount END) as balance FROM transactions WHERE user_id = ?", (user_id,))
-    row = cur.fetchone()
-    conn.close()
-    return float(row["balance"]) if row and row["balance"] is not None else 0.0
-
-
-def get_monthly_summary(user_id: int) -> List[Dict]:
-    """
-    Returns monthly totals grouped by YYYY-MM (list of dicts with 'month','income','expense')
-    """
-    conn = get_connection()
-    cur = conn.cursor()
-    cur.execute("""
-    SELECT substr(date,1,7) as month,
-           SUM(CASE WHEN ttype='income' THEN amount ELSE 0 END) as income,
-           SUM(CASE WHEN ttype='expense' THEN amount ELSE 0 END) as expense
-    FROM transactions
-    WHERE user_id = ?
-    GROUP BY month
-    ORDER BY month ASC
-    """, (user_id,))
-    rows = cur.fetchall()
-    conn.close()
-    summary = []
-    for r in rows:
-        summary.append({"month": r["month"], "income": float(r["income"] or 0.0), "expense": float(r["expense"] or 0.0)})
-    return summary
-
-
-def update_transaction(tx_id: int, user_id: int, date_iso: str, amount: float, category: str, ttype: str, description: str = None) -> Tuple[bool, str]:
-    try:
-        conn = get_connection()
-        cur = conn.cursor()
-        cur.execute(
-            "UPDATE transactions SET date = ?, amount = ?, category = ?, ttype = ?, description = ? WHERE id = ? AND user_id = ?",
-            (date_iso, amount, category, ttype, description, tx_id, user_id)
-        )
-        conn.commit()
-        if cur.rowcount == 0:
-            return False, "Transaction not found or not authorized"
-        return True, "Updated"
-    except Exception as e:
-        return False, f"Error: {e}"
-    finally:
-        conn.close()
-
-
-def delete_transaction(tx_id: int, user_id: int) -> Tuple[bool, str]:
-    try:
-        conn = get_connection()
-        cur = conn.cursor()
-        cur.execute(
-            "DELETE FROM transactions WHERE id = ? AND user_id = ?",
-            (tx_id, user_id)
-        )
-        conn.commit()
-        if cur.rowcount == 0:
-            return False, "Transaction not found or not authorized"
-        return True, "Deleted"
-    except Exception as e:
-        return False, f"Error: {e}"
-    finally:
-        conn.close()
+
+
+def get_category_rules(user_id: int) -> List[CategoryRule]:
+    """
+    The user's rules in the order they are tried: highest priority first, then oldest first.
+    """
+    return get_backend().get_category_rules(user_id)
+
+
+def delete_category_rule(rule_id: int, user_id: int) -> Tuple[bool, str]:
+    """
+    Delete a rule. Transactions it already categorized keep their category.
+    """
+    return get_backend().delete_category_rule(rule_id, user_id)
+
+
+def get_category_rules_version(user_id: int) -> Tuple[int, int]:
+    """
+    A cheap fingerprint of the user's rules that changes whenever one is added or deleted
+    (ids are never reused), for caches of compiled rules (see finance.categorize).
+    """
+    return get_backend().get_category_rules_version(user_id)
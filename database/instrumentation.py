@@ -0,0 +1,199 @@
+"""
+SQLite instrumentation: per-statement-shape counters and timings, open connection
+count and the slow-query log.
+
+Connections are created with InstrumentedConnection as factory (see
+database.db.get_connection). Every statement SQLite runs -- including the
+implicit BEGIN/COMMIT -- is counted through sqlite3's trace callback. SQLite's
+trace hook has no duration, so time is measured around cursor.execute /
+executemany, which is how every query in database/db.py is issued.
+
+Statements slower than settings.SLOW_QUERY_MS are logged with their shape,
+parameter types and EXPLAIN QUERY PLAN output (see get_slow_queries).
+"""
+
+import collections
+import json
+import logging
+import os
+import re
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+from datetime import datetime
+from functools import lru_cache
+from typing import Dict, List
+
+from config import settings
+from utils import metrics
+
+_STRING_RE = re.compile(r"'(?:[^']|'')*'")
+_NUMBER_RE = re.compile(r"(?<![\w.])-?\d+(?:\.\d+)?(?:[eE][-+]?\d+)?")
+_IN_LIST_RE = re.compile(r"\(\s*\?(?:\s*,\s*\?)+\s*\)")
+_SPACE_RE = re.compile(r"\s+")
+_MAX_SHAPE_LEN = 200
+
+SQL_STATEMENTS = metrics.counter(
+    "finance_sql_statements_total", "SQL statements executed, by normalized statement shape", ["shape"]
+)
+SQL_SECONDS = metrics.histogram(
+    "finance_sql_statement_seconds", "Time spent in cursor.execute/executemany, by normalized statement shape", ["shape"]
+)
+OPEN_CONNECTIONS = metrics.gauge("finance_sqlite_open_connections", "SQLite connections currently open")
+SLOW_QUERIES = metrics.counter(
+    "finance_sql_slow_queries_total", "Statements slower than SLOW_QUERY_MS, by normalized statement shape", ["shape"]
+)
+
+logger = logging.getLogger("finance.slow_query")
+_slow_log = collections.deque(maxlen=settings.SLOW_QUERY_LOG_SIZE)
+_slow_lock = threading.Lock()
+_file_handler_ready = False
+_captures: List[list] = []
+
+
+def _count_open_files():
+    try:
+        return len(os.listdir("/proc/self/fd"))
+    except OSError:
+        return None
+
+
+metrics.gauge("finance_process_open_fds", "File descriptors open in this process", callback=_count_open_files)
+
+
+@lru_cache(maxsize=1024)
+def normalize_sql(sql: str) -> str:
+    """
+    Reduce a statement to its shape: literals become ?, IN-lists collapse, whitespace is squeezed.
+    """
+    shape = _STRING_RE.sub("?", sql)
+    shape = _NUMBER_RE.sub("?", shape)
+    shape = _IN_LIST_RE.sub("(?, ...)", shape)
+    shape = _SPACE_RE.sub(" ", shape).strip()
+    if len(shape) > _MAX_SHAPE_LEN:
+        shape = shape[:_MAX_SHAPE_LEN] + "..."
+    return shape
+
+
+def param_shape(parameters):
+    """
+    Types of bound parameters, without their values: ["int", "str"] or {"user_id": "int"}.
+    """
+    if isinstance(parameters, dict):
+        return {k: type(v).__name__ for k, v in parameters.items()}
+    return [type(v).__name__ for v in parameters]
+
+
+def explain(conn: sqlite3.Connection, sql: str, parameters=()) -> List[str]:
+    """
+    EXPLAIN QUERY PLAN rows for a statement, as plan detail strings.
+    """
+    cur = sqlite3.Cursor(conn)
+    try:
+        cur.execute("EXPLAIN QUERY PLAN " + sql, parameters)
+        return [row[3] for row in cur.fetchall()]
+    finally:
+        cur.close()
+
+
+def _ensure_file_handler() -> None:
+    global _file_handler_ready
+    if _file_handler_ready:
+        return
+    _file_handler_ready = True
+    if settings.SLOW_QUERY_LOG_FILE:
+        handler = logging.FileHandler(settings.SLOW_QUERY_LOG_FILE, encoding="utf-8")
+        handler.setFormatter(logging.Formatter("%(message)s"))
+        logger.addHandler(handler)
+        logger.setLevel(logging.WARNING)
+
+
+def _record_slow(conn: sqlite3.Connection, sql: str, parameters, elapsed: float, many: bool) -> None:
+    shape = normalize_sql(sql)
+    SLOW_QUERIES.inc(shape)
+    plan = []
+    if not many and sql.split(None, 1)[0].upper() in ("SELECT", "UPDATE", "DELETE", "INSERT", "WITH"):
+        try:
+            plan = explain(conn, sql, parameters)
+        except sqlite3.Error:
+            pass
+    entry = {
+        "at": datetime.utcnow().isoformat(),
+        "ms": round(elapsed * 1000, 3),
+        "sql": shape,
+        "params": "executemany" if many else param_shape(parameters),
+        "plan": plan,
+    }
+    with _slow_lock:
+        _slow_log.append(entry)
+    _ensure_file_handler()
+    logger.warning(json.dumps(entry))
+
+
+def get_slow_queries() -> List[Dict]:
+    """
+    Most recent slow statements, oldest first (at most settings.SLOW_QUERY_LOG_SIZE).
+    """
+    with _slow_lock:
+        return list(_slow_log)
+
+
+@contextmanager
+def capture_statements():
+    """
+    Collect (sql, parameters) for every statement executed through TimedCursor inside the block.
+    Used by database.plan_guard to find the queries a function issues.
+    """
+    captured = []
+    _captures.append(captured)
+    try:
+        yield captured
+    finally:
+        _captures.remove(captured)
+
+
+def _trace(statement: str) -> None:
+    SQL_STATEMENTS.inc(normalize_sql(statement))
+
+
+class TimedCursor(sqlite3.Cursor):
+    def execute(self, sql, parameters=()):
+        if _captures:
+            _captures[-1].append((sql, parameters))
+        start = time.perf_counter()
+        try:
+            return super().execute(sql, parameters)
+        finally:
+            elapsed = time.perf_counter() - start
+            SQL_SECONDS.observe(elapsed, normalize_sql(sql))
+            if 0 < settings.SLOW_QUERY_MS <= elapsed * 1000:
+                _record_slow(self.connection, sql, parameters, elapsed, many=False)
+
+    def executemany(self, sql, seq_of_parameters):
+        start = time.perf_counter()
+        try:
+            return super().executemany(sql, seq_of_parameters)
+        finally:
+            elapsed = time.perf_counter() - start
+            SQL_SECONDS.observe(elapsed, normalize_sql(sql))
+            if 0 < settings.SLOW_QUERY_MS <= elapsed * 1000:
+                _record_slow(self.connection, sql, (), elapsed, many=True)
+
+
+class InstrumentedConnection(sqlite3.Connection):
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._closed = False
+        if settings.METRICS_ENABLED:
+            self.set_trace_callback(_trace)
+        OPEN_CONNECTIONS.inc()
+
+    def cursor(self, factory=TimedCursor):
+        return super().cursor(factory)
+
+    def close(self):
+        if not self._closed:
+            self._closed = True
+            OPEN_CONNECTIONS.dec()
+        super().close()
@@ -0,0 +1,309 @@
+"""
+Routine maintenance of the SQLite databases (sqlite backend).
+
+  python -m database.maintenance run        # one pass over every database file
+  python -m database.maintenance status     # size, free pages and vacuum mode per file
+  python -m database.maintenance vacuum     # full VACUUM; stop the API first
+
+A pass does, per file (DB_PATH, or the shard directory and every shard):
+
+  optimize     PRAGMA optimize with a bounded analysis_limit, so the planner's
+               statistics follow the data without a full ANALYZE
+  vacuum       PRAGMA incremental_vacuum(MAINTENANCE_VACUUM_PAGES) in steps with
+               a pause between them, until no free pages are left or the file's
+               MAINTENANCE_BUDGET_MS is spent; each step is a short write, so the
+               group-commit writer is never held up for long
+  checkpoint   PRAGMA wal_checkpoint(PASSIVE): copies what it can without waiting
+               for readers or writers
+  integrity    PRAGMA quick_check (or integrity_check), a read transaction that
+               writers don't wait for; abandoned when the budget runs out
+
+and reports the bytes reclaimed, the file sizes (database plus WAL) before and
+after, and the time taken.
+Files created before incremental auto-vacuum was enabled keep their free
+pages until one full `vacuum`, which also switches them over.
+
+start_maintenance() runs passes from the API process on a low-priority thread.
+"""
+
+import logging
+import os
+import sqlite3
+import sys
+import threading
+import time
+from typing import Dict, List, Optional, Tuple
+
+from config import settings
+from utils import metrics
+from . import sharding
+
+logger = logging.getLogger(__name__)
+
+ANALYSIS_LIMIT = 400  # rows sampled per index by PRAGMA optimize's ANALYZE
+BUSY_TIMEOUT_SECONDS = 1.0  # a step that can't get the write lock quickly is retried next pass
+INTEGRITY_CHECKS = ("quick", "full", "off")
+
+RUNS = metrics.counter("finance_maintenance_runs_total", "Maintenance passes by outcome", ["status"])
+RUN_SECONDS = metrics.histogram(
+    "finance_maintenance_duration_seconds", "Wall time of a maintenance pass", buckets=(0.1, 0.5, 1, 5, 15, 60, 300)
+)
+RECLAIMED = metrics.counter("finance_maintenance_reclaimed_bytes_total", "Bytes returned to the file system by maintenance")
+
+
+class MaintenanceError(Exception):
+    pass
+
+
+def _files() -> List[Tuple[str, str]]:
+    """
+    (name, path) of every live database file.
+    """
+    if sharding.enabled():
+        files = [("directory.db", sharding.directory_path())]
+        files += [(os.path.basename(sharding.shard_path(i)), sharding.shard_path(i)) for i in range(settings.SHARD_COUNT)]
+    else:
+        files = [(os.path.basename(settings.DB_PATH), settings.DB_PATH)]
+    return [(name, path) for name, path in files if os.path.exists(path)]
+
+
+def _size(path: str) -> int:
+    total = 0
+    for suffix in ("", "-wal"):
+        try:
+            total += os.path.getsize(path + suffix)
+        except FileNotFoundError:
+            pass
+    return total
+
+
+def _pragma(conn: sqlite3.Connection, name: str):
+    return conn.execute(f"PRAGMA {name}").fetchone()[0]
+
+
+def _lower_priority() -> None:
+    # Linux applies nice values per thread; elsewhere this is a no-op
+    try:
+        os.setpriority(os.PRIO_PROCESS, threading.get_native_id(), 10)
+    except (AttributeError, OSError):
+        pass
+
+
+def _vacuum_step(conn: sqlite3.Connection, pages: int) -> None:
+    # The sqlite3 module steps a statement without result columns only once, and each
+    # step of incremental_vacuum frees one page: one execute per page, one commit per step
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        for _ in range(pages):
+            conn.execute("PRAGMA incremental_vacuum(1)")
+        conn.execute("COMMIT")
+    except BaseException:
+        conn.execute("ROLLBACK")
+        raise
+
+
+def maintain_file(path: str, budget_ms: Optional[int] = None, vacuum_pages: Optional[int] = None,
+                  step_sleep_ms: Optional[int] = None, integrity: Optional[str] = None) -> Dict:
+    """
+    One maintenance pass over a database file (see the module docstring). Returns what it did.
+    """
+    budget_ms = settings.MAINTENANCE_BUDGET_MS if budget_ms is None else budget_ms
+    vacuum_pages = settings.MAINTENANCE_VACUUM_PAGES if vacuum_pages is None else vacuum_pages
+    step_sleep_ms = settings.MAINTENANCE_STEP_SLEEP_MS if step_sleep_ms is None else step_sleep_ms
+    integrity = settings.MAINTENANCE_INTEGRITY_CHECK if integrity is None else integrity
+    started = time.perf_counter()
+    deadline = started + budget_ms / 1000.0
+    size_before = _size(path)
+    report = {"path": path, "budget_exhausted": False}
+
+    # Autocommit: every PRAGMA below is its own short transaction
+    conn = sqlite3.connect(path, timeout=BUSY_TIMEOUT_SECONDS, isolation_level=None)
+    try:
+        page_size = _pragma(conn, "page_size")
+        report["auto_vacuum"] = ("none", "full", "incremental")[_pragma(conn, "auto_vacuum")]
+
+        step = time.perf_counter()
+        conn.execute(f"PRAGMA analysis_limit={ANALYSIS_LIMIT}")
+        try:
+            conn.execute("PRAGMA optimize")
+            report["optimize_ms"] = round((time.perf_counter() - step) * 1000, 1)
+        except sqlite3.OperationalError:  # busy: statistics are refreshed next pass
+            report["optimize_ms"] = None
+
+        free_before = _pragma(conn, "freelist_count")
+        if report["auto_vacuum"] == "incremental":
+            while _pragma(conn, "freelist_count") > 0:
+                if time.perf_counter() >= deadline:
+                    report["budget_exhausted"] = True
+                    break
+                try:
+                    _vacuum_step(conn, vacuum_pages)
+                except sqlite3.OperationalError:  # busy: the writer keeps priority
+                    break
+                time.sleep(step_sleep_ms / 1000.0)
+        free_after = _pragma(conn, "freelist_count")
+        report["freed_pages"] = free_before - free_after
+        report["free_pages_left"] = free_after
+
+        busy, wal_frames, checkpointed = conn.execute("PRAGMA wal_checkpoint(PASSIVE)").fetchone()
+        report["wal_frames"] = max(wal_frames, 0)
+        report["wal_frames_checkpointed"] = max(checkpointed, 0)
+
+        report["integrity"] = "skipped"
+        if integrity != "off":
+            if time.perf_counter() >= deadline:
+                report["budget_exhausted"] = True
+            else:
+                conn.set_progress_handler(lambda: int(time.perf_counter() >= deadline), 10000)
+                try:
+                    rows = conn.execute("PRAGMA quick_check" if integrity == "quick" else "PRAGMA integrity_check").fetchall()
+                    report["integrity"] = "; ".join(r[0] for r in rows)
+                except sqlite3.OperationalError as e:
+                    if "interrupt" not in str(e):
+                        raise
+                    report["budget_exhausted"] = True
+                finally:
+                    conn.set_progress_handler(None, 0)
+    finally:
+        conn.close()
+
+    # Freed pages leave the database file once the WAL frames truncating it are checkpointed
+    report["reclaimed_bytes"] = report["freed_pages"] * page_size
+    report["free_bytes_left"] = report["free_pages_left"] * page_size
+    report["bytes_before"], report["bytes_after"] = size_before, _size(path)
+    report["seconds"] = round(time.perf_counter() - started, 3)
+    return report
+
+
+def run_maintenance(**options) -> Dict:
+    """
+    maintain_file over every database file; options as in maintain_file.
+    Raises MaintenanceError on another storage backend.
+    """
+    if settings.STORAGE_BACKEND != "sqlite":
+        raise MaintenanceError("Maintenance works on the SQLite files; the sqlalchemy backend's server maintains its own")
+    started = time.perf_counter()
+    files = []
+    try:
+        for name, path in _files():
+            report = maintain_file(path, **options)
+            report["file"] = name
+            files.append(report)
+    except Exception:
+        RUNS.inc("failed")
+        raise
+    seconds = time.perf_counter() - started
+    reclaimed = sum(f["reclaimed_bytes"] for f in files)
+    RUNS.inc("ok" if all(f["integrity"] in ("ok", "skipped") for f in files) else "integrity_error")
+    RUN_SECONDS.observe(seconds)
+    RECLAIMED.inc(reclaimed)
+    return {"files": files, "reclaimed_bytes": reclaimed, "seconds": round(seconds, 3)}
+
+
+def status() -> List[Dict]:
+    result = []
+    for name, path in _files():
+        conn = sqlite3.connect(f"file:{path}?mode=ro", uri=True, timeout=BUSY_TIMEOUT_SECONDS)
+        try:
+            page_size = _pragma(conn, "page_size")
+            result.append({
+                "file": name,
+                "bytes": _size(path),
+                "free_bytes": _pragma(conn, "freelist_count") * page_size,
+                "auto_vacuum": ("none", "full", "incremental")[_pragma(conn, "auto_vacuum")],
+            })
+        finally:
+            conn.close()
+    return result
+
+
+def full_vacuum() -> int:
+    """
+    VACUUM every file, switching it to incremental auto-vacuum. Rewrites whole files and
+    blocks writers while it runs: for a maintenance window. Returns the bytes reclaimed.
+    """
+    if settings.STORAGE_BACKEND != "sqlite":
+        raise MaintenanceError("Maintenance works on the SQLite files; the sqlalchemy backend's server maintains its own")
+    reclaimed = 0
+    for _name, path in _files():
+        before = _size(path)
+        conn = sqlite3.connect(path, timeout=30, isolation_level=None)
+        try:
+            conn.execute("PRAGMA auto_vacuum=INCREMENTAL")
+            conn.execute("VACUUM")
+            conn.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+        finally:
+            conn.close()
+        reclaimed += max(before - _size(path), 0)
+    return reclaimed
+
+
+def _summary(result: Dict) -> str:
+    left = sum(f["free_bytes_left"] for f in result["files"])
+    problems = [f"{f['file']}: {f['integrity']}" for f in result["files"] if f["integrity"] not in ("ok", "skipped")]
+    line = (f"Maintenance: {len(result['files'])} file(s), reclaimed {result['reclaimed_bytes']} bytes "
+            f"({left} free bytes left) in {result['seconds']}s")
+    stuck = [f["file"] for f in result["files"] if f["auto_vacuum"] != "incremental" and f["free_pages_left"]]
+    if stuck:
+        line += f"; {', '.join(stuck)} need one full `python -m database.maintenance vacuum` to release free pages"
+    return line + ("; integrity problems: " + ", ".join(problems) if problems else "")
+
+
+def start_maintenance(interval_seconds: Optional[int] = None) -> Optional[threading.Thread]:
+    """
+    Run run_maintenance periodically in a low-priority daemon thread. Returns None when
+    disabled or on the sqlalchemy backend.
+    """
+    interval_seconds = settings.MAINTENANCE_INTERVAL_SECONDS if interval_seconds is None else interval_seconds
+    if interval_seconds <= 0 or settings.STORAGE_BACKEND != "sqlite":
+        return None
+    stop = threading.Event()
+
+    def _loop():
+        _lower_priority()
+        while not stop.wait(interval_seconds):
+            try:
+                logger.info(_summary(run_maintenance()))
+            except Exception:
+                logger.exception("Maintenance failed")
+
+    thread = threading.Thread(target=_loop, name="db-maintenance", daemon=True)
+    thread.stop_event = stop
+    thread.start()
+    return thread
+
+
+def main(argv=None) -> int:
+    import argparse
+    import json
+
+    parser = argparse.ArgumentParser(description="Maintenance of the finance databases")
+    sub = parser.add_subparsers(dest="command", required=True)
+    run = sub.add_parser("run", help="optimize, incremental vacuum, checkpoint and integrity check")
+    run.add_argument("--budget-ms", type=int, default=None, help="time budget per file")
+    run.add_argument("--vacuum-pages", type=int, default=None, help="pages freed per incremental vacuum step")
+    run.add_argument("--integrity", choices=INTEGRITY_CHECKS, default=None)
+    run.add_argument("--json", action="store_true", help="print the full report")
+    sub.add_parser("status", help="size, free space and vacuum mode per file")
+    sub.add_parser("vacuum", help="full VACUUM (switches files to incremental auto-vacuum); stop the API first")
+    args = parser.parse_args(argv)
+
+    try:
+        if args.command == "run":
+            result = run_maintenance(budget_ms=args.budget_ms, vacuum_pages=args.vacuum_pages, integrity=args.integrity)
+            print(json.dumps(result, indent=2) if args.json else _summary(result))
+            if any(f["integrity"] not in ("ok", "skipped") for f in result["files"]):
+                return 1
+        elif args.command == "status":
+            for f in status():
+                print(f"{f['file']}  {f['bytes']} bytes  {f['free_bytes']} free  auto_vacuum={f['auto_vacuum']}")
+        else:
+            print(f"Reclaimed {full_vacuum()} bytes")
+    except MaintenanceError as e:
+        print(e, file=sys.stderr)
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -26,6 +26,7 @@ class Transaction:
     category: str
     ttype: str   # 'income' or 'expense'
     description: Optional[str]
+    currency: Optional[str] = None  # ISO 4217 code; None means settings.DEFAULT_CURRENCY
 
     @staticmethod
     def from_row(row):
@@ -38,5 +39,132 @@ class Transaction:
             amount=float(row[3]),
             category=row[4],
             ttype=row[5],
-            description=row[6]
+            description=row[6],
+            currency=row[7] if len(row) > 7 else None
         )
+
+
+@dataclass
+class RecurringRule:
+    id: int
+    user_id: int
+    amount: float
+    category: str
+    ttype: str
+    description: Optional[str]
+    frequency: str          # 'daily', 'weekly', 'monthly' or 'cron'
+    interval: int           # every N days/weeks/months (ignored for cron)
+    cron: Optional[str]     # "dom mon dow" (or full 5-field) expression
+    start_date: str         # ISO date of the first occurrence
+    end_date: Optional[str]
+    next_due: Optional[str]  # first occurrence not yet materialized, None when exhausted
+    currency: Optional[str] = None
+
+    @staticmethod
+    def from_row(row):
+        if row is None:
+            return None
+        return RecurringRule(
+            id=row[0],
+            user_id=row[1],
+            amount=float(row[2]),
+            category=row[3],
+            ttype=row[4],
+            description=row[5],
+            frequency=row[6],
+            interval=int(row[7]),
+            cron=row[8],
+            start_date=row[9],
+            end_date=row[10],
+            next_due=row[11],
+            currency=row[12] if len(row) > 12 else None
+        )
+
+
+@dataclass
+class CategoryRule:
+    id: int
+    user_id: int
+    category: str
+    pattern: Optional[str]      # None matches any description (amount-range rules)
+    match: str                  # 'substring' (case-insensitive) or 'regex'
+    ttype: Optional[str]        # only applies to this type; None = both
+    min_amount: Optional[float]  # inclusive bounds on the amount, None = unbounded
+    max_amount: Optional[float]
+    priority: int               # higher wins; ties go to the older rule
+
+    @staticmethod
+    def from_row(row):
+        if row is None:
+            return None
+        return CategoryRule(
+            id=row[0],
+            user_id=row[1],
+            category=row[2],
+            pattern=row[3],
+            match=row[4],
+            ttype=row[5],
+            min_amount=None if row[6] is None else float(row[6]),
+            max_amount=None if row[7] is None else float(row[7]),
+            priority=int(row[8])
+        )
+
+
+@dataclass
+class CategoryStats:
+    user_id: int
+    category: str
+    count: int
+    mean: float
+    m2: float               # sum of squared deviations (Welford)
+    sketch: Optional[str]   # JSON state of the median estimator (finance.anomalies.P2Quantile)
+
+    @staticmethod
+    def from_row(row):
+        if row is None:
+            return None
+        return CategoryStats(user_id=row[0], category=row[1], count=int(row[2]), mean=float(row[3]), m2=float(row[4]), sketch=row[5])
+
+
+@dataclass
+class Anomaly:
+    id: int
+    user_id: int
+    tx_id: int
+    date: str
+    category: str
+    amount: float           # in settings.DEFAULT_CURRENCY
+    score: float            # standard deviations above the category mean
+    ratio: Optional[float]  # amount / estimated category median
+    created_at: str
+
+    @staticmethod
+    def from_row(row):
+        if row is None:
+            return None
+        return Anomaly(
+            id=row[0],
+            user_id=row[1],
+            tx_id=row[2],
+            date=row[3],
+            category=row[4],
+            amount=float(row[5]),
+            score=float(row[6]),
+            ratio=None if row[7] is None else float(row[7]),
+            created_at=row[8]
+        )
+
+
+@dataclass
+class TransactionFilter:
+    """
+    Selects a user's transactions for bulk changes; fields left None match everything.
+    """
+    start_date: Optional[str] = None    # inclusive ISO dates
+    end_date: Optional[str] = None
+    category: Optional[str] = None
+    ttype: Optional[str] = None
+    description: Optional[str] = None   # case-insensitive substring of the description
+
+    def is_empty(self) -> bool:
+        return all(v is None for v in (self.start_date, self.end_date, self.category, self.ttype, self.description))
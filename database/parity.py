@@ -0,0 +1,218 @@
+"""
+Backend parity check.
+
+Runs one scripted session of database/db.py calls against each storage backend,
+each on a fresh temporary SQLite database, and compares what every call returned:
+the sqlite3 backend is the reference, SQLAlchemy must answer the same (it runs
+against SQLite here, so the check needs no database server).
+
+Run it as a check (exit status 1 on differences):
+  python -m database.parity
+"""
+
+import dataclasses
+import os
+import shutil
+import sys
+import tempfile
+from typing import Callable, List, Tuple
+
+from config import settings
+from . import db
+from .models import Anomaly, CategoryStats, TransactionFilter
+from .storage import get_backend
+
+BACKENDS = ("sqlite", "sqlalchemy")
+
+# Set from the clock when the row is written: never equal across two runs
+VOLATILE_FIELDS = ("created_at",)
+
+
+def _stats_hook(seen: List):
+    # What finance.anomalies does inside a transaction write, recording what the hook was given
+    def then(stats, arg):
+        seen.append(arg)
+        category = arg.category if hasattr(arg, "category") else "Food"
+        current = stats.get_stats(category) or CategoryStats(1, category, 0, 0.0, 0.0, None)
+        stats.put_stats(CategoryStats(current.user_id, category, current.count + 1, current.mean + 1.0, current.m2, current.sketch))
+        seen.append(stats.get_stats(category))
+    return then
+
+
+def _read_stats(user_id: int, category: str, seen: List):
+    # The stored statistics, read back through a no-op update
+    db.update_category_stats(user_id, category, lambda stats: seen.append(stats) or stats)
+    return seen[-1]
+
+
+def _recompute_hook(seen: List):
+    # What finance.anomalies.recompute does inside a bulk write
+    def then(stats):
+        expenses = list(stats.expenses())
+        seen.append(expenses)
+        stats.replace_stats([CategoryStats(1, "Food", len(expenses), sum(t.amount for t in expenses), 0.0, None)])
+    return then
+
+
+def _session() -> List[Tuple[str, Callable[[], object]]]:
+    """
+    The calls to compare, in order; later calls see the writes of earlier ones. Keep in sync
+    with db.py: check_coverage() fails if a public db function is neither here nor in UNCOMPARED.
+    """
+    seen: List = []
+    jan = TransactionFilter("2026-01-01", "2026-01-31")
+    return [
+        ("save_exchange_rates", lambda: db.save_exchange_rates([("EUR", "2026-01-01", 1.1), ("EUR", "2026-02-01", 1.2), ("GBP", "2026-01-01", 1.3)])),
+        ("get_exchange_rates", lambda: db.get_exchange_rates()),
+        ("create_user", lambda: (db.create_user("parity_a", "secret1"), db.create_user("parity_b", "secret2"), db.create_user("parity_a", "other"))),
+        ("get_user_by_username", lambda: (db.get_user_by_username("parity_a"), db.get_user_by_username("nobody"))),
+        ("verify_user", lambda: (db.verify_user("parity_a", "secret1"), db.verify_user("parity_a", "wrong"), db.verify_user("nobody", "secret1"))),
+        ("ledger_shards", lambda: db.ledger_shards()),
+        ("add_transaction", lambda: [db.add_transaction(1, f"2026-01-{d:02d}", 10.0 + d, "Food" if d % 3 else "Rent", "expense", f"shop {d}", "EUR" if d % 4 == 0 else None)
+                                     for d in range(1, 21)]),
+        ("add_transaction_with_id", lambda: (db.add_transaction_with_id(1, "2026-02-01", 2500.0, "Salary", "income", "pay"),
+                                             db.add_transaction_with_id(2, "2026-02-02", 40.0, "Food", "expense", None, "GBP", then=_stats_hook(seen)), seen[-2:])),
+        ("add_transactions", lambda: (db.add_transactions(1, [("2026-02-03", 7.5, "Food", "expense", "bakery", None), ("2026-02-04", 80.0, "Fun", "expense", None, "EUR")]),
+                                      db.add_transactions(2, [("2026-02-05", 12.0, "Food", "expense", "x", None)] * 3, then=_stats_hook(seen)), seen[-2:])),
+        ("get_transactions_by_user", lambda: (db.get_transactions_by_user(1), db.get_transactions_by_user(2, limit=2))),
+        ("search_transactions", lambda: (db.search_transactions(1, "2026-01-05", "2026-01-15"), db.search_transactions(1, category="Rent"), db.search_transactions(2, limit=1))),
+        ("get_transaction_by_id", lambda: (db.get_transaction_by_id(1), db.get_transaction_by_id(1, 1), db.get_transaction_by_id(1, 2), db.get_transaction_by_id(999))),
+        ("get_balance", lambda: (db.get_balance(1), db.get_balance(1, "EUR"), db.get_balance(2, "GBP"))),
+        ("get_monthly_summary", lambda: (db.get_monthly_summary(1), db.get_monthly_summary(2, "EUR"))),
+        ("get_category_totals", lambda: (db.get_category_totals(1), db.get_category_totals(1, "expense", "2026-01", "EUR"), db.get_category_totals(1, "income"))),
+        ("update_transaction", lambda: (db.update_transaction(1, 1, "2026-01-02", 99.0, "Fun", "expense", "edited", "GBP", then=_stats_hook(seen)), seen[-2:],
+                                        db.update_transaction(2, 1, "2026-01-02", 5.0, "Food", "expense"), db.update_transaction(1, 2, "2026-01-02", 5.0, "Food", "expense"),
+                                        db.get_transaction_by_id(1), db.get_transaction_by_id(2))),
+        ("delete_transaction", lambda: (db.delete_transaction(3, 1, then=_stats_hook(seen)), seen[-2:], db.delete_transaction(3, 1), db.delete_transaction(4, 2))),
+        ("preview_transactions", lambda: (db.preview_transactions(1, jan, 5), db.preview_transactions(1, TransactionFilter(description="shop 1")))),
+        ("bulk_update_transactions", lambda: (db.bulk_update_transactions(1, TransactionFilter(category="Rent"), {"category": "Housing", "description": None}),
+                                              db.bulk_update_transactions(1, TransactionFilter(category="Housing"), {"category": "Housing", "description": None}),
+                                              db.bulk_update_transactions(1, jan, {"ttype": "income"}, then=_recompute_hook(seen)), seen[-1:],
+                                              db.get_transactions_by_user(1), _read_stats(1, "Food", seen))),
+        ("bulk_delete_transactions", lambda: (db.bulk_delete_transactions(1, TransactionFilter("2026-01-10", "2026-01-14"), then=_recompute_hook(seen)), seen[-1:],
+                                              db.bulk_delete_transactions(2, TransactionFilter(category="Nothing")), db.get_transactions_by_user(1))),
+        ("get_transaction_changes", lambda: (db.get_transaction_changes(1), db.get_transaction_changes(1, since=5, limit=3), db.get_transaction_changes(2, since=1))),
+        ("get_change_watermark", lambda: db.get_change_watermark()),
+        ("tail_transaction_changes", lambda: (db.tail_transaction_changes(0), db.tail_transaction_changes(10, limit=5))),
+        # Default retention keeps this session's tombstones; -1 day purges them all, whatever second they were written in
+        ("compact_transaction_changes", lambda: (db.compact_transaction_changes(), db.get_transaction_changes(1, since=5), db.compact_transaction_changes(-1),
+                                                 db.get_transaction_changes(1, since=5), db.tail_transaction_changes(0))),
+        ("update_category_stats", lambda: (db.update_category_stats(1, "Food", lambda s: CategoryStats(1, "Food", 3, 12.5, 4.0, '{"p": 0.5, "initial": [1.0]}')),
+                                           db.update_category_stats(1, "Food", lambda s: CategoryStats(1, "Food", s.count + 1, s.mean, s.m2, s.sketch)),
+                                           _read_stats(1, "Food", seen), _read_stats(1, "Nothing", seen))),
+        ("replace_category_stats", lambda: (db.replace_category_stats(2, [CategoryStats(2, "Food", 3, 10.0, 2.0, None), CategoryStats(2, "Fun", 1, 5.0, 0.0, None)]),
+                                            _read_stats(2, "Fun", seen), db.replace_category_stats(2, []), _read_stats(2, "Fun", seen))),
+        ("replace_anomaly", lambda: (db.replace_anomaly(1, 5, Anomaly(None, 1, 5, "2026-01-05", "Food", 500.0, 4.2, 5.1, "2026-01-05 00:00:00")),
+                                     db.replace_anomaly(1, 6, Anomaly(None, 1, 6, "2026-01-06", "Food", 600.0, 4.5, None, "2026-01-06 00:00:00")),
+                                     db.replace_anomaly(1, 5, Anomaly(None, 1, 5, "2026-01-05", "Food", 510.0, 4.3, 5.2, "2026-01-05 00:00:00")),
+                                     db.replace_anomaly(1, 6))),
+        ("get_anomalies", lambda: (db.get_anomalies(1), db.get_anomalies(2))),
+        ("add_recurring_rule", lambda: (db.add_recurring_rule(1, 900.0, "Rent", "expense", "flat", "monthly", 1, None, "2026-01-01", None, "2026-01-01"),
+                                        db.add_recurring_rule(1, 5.0, "Fun", "expense", None, "cron", 1, "1 * *", "2026-01-01", "2026-06-30", "2026-03-01", "EUR"),
+                                        db.add_recurring_rule(2, 50.0, "Food", "expense", None, "weekly", 2, None, "2026-01-05", None, "2026-01-05"))),
+        ("get_recurring_rules", lambda: (db.get_recurring_rules(1), db.get_recurring_rules(2))),
+        ("get_due_recurring_rules", lambda: (db.get_due_recurring_rules("2026-02-01"), db.get_due_recurring_rules("2026-03-01", after_id=1, limit=1))),
+        ("materialize_recurring", lambda: (db.materialize_recurring([(1, "2026-01-01", 900.0, "Rent", "expense", "flat", "USD", 1)], [("2026-02-01", 1, "2026-01-01")]),
+                                           db.materialize_recurring([(1, "2026-01-01", 900.0, "Rent", "expense", "flat", "USD", 1)], [("2026-03-01", 1, "2026-01-01")]),
+                                           db.get_recurring_rules(1), db.search_transactions(1, category="Rent"))),
+        ("delete_recurring_rule", lambda: (db.delete_recurring_rule(3, 1), db.delete_recurring_rule(3, 2), db.get_recurring_rules(2))),
+        ("add_category_rule", lambda: (db.add_category_rule(1, "Food", "bakery", "substring", "expense", None, 50.0, 5),
+                                       db.add_category_rule(1, "Fun", r"^cinema\b", "regex", None, 1.0, None, 9),
+                                       db.add_category_rule(1, "Other", "shop", priority=5))),
+        ("get_category_rules", lambda: db.get_category_rules(1)),
+        ("get_category_rules_version", lambda: (db.get_category_rules_version(1), db.get_category_rules_version(2))),
+        ("delete_category_rule", lambda: (db.delete_category_rule(2, 2), db.delete_category_rule(2, 1), db.get_category_rules(1), db.get_category_rules_version(1))),
+    ]
+
+
+# Public db functions whose results are not compared
+UNCOMPARED = {
+    "get_connection",      # a driver connection object
+    "init_db",             # run before every session
+    "add_write_listener",  # in-process callbacks, not storage
+    "archive_transactions",  # the SQLAlchemy backend keeps every row in its one database by design
+}
+
+
+def _normalize(value):
+    if dataclasses.is_dataclass(value) and not isinstance(value, type):
+        return {f.name: _normalize(getattr(value, f.name)) for f in dataclasses.fields(value) if f.name not in VOLATILE_FIELDS}
+    if isinstance(value, dict):
+        return {k: _normalize(v) for k, v in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [_normalize(v) for v in value]
+    if isinstance(value, float):
+        return round(value, 6)
+    if isinstance(value, str) and value.startswith("Error:"):
+        return "Error"  # the driver's wording differs
+    return value
+
+
+def check_coverage() -> List[str]:
+    """
+    Public functions in database/db.py that the parity check does not know about.
+    """
+    covered = {name for name, _ in _session()} | UNCOMPARED
+    public = {
+        name for name, obj in vars(db).items()
+        if callable(obj) and not name.startswith("_") and getattr(obj, "__module__", None) == db.__name__
+    }
+    return sorted(public - covered)
+
+
+def run_session(backend: str) -> List[Tuple[str, object]]:
+    """
+    (name, normalized result) of every call in the session, run through `backend` on a fresh database.
+    """
+    workdir = tempfile.mkdtemp(prefix="finance_parity_")
+    previous = (settings.DB_PATH, settings.SHARD_COUNT, settings.STORAGE_BACKEND, settings.DATABASE_URL, settings.GROUP_COMMIT)
+    settings.DB_PATH = os.path.join(workdir, "finance.db")
+    settings.SHARD_COUNT = 0
+    settings.STORAGE_BACKEND = backend
+    settings.DATABASE_URL = None  # sqlite:///DB_PATH
+    settings.GROUP_COMMIT = False  # one database file per run: no writer thread left behind
+    try:
+        db.init_db()
+        results = []
+        for name, call in _session():
+            try:
+                results.append((name, _normalize(call())))
+            except Exception as e:
+                results.append((name, f"raised {type(e).__name__}"))
+        get_backend().dispose()
+    finally:
+        settings.DB_PATH, settings.SHARD_COUNT, settings.STORAGE_BACKEND, settings.DATABASE_URL, settings.GROUP_COMMIT = previous
+        shutil.rmtree(workdir, ignore_errors=True)
+    return results
+
+
+def check_parity() -> List[str]:
+    """
+    One message per db function whose result differs between the backends (empty list = parity).
+    """
+    differences = [f"{name}: not covered by database.parity" for name in check_coverage()]
+    reference, *others = [(backend, run_session(backend)) for backend in BACKENDS]
+    for backend, results in others:
+        for (name, expected), (_name, got) in zip(reference[1], results):
+            if got != expected:
+                differences.append(f"{name}: {backend} differs from {reference[0]}\n    {reference[0]}: {expected}\n    {backend}: {got}")
+    return differences
+
+
+def main(argv=None) -> int:
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Check that every storage backend returns the same results")
+    parser.parse_args(argv)
+    differences = check_parity()
+    if differences:
+        print(f"{len(differences)} backend difference(s):")
+        for d in differences:
+            print("  " + d)
+        return 1
+    print(f"OK: {len(_session())} db functions return the same results on {', '.join(BACKENDS)}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,225 @@
+"""
+Query-plan regression guard.
+
+Runs every query function in database/db.py against a freshly seeded
+database, captures the statements each one issues, and checks their
+EXPLAIN QUERY PLAN output: a full `SCAN` of a guarded table (one that should
+always be reached through an index) is reported as a violation.
+
+Run it as a check (exit status 1 on violations):
+  python -m database.plan_guard [--backend sqlalchemy]
+The SQLAlchemy backend is checked against SQLite, where its statements are
+captured the same way.
+"""
+
+import os
+import shutil
+import sqlite3
+import sys
+import tempfile
+from typing import Callable, List, Tuple
+
+from config import settings
+from . import db
+from .models import Anomaly, CategoryStats, TransactionFilter
+from .instrumentation import capture_statements, explain
+from .storage import get_backend
+
+# Tables that must never be scanned in full by a per-user query
+GUARDED_TABLES = (
+    "transactions", "recurring_rules", "transaction_changes", "category_stats", "anomalies", "archived_daily_totals",
+    "category_rules",
+)
+
+SEED_USERS = 20
+SEED_ROWS_PER_USER = 200
+
+
+def _touch_stats(stats, old) -> None:
+    # What finance.anomalies does inside a transaction write
+    stats.put_stats(stats.get_stats(old.category) or CategoryStats(old.user_id, old.category, 0, 0.0, 0.0, None))
+    stats.replace_anomaly(old.id, None)
+
+
+def _recompute_stats(stats) -> None:
+    # What finance.anomalies.recompute does inside a bulk write
+    categories = {tx.category: tx for tx in stats.expenses()}
+    stats.replace_stats([CategoryStats(tx.user_id, category, 1, tx.amount, 0.0, None) for category, tx in categories.items()])
+
+
+def _exercises() -> List[Tuple[str, Callable[[], object]]]:
+    """
+    One call per query function in database/db.py. Keep in sync with db.py:
+    check_coverage() fails if a public db function is neither here nor in UNGUARDED.
+    """
+    return [
+        ("create_user", lambda: db.create_user("guard_new_user", "secret1")),
+        ("get_user_by_username", lambda: db.get_user_by_username("guard_0")),
+        ("verify_user", lambda: db.verify_user("guard_0", "secret1")),
+        ("add_transaction", lambda: db.add_transaction(1, "2026-01-15", 12.5, "Food", "expense", "guard", "EUR")),
+        ("add_transaction_with_id", lambda: db.add_transaction_with_id(1, "2026-01-15", 12.5, "Food", "expense", "guard")),
+        ("add_transactions", lambda: db.add_transactions(1, [("2026-01-15", 12.5, "Food", "expense", "guard", None)] * 3)),
+        ("get_transactions_by_user", lambda: db.get_transactions_by_user(1)),
+        ("search_transactions", lambda: db.search_transactions(1, "2025-01-01", "2025-03-31", "Food")),
+        ("get_transaction_by_id", lambda: db.get_transaction_by_id(1)),
+        ("get_balance", lambda: db.get_balance(1, "EUR")),
+        ("get_monthly_summary", lambda: db.get_monthly_summary(1, "EUR")),
+        ("get_category_totals", lambda: db.get_category_totals(1, "expense", "2026-01", "EUR")),
+        ("update_transaction", lambda: db.update_transaction(1, 1, "2026-01-16", 13.0, "Food", "expense", "guard", then=_touch_stats)),
+        ("delete_transaction", lambda: db.delete_transaction(2, 1, then=_touch_stats)),
+        ("preview_transactions", lambda: db.preview_transactions(1, TransactionFilter(category="Food", description="guard"))),
+        ("bulk_update_transactions", lambda: db.bulk_update_transactions(1, TransactionFilter("2025-01-01", "2025-03-31", "Food"), {"category": "Groceries"}, then=_recompute_stats)),
+        ("bulk_delete_transactions", lambda: db.bulk_delete_transactions(1, TransactionFilter(ttype="income", description="x"), then=_recompute_stats)),
+        ("get_transaction_changes", lambda: (db.get_transaction_changes(1), db.get_transaction_changes(1, since=100))),
+        ("get_change_watermark", lambda: db.get_change_watermark()),
+        ("tail_transaction_changes", lambda: db.tail_transaction_changes(100)),
+        ("update_category_stats", lambda: db.update_category_stats(1, "Food", lambda stats: stats)),
+        ("replace_category_stats", lambda: db.replace_category_stats(2, [CategoryStats(2, "Food", 3, 10.0, 2.0, None)])),
+        ("replace_anomaly", lambda: db.replace_anomaly(1, 3, Anomaly(None, 1, 3, "2025-01-04", "Food", 500.0, 4.2, 5.1, "2025-01-04 00:00:00"))),
+        ("get_anomalies", lambda: db.get_anomalies(1)),
+        ("add_recurring_rule", lambda: db.add_recurring_rule(1, 10.0, "Rent", "expense", None, "monthly", 1, None, "2026-01-01", None, "2026-01-01")),
+        ("get_recurring_rules", lambda: db.get_recurring_rules(1)),
+        ("get_due_recurring_rules", lambda: db.get_due_recurring_rules("2026-02-01")),
+        ("delete_recurring_rule", lambda: db.delete_recurring_rule(1, 1)),
+        ("add_category_rule", lambda: db.add_category_rule(1, "Food", "bakery", "substring", "expense", None, 50.0, 5)),
+        ("get_category_rules", lambda: db.get_category_rules(1)),
+        ("get_category_rules_version", lambda: db.get_category_rules_version(1)),
+        ("delete_category_rule", lambda: db.delete_category_rule(1, 1)),
+    ]
+
+
+# Public db functions that are not per-user queries (schema, bulk loads, full-table reads by design)
+UNGUARDED = {
+    "get_connection", "ledger_shards", "init_db", "get_exchange_rates", "save_exchange_rates", "materialize_recurring",
+    "compact_transaction_changes", "archive_transactions", "add_write_listener",
+}
+
+
+def _seed(conn: sqlite3.Connection) -> None:
+    cur = conn.cursor()
+    pw_hash = db._hash_password("secret1")
+    cur.executemany(
+        "INSERT INTO users (username, password_hash, created_at) VALUES (?, ?, ?)",
+        [(f"guard_{u}", pw_hash, "2025-01-01") for u in range(SEED_USERS)]
+    )
+    rows = []
+    for u in range(1, SEED_USERS + 1):
+        for i in range(SEED_ROWS_PER_USER):
+            rows.append((u, f"2025-{i % 12 + 1:02d}-{i % 28 + 1:02d}", 10.0 + i, "Food" if i % 3 else "Rent",
+                         "expense" if i % 5 else "income", None, "USD" if i % 4 else "EUR"))
+    cur.executemany(
+        "INSERT INTO transactions (user_id, date, amount, category, ttype, description, currency) VALUES (?, ?, ?, ?, ?, ?, ?)",
+        rows
+    )
+    cur.executemany(
+        "INSERT INTO exchange_rates (currency, date, rate) VALUES (?, ?, ?)",
+        [("EUR", "2025-01-01", 1.1), ("EUR", "2025-07-01", 1.15)]
+    )
+    cur.executemany(
+        "INSERT INTO recurring_rules (user_id, amount, category, ttype, frequency, interval, start_date, next_due, created_at) "
+        "VALUES (?, 5.0, 'Other', 'expense', 'weekly', 1, '2025-01-01', '2025-01-01', '2025-01-01')",
+        [(u,) for u in range(1, SEED_USERS + 1)]
+    )
+    cur.executemany(
+        "INSERT INTO category_rules (user_id, category, pattern, match, priority, created_at) VALUES (?, ?, ?, 'substring', ?, '2025-01-01')",
+        [(u, c, f"shop {i}", i % 3) for u in range(1, SEED_USERS + 1) for i, c in enumerate(("Food", "Rent", "Other") * 10)]
+    )
+    cur.executemany(
+        "INSERT INTO category_stats (user_id, category, count, mean, m2, sketch) VALUES (?, ?, 100, 50.0, 2500.0, NULL)",
+        [(u, c) for u in range(1, SEED_USERS + 1) for c in ("Food", "Rent")]
+    )
+    cur.executemany(
+        "INSERT INTO anomalies (user_id, tx_id, date, category, amount, score, ratio, created_at) "
+        "VALUES (?, ?, '2025-01-01', 'Food', 900.0, 5.0, 6.0, '2025-01-01 00:00:00')",
+        [(u, (u - 1) * SEED_ROWS_PER_USER + i + 1) for u in range(1, SEED_USERS + 1) for i in range(0, SEED_ROWS_PER_USER, 40)]
+    )
+    # An archived year, so reports also query the rollups (sqlite backend only)
+    if cur.execute("SELECT 1 FROM sqlite_master WHERE name = 'archive_meta'").fetchone():
+        cur.executemany(
+            "INSERT INTO archived_daily_totals (user_id, date, category, ttype, currency, amount, count) VALUES (?, ?, ?, ?, ?, 100.0, 3)",
+            [(u, f"2024-{m:02d}-01", c, t, "USD") for u in range(1, SEED_USERS + 1) for m in range(1, 13)
+             for c in ("Food", "Rent") for t in ("expense", "income")]
+        )
+        cur.execute("INSERT INTO archive_meta (name, value) VALUES ('archived_through', '2025-01-01')")
+    conn.commit()
+    cur.execute("ANALYZE")
+    conn.commit()
+
+
+def check_coverage() -> List[str]:
+    """
+    Public functions in database/db.py that the guard does not know about.
+    """
+    covered = {name for name, _ in _exercises()} | UNGUARDED
+    public = {
+        name for name, obj in vars(db).items()
+        if callable(obj) and not name.startswith("_") and getattr(obj, "__module__", None) == db.__name__
+    }
+    return sorted(public - covered)
+
+
+def _scanned_tables(plan: List[str]) -> List[str]:
+    hits = []
+    for detail in plan:
+        parts = detail.split()
+        if len(parts) >= 2 and parts[0] == "SCAN" and parts[1] in GUARDED_TABLES:
+            hits.append(parts[1])
+    return hits
+
+
+def check_query_plans(backend: str = "sqlite") -> List[str]:
+    """
+    Seed a temporary database, run every exercise through `backend` and return one message
+    per violation (empty list = all guarded queries use an index).
+    """
+    violations = [f"{name}: not covered by database.plan_guard" for name in check_coverage()]
+
+    workdir = tempfile.mkdtemp(prefix="finance_plan_guard_")
+    previous = (settings.DB_PATH, settings.METRICS_ENABLED, settings.SHARD_COUNT, settings.STORAGE_BACKEND, settings.DATABASE_URL)
+    settings.DB_PATH = os.path.join(workdir, "finance.db")
+    settings.METRICS_ENABLED = True  # statements are captured by the instrumented cursor
+    settings.SHARD_COUNT = 0  # shards share the single-file schema
+    settings.STORAGE_BACKEND = backend
+    settings.DATABASE_URL = None  # sqlite:///DB_PATH
+    try:
+        db.init_db()
+        conn = sqlite3.connect(settings.DB_PATH)
+        _seed(conn)
+
+        for name, call in _exercises():
+            with capture_statements() as statements:
+                call()
+            if not statements:
+                violations.append(f"{name}: issued no statements")
+            for sql, params in statements:
+                if sql.split(None, 1)[0].upper() not in ("SELECT", "UPDATE", "DELETE", "INSERT", "WITH"):
+                    continue
+                plan = explain(conn, sql, params)
+                for table in _scanned_tables(plan):
+                    violations.append(f"{name}: full SCAN of {table}\n    {' '.join(sql.split())[:160]}\n    plan: {plan}")
+        conn.close()
+        get_backend().dispose()
+    finally:
+        settings.DB_PATH, settings.METRICS_ENABLED, settings.SHARD_COUNT, settings.STORAGE_BACKEND, settings.DATABASE_URL = previous
+        shutil.rmtree(workdir, ignore_errors=True)
+    return violations
+
+
+def main(argv=None) -> int:
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Check that per-user queries use indexes")
+    parser.add_argument("--backend", default="sqlite", choices=["sqlite", "sqlalchemy"])
+    args = parser.parse_args(argv)
+    violations = check_query_plans(args.backend)
+    if violations:
+        print(f"{len(violations)} query plan violation(s):")
+        for v in violations:
+            print("  " + v)
+        return 1
+    print(f"OK: {len(_exercises())} query functions use indexes on {', '.join(GUARDED_TABLES)}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,207 @@
+"""
+Per-user sharding of the ledger across several SQLite files.
+
+With settings.SHARD_COUNT = N > 0, the users table lives in a small directory
+database and every per-user table lives in one of N shard files, picked by a
+stable hash of user_id. Writes for users on different shards no longer queue
+on the same SQLite write lock. database.db routes every call transparently.
+
+Row ids stay unique across shards: each shard's AUTOINCREMENT sequence starts
+in its own block of ID_RANGE ids, so an id alone still identifies a row.
+
+Migrate a single-file database, or rebalance an existing sharded layout into
+a new shard count, with:
+  python -m database.sharding migrate --shards 8 [--source data/finance.db] [--dest data/shards]
+  python -m database.sharding rebalance --shards 16 --dest data/shards16
+Then point FINANCE_SHARD_COUNT / FINANCE_SHARD_DIR at the new layout.
+"""
+
+import os
+import sqlite3
+import sys
+import zlib
+from typing import Dict, List, Optional
+
+from config import settings
+
+ID_RANGE = 10 ** 12
+
+# Per-user tables: table -> user id column. Rows move with their user.
+SHARDED_TABLES: Dict[str, str] = {
+    "transactions": "user_id",
+    "recurring_rules": "user_id",
+    "transaction_changes": "user_id",
+    "category_stats": "user_id",
+    "anomalies": "user_id",
+    "archived_daily_totals": "user_id",
+    "category_rules": "user_id",
+}
+# Global reference data copied to every shard
+REPLICATED_TABLES: List[str] = ["exchange_rates"]
+# AUTOINCREMENT tables whose ids must stay unique across shards
+SEQUENCED_TABLES: List[str] = ["transactions", "recurring_rules", "transaction_changes", "anomalies", "category_rules"]
+
+
+def enabled() -> bool:
+    return settings.SHARD_COUNT > 0
+
+
+def shard_for_user(user_id: int, count: Optional[int] = None) -> int:
+    """
+    Stable shard index for a user (crc32 of the id, so it doesn't depend on Python's hash seed).
+    """
+    count = settings.SHARD_COUNT if count is None else count
+    return zlib.crc32(str(int(user_id)).encode("ascii")) % count
+
+
+def directory_path(shard_dir: Optional[str] = None) -> str:
+    return os.path.join(shard_dir or settings.SHARD_DIR, "directory.db")
+
+
+def shard_path(index: int, shard_dir: Optional[str] = None) -> str:
+    return os.path.join(shard_dir or settings.SHARD_DIR, f"shard_{index:03d}.db")
+
+
+def reserve_id_range(cur, shard: int, base: int = 0) -> None:
+    """
+    Move the shard's AUTOINCREMENT sequences up to base + shard * ID_RANGE (never down).
+    """
+    for table in SEQUENCED_TABLES:
+        cur.execute("SELECT seq FROM sqlite_sequence WHERE name = ?", (table,))
+        row = cur.fetchone()
+        floor = base + shard * ID_RANGE
+        if row is None:
+            cur.execute("INSERT INTO sqlite_sequence (name, seq) VALUES (?, ?)", (table, floor))
+        elif row[0] < floor:
+            cur.execute("UPDATE sqlite_sequence SET seq = ? WHERE name = ?", (floor, table))
+
+
+def _columns(conn: sqlite3.Connection, schema: str, table: str) -> List[str]:
+    return [r[1] for r in conn.execute(f"PRAGMA {schema}.table_info({table})")]
+
+
+def _has_table(conn: sqlite3.Connection, schema: str, table: str) -> bool:
+    row = conn.execute(f"SELECT 1 FROM {schema}.sqlite_master WHERE type = 'table' AND name = ?", (table,)).fetchone()
+    return row is not None
+
+
+def _copy(conn: sqlite3.Connection, table: str, where: str = "") -> int:
+    """
+    INSERT OR IGNORE main.table SELECT ... FROM src.table, over the columns both sides have.
+    """
+    if not _has_table(conn, "src", table):
+        return 0
+    src_cols = set(_columns(conn, "src", table))
+    cols = ", ".join(c for c in _columns(conn, "main", table) if c in src_cols)
+    cur = conn.execute(f"INSERT OR IGNORE INTO main.{table} ({cols}) SELECT {cols} FROM src.{table} {where}")
+    return cur.rowcount
+
+
+def reshard(source_directory: str, source_ledgers: List[str], dest_dir: str, shard_count: int) -> Dict[str, int]:
+    """
+    Copy users from `source_directory` and per-user rows from every file in `source_ledgers`
+    into a new layout of `shard_count` shards under `dest_dir`. The source is not modified.
+    A single-file database is both the directory and the only ledger.
+    Returns row counts per table.
+    """
+    from .sqlite_backend import SQLiteBackend, CHANGE_TRIGGERS, _create_change_triggers
+
+    if shard_count <= 0:
+        raise ValueError("shard_count must be positive")
+    if os.path.exists(directory_path(dest_dir)):
+        raise FileExistsError(f"{dest_dir} already contains a sharded layout")
+
+    previous = (settings.SHARD_COUNT, settings.SHARD_DIR)
+    settings.SHARD_COUNT, settings.SHARD_DIR = shard_count, dest_dir
+    try:
+        SQLiteBackend().init_db()
+    finally:
+        settings.SHARD_COUNT, settings.SHARD_DIR = previous
+
+    counts = {"users": 0}
+    conn = sqlite3.connect(directory_path(dest_dir))
+    conn.execute("ATTACH DATABASE ? AS src", (source_directory,))
+    counts["users"] = _copy(conn, "users")
+    conn.commit()
+    conn.execute("DETACH DATABASE src")
+    conn.close()
+
+    purged_through = 0
+    archived_through = None
+    for index in range(shard_count):
+        conn = sqlite3.connect(shard_path(index, dest_dir))
+        conn.create_function("shard_of", 1, lambda uid: shard_for_user(uid, shard_count), deterministic=True)
+        # Copied rows carry their change-log entries; don't log the copy itself
+        for trigger in CHANGE_TRIGGERS:
+            conn.execute(f"DROP TRIGGER IF EXISTS {trigger}")
+        for i, source in enumerate(source_ledgers):
+            conn.execute("ATTACH DATABASE ? AS src", (source,))
+            for table, user_col in SHARDED_TABLES.items():
+                counts[table] = counts.get(table, 0) + _copy(conn, table, f"WHERE shard_of({user_col}) = {index}")
+            if i == 0:
+                for table in REPLICATED_TABLES:
+                    _copy(conn, table)
+            if _has_table(conn, "src", "change_log_meta"):
+                row = conn.execute("SELECT value FROM src.change_log_meta WHERE name = 'purged_through'").fetchone()
+                purged_through = max(purged_through, row[0] if row else 0)
+            if _has_table(conn, "src", "archive_meta"):
+                row = conn.execute("SELECT value FROM src.archive_meta WHERE name = 'archived_through'").fetchone()
+                if row and (archived_through is None or row[0] > archived_through):
+                    archived_through = row[0]
+            conn.commit()
+            conn.execute("DETACH DATABASE src")
+        _create_change_triggers(conn.cursor())
+        conn.commit()
+        conn.close()
+
+    # Copied rows keep their ids, which may come from any block of the old layout.
+    # Give every new shard a fresh block above all of them.
+    max_id = 0
+    for index in range(shard_count):
+        conn = sqlite3.connect(shard_path(index, dest_dir))
+        for table in SEQUENCED_TABLES:
+            max_id = max(max_id, conn.execute(f"SELECT COALESCE(MAX(rowid), 0) FROM {table}").fetchone()[0])
+        conn.close()
+    base = (max_id // ID_RANGE + 1) * ID_RANGE
+    for index in range(shard_count):
+        conn = sqlite3.connect(shard_path(index, dest_dir))
+        reserve_id_range(conn.cursor(), index, base)
+        # Tombstones compacted away in any source shard may belong to users now here
+        conn.execute("INSERT OR REPLACE INTO change_log_meta (name, value) VALUES ('purged_through', ?)", (purged_through,))
+        # Archive files are shared by all shards; every shard reads them up to the cutoff
+        if archived_through is not None:
+            conn.execute("INSERT OR REPLACE INTO archive_meta (name, value) VALUES ('archived_through', ?)", (archived_through,))
+        conn.commit()
+        conn.close()
+    return counts
+
+
+def main(argv=None) -> int:
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Migrate or rebalance sharded finance databases")
+    sub = parser.add_subparsers(dest="command", required=True)
+    migrate = sub.add_parser("migrate", help="split a single-file database into shards")
+    migrate.add_argument("--shards", type=int, required=True)
+    migrate.add_argument("--source", default=None, help="single-file database (default: settings.DB_PATH)")
+    migrate.add_argument("--dest", default=None, help="directory for the new layout (default: settings.SHARD_DIR)")
+    rebalance = sub.add_parser("rebalance", help="copy the current sharded layout into a new shard count")
+    rebalance.add_argument("--shards", type=int, required=True)
+    rebalance.add_argument("--dest", required=True, help="directory for the new layout")
+    args = parser.parse_args(argv)
+
+    if args.command == "migrate":
+        source = args.source or settings.DB_PATH
+        counts = reshard(source, [source], args.dest or settings.SHARD_DIR, args.shards)
+    else:
+        if not enabled():
+            print("Sharding is not enabled (FINANCE_SHARD_COUNT); use 'migrate' for a single-file database")
+            return 1
+        ledgers = [shard_path(i) for i in range(settings.SHARD_COUNT)]
+        counts = reshard(directory_path(), ledgers, args.dest, args.shards)
+    print(", ".join(f"{table}: {n}" for table, n in counts.items()))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
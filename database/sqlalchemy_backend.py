@@ -0,0 +1,775 @@
+"""
+SQLAlchemy Core storage backend (settings.STORAGE_BACKEND = "sqlalchemy").
+
+Runs against any database SQLAlchemy supports (settings.DATABASE_URL, default
+sqlite:///settings.DB_PATH) through one pooled engine per URL. Statements are
+built once per backend with named bind parameters, so SQLAlchemy's compiled
+cache (settings.DB_STATEMENT_CACHE_SIZE entries) reuses their compiled form.
+
+Sharding, group commit and cold storage (database.archive) are sqlite3-backend
+features; here every user and transaction lives in the one database behind the
+engine. init_db() creates missing tables but
+does not migrate old schemas -- migrate a database with the sqlite backend first.
+"""
+
+import threading
+from datetime import datetime
+from typing import Callable, Dict, Iterator, List, Optional, Tuple
+
+from sqlalchemy import (
+    CheckConstraint, Column, Float, ForeignKey, Index, Integer, MetaData, String, Table, Text,
+    and_, bindparam, case, create_engine, delete, func, insert, literal, select, update,
+)
+from sqlalchemy.exc import DBAPIError, IntegrityError
+
+from config import settings
+from .models import User, Transaction, RecurringRule, CategoryRule, CategoryStats, Anomaly, TransactionFilter
+from .storage import StatsWriter, StorageBackend, fold_changes
+
+metadata = MetaData()
+
+users = Table(
+    "users", metadata,
+    Column("id", Integer, primary_key=True, autoincrement=True),
+    Column("username", String(150), unique=True, nullable=False),
+    Column("password_hash", String(128), nullable=False),
+    Column("created_at", String(32), nullable=False),
+    sqlite_autoincrement=True,
+)
+
+transactions = Table(
+    "transactions", metadata,
+    Column("id", Integer, primary_key=True, autoincrement=True),
+    Column("user_id", Integer, ForeignKey("users.id"), nullable=False),
+    Column("date", String(10), nullable=False),
+    Column("amount", Float, nullable=False),
+    Column("category", String(100), nullable=False),
+    Column("ttype", String(10), nullable=False),
+    Column("description", Text),
+    Column("recurring_id", Integer),
+    Column("currency", String(3), nullable=False, server_default=settings.DEFAULT_CURRENCY),
+    CheckConstraint("ttype IN ('income','expense')"),
+    Index("idx_transactions_user_date", "user_id", "date"),
+    sqlite_autoincrement=True,
+)
+# Same partial unique index as the sqlite3 schema: re-materializing an occurrence is a no-op
+Index(
+    "idx_transactions_recurring", transactions.c.recurring_id, transactions.c.date, unique=True,
+    sqlite_where=transactions.c.recurring_id.isnot(None),
+    postgresql_where=transactions.c.recurring_id.isnot(None),
+)
+
+recurring_rules = Table(
+    "recurring_rules", metadata,
+    Column("id", Integer, primary_key=True, autoincrement=True),
+    Column("user_id", Integer, ForeignKey("users.id"), nullable=False),
+    Column("amount", Float, nullable=False),
+    Column("category", String(100), nullable=False),
+    Column("ttype", String(10), nullable=False),
+    Column("description", Text),
+    Column("frequency", String(10), nullable=False),
+    Column("interval", Integer, nullable=False, server_default="1"),
+    Column("cron", String(100)),
+    Column("start_date", String(10), nullable=False),
+    Column("end_date", String(10)),
+    Column("next_due", String(10)),
+    Column("created_at", String(32), nullable=False),
+    Column("currency", String(3), nullable=False, server_default=settings.DEFAULT_CURRENCY),
+    CheckConstraint("ttype IN ('income','expense')"),
+    CheckConstraint("frequency IN ('daily','weekly','monthly','cron')"),
+    Index("idx_recurring_next_due", "next_due"),
+    Index("idx_recurring_user", "user_id"),
+    sqlite_autoincrement=True,
+)
+
+# Automatic categorization rules (finance.categorize)
+category_rules = Table(
+    "category_rules", metadata,
+    Column("id", Integer, primary_key=True, autoincrement=True),
+    Column("user_id", Integer, ForeignKey("users.id"), nullable=False),
+    Column("category", String(100), nullable=False),
+    Column("pattern", Text),
+    Column("match", String(10), nullable=False),
+    Column("ttype", String(10)),
+    Column("min_amount", Float),
+    Column("max_amount", Float),
+    Column("priority", Integer, nullable=False, server_default="0"),
+    Column("created_at", String(32), nullable=False),
+    CheckConstraint("match IN ('substring','regex')"),
+    CheckConstraint("ttype IN ('income','expense')"),
+    sqlite_autoincrement=True,
+)
+Index("idx_category_rules_user", category_rules.c.user_id, category_rules.c.priority.desc(), category_rules.c.id)
+
+# Change feed for delta sync (written explicitly below; the sqlite3 backend uses triggers)
+transaction_changes = Table(
+    "transaction_changes", metadata,
+    Column("seq", Integer, primary_key=True, autoincrement=True),
+    Column("user_id", Integer, nullable=False),
+    Column("tx_id", Integer, nullable=False),
+    Column("op", String(6), nullable=False),
+    Column("changed_at", String(19), nullable=False),
+    CheckConstraint("op IN ('upsert','delete')"),
+    Index("idx_changes_user_seq", "user_id", "seq"),
+    sqlite_autoincrement=True,
+)
+
+change_log_meta = Table(
+    "change_log_meta", metadata,
+    Column("name", String(50), primary_key=True),
+    Column("value", Integer, nullable=False),
+)
+
+# Online expense statistics per category (finance.anomalies) and the anomalies they flagged
+category_stats = Table(
+    "category_stats", metadata,
+    Column("user_id", Integer, primary_key=True),
+    Column("category", String(100), primary_key=True),
+    Column("count", Integer, nullable=False),
+    Column("mean", Float, nullable=False),
+    Column("m2", Float, nullable=False),
+    Column("sketch", Text),
+)
+
+anomalies = Table(
+    "anomalies", metadata,
+    Column("id", Integer, primary_key=True, autoincrement=True),
+    Column("user_id", Integer, nullable=False),
+    Column("tx_id", Integer, nullable=False),
+    Column("date", String(10), nullable=False),
+    Column("category", String(100), nullable=False),
+    Column("amount", Float, nullable=False),
+    Column("score", Float, nullable=False),
+    Column("ratio", Float),
+    Column("created_at", String(19), nullable=False),
+    Index("idx_anomalies_user", "user_id", "id"),
+    Index("idx_anomalies_tx", "tx_id"),
+    sqlite_autoincrement=True,
+)
+
+exchange_rates = Table(
+    "exchange_rates", metadata,
+    Column("currency", String(3), primary_key=True),
+    Column("date", String(10), primary_key=True),
+    Column("rate", Float, nullable=False),
+    CheckConstraint("rate > 0"),
+)
+
+_TX_COLUMNS = [transactions.c[n] for n in ("id", "user_id", "date", "amount", "category", "ttype", "description", "currency")]
+_RULE_COLUMNS = [recurring_rules.c[n] for n in (
+    "id", "user_id", "amount", "category", "ttype", "description", "frequency", "interval", "cron",
+    "start_date", "end_date", "next_due", "currency",
+)]
+
+_CATEGORY_RULE_COLUMNS = [category_rules.c[n] for n in (
+    "id", "user_id", "category", "pattern", "match", "ttype", "min_amount", "max_amount", "priority",
+)]
+
+def _database_url() -> str:
+    return settings.DATABASE_URL or f"sqlite:///{settings.DB_PATH}"
+
+
+def _create_engine(url: str):
+    kwargs = {"pool_pre_ping": True, "pool_recycle": settings.DB_POOL_RECYCLE, "query_cache_size": settings.DB_STATEMENT_CACHE_SIZE}
+    if url.startswith("sqlite"):
+        connect_args = {"check_same_thread": False}
+        if settings.METRICS_ENABLED or settings.SLOW_QUERY_MS > 0:
+            # Same SQL metrics / slow-query log as the sqlite3 backend
+            from .instrumentation import InstrumentedConnection
+            connect_args["factory"] = InstrumentedConnection
+        kwargs["connect_args"] = connect_args
+        if ":memory:" not in url and url not in ("sqlite://", "sqlite:///"):
+            kwargs["pool_size"] = settings.DB_POOL_SIZE
+    else:
+        kwargs["pool_size"] = settings.DB_POOL_SIZE
+    return create_engine(url, **kwargs)
+
+
+def _log_change(conn, user_id: int, tx_id: int, op: str) -> None:
+    conn.execute(insert(transaction_changes), {
+        "user_id": user_id, "tx_id": tx_id, "op": op,
+        "changed_at": datetime.utcnow().strftime("%Y-%m-%d %H:%M:%S"),  # same format as SQLite's CURRENT_TIMESTAMP
+    })
+
+
+def _log_changes(conn, cond, op: str) -> None:
+    """
+    Log every transaction matching `cond` to the change feed with one INSERT ... SELECT.
+    """
+    t = transactions.c
+    changed_at = datetime.utcnow().strftime("%Y-%m-%d %H:%M:%S")
+    conn.execute(insert(transaction_changes).from_select(
+        ["user_id", "tx_id", "op", "changed_at"],
+        select(t.user_id, t.id, literal(op), literal(changed_at)).where(cond),
+    ))
+
+
+def _filter_clause(user_id: int, flt: TransactionFilter):
+    t = transactions.c
+    clauses = [t.user_id == user_id]
+    if flt.start_date:
+        clauses.append(t.date >= flt.start_date)
+    if flt.end_date:
+        clauses.append(t.date <= flt.end_date)
+    if flt.category:
+        clauses.append(t.category == flt.category)
+    if flt.ttype:
+        clauses.append(t.ttype == flt.ttype)
+    if flt.description:
+        clauses.append(t.description.icontains(flt.description, autoescape=True))
+    return and_(*clauses)
+
+
+def _rate(currency_expr, date_expr):
+    """
+    Rate of `currency_expr` on `date_expr`: the latest rate on or before that date, falling
+    back to the earliest known rate for older dates. NULL if the currency has no rates.
+    """
+    r = exchange_rates.alias("r")
+    latest = (
+        select(r.c.rate).where(r.c.currency == currency_expr, r.c.date <= date_expr)
+        .order_by(r.c.date.desc()).limit(1).scalar_subquery()
+    )
+    earliest = (
+        select(r.c.rate).where(r.c.currency == currency_expr)
+        .order_by(r.c.date.asc()).limit(1).scalar_subquery()
+    )
+    return case((currency_expr == bindparam("base"), literal(1.0)), else_=func.coalesce(latest, earliest))
+
+
+def _converted_amount():
+    """
+    transactions.amount converted into the :rc reporting currency inside the query.
+    """
+    t = transactions.c
+    rc = bindparam("rc")
+    return case(
+        (t.currency == rc, t.amount),
+        else_=t.amount * _rate(t.currency, t.date) / _rate(rc, t.date),
+    )
+
+
+class _Stats(StatsWriter):
+    """
+    Statistics and anomalies through the connection of an open engine.begin() block.
+    """
+
+    def __init__(self, backend: "SQLAlchemyBackend", conn, user_id: int):
+        self.backend = backend
+        self.conn = conn
+        self.user_id = user_id
+
+    def get_stats(self, category: str) -> Optional[CategoryStats]:
+        row = self.conn.execute(self.backend._stmt_category_stats, {"user_id": self.user_id, "category": category}).first()
+        return CategoryStats.from_row(tuple(row)) if row else None
+
+    def put_stats(self, stats: CategoryStats) -> None:
+        values = {"count": stats.count, "mean": stats.mean, "m2": stats.m2, "sketch": stats.sketch}
+        result = self.conn.execute(self.backend._stmt_update_category_stats, {"key_user_id": self.user_id, "key_category": stats.category, **values})
+        if result.rowcount == 0:
+            self.conn.execute(insert(category_stats), {"user_id": self.user_id, "category": stats.category, **values})
+
+    def replace_anomaly(self, tx_id: int, anomaly: Optional[Anomaly]) -> None:
+        self.conn.execute(self.backend._stmt_delete_anomaly, {"tx_id": tx_id})
+        if anomaly is not None:
+            self.conn.execute(insert(anomalies), {
+                "user_id": self.user_id, "tx_id": tx_id, "date": anomaly.date, "category": anomaly.category,
+                "amount": anomaly.amount, "score": anomaly.score, "ratio": anomaly.ratio, "created_at": anomaly.created_at,
+            })
+
+    def expenses(self) -> Iterator[Transaction]:
+        for row in self.conn.execute(self.backend._stmt_expenses_by_user, {"user_id": self.user_id}):
+            yield Transaction.from_row(tuple(row))
+
+    def replace_stats(self, stats: List[CategoryStats]) -> None:
+        self.conn.execute(delete(category_stats).where(category_stats.c.user_id == self.user_id))
+        if stats:
+            self.conn.execute(insert(category_stats), [
+                {"user_id": self.user_id, "category": s.category, "count": s.count, "mean": s.mean, "m2": s.m2, "sketch": s.sketch}
+                for s in stats
+            ])
+
+
+class SQLAlchemyBackend(StorageBackend):
+    name = "sqlalchemy"
+
+    def __init__(self):
+        self._engines: Dict[str, object] = {}
+        self._lock = threading.Lock()
+        self._build_statements()
+
+    @property
+    def engine(self):
+        """
+        The pooled engine for settings.DATABASE_URL (one per URL, created on first use).
+        """
+        url = _database_url()
+        engine = self._engines.get(url)
+        if engine is None:
+            with self._lock:
+                engine = self._engines.get(url)
+                if engine is None:
+                    engine = self._engines[url] = _create_engine(url)
+        return engine
+
+    def dispose(self) -> None:
+        with self._lock:
+            engines = list(self._engines.values())
+            self._engines.clear()
+        for engine in engines:
+            engine.dispose()
+
+    def _build_statements(self) -> None:
+        t = transactions.c
+        amount = _converted_amount()
+        by_user = t.user_id == bindparam("user_id")
+        self._stmt_user_by_name = select(users.c.id, users.c.username, users.c.password_hash, users.c.created_at).where(
+            users.c.username == bindparam("username")
+        )
+        self._stmt_tx_by_user = select(*_TX_COLUMNS).where(by_user).order_by(t.date.desc()).limit(bindparam("limit"))
+        self._stmt_tx_by_id = select(*_TX_COLUMNS).where(t.id == bindparam("tx_id"))
+        self._stmt_update_tx = (
+            update(transactions)
+            .where(t.id == bindparam("tx_id"), t.user_id == bindparam("owner_id"))
+            .values(
+                date=bindparam("new_date"), amount=bindparam("new_amount"), category=bindparam("new_category"),
+                ttype=bindparam("new_ttype"), description=bindparam("new_description"),
+                currency=func.coalesce(bindparam("new_currency", type_=String), t.currency),
+            )
+        )
+        self._stmt_delete_tx = delete(transactions).where(t.id == bindparam("tx_id"), t.user_id == bindparam("owner_id"))
+        self._stmt_balance = select(
+            func.sum(case((t.ttype == "income", amount), else_=-amount)).label("balance")
+        ).where(by_user)
+        month = func.substr(t.date, 1, 7).label("month")
+        self._stmt_monthly = (
+            select(
+                month,
+                func.sum(case((t.ttype == "income", amount), else_=0)).label("income"),
+                func.sum(case((t.ttype == "expense", amount), else_=0)).label("expense"),
+            )
+            .where(by_user).group_by(month).order_by(month)
+        )
+        total = func.sum(amount).label("total")
+        by_type = and_(by_user, t.ttype == bindparam("ttype"))
+        self._stmt_categories = (
+            select(t.category, total).where(by_type).group_by(t.category).order_by(total.desc())
+        )
+        self._stmt_categories_month = (
+            select(t.category, total)
+            .where(by_type, t.date >= bindparam("month_start"), t.date < bindparam("month_end"))
+            .group_by(t.category).order_by(total.desc())
+        )
+        self._stmt_rates = select(exchange_rates.c.currency, exchange_rates.c.date, exchange_rates.c.rate).order_by(
+            exchange_rates.c.currency, exchange_rates.c.date
+        )
+        c = transaction_changes.c
+        self._stmt_purged_through = select(change_log_meta.c.value).where(change_log_meta.c.name == "purged_through")
+        self._stmt_changes = (
+            select(c.seq, c.tx_id, *_TX_COLUMNS)
+            .select_from(transaction_changes.outerjoin(transactions, and_(t.id == c.tx_id, c.op == "upsert")))
+            .where(c.user_id == bindparam("user_id"), c.seq > bindparam("since"))
+            .order_by(c.seq).limit(bindparam("limit"))
+        )
+        self._stmt_change_watermark = select(func.coalesce(func.max(c.seq), 0))
+        self._stmt_tail_changes = select(c.seq, c.user_id).where(c.seq > bindparam("since")).order_by(c.seq).limit(bindparam("limit"))
+        self._stmt_all_by_user = select(*_TX_COLUMNS).where(by_user).order_by(t.date.desc(), t.id.desc())
+        self._stmt_expenses_by_user = select(*_TX_COLUMNS).where(by_user, t.ttype == "expense").order_by(t.date, t.id)
+        cs = category_stats.c
+        self._stmt_category_stats = (
+            select(cs.user_id, cs.category, cs.count, cs.mean, cs.m2, cs.sketch)
+            .where(cs.user_id == bindparam("user_id"), cs.category == bindparam("category"))
+            .with_for_update()
+        )
+        self._stmt_update_category_stats = (
+            update(category_stats)
+            .where(cs.user_id == bindparam("key_user_id"), cs.category == bindparam("key_category"))
+            .values(count=bindparam("count"), mean=bindparam("mean"), m2=bindparam("m2"), sketch=bindparam("sketch"))
+        )
+        a = anomalies.c
+        self._stmt_delete_anomaly = delete(anomalies).where(a.tx_id == bindparam("tx_id"))
+        self._stmt_anomalies = (
+            select(a.id, a.user_id, a.tx_id, a.date, a.category, a.amount, a.score, a.ratio, a.created_at)
+            .where(a.user_id == bindparam("user_id")).order_by(a.id.desc()).limit(bindparam("limit"))
+        )
+        r = recurring_rules.c
+        self._stmt_rules_by_user = select(*_RULE_COLUMNS).where(r.user_id == bindparam("user_id")).order_by(r.id)
+        self._stmt_delete_rule = delete(recurring_rules).where(r.id == bindparam("rule_id"), r.user_id == bindparam("owner_id"))
+        self._stmt_due_rules = (
+            select(*_RULE_COLUMNS)
+            .where(r.next_due.isnot(None), r.next_due <= bindparam("as_of"), r.id > bindparam("after_id"))
+            .order_by(r.id).limit(bindparam("limit"))
+        )
+        self._stmt_advance_rule = (
+            update(recurring_rules)
+            .where(r.id == bindparam("rule_id"), r.next_due == bindparam("old_next_due"))
+            .values(next_due=bindparam("new_next_due"))
+        )
+        cr = category_rules.c
+        self._stmt_category_rules = (
+            select(*_CATEGORY_RULE_COLUMNS).where(cr.user_id == bindparam("user_id")).order_by(cr.priority.desc(), cr.id)
+        )
+        self._stmt_delete_category_rule = delete(category_rules).where(cr.id == bindparam("rule_id"), cr.user_id == bindparam("owner_id"))
+        self._stmt_category_rules_version = select(func.count(), func.coalesce(func.max(cr.id), 0)).where(cr.user_id == bindparam("user_id"))
+
+    def _conversion_params(self, currency: str) -> Dict:
+        return {"rc": currency, "base": settings.DEFAULT_CURRENCY}
+
+    def _write(self, stmt, params, not_found: Optional[str], ok: str, change=None, returns_id: bool = False, then=None) -> Tuple:
+        """
+        Run one write in its own transaction. change=(user_id, tx_id, op) is logged to the
+        change feed in the same transaction (tx_id None = the row just inserted), and so is
+        then(stats, that transaction id) run. With returns_id the result is (ok, message, id
+        of the inserted row or None).
+        """
+        new_id = None
+        try:
+            with self.engine.begin() as conn:
+                result = conn.execute(stmt, params)
+                if not_found and result.rowcount == 0:
+                    return (False, not_found, None) if returns_id else (False, not_found)
+                if returns_id:
+                    new_id = result.inserted_primary_key[0]
+                if change:
+                    user_id, tx_id, op = change
+                    tx_id = result.inserted_primary_key[0] if tx_id is None else tx_id
+                    _log_change(conn, user_id, tx_id, op)
+                    if then is not None:
+                        then(_Stats(self, conn, user_id), tx_id)
+            return (True, ok, new_id) if returns_id else (True, ok)
+        except DBAPIError as e:
+            message = f"Error: {e.orig}"  # the driver's message, as the sqlite3 backend reports it
+        except Exception as e:
+            message = f"Error: {e}"
+        return (False, message, None) if returns_id else (False, message)
+
+    def _insert_ignore(self, table):
+        """
+        INSERT that skips rows violating a unique constraint (INSERT OR IGNORE / ON CONFLICT DO NOTHING).
+        """
+        dialect = self.engine.dialect.name
+        if dialect == "sqlite":
+            from sqlalchemy.dialects.sqlite import insert as dialect_insert
+            return dialect_insert(table).on_conflict_do_nothing()
+        if dialect == "postgresql":
+            from sqlalchemy.dialects.postgresql import insert as dialect_insert
+            return dialect_insert(table).on_conflict_do_nothing()
+        return insert(table).prefix_with("IGNORE")
+
+    # ----------------- Connections and schema -----------------
+    def connection(self, user_id: Optional[int] = None, shard: Optional[int] = None):
+        return self.engine.raw_connection()
+
+    def init_db(self) -> None:
+        metadata.create_all(self.engine)
+
+    # ----------------- Users -----------------
+    def create_user(self, username: str, password_hash: str, created_at: str) -> Tuple[bool, str]:
+        try:
+            with self.engine.begin() as conn:
+                conn.execute(insert(users), {"username": username, "password_hash": password_hash, "created_at": created_at})
+            return True, "User created"
+        except IntegrityError:
+            return False, "Username already exists"
+        except DBAPIError as e:
+            return False, f"Error: {e.orig}"
+        except Exception as e:
+            return False, f"Error: {e}"
+
+    def get_user_by_username(self, username: str) -> Optional[User]:
+        with self.engine.connect() as conn:
+            row = conn.execute(self._stmt_user_by_name, {"username": username}).first()
+        return User.from_row(row)
+
+    # ----------------- Transactions -----------------
+    def add_transaction(self, user_id, date_iso, amount, category, ttype, description, currency, then=None) -> Tuple[bool, str, Optional[int]]:
+        return self._write(insert(transactions), {
+            "user_id": user_id, "date": date_iso, "amount": amount, "category": category,
+            "ttype": ttype, "description": description, "currency": currency,
+        }, None, "Saved", change=(user_id, None, "upsert"), returns_id=True, then=then)
+
+    def add_transactions(self, user_id: int, rows: List[Tuple], then=None) -> Tuple[bool, str, List[int]]:
+        keys = ("date", "amount", "category", "ttype", "description", "currency")
+        ids = []
+        try:
+            with self.engine.begin() as conn:
+                # One statement per row for the new ids (executemany doesn't return them portably)
+                for row in rows:
+                    result = conn.execute(insert(transactions), {"user_id": user_id, **dict(zip(keys, row))})
+                    ids.append(result.inserted_primary_key[0])
+                    _log_change(conn, user_id, ids[-1], "upsert")
+                if then is not None:
+                    then(_Stats(self, conn, user_id), ids)
+            return True, f"Saved {len(ids)} transaction(s)", ids
+        except DBAPIError as e:
+            return False, f"Error: {e.orig}", []
+        except Exception as e:
+            return False, f"Error: {e}", []
+
+    def get_transactions_by_user(self, user_id: int, limit: int) -> List[Transaction]:
+        with self.engine.connect() as conn:
+            rows = conn.execute(self._stmt_tx_by_user, {"user_id": user_id, "limit": limit}).all()
+        return [Transaction.from_row(tuple(r)) for r in rows]
+
+    def search_transactions(self, user_id: int, start_date: Optional[str], end_date: Optional[str], category: Optional[str], limit: int) -> List[Transaction]:
+        stmt = select(*_TX_COLUMNS).where(_filter_clause(user_id, TransactionFilter(start_date, end_date, category)))
+        with self.engine.connect() as conn:
+            rows = conn.execute(stmt.order_by(transactions.c.date.desc()).limit(limit)).all()
+        return [Transaction.from_row(tuple(r)) for r in rows]
+
+    def get_transaction_by_id(self, tx_id: int, user_id: Optional[int]) -> Optional[Transaction]:
+        with self.engine.connect() as conn:
+            row = conn.execute(self._stmt_tx_by_id, {"tx_id": tx_id}).first()
+        return Transaction.from_row(tuple(row)) if row else None
+
+    def update_transaction(self, tx_id, user_id, date_iso, amount, category, ttype, description, currency, then=None) -> Tuple[bool, str]:
+        return self._change(self._stmt_update_tx, {
+            "tx_id": tx_id, "owner_id": user_id, "new_date": date_iso, "new_amount": amount, "new_category": category,
+            "new_ttype": ttype, "new_description": description, "new_currency": currency,
+        }, tx_id, user_id, "Updated", "upsert", then)
+
+    def delete_transaction(self, tx_id: int, user_id: int, then=None) -> Tuple[bool, str]:
+        return self._change(self._stmt_delete_tx, {"tx_id": tx_id, "owner_id": user_id}, tx_id, user_id, "Deleted", "delete", then)
+
+    def _change(self, stmt, params, tx_id: int, user_id: int, ok: str, op: str, then) -> Tuple[bool, str]:
+        """
+        Update or delete one of the user's transactions (see _write); then(stats, the row as it
+        was) runs in the same transaction.
+        """
+        not_found = "Transaction not found or not authorized"
+        if then is None:
+            return self._write(stmt, params, not_found, ok, change=(user_id, tx_id, op))
+        try:
+            with self.engine.begin() as conn:
+                row = conn.execute(self._stmt_tx_by_id, {"tx_id": tx_id}).first()
+                if row is None or row.user_id != user_id or conn.execute(stmt, params).rowcount == 0:
+                    return False, not_found
+                _log_change(conn, user_id, tx_id, op)
+                then(_Stats(self, conn, user_id), Transaction.from_row(tuple(row)))
+            return True, ok
+        except DBAPIError as e:
+            return False, f"Error: {e.orig}"
+        except Exception as e:
+            return False, f"Error: {e}"
+
+    # ----------------- Bulk changes -----------------
+    def preview_transactions(self, user_id: int, flt: TransactionFilter, limit: int) -> Tuple[int, List[Transaction]]:
+        cond = _filter_clause(user_id, flt)
+        t = transactions.c
+        with self.engine.begin() as conn:  # count and sample from one transaction
+            count = conn.execute(select(func.count()).select_from(transactions).where(cond)).scalar()
+            rows = conn.execute(select(*_TX_COLUMNS).where(cond).order_by(t.date.desc(), t.id.desc()).limit(limit)).all()
+        return count, [Transaction.from_row(tuple(r)) for r in rows]
+
+    def bulk_update_transactions(self, user_id: int, flt: TransactionFilter, changes: Dict[str, Optional[str]], then=None) -> Tuple[bool, str, int]:
+        t = transactions.c
+        # Skip rows that already have the new values: they'd only churn the change feed
+        cond = and_(_filter_clause(user_id, flt), ~and_(*(t[col].is_not_distinct_from(value) for col, value in changes.items())))
+        try:
+            with self.engine.begin() as conn:
+                # Log first: after the update a changed category may no longer match the filter
+                _log_changes(conn, cond, "upsert")
+                if "category" in changes or "ttype" in changes:
+                    conn.execute(delete(anomalies).where(anomalies.c.user_id == user_id, anomalies.c.tx_id.in_(select(t.id).where(cond))))
+                count = conn.execute(update(transactions).where(cond).values(**changes)).rowcount
+                if count and then is not None:
+                    then(_Stats(self, conn, user_id))
+            return True, f"Updated {count} transaction(s)", count
+        except DBAPIError as e:
+            return False, f"Error: {e.orig}", 0
+        except Exception as e:
+            return False, f"Error: {e}", 0
+
+    def bulk_delete_transactions(self, user_id: int, flt: TransactionFilter, then=None) -> Tuple[bool, str, int]:
+        cond = _filter_clause(user_id, flt)
+        try:
+            with self.engine.begin() as conn:
+                _log_changes(conn, cond, "delete")
+                conn.execute(delete(anomalies).where(anomalies.c.user_id == user_id, anomalies.c.tx_id.in_(select(transactions.c.id).where(cond))))
+                count = conn.execute(delete(transactions).where(cond)).rowcount
+                if count and then is not None:
+                    then(_Stats(self, conn, user_id))
+            return True, f"Deleted {count} transaction(s)", count
+        except DBAPIError as e:
+            return False, f"Error: {e.orig}", 0
+        except Exception as e:
+            return False, f"Error: {e}", 0
+
+    # ----------------- Change feed -----------------
+    def get_transaction_changes(self, user_id: int, since: int, limit: int) -> Dict:
+        with self.engine.connect() as conn:
+            purged_through = conn.execute(self._stmt_purged_through).scalar() or 0
+            if since <= 0 or since < purged_through:
+                # Watermark first: a change racing with the read is at worst sent again next time
+                watermark = max(conn.execute(select(func.coalesce(func.max(transaction_changes.c.seq), 0))).scalar(), purged_through)
+                rows = conn.execute(self._stmt_all_by_user, {"user_id": user_id}).all()
+                upserts = [Transaction.from_row(tuple(r)) for r in rows]
+                return {"full": True, "watermark": watermark, "more": False, "upserts": upserts, "deletes": []}
+            rows = conn.execute(self._stmt_changes, {"user_id": user_id, "since": since, "limit": limit}).all()
+        return fold_changes(rows, since, limit)
+
+    def get_change_watermark(self, shard: Optional[int]) -> int:
+        with self.engine.connect() as conn:
+            return conn.execute(self._stmt_change_watermark).scalar()
+
+    def tail_transaction_changes(self, since: int, limit: int, shard: Optional[int]) -> List[Tuple[int, int]]:
+        with self.engine.connect() as conn:
+            rows = conn.execute(self._stmt_tail_changes, {"since": since, "limit": limit}).all()
+        return [(r.seq, r.user_id) for r in rows]
+
+    def compact_transaction_changes(self, tombstones_before: str) -> int:
+        c = transaction_changes.c
+        with self.engine.begin() as conn:
+            latest = select(func.max(c.seq)).group_by(c.tx_id).scalar_subquery()
+            removed = conn.execute(delete(transaction_changes).where(c.seq.not_in(latest))).rowcount
+            purge = conn.execute(
+                select(func.max(c.seq)).where(c.op == "delete", c.changed_at < tombstones_before)
+            ).scalar()
+            if purge is not None:
+                removed += conn.execute(delete(transaction_changes).where(c.op == "delete", c.seq <= purge)).rowcount
+                previous = conn.execute(self._stmt_purged_through).scalar()
+                if previous is None:
+                    conn.execute(insert(change_log_meta), {"name": "purged_through", "value": purge})
+                elif purge > previous:
+                    conn.execute(update(change_log_meta).where(change_log_meta.c.name == "purged_through").values(value=purge))
+        return removed
+
+    # ----------------- Cold storage -----------------
+    def archive_transactions(self, before: str) -> int:
+        return 0  # every transaction stays in the one database
+
+    # ----------------- Expense statistics and anomalies -----------------
+    def update_category_stats(self, user_id: int, category: str, update: Callable[[Optional[CategoryStats]], CategoryStats]) -> Tuple[bool, str]:
+        try:
+            with self.engine.begin() as conn:
+                stats = _Stats(self, conn, user_id)
+                stats.put_stats(update(stats.get_stats(category)))
+            return True, "Updated"
+        except DBAPIError as e:
+            return False, f"Error: {e.orig}"
+        except Exception as e:
+            return False, f"Error: {e}"
+
+    def replace_category_stats(self, user_id: int, stats: List[CategoryStats]) -> Tuple[bool, str]:
+        try:
+            with self.engine.begin() as conn:
+                _Stats(self, conn, user_id).replace_stats(stats)
+            return True, "Replaced"
+        except DBAPIError as e:
+            return False, f"Error: {e.orig}"
+        except Exception as e:
+            return False, f"Error: {e}"
+
+    def replace_anomaly(self, user_id: int, tx_id: int, anomaly: Optional[Anomaly]) -> Tuple[bool, str]:
+        try:
+            with self.engine.begin() as conn:
+                _Stats(self, conn, user_id).replace_anomaly(tx_id, anomaly)
+            return True, "Saved"
+        except DBAPIError as e:
+            return False, f"Error: {e.orig}"
+        except Exception as e:
+            return False, f"Error: {e}"
+
+    def get_anomalies(self, user_id: int, limit: int) -> List[Anomaly]:
+        with self.engine.connect() as conn:
+            rows = conn.execute(self._stmt_anomalies, {"user_id": user_id, "limit": limit}).all()
+        return [Anomaly.from_row(tuple(r)) for r in rows]
+
+    # ----------------- Reports -----------------
+    def get_balance(self, user_id: int, currency: str) -> float:
+        with self.engine.connect() as conn:
+            balance = conn.execute(self._stmt_balance, {"user_id": user_id, **self._conversion_params(currency)}).scalar()
+        return float(balance) if balance is not None else 0.0
+
+    def get_monthly_summary(self, user_id: int, currency: str) -> List[Dict]:
+        with self.engine.connect() as conn:
+            rows = conn.execute(self._stmt_monthly, {"user_id": user_id, **self._conversion_params(currency)}).all()
+        return [{"month": r.month, "income": float(r.income or 0.0), "expense": float(r.expense or 0.0)} for r in rows]
+
+    def get_category_totals(self, user_id: int, ttype: str, month: Optional[str], currency: str) -> List[Dict]:
+        params = {"user_id": user_id, "ttype": ttype, **self._conversion_params(currency)}
+        stmt = self._stmt_categories
+        if month:
+            stmt = self._stmt_categories_month
+            params["month_start"] = month
+            params["month_end"] = month + "-32"  # sorts after every day of the month
+        with self.engine.connect() as conn:
+            rows = conn.execute(stmt, params).all()
+        return [{"category": r.category, "total": float(r.total or 0.0)} for r in rows]
+
+    # ----------------- Exchange rates -----------------
+    def get_exchange_rates(self) -> List[Tuple[str, str, float]]:
+        with self.engine.connect() as conn:
+            rows = conn.execute(self._stmt_rates).all()
+        return [(r.currency, r.date, float(r.rate)) for r in rows]
+
+    def save_exchange_rates(self, rates: List[Tuple[str, str, float]]) -> int:
+        if not rates:
+            return 0
+        e = exchange_rates.c
+        keys = [{"currency": c, "date": d} for c, d, _ in rates]
+        with self.engine.begin() as conn:
+            # Portable upsert: drop the (currency, date) rows being replaced, then insert
+            conn.execute(delete(exchange_rates).where(e.currency == bindparam("currency"), e.date == bindparam("date")), keys)
+            conn.execute(insert(exchange_rates), [{"currency": c, "date": d, "rate": r} for c, d, r in rates])
+        return len(rates)
+
+    # ----------------- Recurring rules -----------------
+    def add_recurring_rule(self, user_id, amount, category, ttype, description, frequency, interval, cron, start_date, end_date, next_due, created_at, currency) -> Tuple[bool, str]:
+        return self._write(insert(recurring_rules), {
+            "user_id": user_id, "amount": amount, "category": category, "ttype": ttype, "description": description,
+            "frequency": frequency, "interval": interval, "cron": cron, "start_date": start_date, "end_date": end_date,
+            "next_due": next_due, "created_at": created_at, "currency": currency,
+        }, None, "Saved")
+
+    def get_recurring_rules(self, user_id: int) -> List[RecurringRule]:
+        with self.engine.connect() as conn:
+            rows = conn.execute(self._stmt_rules_by_user, {"user_id": user_id}).all()
+        return [RecurringRule.from_row(tuple(r)) for r in rows]
+
+    def delete_recurring_rule(self, rule_id: int, user_id: int) -> Tuple[bool, str]:
+        return self._write(self._stmt_delete_rule, {"rule_id": rule_id, "owner_id": user_id},
+                           "Rule not found or not authorized", "Deleted")
+
+    def get_due_recurring_rules(self, as_of: str, after_id: int, limit: int, shard: Optional[int]) -> List[RecurringRule]:
+        with self.engine.connect() as conn:
+            rows = conn.execute(self._stmt_due_rules, {"as_of": as_of, "after_id": after_id, "limit": limit}).all()
+        return [RecurringRule.from_row(tuple(r)) for r in rows]
+
+    def materialize_recurring(self, occurrences: List[Tuple], advances: List[Tuple[Optional[str], int, str]], shard: Optional[int]) -> int:
+        keys = ("user_id", "date", "amount", "category", "ttype", "description", "currency", "recurring_id")
+        stmt = self._insert_ignore(transactions)
+        inserted = 0
+        with self.engine.begin() as conn:
+            # One statement per row: executemany rowcounts aren't reliable across drivers
+            for occurrence in occurrences:
+                result = conn.execute(stmt, dict(zip(keys, occurrence)))
+                if result.rowcount > 0:
+                    inserted += 1
+                    _log_change(conn, occurrence[0], result.inserted_primary_key[0], "upsert")
+            if advances:
+                conn.execute(self._stmt_advance_rule, [
+                    {"new_next_due": new, "rule_id": rule_id, "old_next_due": old} for new, rule_id, old in advances
+                ])
+        return inserted
+
+    # ----------------- Categorization rules -----------------
+    def add_category_rule(self, user_id, category, pattern, match, ttype, min_amount, max_amount, priority, created_at) -> Tuple[bool, str]:
+        return self._write(insert(category_rules), {
+            "user_id": user_id, "category": category, "pattern": pattern, "match": match, "ttype": ttype,
+            "min_amount": min_amount, "max_amount": max_amount, "priority": priority, "created_at": created_at,
+        }, None, "Saved")
+
+    def get_category_rules(self, user_id: int) -> List[CategoryRule]:
+        with self.engine.connect() as conn:
+            rows = conn.execute(self._stmt_category_rules, {"user_id": user_id}).all()
+        return [CategoryRule.from_row(tuple(r)) for r in rows]
+
+    def delete_category_rule(self, rule_id: int, user_id: int) -> Tuple[bool, str]:
+        return self._write(self._stmt_delete_category_rule, {"rule_id": rule_id, "owner_id": user_id},
+                           "Rule not found or not authorized", "Deleted")
+
+    def get_category_rules_version(self, user_id: int) -> Tuple[int, int]:
+        with self.engine.connect() as conn:
+            count, max_id = conn.execute(self._stmt_category_rules_version, {"user_id": user_id}).one()
+        return int(count), int(max_id)
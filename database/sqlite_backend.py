@@ -0,0 +1,978 @@
+"""
+sqlite3 storage backend (the default, see database.storage).
+
+Everything lives in settings.DB_PATH, or in per-user shard files when
+settings.SHARD_COUNT > 0 (database.sharding). Transaction writes go through the
+group-commit writer (database.write_queue) when settings.GROUP_COMMIT is on.
+"""
+
+import os
+import sqlite3
+from typing import Callable, Iterator, List, Tuple, Optional, Dict
+
+from config import settings
+from .models import User, Transaction, RecurringRule, CategoryRule, CategoryStats, Anomaly, TransactionFilter
+from .instrumentation import InstrumentedConnection
+from .storage import StatsWriter, StorageBackend, fold_changes
+from . import sharding
+from . import write_queue
+from . import archive
+
+
+def _connect(path: str):
+    if settings.METRICS_ENABLED or settings.SLOW_QUERY_MS > 0:
+        conn = sqlite3.connect(path, check_same_thread=False, factory=InstrumentedConnection)
+    else:
+        conn = sqlite3.connect(path, check_same_thread=False)
+    conn.row_factory = sqlite3.Row
+    return conn
+
+
+def _db_path(user_id: Optional[int] = None, shard: Optional[int] = None) -> str:
+    if not sharding.enabled():
+        return settings.DB_PATH
+    if shard is None and user_id is not None:
+        shard = sharding.shard_for_user(user_id)
+    if shard is None:
+        return sharding.directory_path()
+    return sharding.shard_path(shard)
+
+
+def _run_write(user_id: int, op) -> Tuple[bool, str]:
+    """
+    Apply op(cursor) -> (ok, message) to the user's database and commit.
+    With settings.GROUP_COMMIT the write goes through the group-commit writer
+    (database.write_queue) and this returns once the batch holding it is durable.
+    """
+    try:
+        if settings.GROUP_COMMIT:
+            return write_queue.get_write_queue(_db_path(user_id), _connect).submit(op).result()
+        conn = _connect(_db_path(user_id))
+        try:
+            result = op(conn.cursor())
+            conn.commit()
+            return result
+        finally:
+            conn.close()
+    except Exception as e:
+        return False, f"Error: {e}"
+
+
+# ----------------- Schema -----------------
+def _enable_wal(conn) -> None:
+    # Readers keep working while the group-commit writer holds the write lock
+    conn.execute("PRAGMA journal_mode=WAL")
+
+
+def _enable_incremental_vacuum(conn) -> None:
+    # Must precede the first table; an existing file switches on its next full VACUUM
+    # (python -m database.maintenance vacuum). Free pages are then returned in small
+    # steps by the maintenance scheduler.
+    conn.execute("PRAGMA auto_vacuum=INCREMENTAL")
+
+
+def _create_directory_schema(cur) -> None:
+    cur.execute("""
+    CREATE TABLE IF NOT EXISTS users (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        username TEXT UNIQUE NOT NULL,
+        password_hash TEXT NOT NULL,
+        created_at TEXT NOT NULL
+    );
+    """)
+
+
+def _create_ledger_schema(cur) -> None:
+    cur.execute("""
+    CREATE TABLE IF NOT EXISTS transactions (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        user_id INTEGER NOT NULL,
+        date TEXT NOT NULL,
+        amount REAL NOT NULL,
+        category TEXT NOT NULL,
+        ttype TEXT NOT NULL CHECK(ttype IN ('income','expense')),
+        description TEXT,
+        FOREIGN KEY(user_id) REFERENCES users(id)
+    );
+    """)
+
+    cur.execute("""
+    CREATE TABLE IF NOT EXISTS recurring_rules (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        user_id INTEGER NOT NULL,
+        amount REAL NOT NULL,
+        category TEXT NOT NULL,
+        ttype TEXT NOT NULL CHECK(ttype IN ('income','expense')),
+        description TEXT,
+        frequency TEXT NOT NULL CHECK(frequency IN ('daily','weekly','monthly','cron')),
+        interval INTEGER NOT NULL DEFAULT 1,
+        cron TEXT,
+        start_date TEXT NOT NULL,
+        end_date TEXT,
+        next_due TEXT,
+        created_at TEXT NOT NULL,
+        FOREIGN KEY(user_id) REFERENCES users(id)
+    );
+    """)
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_recurring_next_due ON recurring_rules(next_due)")
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_recurring_user ON recurring_rules(user_id)")
+
+    # Every per-user read filters on user_id and most sort or group by date
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_transactions_user_date ON transactions(user_id, date)")
+
+    # Materialized occurrences remember their rule; the unique index makes
+    # re-running the materializer (or two overlapping runs) harmless.
+    _ensure_column(cur, "transactions", "recurring_id", "INTEGER")
+    cur.execute("""
+    CREATE UNIQUE INDEX IF NOT EXISTS idx_transactions_recurring
+    ON transactions(recurring_id, date) WHERE recurring_id IS NOT NULL
+    """)
+
+    # Amounts are stored in their own currency; rows from before multi-currency
+    # support are in the default currency.
+    currency_decl = f"TEXT NOT NULL DEFAULT '{settings.DEFAULT_CURRENCY}'"
+    _ensure_column(cur, "transactions", "currency", currency_decl)
+    _ensure_column(cur, "recurring_rules", "currency", currency_decl)
+
+    # Automatic categorization rules (finance.categorize)
+    cur.execute("""
+    CREATE TABLE IF NOT EXISTS category_rules (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        user_id INTEGER NOT NULL,
+        category TEXT NOT NULL,
+        pattern TEXT,
+        match TEXT NOT NULL CHECK(match IN ('substring','regex')),
+        ttype TEXT CHECK(ttype IN ('income','expense')),
+        min_amount REAL,
+        max_amount REAL,
+        priority INTEGER NOT NULL DEFAULT 0,
+        created_at TEXT NOT NULL,
+        FOREIGN KEY(user_id) REFERENCES users(id)
+    );
+    """)
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_category_rules_user ON category_rules(user_id, priority DESC, id)")
+
+    # Change feed for delta sync: every insert/update/delete of a transaction appends
+    # (seq, user, tx, op). Triggers keep it complete whichever code path writes.
+    cur.execute("""
+    CREATE TABLE IF NOT EXISTS transaction_changes (
+        seq INTEGER PRIMARY KEY AUTOINCREMENT,
+        user_id INTEGER NOT NULL,
+        tx_id INTEGER NOT NULL,
+        op TEXT NOT NULL CHECK(op IN ('upsert','delete')),
+        changed_at TEXT NOT NULL DEFAULT CURRENT_TIMESTAMP
+    );
+    """)
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_changes_user_seq ON transaction_changes(user_id, seq)")
+    # purged_through: highest seq whose tombstone compaction may have dropped
+    cur.execute("""
+    CREATE TABLE IF NOT EXISTS change_log_meta (
+        name TEXT PRIMARY KEY,
+        value INTEGER NOT NULL
+    ) WITHOUT ROWID;
+    """)
+    _create_change_triggers(cur)
+
+    # Online expense statistics per category (finance.anomalies), updated on every write
+    cur.execute("""
+    CREATE TABLE IF NOT EXISTS category_stats (
+        user_id INTEGER NOT NULL,
+        category TEXT NOT NULL,
+        count INTEGER NOT NULL,
+        mean REAL NOT NULL,
+        m2 REAL NOT NULL,
+        sketch TEXT,
+        PRIMARY KEY (user_id, category)
+    ) WITHOUT ROWID;
+    """)
+    cur.execute("""
+    CREATE TABLE IF NOT EXISTS anomalies (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        user_id INTEGER NOT NULL,
+        tx_id INTEGER NOT NULL,
+        date TEXT NOT NULL,
+        category TEXT NOT NULL,
+        amount REAL NOT NULL,
+        score REAL NOT NULL,
+        ratio REAL,
+        created_at TEXT NOT NULL
+    );
+    """)
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_anomalies_user ON anomalies(user_id, id)")
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_anomalies_tx ON anomalies(tx_id)")
+
+    # Cold storage (database.archive): per-day sums of archived transactions, and the
+    # date before which transactions may have been moved to the archive files
+    cur.execute("""
+    CREATE TABLE IF NOT EXISTS archived_daily_totals (
+        user_id INTEGER NOT NULL,
+        date TEXT NOT NULL,
+        category TEXT NOT NULL,
+        ttype TEXT NOT NULL,
+        currency TEXT NOT NULL,
+        amount REAL NOT NULL,
+        count INTEGER NOT NULL,
+        PRIMARY KEY (user_id, date, category, ttype, currency)
+    ) WITHOUT ROWID;
+    """)
+    cur.execute("""
+    CREATE TABLE IF NOT EXISTS archive_meta (
+        name TEXT PRIMARY KEY,
+        value TEXT NOT NULL
+    ) WITHOUT ROWID;
+    """)
+
+    # rate = value of one unit of `currency` in settings.DEFAULT_CURRENCY, valid from `date`.
+    # Replicated to every shard so conversions can join against it locally.
+    cur.execute("""
+    CREATE TABLE IF NOT EXISTS exchange_rates (
+        currency TEXT NOT NULL,
+        date TEXT NOT NULL,
+        rate REAL NOT NULL CHECK(rate > 0),
+        PRIMARY KEY (currency, date)
+    ) WITHOUT ROWID;
+    """)
+
+
+CHANGE_TRIGGERS = ("trg_transactions_insert", "trg_transactions_update", "trg_transactions_delete")
+
+
+def _create_change_triggers(cur) -> None:
+    cur.execute("""
+    CREATE TRIGGER IF NOT EXISTS trg_transactions_insert AFTER INSERT ON transactions BEGIN
+        INSERT INTO transaction_changes (user_id, tx_id, op) VALUES (NEW.user_id, NEW.id, 'upsert');
+    END
+    """)
+    cur.execute("""
+    CREATE TRIGGER IF NOT EXISTS trg_transactions_update AFTER UPDATE ON transactions BEGIN
+        INSERT INTO transaction_changes (user_id, tx_id, op) VALUES (NEW.user_id, NEW.id, 'upsert');
+    END
+    """)
+    cur.execute("""
+    CREATE TRIGGER IF NOT EXISTS trg_transactions_delete AFTER DELETE ON transactions BEGIN
+        INSERT INTO transaction_changes (user_id, tx_id, op) VALUES (OLD.user_id, OLD.id, 'delete');
+    END
+    """)
+
+
+def _ensure_column(cur, table: str, column: str, decl: str) -> None:
+    """
+    Add a column to an existing table (databases created before the column existed).
+    """
+    cur.execute(f"PRAGMA table_info({table})")
+    if column not in {r[1] for r in cur.fetchall()}:
+        cur.execute(f"ALTER TABLE {table} ADD COLUMN {column} {decl}")
+
+
+# ----------------- Currency conversion -----------------
+def _rate_sql(currency_expr: str, date_expr: str) -> str:
+    """
+    SQL expression for the rate of `currency_expr` on `date_expr`: the latest rate on or
+    before that date, falling back to the earliest known rate for older dates.
+    NULL if the currency has no rates at all.
+    """
+    return (
+        f"(CASE WHEN {currency_expr} = :base THEN 1.0 ELSE COALESCE("
+        f"(SELECT r.rate FROM exchange_rates r WHERE r.currency = {currency_expr} AND r.date <= {date_expr} ORDER BY r.date DESC LIMIT 1), "
+        f"(SELECT r.rate FROM exchange_rates r WHERE r.currency = {currency_expr} ORDER BY r.date ASC LIMIT 1)) END)"
+    )
+
+
+def _converted_amount_sql(table: str = "transactions") -> str:
+    """
+    SQL expression converting `table`.amount into the :rc reporting currency inside the query,
+    so aggregations convert in one pass instead of calling back into Python per row.
+    """
+    return (
+        f"(CASE WHEN {table}.currency = :rc THEN {table}.amount ELSE "
+        f"{table}.amount * {_rate_sql(f'{table}.currency', f'{table}.date')} / {_rate_sql(':rc', f'{table}.date')} END)"
+    )
+
+
+def _conversion_params(currency: str) -> Dict:
+    return {"rc": currency, "base": settings.DEFAULT_CURRENCY}
+
+
+_TX_COLUMNS = "id, user_id, date, amount, category, ttype, description, currency"
+_NOT_FOUND = "Transaction not found or not authorized"
+_RULE_COLUMNS = "id, user_id, amount, category, ttype, description, frequency, interval, cron, start_date, end_date, next_due, currency"
+_CATEGORY_RULE_COLUMNS = "id, user_id, category, pattern, match, ttype, min_amount, max_amount, priority"
+# Report sources: the hot table and, for periods that were archived, the daily rollups
+_HOT = "transactions"
+_ROLLUPS = "archived_daily_totals"
+
+
+def _filter_sql(user_id: int, flt: TransactionFilter) -> Tuple[str, List]:
+    """
+    WHERE clause and parameters selecting the user's transactions that match `flt`.
+    """
+    where, params = ["user_id = ?"], [user_id]
+    if flt.start_date:
+        where.append("date >= ?")
+        params.append(flt.start_date)
+    if flt.end_date:
+        where.append("date <= ?")
+        params.append(flt.end_date)
+    if flt.category:
+        where.append("category = ?")
+        params.append(flt.category)
+    if flt.ttype:
+        where.append("ttype = ?")
+        params.append(flt.ttype)
+    if flt.description:
+        where.append("description LIKE ? ESCAPE '\\'")
+        params.append("%" + _escape_like(flt.description) + "%")
+    return " AND ".join(where), params
+
+
+class _Stats(StatsWriter):
+    """
+    Statistics and anomalies through the cursor of a _run_write op.
+    """
+
+    def __init__(self, cur, user_id: int):
+        self.cur = cur
+        self.user_id = user_id
+
+    def get_stats(self, category: str) -> Optional[CategoryStats]:
+        self.cur.execute(
+            "SELECT user_id, category, count, mean, m2, sketch FROM category_stats WHERE user_id = ? AND category = ?",
+            (self.user_id, category)
+        )
+        return CategoryStats.from_row(self.cur.fetchone())
+
+    def put_stats(self, stats: CategoryStats) -> None:
+        self.cur.execute(
+            "INSERT OR REPLACE INTO category_stats (user_id, category, count, mean, m2, sketch) VALUES (?, ?, ?, ?, ?, ?)",
+            (self.user_id, stats.category, stats.count, stats.mean, stats.m2, stats.sketch)
+        )
+
+    def replace_anomaly(self, tx_id: int, anomaly: Optional[Anomaly]) -> None:
+        self.cur.execute("DELETE FROM anomalies WHERE tx_id = ?", (tx_id,))
+        if anomaly is not None:
+            self.cur.execute(
+                "INSERT INTO anomalies (user_id, tx_id, date, category, amount, score, ratio, created_at) VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                (self.user_id, tx_id, anomaly.date, anomaly.category, anomaly.amount, anomaly.score, anomaly.ratio, anomaly.created_at)
+            )
+
+    def expenses(self) -> Iterator[Transaction]:
+        seen = set()
+        archived_through = _archived_through(self.cur)
+        if archived_through is not None:
+            # Everything archived is older than the hot rows
+            older = [t for t in archive.read(self.user_id, archived_through) if t.ttype == "expense"]
+            for t in sorted(older, key=lambda t: (t.date, t.id)):
+                seen.add(t.id)
+                yield t
+        # A cursor of its own: the hook may write while this is being read
+        cur = self.cur.connection.cursor()
+        cur.execute(f"SELECT {_TX_COLUMNS} FROM transactions WHERE user_id = ? AND ttype = 'expense' ORDER BY date, id", (self.user_id,))
+        for row in cur:
+            if row[0] not in seen:
+                yield Transaction.from_row(tuple(row))
+
+    def replace_stats(self, stats: List[CategoryStats]) -> None:
+        self.cur.execute("DELETE FROM category_stats WHERE user_id = ?", (self.user_id,))
+        self.cur.executemany(
+            "INSERT INTO category_stats (user_id, category, count, mean, m2, sketch) VALUES (?, ?, ?, ?, ?, ?)",
+            [(self.user_id, s.category, s.count, s.mean, s.m2, s.sketch) for s in stats]
+        )
+
+
+def _old_row(cur, tx_id: int, user_id: int) -> Optional[Transaction]:
+    cur.execute(f"SELECT {_TX_COLUMNS} FROM transactions WHERE id = ? AND user_id = ?", (tx_id, user_id))
+    row = cur.fetchone()
+    return Transaction.from_row(tuple(row)) if row else None
+
+
+def _escape_like(text: str) -> str:
+    return text.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+
+
+def _archived_through(cur) -> Optional[str]:
+    cur.execute("SELECT value FROM archive_meta WHERE name = 'archived_through'")
+    row = cur.fetchone()
+    return row[0] if row else None
+
+
+def _report_sources(cur, month: Optional[str] = None) -> List[str]:
+    """
+    Tables a report has to aggregate: the rollups join in once something was archived
+    (and, for a single month, only if that month is older than the cutoff).
+    """
+    archived_through = _archived_through(cur)
+    if archived_through is None or (month and month + "-01" >= archived_through):
+        return [_HOT]
+    return [_HOT, _ROLLUPS]
+
+
+class SQLiteBackend(StorageBackend):
+    name = "sqlite"
+
+    def connection(self, user_id: Optional[int] = None, shard: Optional[int] = None):
+        """
+        Without sharding everything lives in settings.DB_PATH. With settings.SHARD_COUNT > 0,
+        `user_id` (or an explicit `shard` index) selects a shard file and no argument
+        selects the directory database that holds the users table.
+        """
+        return _connect(_db_path(user_id, shard))
+
+    def ledger_shards(self) -> List[Optional[int]]:
+        return list(range(settings.SHARD_COUNT)) if sharding.enabled() else [None]
+
+    def init_db(self) -> None:
+        if not sharding.enabled():
+            conn = self.connection()
+            _enable_incremental_vacuum(conn)
+            _create_directory_schema(conn.cursor())
+            _create_ledger_schema(conn.cursor())
+            conn.commit()
+            _enable_wal(conn)
+            conn.close()
+            return
+
+        os.makedirs(settings.SHARD_DIR, exist_ok=True)
+        conn = self.connection()
+        _enable_incremental_vacuum(conn)
+        _create_directory_schema(conn.cursor())
+        conn.commit()
+        conn.close()
+        for shard in self.ledger_shards():
+            conn = self.connection(shard=shard)
+            _enable_incremental_vacuum(conn)
+            cur = conn.cursor()
+            _create_ledger_schema(cur)
+            sharding.reserve_id_range(cur, shard)
+            conn.commit()
+            _enable_wal(conn)
+            conn.close()
+
+    # ----------------- Users -----------------
+    def create_user(self, username: str, password_hash: str, created_at: str) -> Tuple[bool, str]:
+        conn = self.connection()
+        cur = conn.cursor()
+        try:
+            cur.execute(
+                "INSERT INTO users (username, password_hash, created_at) VALUES (?, ?, ?)",
+                (username, password_hash, created_at)
+            )
+            conn.commit()
+            return True, "User created"
+        except sqlite3.IntegrityError:
+            return False, "Username already exists"
+        except Exception as e:
+            return False, f"Error: {e}"
+        finally:
+            conn.close()
+
+    def get_user_by_username(self, username: str) -> Optional[User]:
+        conn = self.connection()
+        cur = conn.cursor()
+        cur.execute("SELECT id, username, password_hash, created_at FROM users WHERE username = ?", (username,))
+        row = cur.fetchone()
+        conn.close()
+        return User.from_row(row)
+
+    # ----------------- Transactions -----------------
+    def add_transaction(self, user_id, date_iso, amount, category, ttype, description, currency, then=None) -> Tuple[bool, str, Optional[int]]:
+        def op(cur):
+            cur.execute(
+                "INSERT INTO transactions (user_id, date, amount, category, ttype, description, currency) VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (user_id, date_iso, amount, category, ttype, description, currency)
+            )
+            tx_id = cur.lastrowid
+            if then is not None:
+                then(_Stats(cur, user_id), tx_id)
+            return True, "Saved", tx_id
+        result = _run_write(user_id, op)
+        return result if len(result) == 3 else (*result, None)
+
+    def add_transactions(self, user_id: int, rows: List[Tuple], then=None) -> Tuple[bool, str, List[int]]:
+        def op(cur):
+            ids = []
+            for row in rows:
+                cur.execute(
+                    "INSERT INTO transactions (user_id, date, amount, category, ttype, description, currency) VALUES (?, ?, ?, ?, ?, ?, ?)",
+                    (user_id, *row)
+                )
+                ids.append(cur.lastrowid)
+            if then is not None:
+                then(_Stats(cur, user_id), ids)
+            return True, f"Saved {len(ids)} transaction(s)", ids
+        result = _run_write(user_id, op)
+        return result if len(result) == 3 else (*result, [])
+
+    def get_transactions_by_user(self, user_id: int, limit: int) -> List[Transaction]:
+        return self.search_transactions(user_id, None, None, None, limit)
+
+    def search_transactions(self, user_id: int, start_date: Optional[str], end_date: Optional[str], category: Optional[str], limit: int) -> List[Transaction]:
+        where, params = _filter_sql(user_id, TransactionFilter(start_date, end_date, category))
+        conn = self.connection(user_id)
+        try:
+            cur = conn.cursor()
+            cur.execute(f"SELECT {_TX_COLUMNS} FROM transactions WHERE {where} ORDER BY date DESC LIMIT ?", (*params, limit))
+            found = [Transaction.from_row(tuple(r)) for r in cur.fetchall()]
+            archived_through = _archived_through(cur)
+        finally:
+            conn.close()
+        # Archived rows are all older than the cutoff: only read them if the hot rows
+        # didn't fill the page and the range reaches back past the cutoff
+        if len(found) >= limit or archived_through is None or (start_date and start_date >= archived_through):
+            return found
+        seen = {t.id for t in found}
+        older = []
+        for t in archive.read(user_id, archived_through, start_date, end_date):
+            if (category and t.category != category) or t.id in seen:
+                continue
+            older.append(t)
+            if len(found) + len(older) >= limit:
+                break
+        return sorted(found + older, key=lambda t: t.date, reverse=True)[:limit]
+
+    def get_transaction_by_id(self, tx_id: int, user_id: Optional[int]) -> Optional[Transaction]:
+        # Ids are unique across shards (sharding.reserve_id_range), so without a user probe each one
+        shards = [None] if user_id is not None else self.ledger_shards()
+        for shard in shards:
+            conn = self.connection(user_id, shard)
+            cur = conn.cursor()
+            cur.execute(
+                f"SELECT {_TX_COLUMNS} FROM transactions WHERE id = ?",
+                (tx_id,)
+            )
+            row = cur.fetchone()
+            conn.close()
+            if row:
+                return Transaction.from_row(tuple(row))
+        return None
+
+    def _not_found(self, tx_id: int, user_id: int) -> Tuple[bool, str]:
+        """
+        Why a write matched no hot row: an archived transaction is still listed, so say that it's read-only.
+        """
+        conn = self.connection(user_id)
+        try:
+            archived_through = _archived_through(conn.cursor())
+        finally:
+            conn.close()
+        if archived_through is not None and archive.find(user_id, tx_id, archived_through) is not None:
+            return False, f"Transaction is archived (dated before {archived_through}) and can no longer be changed"
+        return False, _NOT_FOUND
+
+    def update_transaction(self, tx_id, user_id, date_iso, amount, category, ttype, description, currency, then=None) -> Tuple[bool, str]:
+        def op(cur):
+            old = _old_row(cur, tx_id, user_id) if then is not None else None
+            cur.execute(
+                "UPDATE transactions SET date = ?, amount = ?, category = ?, ttype = ?, description = ?, currency = COALESCE(?, currency) WHERE id = ? AND user_id = ?",
+                (date_iso, amount, category, ttype, description, currency, tx_id, user_id)
+            )
+            if cur.rowcount == 0:
+                return False, _NOT_FOUND
+            if old is not None:
+                then(_Stats(cur, user_id), old)
+            return True, "Updated"
+        result = _run_write(user_id, op)
+        return self._not_found(tx_id, user_id) if result == (False, _NOT_FOUND) else result
+
+    def delete_transaction(self, tx_id: int, user_id: int, then=None) -> Tuple[bool, str]:
+        def op(cur):
+            old = _old_row(cur, tx_id, user_id) if then is not None else None
+            cur.execute(
+                "DELETE FROM transactions WHERE id = ? AND user_id = ?",
+                (tx_id, user_id)
+            )
+            if cur.rowcount == 0:
+                return False, _NOT_FOUND
+            if old is not None:
+                then(_Stats(cur, user_id), old)
+            return True, "Deleted"
+        result = _run_write(user_id, op)
+        return self._not_found(tx_id, user_id) if result == (False, _NOT_FOUND) else result
+
+    # ----------------- Bulk changes -----------------
+    def preview_transactions(self, user_id: int, flt: TransactionFilter, limit: int) -> Tuple[int, List[Transaction]]:
+        where, params = _filter_sql(user_id, flt)
+        conn = self.connection(user_id)
+        try:
+            cur = conn.cursor()
+            cur.execute("BEGIN")  # count and sample from one snapshot
+            cur.execute(f"SELECT COUNT(*) FROM transactions WHERE {where}", params)
+            count = cur.fetchone()[0]
+            cur.execute(f"SELECT {_TX_COLUMNS} FROM transactions WHERE {where} ORDER BY date DESC, id DESC LIMIT ?", (*params, limit))
+            sample = [Transaction.from_row(tuple(r)) for r in cur.fetchall()]
+        finally:
+            conn.close()
+        return count, sample
+
+    def bulk_update_transactions(self, user_id: int, flt: TransactionFilter, changes: Dict[str, Optional[str]], then=None) -> Tuple[bool, str, int]:
+        where, params = _filter_sql(user_id, flt)
+        # Skip rows that already have the new values: they'd only churn the change feed
+        where += " AND NOT (" + " AND ".join(f"{col} IS ?" for col in changes) + ")"
+        params += list(changes.values())
+        assignments = ", ".join(f"{col} = ?" for col in changes)
+
+        def op(cur):
+            if "category" in changes or "ttype" in changes:
+                # Anomalies were scored against the old category
+                cur.execute(f"DELETE FROM anomalies WHERE user_id = ? AND tx_id IN (SELECT id FROM transactions WHERE {where})", (user_id, *params))
+            cur.execute(f"UPDATE transactions SET {assignments} WHERE {where}", (*changes.values(), *params))
+            count = cur.rowcount
+            if count and then is not None:
+                then(_Stats(cur, user_id))
+            return True, f"Updated {count} transaction(s)", count
+        result = _run_write(user_id, op)
+        return result if len(result) == 3 else (*result, 0)
+
+    def bulk_delete_transactions(self, user_id: int, flt: TransactionFilter, then=None) -> Tuple[bool, str, int]:
+        where, params = _filter_sql(user_id, flt)
+
+        def op(cur):
+            cur.execute(f"DELETE FROM anomalies WHERE user_id = ? AND tx_id IN (SELECT id FROM transactions WHERE {where})", (user_id, *params))
+            cur.execute(f"DELETE FROM transactions WHERE {where}", params)
+            count = cur.rowcount
+            if count and then is not None:
+                then(_Stats(cur, user_id))
+            return True, f"Deleted {count} transaction(s)", count
+        result = _run_write(user_id, op)
+        return result if len(result) == 3 else (*result, 0)
+
+    # ----------------- Change feed -----------------
+    def get_transaction_changes(self, user_id: int, since: int, limit: int) -> Dict:
+        conn = self.connection(user_id)
+        try:
+            cur = conn.cursor()
+            cur.execute("BEGIN")  # one snapshot for the watermark and the rows
+            cur.execute("SELECT value FROM change_log_meta WHERE name = 'purged_through'")
+            row = cur.fetchone()
+            purged_through = row[0] if row else 0
+            if since <= 0 or since < purged_through:
+                cur.execute("SELECT COALESCE(MAX(seq), 0) FROM transaction_changes")
+                watermark = max(cur.fetchone()[0], purged_through)
+                cur.execute(f"SELECT {_TX_COLUMNS} FROM transactions WHERE user_id = ? ORDER BY date DESC, id DESC", (user_id,))
+                upserts = [Transaction.from_row(tuple(r)) for r in cur.fetchall()]
+                archived_through = _archived_through(cur)
+                if archived_through is not None:
+                    # All older than the hot rows; a row being archived right now may be in both
+                    seen = {t.id for t in upserts}
+                    upserts += [t for t in archive.read(user_id, archived_through) if t.id not in seen]
+                return {"full": True, "watermark": watermark, "more": False, "upserts": upserts, "deletes": []}
+
+            tx_columns = ", ".join(f"transactions.{c.strip()}" for c in _TX_COLUMNS.split(","))
+            cur.execute(f"""
+            SELECT transaction_changes.seq, transaction_changes.tx_id, {tx_columns}
+            FROM transaction_changes
+            LEFT JOIN transactions ON transactions.id = transaction_changes.tx_id AND transaction_changes.op = 'upsert'
+            WHERE transaction_changes.user_id = ? AND transaction_changes.seq > ?
+            ORDER BY transaction_changes.seq
+            LIMIT ?
+            """, (user_id, since, limit))
+            rows = cur.fetchall()
+        finally:
+            conn.rollback()
+            conn.close()
+        return fold_changes(rows, since, limit)
+
+    def get_change_watermark(self, shard: Optional[int]) -> int:
+        conn = self.connection(shard=shard)
+        cur = conn.cursor()
+        cur.execute("SELECT COALESCE(MAX(seq), 0) FROM transaction_changes")
+        watermark = cur.fetchone()[0]
+        conn.close()
+        return watermark
+
+    def tail_transaction_changes(self, since: int, limit: int, shard: Optional[int]) -> List[Tuple[int, int]]:
+        conn = self.connection(shard=shard)
+        cur = conn.cursor()
+        cur.execute("SELECT seq, user_id FROM transaction_changes WHERE seq > ? ORDER BY seq LIMIT ?", (since, limit))
+        rows = cur.fetchall()
+        conn.close()
+        return [(r[0], r[1]) for r in rows]
+
+    def compact_transaction_changes(self, tombstones_before: str) -> int:
+        removed = 0
+        for shard in self.ledger_shards():
+            conn = self.connection(shard=shard)
+            try:
+                cur = conn.cursor()
+                # Only the latest entry per transaction matters to a client
+                cur.execute("DELETE FROM transaction_changes WHERE seq NOT IN (SELECT MAX(seq) FROM transaction_changes GROUP BY tx_id)")
+                removed += cur.rowcount
+                cur.execute("SELECT MAX(seq) FROM transaction_changes WHERE op = 'delete' AND changed_at < ?", (tombstones_before,))
+                purge = cur.fetchone()[0]
+                if purge is not None:
+                    cur.execute("DELETE FROM transaction_changes WHERE op = 'delete' AND seq <= ?", (purge,))
+                    removed += cur.rowcount
+                    cur.execute(
+                        "INSERT INTO change_log_meta (name, value) VALUES ('purged_through', ?) "
+                        "ON CONFLICT(name) DO UPDATE SET value = MAX(value, excluded.value)",
+                        (purge,)
+                    )
+                conn.commit()
+            finally:
+                conn.close()
+        return removed
+
+    # ----------------- Expense statistics and anomalies -----------------
+    def update_category_stats(self, user_id: int, category: str, update: Callable[[Optional[CategoryStats]], CategoryStats]) -> Tuple[bool, str]:
+        def op(cur):
+            stats = _Stats(cur, user_id)
+            stats.put_stats(update(stats.get_stats(category)))
+            return True, "Updated"
+        return _run_write(user_id, op)
+
+    def replace_category_stats(self, user_id: int, stats: List[CategoryStats]) -> Tuple[bool, str]:
+        def op(cur):
+            _Stats(cur, user_id).replace_stats(stats)
+            return True, "Replaced"
+        return _run_write(user_id, op)
+
+    def replace_anomaly(self, user_id: int, tx_id: int, anomaly: Optional[Anomaly]) -> Tuple[bool, str]:
+        def op(cur):
+            _Stats(cur, user_id).replace_anomaly(tx_id, anomaly)
+            return True, "Saved"
+        return _run_write(user_id, op)
+
+    def get_anomalies(self, user_id: int, limit: int) -> List[Anomaly]:
+        conn = self.connection(user_id)
+        cur = conn.cursor()
+        cur.execute(
+            "SELECT id, user_id, tx_id, date, category, amount, score, ratio, created_at FROM anomalies "
+            "WHERE user_id = ? ORDER BY id DESC LIMIT ?",
+            (user_id, limit)
+        )
+        rows = cur.fetchall()
+        conn.close()
+        return [Anomaly.from_row(tuple(r)) for r in rows]
+
+    # ----------------- Reports -----------------
+    def get_balance(self, user_id: int, currency: str) -> float:
+        conn = self.connection(user_id)
+        cur = conn.cursor()
+        balance = 0.0
+        for table in _report_sources(cur):
+            amount = _converted_amount_sql(table)
+            cur.execute(
+                f"SELECT SUM(CASE WHEN ttype='income' THEN {amount} ELSE -{amount} END) as balance FROM {table} WHERE user_id = :user_id",
+                {"user_id": user_id, **_conversion_params(currency)}
+            )
+            row = cur.fetchone()
+            balance += float(row["balance"]) if row and row["balance"] is not None else 0.0
+        conn.close()
+        return balance
+
+    def get_monthly_summary(self, user_id: int, currency: str) -> List[Dict]:
+        conn = self.connection(user_id)
+        cur = conn.cursor()
+        months: Dict[str, Dict] = {}
+        for table in _report_sources(cur):
+            amount = _converted_amount_sql(table)
+            cur.execute(f"""
+            SELECT substr(date,1,7) as month,
+                   SUM(CASE WHEN ttype='income' THEN {amount} ELSE 0 END) as income,
+                   SUM(CASE WHEN ttype='expense' THEN {amount} ELSE 0 END) as expense
+            FROM {table}
+            WHERE user_id = :user_id
+            GROUP BY month
+            ORDER BY month ASC
+            """, {"user_id": user_id, **_conversion_params(currency)})
+            for r in cur.fetchall():
+                m = months.setdefault(r["month"], {"month": r["month"], "income": 0.0, "expense": 0.0})
+                m["income"] += float(r["income"] or 0.0)
+                m["expense"] += float(r["expense"] or 0.0)
+        conn.close()
+        return [months[k] for k in sorted(months)]
+
+    def get_category_totals(self, user_id: int, ttype: str, month: Optional[str], currency: str) -> List[Dict]:
+        params = {"user_id": user_id, "ttype": ttype, **_conversion_params(currency)}
+        month_filter = ""
+        if month:
+            month_filter = "AND date >= :month_start AND date < :month_end"
+            params["month_start"] = month
+            params["month_end"] = month + "-32"  # sorts after every day of the month
+        conn = self.connection(user_id)
+        cur = conn.cursor()
+        totals: Dict[str, float] = {}
+        for table in _report_sources(cur, month):
+            amount = _converted_amount_sql(table)
+            cur.execute(f"""
+            SELECT category, SUM({amount}) as total
+            FROM {table}
+            WHERE user_id = :user_id AND ttype = :ttype {month_filter}
+            GROUP BY category
+            """, params)
+            for r in cur.fetchall():
+                totals[r["category"]] = totals.get(r["category"], 0.0) + float(r["total"] or 0.0)
+        conn.close()
+        return [{"category": c, "total": t} for c, t in sorted(totals.items(), key=lambda item: item[1], reverse=True)]
+
+    # ----------------- Cold storage -----------------
+    def archive_transactions(self, before: str) -> int:
+        moved = 0
+        for shard in self.ledger_shards():
+            conn = self.connection(shard=shard)
+            try:
+                cur = conn.cursor()
+                # The write lock is held from the read to the delete, so no row changes in between
+                cur.execute("BEGIN IMMEDIATE")
+                cur.execute(f"SELECT {_TX_COLUMNS} FROM transactions WHERE date < ?", (before,))
+                rows = [tuple(r) for r in cur.fetchall()]
+                if not rows:
+                    conn.rollback()
+                    continue
+                # Files first: if the ledger transaction fails, the next run merges the same rows again
+                archive.write(rows)
+                cur.execute("""
+                INSERT INTO archived_daily_totals (user_id, date, category, ttype, currency, amount, count)
+                SELECT user_id, date, category, ttype, currency, SUM(amount), COUNT(*)
+                FROM transactions WHERE date < ?
+                GROUP BY user_id, date, category, ttype, currency
+                ON CONFLICT(user_id, date, category, ttype, currency)
+                DO UPDATE SET amount = amount + excluded.amount, count = count + excluded.count
+                """, (before,))
+                # Archived rows leave the hot set without showing up as deletions in the change feed
+                for name in CHANGE_TRIGGERS:
+                    cur.execute(f"DROP TRIGGER IF EXISTS {name}")
+                cur.execute("DELETE FROM transactions WHERE date < ?", (before,))
+                moved += cur.rowcount
+                _create_change_triggers(cur)
+                cur.execute(
+                    "INSERT INTO archive_meta (name, value) VALUES ('archived_through', ?) "
+                    "ON CONFLICT(name) DO UPDATE SET value = MAX(value, excluded.value)",
+                    (before,)
+                )
+                conn.commit()
+            finally:
+                conn.close()
+        return moved
+
+    # ----------------- Exchange rates -----------------
+    def get_exchange_rates(self) -> List[Tuple[str, str, float]]:
+        conn = self.connection(shard=self.ledger_shards()[0])
+        cur = conn.cursor()
+        cur.execute("SELECT currency, date, rate FROM exchange_rates ORDER BY currency, date")
+        rows = cur.fetchall()
+        conn.close()
+        return [(r["currency"], r["date"], float(r["rate"])) for r in rows]
+
+    def save_exchange_rates(self, rates: List[Tuple[str, str, float]]) -> int:
+        # Replicated: every shard gets a full copy
+        for shard in self.ledger_shards():
+            conn = self.connection(shard=shard)
+            try:
+                cur = conn.cursor()
+                cur.executemany("INSERT OR REPLACE INTO exchange_rates (currency, date, rate) VALUES (?, ?, ?)", rates)
+                conn.commit()
+            finally:
+                conn.close()
+        return len(rates)
+
+    # ----------------- Recurring rules -----------------
+    def add_recurring_rule(self, user_id, amount, category, ttype, description, frequency, interval, cron, start_date, end_date, next_due, created_at, currency) -> Tuple[bool, str]:
+        try:
+            conn = self.connection(user_id)
+            cur = conn.cursor()
+            cur.execute(
+                "INSERT INTO recurring_rules (user_id, amount, category, ttype, description, frequency, interval, cron, start_date, end_date, next_due, created_at, currency) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (user_id, amount, category, ttype, description, frequency, interval, cron, start_date, end_date, next_due, created_at, currency)
+            )
+            conn.commit()
+            return True, "Saved"
+        except Exception as e:
+            return False, f"Error: {e}"
+        finally:
+            conn.close()
+
+    def get_recurring_rules(self, user_id: int) -> List[RecurringRule]:
+        conn = self.connection(user_id)
+        cur = conn.cursor()
+        cur.execute(f"SELECT {_RULE_COLUMNS} FROM recurring_rules WHERE user_id = ? ORDER BY id", (user_id,))
+        rows = cur.fetchall()
+        conn.close()
+        return [RecurringRule.from_row(tuple(r)) for r in rows]
+
+    def delete_recurring_rule(self, rule_id: int, user_id: int) -> Tuple[bool, str]:
+        try:
+            conn = self.connection(user_id)
+            cur = conn.cursor()
+            cur.execute("DELETE FROM recurring_rules WHERE id = ? AND user_id = ?", (rule_id, user_id))
+            conn.commit()
+            if cur.rowcount == 0:
+                return False, "Rule not found or not authorized"
+            return True, "Deleted"
+        except Exception as e:
+            return False, f"Error: {e}"
+        finally:
+            conn.close()
+
+    def get_due_recurring_rules(self, as_of: str, after_id: int, limit: int, shard: Optional[int]) -> List[RecurringRule]:
+        conn = self.connection(shard=shard)
+        cur = conn.cursor()
+        cur.execute(
+            f"SELECT {_RULE_COLUMNS} FROM recurring_rules WHERE next_due IS NOT NULL AND next_due <= ? AND id > ? ORDER BY id LIMIT ?",
+            (as_of, after_id, limit)
+        )
+        rows = cur.fetchall()
+        conn.close()
+        return [RecurringRule.from_row(tuple(r)) for r in rows]
+
+    def materialize_recurring(self, occurrences: List[Tuple], advances: List[Tuple[Optional[str], int, str]], shard: Optional[int]) -> int:
+        conn = self.connection(shard=shard)
+        try:
+            cur = conn.cursor()
+            cur.executemany(
+                "INSERT OR IGNORE INTO transactions (user_id, date, amount, category, ttype, description, currency, recurring_id) VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                occurrences
+            )
+            inserted = cur.rowcount
+            cur.executemany("UPDATE recurring_rules SET next_due = ? WHERE id = ? AND next_due = ?", advances)
+            conn.commit()
+            return max(inserted, 0)
+        finally:
+            conn.close()
+
+    # ----------------- Categorization rules -----------------
+    def add_category_rule(self, user_id, category, pattern, match, ttype, min_amount, max_amount, priority, created_at) -> Tuple[bool, str]:
+        try:
+            conn = self.connection(user_id)
+            cur = conn.cursor()
+            cur.execute(
+                "INSERT INTO category_rules (user_id, category, pattern, match, ttype, min_amount, max_amount, priority, created_at) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (user_id, category, pattern, match, ttype, min_amount, max_amount, priority, created_at)
+            )
+            conn.commit()
+            return True, "Saved"
+        except Exception as e:
+            return False, f"Error: {e}"
+        finally:
+            conn.close()
+
+    def get_category_rules(self, user_id: int) -> List[CategoryRule]:
+        conn = self.connection(user_id)
+        cur = conn.cursor()
+        cur.execute(f"SELECT {_CATEGORY_RULE_COLUMNS} FROM category_rules WHERE user_id = ? ORDER BY priority DESC, id", (user_id,))
+        rows = cur.fetchall()
+        conn.close()
+        return [CategoryRule.from_row(tuple(r)) for r in rows]
+
+    def delete_category_rule(self, rule_id: int, user_id: int) -> Tuple[bool, str]:
+        try:
+            conn = self.connection(user_id)
+            cur = conn.cursor()
+            cur.execute("DELETE FROM category_rules WHERE id = ? AND user_id = ?", (rule_id, user_id))
+            conn.commit()
+            if cur.rowcount == 0:
+                return False, "Rule not found or not authorized"
+            return True, "Deleted"
+        except Exception as e:
+            return False, f"Error: {e}"
+        finally:
+            conn.close()
+
+    def get_category_rules_version(self, user_id: int) -> Tuple[int, int]:
+        conn = self.connection(user_id)
+        cur = conn.cursor()
+        cur.execute("SELECT COUNT(*), COALESCE(MAX(id), 0) FROM category_rules WHERE user_id = ?", (user_id,))
+        row = cur.fetchone()
+        conn.close()
+        return int(row[0]), int(row[1])
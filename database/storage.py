@@ -0,0 +1,332 @@
+"""
+Storage backend interface.
+
+database.db is the only module the rest of the app talks to; every function
+there delegates to the backend selected by settings.STORAGE_BACKEND:
+
+  sqlite      database.sqlite_backend.SQLiteBackend -- sqlite3 on settings.DB_PATH,
+              with sharding (database.sharding) and group commit (database.write_queue)
+  sqlalchemy  database.sqlalchemy_backend.SQLAlchemyBackend -- SQLAlchemy Core on
+              settings.DATABASE_URL with a pooled engine
+
+Backends receive already-normalized arguments (password hashes, concrete currency
+codes) and return the same values database.db documents.
+
+The transaction writes take an optional `then` hook, run inside the same write
+transaction with a StatsWriter: expense statistics and anomalies (finance.anomalies)
+then commit, or roll back, together with the change they follow.
+"""
+
+import abc
+import threading
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+
+from config import settings
+from .models import User, Transaction, RecurringRule, CategoryRule, CategoryStats, Anomaly, TransactionFilter
+
+
+class StatsWriter(abc.ABC):
+    """
+    One user's expense statistics and anomalies, read and written in the current write transaction.
+    """
+
+    @abc.abstractmethod
+    def get_stats(self, category: str) -> Optional[CategoryStats]:
+        raise NotImplementedError
+
+    @abc.abstractmethod
+    def put_stats(self, stats: CategoryStats) -> None:
+        raise NotImplementedError
+
+    @abc.abstractmethod
+    def replace_anomaly(self, tx_id: int, anomaly: Optional[Anomaly]) -> None:
+        """
+        Drop the anomaly recorded for a transaction and store `anomaly` (if any) instead.
+        """
+        raise NotImplementedError
+
+    @abc.abstractmethod
+    def expenses(self) -> Iterable[Transaction]:
+        """
+        All of the user's expenses, archived ones included, oldest first (by date, then id).
+        """
+        raise NotImplementedError
+
+    @abc.abstractmethod
+    def replace_stats(self, stats: List[CategoryStats]) -> None:
+        """
+        Replace all of the user's category statistics with `stats`.
+        """
+        raise NotImplementedError
+
+
+class StorageBackend(abc.ABC):
+    name = "abstract"
+
+    # ----- connections and schema -----
+    @abc.abstractmethod
+    def connection(self, user_id: Optional[int] = None, shard: Optional[int] = None):
+        """
+        A DB-API connection to the database holding a user's data (caller closes it).
+        """
+        raise NotImplementedError
+
+    def ledger_shards(self) -> List[Optional[int]]:
+        return [None]
+
+    @abc.abstractmethod
+    def init_db(self) -> None:
+        raise NotImplementedError
+
+    def dispose(self) -> None:
+        """
+        Release pooled connections (before switching databases or forking).
+        """
+
+    # ----- users -----
+    @abc.abstractmethod
+    def create_user(self, username: str, password_hash: str, created_at: str) -> Tuple[bool, str]:
+        raise NotImplementedError
+
+    @abc.abstractmethod
+    def get_user_by_username(self, username: str) -> Optional[User]:
+        raise NotImplementedError
+
+    # ----- transactions -----
+    @abc.abstractmethod
+    def add_transaction(self, user_id: int, date_iso: str, amount: float, category: str, ttype: str, description: Optional[str], currency: str,
+                        then: Optional[Callable[[StatsWriter, int], None]] = None) -> Tuple[bool, str, Optional[int]]:
+        """
+        (ok, message, id of the new transaction or None on failure). then(stats, new id) runs in the same write.
+        """
+        raise NotImplementedError
+
+    @abc.abstractmethod
+    def add_transactions(self, user_id: int, rows: List[Tuple], then: Optional[Callable[[StatsWriter, List[int]], None]] = None) -> Tuple[bool, str, List[int]]:
+        """
+        Insert (date, amount, category, ttype, description, currency) rows for one user in one
+        write transaction: (ok, message, ids of the new transactions in row order, [] on failure).
+        then(stats, new ids) runs in the same write.
+        """
+        raise NotImplementedError
+
+    @abc.abstractmethod
+    def get_transactions_by_user(self, user_id: int, limit: int) -> List[Transaction]:
+        raise NotImplementedError
+
+    @abc.abstractmethod
+    def search_transactions(self, user_id: int, start_date: Optional[str], end_date: Optional[str], category: Optional[str], limit: int) -> List[Transaction]:
+        """
+        Newest first; dates are inclusive, None means unbounded.
+        """
+        raise NotImplementedError
+
+    @abc.abstractmethod
+    def get_transaction_by_id(self, tx_id: int, user_id: Optional[int]) -> Optional[Transaction]:
+        raise NotImplementedError
+
+    @abc.abstractmethod
+    def update_transaction(self, tx_id: int, user_id: int, date_iso: str, amount: float, category: str, ttype: str, description: Optional[str], currency: Optional[str],
+                           then: Optional[Callable[[StatsWriter, Transaction], None]] = None) -> Tuple[bool, str]:
+        """
+        then(stats, the transaction as it was) runs in the same write.
+        """
+        raise NotImplementedError
+
+    @abc.abstractmethod
+    def delete_transaction(self, tx_id: int, user_id: int, then: Optional[Callable[[StatsWriter, Transaction], None]] = None) -> Tuple[bool, str]:
+        """
+        then(stats, the deleted transaction) runs in the same write.
+        """
+        raise NotImplementedError
+
+    # ----- bulk changes (one set-based statement each) -----
+    @abc.abstractmethod
+    def preview_transactions(self, user_id: int, flt: TransactionFilter, limit: int) -> Tuple[int, List[Transaction]]:
+        """
+        (number of matching transactions, the newest `limit` of them)
+        """
+        raise NotImplementedError
+
+    @abc.abstractmethod
+    def bulk_update_transactions(self, user_id: int, flt: TransactionFilter, changes: Dict[str, Optional[str]],
+                                 then: Optional[Callable[[StatsWriter], None]] = None) -> Tuple[bool, str, int]:
+        """
+        Set `changes` (category, ttype and/or description) on every matching transaction
+        that doesn't have those values yet. (ok, message, rows changed). When rows changed,
+        then(stats) runs in the same write.
+        """
+        raise NotImplementedError
+
+    @abc.abstractmethod
+    def bulk_delete_transactions(self, user_id: int, flt: TransactionFilter,
+                                 then: Optional[Callable[[StatsWriter], None]] = None) -> Tuple[bool, str, int]:
+        raise NotImplementedError
+
+    # ----- change feed -----
+    @abc.abstractmethod
+    def get_transaction_changes(self, user_id: int, since: int, limit: int) -> Dict:
+        raise NotImplementedError
+
+    @abc.abstractmethod
+    def compact_transaction_changes(self, tombstones_before: str) -> int:
+        raise NotImplementedError
+
+    @abc.abstractmethod
+    def get_change_watermark(self, shard: Optional[int]) -> int:
+        """
+        Highest sequence number in the shard's change log (0 when empty).
+        """
+        raise NotImplementedError
+
+    @abc.abstractmethod
+    def tail_transaction_changes(self, since: int, limit: int, shard: Optional[int]) -> List[Tuple[int, int]]:
+        """
+        (seq, user_id) of the shard's change-log entries after `since`, in seq order.
+        """
+        raise NotImplementedError
+
+    # ----- cold storage -----
+    @abc.abstractmethod
+    def archive_transactions(self, before: str) -> int:
+        """
+        Move transactions dated before `before` out of the hot table (database.archive). Returns rows moved.
+        """
+        raise NotImplementedError
+
+    # ----- expense statistics and anomalies -----
+    @abc.abstractmethod
+    def update_category_stats(self, user_id: int, category: str, update: Callable[[Optional[CategoryStats]], CategoryStats]) -> Tuple[bool, str]:
+        """
+        Read the (user, category) statistics and store update(current) in one write transaction.
+        """
+        raise NotImplementedError
+
+    @abc.abstractmethod
+    def replace_category_stats(self, user_id: int, stats: List[CategoryStats]) -> Tuple[bool, str]:
+        """
+        Replace all of the user's category statistics with `stats` in one write transaction.
+        """
+        raise NotImplementedError
+
+    @abc.abstractmethod
+    def replace_anomaly(self, user_id: int, tx_id: int, anomaly: Optional[Anomaly]) -> Tuple[bool, str]:
+        """
+        Drop the anomaly recorded for a transaction and store `anomaly` (if any) instead.
+        """
+        raise NotImplementedError
+
+    @abc.abstractmethod
+    def get_anomalies(self, user_id: int, limit: int) -> List[Anomaly]:
+        raise NotImplementedError
+
+    # ----- reports (amounts converted to `currency` inside the query) -----
+    @abc.abstractmethod
+    def get_balance(self, user_id: int, currency: str) -> float:
+        raise NotImplementedError
+
+    @abc.abstractmethod
+    def get_monthly_summary(self, user_id: int, currency: str) -> List[Dict]:
+        raise NotImplementedError
+
+    @abc.abstractmethod
+    def get_category_totals(self, user_id: int, ttype: str, month: Optional[str], currency: str) -> List[Dict]:
+        raise NotImplementedError
+
+    # ----- exchange rates -----
+    @abc.abstractmethod
+    def get_exchange_rates(self) -> List[Tuple[str, str, float]]:
+        raise NotImplementedError
+
+    @abc.abstractmethod
+    def save_exchange_rates(self, rates: List[Tuple[str, str, float]]) -> int:
+        raise NotImplementedError
+
+    # ----- recurring rules -----
+    @abc.abstractmethod
+    def add_recurring_rule(self, user_id: int, amount: float, category: str, ttype: str, description: Optional[str], frequency: str, interval: int, cron: Optional[str], start_date: str, end_date: Optional[str], next_due: Optional[str], created_at: str, currency: str) -> Tuple[bool, str]:
+        raise NotImplementedError
+
+    @abc.abstractmethod
+    def get_recurring_rules(self, user_id: int) -> List[RecurringRule]:
+        raise NotImplementedError
+
+    @abc.abstractmethod
+    def delete_recurring_rule(self, rule_id: int, user_id: int) -> Tuple[bool, str]:
+        raise NotImplementedError
+
+    @abc.abstractmethod
+    def get_due_recurring_rules(self, as_of: str, after_id: int, limit: int, shard: Optional[int]) -> List[RecurringRule]:
+        raise NotImplementedError
+
+    @abc.abstractmethod
+    def materialize_recurring(self, occurrences: List[Tuple], advances: List[Tuple[Optional[str], int, str]], shard: Optional[int]) -> int:
+        raise NotImplementedError
+
+    # ----- categorization rules -----
+    @abc.abstractmethod
+    def add_category_rule(self, user_id: int, category: str, pattern: Optional[str], match: str, ttype: Optional[str], min_amount: Optional[float], max_amount: Optional[float], priority: int, created_at: str) -> Tuple[bool, str]:
+        raise NotImplementedError
+
+    @abc.abstractmethod
+    def get_category_rules(self, user_id: int) -> List[CategoryRule]:
+        """
+        Highest priority first, then oldest first.
+        """
+        raise NotImplementedError
+
+    @abc.abstractmethod
+    def delete_category_rule(self, rule_id: int, user_id: int) -> Tuple[bool, str]:
+        raise NotImplementedError
+
+    @abc.abstractmethod
+    def get_category_rules_version(self, user_id: int) -> Tuple[int, int]:
+        """
+        (number of rules, highest rule id): changes whenever a rule is added or deleted.
+        """
+        raise NotImplementedError
+
+
+def fold_changes(rows, since: int, limit: int) -> Dict:
+    """
+    (seq, tx_id, *transaction columns) rows in seq order -> the latest state of each changed
+    transaction. A transaction row that no longer exists is reported as deleted.
+    """
+    latest = {}
+    for r in rows:
+        latest[r[1]] = None if r[2] is None else Transaction.from_row(tuple(r[2:]))
+    return {
+        "full": False,
+        "watermark": rows[-1][0] if rows else since,
+        "more": len(rows) >= limit,
+        "upserts": [t for t in latest.values() if t is not None],
+        "deletes": [tx_id for tx_id, t in latest.items() if t is None],
+    }
+
+
+_backends: Dict[str, StorageBackend] = {}
+_lock = threading.Lock()
+
+
+def _create(name: str) -> StorageBackend:
+    if name == "sqlite":
+        from .sqlite_backend import SQLiteBackend
+        return SQLiteBackend()
+    if name == "sqlalchemy":
+        from .sqlalchemy_backend import SQLAlchemyBackend
+        return SQLAlchemyBackend()
+    raise ValueError(f"Unknown storage backend: {name!r} (expected 'sqlite' or 'sqlalchemy')")
+
+
+def get_backend() -> StorageBackend:
+    """
+    The backend named by settings.STORAGE_BACKEND, created on first use.
+    """
+    name = settings.STORAGE_BACKEND
+    backend = _backends.get(name)
+    if backend is None:
+        with _lock:
+            backend = _backends.get(name)
+            if backend is None:
+                backend = _backends[name] = _create(name)
+    return backend
@@ -0,0 +1,155 @@
+"""
+Group commit for transaction writes.
+
+One writer thread per database file takes write operations from a queue and
+applies them in small batches inside a single SQLite transaction, so a batch
+pays for one fsync instead of one per write. A batch is flushed when it
+reaches settings.GROUP_COMMIT_MAX_BATCH operations or when
+settings.GROUP_COMMIT_WINDOW_MS has passed since its first operation.
+
+Each operation runs in its own SAVEPOINT: a failing write is rolled back and
+reported to its caller without affecting the rest of the batch. Futures are
+resolved only after the batch's COMMIT returned, i.e. once the write is durable.
+"""
+
+import atexit
+import os
+import queue
+import threading
+import time
+from concurrent.futures import Future
+from typing import Callable, Dict, Optional
+
+from config import settings
+from utils import metrics
+
+BATCH_SIZE = metrics.histogram(
+    "finance_group_commit_batch_size", "Writes committed together by the group-commit writer",
+    buckets=(1, 2, 4, 8, 16, 32, 64, 128, 256)
+)
+
+_STOP = object()
+
+
+class WriteQueue:
+    def __init__(self, path: str, connect: Callable[[str], object]):
+        self.path = path
+        self._connect = connect
+        self._queue: "queue.Queue" = queue.Queue()
+        self._thread = threading.Thread(target=self._run, name=f"group-commit:{path}", daemon=True)
+        self._thread.start()
+
+    def submit(self, op: Callable) -> Future:
+        """
+        Queue op(cursor) -> result. The future resolves to the result once committed.
+        """
+        future: Future = Future()
+        self._queue.put((op, future))
+        return future
+
+    def close(self, timeout: Optional[float] = None) -> None:
+        """
+        Flush everything queued so far and stop the writer thread.
+        """
+        self._queue.put(_STOP)
+        self._thread.join(timeout)
+
+    def _collect(self, first):
+        """
+        Gather a batch: the first item plus whatever arrives within the window, up to the size cap.
+        """
+        batch = [first]
+        deadline = time.monotonic() + settings.GROUP_COMMIT_WINDOW_MS / 1000.0
+        stop = False
+        while len(batch) < settings.GROUP_COMMIT_MAX_BATCH:
+            remaining = deadline - time.monotonic()
+            try:
+                item = self._queue.get(timeout=remaining) if remaining > 0 else self._queue.get_nowait()
+            except queue.Empty:
+                break
+            if item is _STOP:
+                stop = True
+                break
+            batch.append(item)
+        return batch, stop
+
+    def _run(self) -> None:
+        conn = self._connect(self.path)
+        conn.isolation_level = None  # transactions are managed explicitly below
+        conn.execute("PRAGMA synchronous=FULL")
+        cur = conn.cursor()
+        stop = False
+        while not stop:
+            first = self._queue.get()
+            if first is _STOP:
+                break
+            batch, stop = self._collect(first)
+            results = []
+            try:
+                cur.execute("BEGIN IMMEDIATE")
+                for op, future in batch:
+                    if not future.set_running_or_notify_cancel():
+                        continue
+                    cur.execute("SAVEPOINT write_op")
+                    try:
+                        results.append((future, op(cur), None))
+                        cur.execute("RELEASE write_op")
+                    except Exception as e:
+                        cur.execute("ROLLBACK TO write_op")
+                        cur.execute("RELEASE write_op")
+                        results.append((future, None, e))
+                cur.execute("COMMIT")
+            except Exception as e:
+                if conn.in_transaction:
+                    conn.execute("ROLLBACK")
+                for op, future in batch:
+                    if not future.done():
+                        if future.running():
+                            future.set_exception(e)
+                        elif future.set_running_or_notify_cancel():
+                            future.set_exception(e)
+                continue
+            BATCH_SIZE.observe(len(results))
+            for future, result, error in results:
+                if error is not None:
+                    future.set_exception(error)
+                else:
+                    future.set_result(result)
+        conn.close()
+
+
+_queues: Dict[str, WriteQueue] = {}
+_lock = threading.Lock()
+
+
+def _reset_after_fork() -> None:
+    # Writer threads don't survive fork(); a child starts its own on first write
+    global _lock
+    _queues.clear()
+    _lock = threading.Lock()
+
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=_reset_after_fork)
+
+
+def get_write_queue(path: str, connect: Callable[[str], object]) -> WriteQueue:
+    """
+    The writer for a database file, started on first use.
+    """
+    wq = _queues.get(path)
+    if wq is None:
+        with _lock:
+            wq = _queues.get(path)
+            if wq is None:
+                wq = _queues[path] = WriteQueue(path, connect)
+    return wq
+
+
+@atexit.register
+def close_all() -> None:
+    with _lock:
+        queues = list(_queues.values())
+        _queues.clear()
+    for wq in queues:
+        wq.close(timeout=5)
@@ -1,10 +1,21 @@
 # finance package initializer
-from .finance_service import add_transaction_validated, get_transactions_filtered, export_transactions_csv, calculate_balance
-from database.db import get_monthly_summary
-from .categories import get_categories, add_custom_category, reset_custom_categories
+# Exports load on first use; importing one finance module doesn't import the others.
+from utils.lazy import lazy_exports
 
-__all__ = [
-    "add_transaction_validated", "get_transactions_filtered", "export_transactions_csv", "calculate_balance",
-    "get_monthly_summary",
-    "get_categories", "add_custom_category", "reset_custom_categories"
-]
+_EXPORTS = {
+    "add_transaction_validated": ".finance_service",
+    "get_transactions_filtered": ".finance_service",
+    "export_transactions_csv": ".finance_service",
+    "calculate_balance": ".finance_service",
+    "get_monthly_summary": "database.db",
+    "get_category_totals": "database.db",
+    "convert": ".currency",
+    "load_rates_from_file": ".currency",
+    "rate_cache": ".currency",
+    "get_categories": ".categories",
+    "add_custom_category": ".categories",
+    "reset_custom_categories": ".categories",
+}
+__getattr__ = lazy_exports(__name__, _EXPORTS)
+
+__all__ = list(_EXPORTS)
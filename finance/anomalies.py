@@ -0,0 +1,266 @@
+"""
+Streaming anomaly detection for expenses.
+
+Every expense write updates online statistics for its (user, category):
+Welford's running mean/variance and a P-square estimate of the median
+(Jain & Chlamtac, 1985), five markers whatever the history length. A new
+amount is scored against the statistics from before it:
+
+  score  standard deviations above the category mean
+  ratio  amount / estimated median
+
+and flagged when the category has at least ANOMALY_MIN_SAMPLES expenses and
+score >= ANOMALY_Z_THRESHOLD or ratio >= ANOMALY_RATIO_THRESHOLD. Flagged
+transactions are listed by database.db.get_anomalies. Amounts are compared in
+settings.DEFAULT_CURRENCY. The hooks below run inside the transaction write
+they follow (the `then` of database.db's transaction writes), so statistics and
+anomalies commit with it; each costs one statistics row read and written,
+whatever the size of the history.
+
+Updates and deletes take the old amount back out of the mean/variance; the
+median sketch cannot forget values, which only matters after heavy editing.
+Bulk updates and deletes recompute the user's statistics from their history in
+the bulk statement's write instead (recompute).
+Statistics for an existing ledger can be rebuilt with
+  python -m finance.anomalies --rebuild USER_ID
+"""
+
+import json
+import math
+from datetime import datetime
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from config import settings
+from database.db import replace_category_stats, get_transactions_by_user
+from database.models import Anomaly, CategoryStats, Transaction
+from database.storage import StatsWriter
+from .currency import convert
+
+
+# ----------------- Online statistics -----------------
+class P2Quantile:
+    """
+    P-square estimator of the p-quantile in O(1) memory. The first five
+    observations are kept as they are; after that five markers track the
+    minimum, p/2, p, (1+p)/2 quantiles and the maximum.
+    """
+
+    def __init__(self, p: float = 0.5):
+        self.p = p
+        self.initial: List[float] = []
+        self.q: List[float] = []      # marker heights
+        self.n: List[float] = []      # marker positions
+        self.np: List[float] = []     # desired positions
+
+    @property
+    def increments(self) -> List[float]:
+        p = self.p
+        return [0.0, p / 2, p, (1 + p) / 2, 1.0]
+
+    def add(self, x: float) -> None:
+        if not self.q:
+            self.initial.append(x)
+            if len(self.initial) == 5:
+                p = self.p
+                self.q = sorted(self.initial)
+                self.n = [0.0, 1.0, 2.0, 3.0, 4.0]
+                self.np = [0.0, 2 * p, 4 * p, 2 + 2 * p, 4.0]
+                self.initial = []
+            return
+        q, n = self.q, self.n
+        if x < q[0]:
+            q[0] = x
+            k = 0
+        elif x >= q[4]:
+            q[4] = x
+            k = 3
+        else:
+            k = next(i for i in range(4) if q[i] <= x < q[i + 1])
+        for i in range(k + 1, 5):
+            n[i] += 1
+        self.np = [a + b for a, b in zip(self.np, self.increments)]
+        for i in (1, 2, 3):
+            d = self.np[i] - n[i]
+            if (d >= 1 and n[i + 1] - n[i] > 1) or (d <= -1 and n[i - 1] - n[i] < -1):
+                d = 1 if d > 0 else -1
+                candidate = q[i] + d / (n[i + 1] - n[i - 1]) * (
+                    (n[i] - n[i - 1] + d) * (q[i + 1] - q[i]) / (n[i + 1] - n[i])
+                    + (n[i + 1] - n[i] - d) * (q[i] - q[i - 1]) / (n[i] - n[i - 1])
+                )
+                if not q[i - 1] < candidate < q[i + 1]:
+                    candidate = q[i] + d * (q[i + d] - q[i]) / (n[i + d] - n[i])
+                q[i] = candidate
+                n[i] += d
+
+    def value(self) -> Optional[float]:
+        if self.q:
+            return self.q[2]
+        if not self.initial:
+            return None
+        ordered = sorted(self.initial)
+        return ordered[min(len(ordered) - 1, int(self.p * len(ordered)))]
+
+    def to_json(self) -> str:
+        if self.q:
+            return json.dumps({"p": self.p, "q": self.q, "n": self.n, "np": self.np})
+        return json.dumps({"p": self.p, "initial": self.initial})
+
+    @staticmethod
+    def from_json(text: Optional[str], p: float = 0.5) -> "P2Quantile":
+        sketch = P2Quantile(p)
+        if text:
+            state = json.loads(text)
+            sketch.p = state["p"]
+            sketch.initial = state.get("initial", [])
+            sketch.q, sketch.n, sketch.np = state.get("q", []), state.get("n", []), state.get("np", [])
+        return sketch
+
+
+def _std(stats: CategoryStats) -> float:
+    return math.sqrt(stats.m2 / (stats.count - 1)) if stats.count > 1 else 0.0
+
+
+def _added(stats: Optional[CategoryStats], user_id: int, category: str, x: float) -> CategoryStats:
+    count, mean, m2 = (stats.count, stats.mean, stats.m2) if stats else (0, 0.0, 0.0)
+    count += 1
+    delta = x - mean
+    mean += delta / count
+    m2 += delta * (x - mean)
+    sketch = P2Quantile.from_json(stats.sketch if stats else None)
+    sketch.add(x)
+    return CategoryStats(user_id, category, count, mean, m2, sketch.to_json())
+
+
+def _removed(stats: Optional[CategoryStats], user_id: int, category: str, x: float) -> CategoryStats:
+    if stats is None or stats.count <= 1:
+        return CategoryStats(user_id, category, 0, 0.0, 0.0, stats.sketch if stats else None)
+    count = stats.count - 1
+    mean = (stats.mean * stats.count - x) / count
+    m2 = max(0.0, stats.m2 - (x - stats.mean) * (x - mean))
+    return CategoryStats(user_id, category, count, mean, m2, stats.sketch)
+
+
+def score(stats: Optional[CategoryStats], x: float) -> Dict:
+    """
+    How unusual expense amount `x` is given the category's statistics so far.
+    """
+    if stats is None or stats.count == 0:
+        return {"anomaly": False, "score": 0.0, "ratio": None, "samples": 0}
+    std = _std(stats)
+    z = (x - stats.mean) / std if std > 0 else 0.0
+    median = P2Quantile.from_json(stats.sketch).value()
+    ratio = x / median if median and median > 0 else None
+    flagged = stats.count >= settings.ANOMALY_MIN_SAMPLES and (
+        z >= settings.ANOMALY_Z_THRESHOLD or (ratio is not None and ratio >= settings.ANOMALY_RATIO_THRESHOLD)
+    )
+    return {
+        "anomaly": flagged,
+        "score": round(z, 2),
+        "ratio": None if ratio is None else round(ratio, 2),
+        "samples": stats.count,
+        "mean": round(stats.mean, 2),
+        "median": None if median is None else round(median, 2),
+    }
+
+
+# ----------------- Write hooks -----------------
+def _base_amount(amount: float, currency: Optional[str], date_iso: str) -> Optional[float]:
+    if not currency or currency == settings.DEFAULT_CURRENCY:
+        return amount
+    return convert(amount, currency, None, date_iso)
+
+
+def observe(stats: StatsWriter, user_id: int, tx_id: int, date_iso: str, amount: float, category: str, currency: Optional[str] = None) -> Optional[Dict]:
+    """
+    Score an expense just inserted (or updated after forget()), add it to its category's
+    statistics and record its anomaly if flagged. Returns the score dict, or None when
+    detection is off or the amount can't be converted.
+    """
+    return observe_batch(stats, user_id, [(tx_id, date_iso, amount, category, currency)])[0]
+
+
+def observe_batch(stats: StatsWriter, user_id: int, items: List[Tuple[int, str, float, str, Optional[str]]]) -> List[Optional[Dict]]:
+    """
+    observe() for expenses given as (tx_id, date_iso, amount, category, currency), in order:
+    one statistics row written per category instead of per expense. Returns the score
+    dicts in item order, as observe() would have one by one.
+    """
+    results: List[Optional[Dict]] = [None] * len(items)
+    if not settings.ANOMALY_DETECTION:
+        return results
+    by_category: Dict[str, List[Tuple[int, float]]] = {}
+    for i, (_tx_id, date_iso, amount, category, currency) in enumerate(items):
+        x = _base_amount(amount, currency, date_iso)
+        if x is not None:
+            by_category.setdefault(category, []).append((i, x))
+
+    created_at = datetime.utcnow().strftime("%Y-%m-%d %H:%M:%S")
+    for category, values in by_category.items():
+        current = stats.get_stats(category)
+        for i, x in values:
+            results[i] = score(current, x)
+            current = _added(current, user_id, category, x)
+        stats.put_stats(current)
+        for i, x in values:
+            result = results[i]
+            if result["anomaly"]:
+                tx_id, date_iso = items[i][:2]
+                stats.replace_anomaly(tx_id, Anomaly(
+                    id=None, user_id=user_id, tx_id=tx_id, date=date_iso, category=category, amount=x,
+                    score=result["score"], ratio=result["ratio"], created_at=created_at,
+                ))
+    return results
+
+
+def forget(stats: StatsWriter, tx: Transaction) -> None:
+    """
+    Take a changed or deleted expense out of its category's statistics and drop its anomaly.
+    """
+    if not settings.ANOMALY_DETECTION or tx.ttype != "expense":
+        return
+    x = _base_amount(tx.amount, tx.currency, tx.date)
+    if x is not None:
+        stats.put_stats(_removed(stats.get_stats(tx.category), tx.user_id, tx.category, x))
+    stats.replace_anomaly(tx.id, None)
+
+
+def _history_stats(user_id: int, expenses: Iterable[Transaction]) -> List[CategoryStats]:
+    stats: Dict[str, Optional[CategoryStats]] = {}
+    for tx in expenses:
+        x = _base_amount(tx.amount, tx.currency, tx.date)
+        if x is not None:
+            stats[tx.category] = _added(stats.get(tx.category), user_id, tx.category, x)
+    return list(stats.values())
+
+
+def recompute(stats: StatsWriter, user_id: int) -> int:
+    """
+    Write hook for bulk changes: recompute the user's expense statistics from their whole
+    history, replacing all existing ones. Returns categories written.
+    """
+    rebuilt = _history_stats(user_id, stats.expenses())
+    stats.replace_stats(rebuilt)
+    return len(rebuilt)
+
+
+def rebuild(user_id: int, limit: int = 1000000) -> int:
+    """
+    Recompute the user's expense statistics from their history (oldest first), replacing
+    all existing ones. Returns categories written.
+    """
+    history = sorted(get_transactions_by_user(user_id, limit=limit), key=lambda t: (t.date, t.id))
+    rebuilt = _history_stats(user_id, (tx for tx in history if tx.ttype == "expense"))
+    ok, _msg = replace_category_stats(user_id, rebuilt)
+    return len(rebuilt) if ok else 0
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Expense anomaly statistics")
+    parser.add_argument("--rebuild", type=int, metavar="USER_ID", required=True, help="recompute a user's statistics from history")
+    args = parser.parse_args()
+
+    from database.db import init_db
+    init_db()
+    print(f"Rebuilt statistics for {rebuild(args.rebuild)} categories")
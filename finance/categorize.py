@@ -0,0 +1,371 @@
+"""
+Automatic transaction categorization with per-user rules.
+
+A rule assigns `category` to a transaction whose description contains `pattern`
+(match="substring", case-insensitive) or matches it (match="regex", re.search,
+case-insensitive), optionally only for one ttype and/or an inclusive amount
+range. A rule without a pattern matches on type and amount alone. When several
+rules match, the highest priority wins, then the oldest rule.
+
+Rules are compiled into one RuleMatcher per user:
+
+  substring rules  one Aho-Corasick automaton over all patterns, so a description
+                   is scanned once whatever the number of rules
+  regex rules      their longest required literal goes into the same automaton,
+                   so a regex only runs on descriptions that contain it (and
+                   only if it outranks the best match found so far)
+
+Compiled matchers are cached per user (settings.CATEGORY_RULE_CACHE_SIZE users)
+next to the fingerprint of the rules they were built from
+(database.db.get_category_rules_version), so a rule added or deleted through any
+API worker process is picked up on that user's next categorization.
+
+Try a user's rules against descriptions with
+  python -m finance.categorize USER_ID "description" [...]
+"""
+
+import bisect
+import math
+import re
+import sys
+import threading
+from collections import OrderedDict, deque
+from typing import Dict, List, Optional, Sequence, Tuple
+
+from config import settings
+from database.db import add_category_rule, delete_category_rule, get_category_rules, get_category_rules_version
+from database.models import CategoryRule
+from utils import metrics
+
+try:
+    from re import _parser as _regex_parser  # Python 3.11+
+except ImportError:
+    import sre_parse as _regex_parser
+
+# Category given to a transaction without a category that no rule matched
+FALLBACK_CATEGORY = "Other"
+MATCH_KINDS = ("substring", "regex")
+MAX_PATTERN_LENGTH = 200
+
+_CACHE_LOOKUPS = metrics.counter("finance_category_rule_cache_lookups_total", "Compiled categorization rule cache lookups", ["result"])
+_BACKREFERENCE = re.compile(r"\\[1-9]|\(\?P=")
+
+
+# ----------------- Compiled matcher -----------------
+def _build_automaton(words: Dict[str, List[int]]) -> Tuple[List[Dict[str, int]], List[Tuple[int, ...]]]:
+    """
+    Aho-Corasick automaton for `words` (pattern -> ranks of the rules using it) as a DFA:
+    per state, a dict of transitions for every character that leads anywhere but the root,
+    and the ranks of all patterns ending there (including via failure links).
+    """
+    goto: List[Dict[str, int]] = [{}]
+    out: List[Tuple[int, ...]] = [()]
+    for word, ranks in words.items():
+        state = 0
+        for ch in word:
+            nxt = goto[state].get(ch)
+            if nxt is None:
+                nxt = len(goto)
+                goto[state][ch] = nxt
+                goto.append({})
+                out.append(())
+            state = nxt
+        out[state] += tuple(ranks)
+
+    # Breadth-first: a state's failure target is shallower, so it is complete by the time we get here
+    fail = [0] * len(goto)
+    delta: List[Dict[str, int]] = [{}] * len(goto)
+    delta[0] = dict(goto[0])
+    queue = deque(goto[0].values())
+    while queue:
+        state = queue.popleft()
+        f = fail[state]
+        out[state] += out[f]
+        delta[state] = {**delta[f], **goto[state]}
+        for ch, nxt in goto[state].items():
+            fail[nxt] = delta[f].get(ch, 0)
+            queue.append(nxt)
+    return delta, out
+
+
+def _paint(segments: int, spans: List[Tuple[int, int, int]], empty: int) -> List[int]:
+    """
+    For each of `segments` segments, the first rank among (rank, first, last) spans (given in
+    rank order) covering it, or `empty`. Painted segments are skipped with a union-find of
+    "next unpainted segment" pointers, so every segment is written once.
+    """
+    best = [empty] * segments
+    nxt = list(range(segments + 1))
+
+    def find(i: int) -> int:
+        while nxt[i] != i:
+            nxt[i] = nxt[nxt[i]]
+            i = nxt[i]
+        return i
+
+    for rank, first, last in spans:
+        i = find(first)
+        while i <= last:
+            best[i] = rank
+            nxt[i] = i + 1
+            i = find(i + 1)
+    return best
+
+
+def _required_literal(pattern: str) -> Optional[str]:
+    """
+    The longest run of plain characters every match of a regex must contain (lower-cased),
+    or None if there is none or the pattern can't be analysed.
+    """
+    try:
+        parsed = _regex_parser.parse(pattern)
+    except Exception:
+        return None
+    best, run = "", []
+    for op, arg in list(parsed) + [(None, None)]:
+        if op == _regex_parser.LITERAL:
+            run.append(chr(arg))
+            continue
+        if len(run) > len(best):
+            best = "".join(run)
+        run = []
+    return best.lower() or None
+
+
+class RuleMatcher:
+    """
+    A user's rules compiled for matching many transactions at once.
+    """
+
+    def __init__(self, rules: Sequence[CategoryRule]):
+        self.rules = sorted(rules, key=lambda r: (-r.priority, r.id or 0))
+        self._bounds = [(r.ttype, r.min_amount, r.max_amount) for r in self.rules]
+        self._regexes: List[Optional[re.Pattern]] = [None] * len(self.rules)
+        self._unconditional = []   # ranks of rules the automaton can't preselect, in rank order
+        words: Dict[str, List[int]] = {}
+        for rank, r in enumerate(self.rules):
+            if not r.pattern:
+                self._unconditional.append(rank)
+            elif r.match == "regex":
+                # A regex is only tried on descriptions containing its required literal, if it has one
+                self._regexes[rank] = re.compile(r.pattern, re.IGNORECASE)
+                literal = _required_literal(r.pattern)
+                if literal:
+                    words.setdefault(literal, []).append(rank)
+                else:
+                    self._unconditional.append(rank)
+            else:
+                words.setdefault(r.pattern.lower(), []).append(rank)
+        self._delta, self._out = _build_automaton(words) if words else ([], [])
+        self._compile_ranges([rank for rank in self._unconditional if self._regexes[rank] is None])
+        self._unconditional = [rank for rank in self._unconditional if self._regexes[rank] is not None]
+
+    def _compile_ranges(self, ranks: List[int]) -> None:
+        """
+        Pattern-less rules become a lookup table: the amount axis is cut at every bound into
+        segments (open intervals between bounds and the bounds themselves), and each segment
+        remembers the first rule covering it, per ttype.
+        """
+        empty = len(self.rules)
+        points = sorted({b for rank in ranks for b in self._bounds[rank][1:] if b is not None})
+        segments = 2 * len(points) + 1
+        self._points = points
+        self._range_best: Dict[Optional[str], List[int]] = {}
+        self._unbounded_best: Dict[Optional[str], int] = {}
+        for key in (None, "income", "expense"):
+            spans = []
+            for rank in ranks:
+                rule_ttype, low, high = self._bounds[rank]
+                if rule_ttype is not None and key is not None and rule_ttype != key:
+                    continue
+                first = 0 if low is None else 2 * bisect.bisect_left(points, low) + 1
+                last = segments - 1 if high is None else 2 * bisect.bisect_left(points, high) + 1
+                if first <= last:
+                    spans.append((rank, first, last))
+            self._range_best[key] = _paint(segments, spans, empty) if spans else [empty] * segments
+            self._unbounded_best[key] = next((r for r, first, last in spans if first == 0 and last == segments - 1), empty)
+
+    def _range_match(self, amount: float, ttype: Optional[str]) -> int:
+        """
+        Rank of the first pattern-less rule that accepts the amount and type (len(rules) if none).
+        """
+        if amount != amount:  # NaN: only rules without bounds
+            return self._unbounded_best.get(ttype, self._unbounded_best[None])
+        points = self._points
+        i = bisect.bisect_left(points, amount)
+        segment = 2 * i + 1 if i < len(points) and points[i] == amount else 2 * i
+        return self._range_best.get(ttype, self._range_best[None])[segment]
+
+    def __len__(self) -> int:
+        return len(self.rules)
+
+    def match(self, description: Optional[str], amount: Optional[float] = None, ttype: Optional[str] = None) -> Optional[CategoryRule]:
+        """
+        The rule that categorizes a transaction, or None if no rule matches. Rules with an
+        amount range never match a None amount; a None ttype matches rules of either type.
+        """
+        text = description or ""
+        if amount is None:
+            amount = math.nan  # fails every bound
+        bounds, regexes = self._bounds, self._regexes
+        best = len(self.rules)
+        if self._delta:
+            delta, out, state, hits = self._delta, self._out, 0, []
+            for ch in text.lower():
+                state = delta[state].get(ch, 0)
+                if out[state]:
+                    hits.extend(out[state])
+            for rank in sorted(set(hits)) if hits else ():
+                rule_ttype, low, high = bounds[rank]
+                if (rule_ttype is None or ttype is None or rule_ttype == ttype) and (low is None or amount >= low) and (high is None or amount <= high):
+                    regex = regexes[rank]
+                    if regex is None or regex.search(text):
+                        best = rank
+                        break
+        # Rules without a literal to look for only matter when they outrank the best match so far
+        if self._points or self._unbounded_best[None] < best:
+            best = min(best, self._range_match(amount, ttype))
+        for rank in self._unconditional:
+            if rank >= best:
+                break
+            rule_ttype, low, high = bounds[rank]
+            if (rule_ttype is None or ttype is None or rule_ttype == ttype) and (low is None or amount >= low) and (high is None or amount <= high):
+                regex = regexes[rank]
+                if regex is None or regex.search(text):
+                    best = rank
+                    break
+        return self.rules[best] if best < len(self.rules) else None
+
+    def categorize(self, items: Sequence[Tuple[Optional[str], Optional[float], Optional[str]]]) -> List[Optional[str]]:
+        """
+        Category for each (description, amount, ttype), None where no rule matches.
+        """
+        if not self.rules:
+            return [None] * len(items)
+        categories = []
+        for description, amount, ttype in items:
+            rule = self.match(description, amount, ttype)
+            categories.append(rule.category if rule is not None else None)
+        return categories
+
+
+# ----------------- Per-user cache -----------------
+_cache: "OrderedDict[int, Tuple[Tuple[int, int], RuleMatcher]]" = OrderedDict()
+_lock = threading.Lock()
+_EMPTY = RuleMatcher([])
+
+
+def matcher_for(user_id: int) -> RuleMatcher:
+    """
+    The user's compiled rules; recompiled only when the rules changed since the cached copy.
+    """
+    version = get_category_rules_version(user_id)
+    if version[0] == 0:
+        return _EMPTY
+    with _lock:
+        cached = _cache.get(user_id)
+        if cached is not None and cached[0] == version:
+            _cache.move_to_end(user_id)
+            _CACHE_LOOKUPS.inc("hit")
+            return cached[1]
+    _CACHE_LOOKUPS.inc("miss")
+    matcher = RuleMatcher(get_category_rules(user_id))
+    with _lock:
+        _cache[user_id] = (version, matcher)
+        _cache.move_to_end(user_id)
+        while len(_cache) > settings.CATEGORY_RULE_CACHE_SIZE:
+            _cache.popitem(last=False)
+    return matcher
+
+
+def invalidate(user_id: Optional[int] = None) -> None:
+    with _lock:
+        if user_id is None:
+            _cache.clear()
+        else:
+            _cache.pop(user_id, None)
+
+
+def categorize(user_id: int, items: Sequence[Tuple[Optional[str], Optional[float], Optional[str]]]) -> List[str]:
+    """
+    Category for each (description, amount, ttype) of a batch of the user's transactions,
+    FALLBACK_CATEGORY where no rule matches. The rules are looked up once per batch.
+    """
+    return [c or FALLBACK_CATEGORY for c in matcher_for(user_id).categorize(items)]
+
+
+# ----------------- Rule management -----------------
+def _rule_error(category: str, pattern: Optional[str], match: str, ttype: Optional[str], min_amount: Optional[float], max_amount: Optional[float]) -> Optional[str]:
+    if not category or not category.strip():
+        return "Category is required."
+    if match not in MATCH_KINDS:
+        return "Match must be 'substring' or 'regex'."
+    if ttype is not None and ttype not in ("income", "expense"):
+        return "Type must be 'income' or 'expense'."
+    if min_amount is not None and max_amount is not None and min_amount > max_amount:
+        return "min_amount must not exceed max_amount."
+    if not pattern:
+        if min_amount is None and max_amount is None:
+            return "Give a pattern or an amount range."
+        return None
+    if len(pattern) > MAX_PATTERN_LENGTH:
+        return f"Pattern must be at most {MAX_PATTERN_LENGTH} characters."
+    if match == "regex":
+        if _BACKREFERENCE.search(pattern):
+            return "Backreferences are not supported in rule patterns."
+        try:
+            re.compile(pattern)
+        except re.error as e:
+            return f"Invalid regular expression: {e}"
+    return None
+
+
+def add_rule_validated(user_id: int, category: str, pattern: Optional[str] = None, match: str = "substring", ttype: Optional[str] = None, min_amount: Optional[float] = None, max_amount: Optional[float] = None, priority: int = 0) -> Tuple[bool, str]:
+    """
+    Validate and store a categorization rule. Returns (success, message).
+    """
+    if user_id is None:
+        return False, "User not authenticated."
+    pattern = pattern.strip() if pattern and pattern.strip() else None
+    error = _rule_error(category, pattern, match, ttype, min_amount, max_amount)
+    if error:
+        return False, error
+    if get_category_rules_version(user_id)[0] >= settings.MAX_CATEGORY_RULES:
+        return False, f"At most {settings.MAX_CATEGORY_RULES} rules per user."
+    ok, msg = add_category_rule(user_id, category.strip(), pattern, match, ttype, min_amount, max_amount, int(priority))
+    if ok:
+        invalidate(user_id)
+    return ok, msg
+
+
+def delete_rule(user_id: int, rule_id: int) -> Tuple[bool, str]:
+    if user_id is None:
+        return False, "User not authenticated."
+    ok, msg = delete_category_rule(rule_id, user_id)
+    if ok:
+        invalidate(user_id)
+    return ok, msg
+
+
+def main(argv=None) -> int:
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Show which rule categorizes each description")
+    parser.add_argument("user_id", type=int)
+    parser.add_argument("descriptions", nargs="+")
+    parser.add_argument("--amount", type=float, default=None)
+    parser.add_argument("--ttype", choices=["income", "expense"], default=None)
+    args = parser.parse_args(argv)
+
+    matcher = matcher_for(args.user_id)
+    for description in args.descriptions:
+        rule = matcher.match(description, args.amount, args.ttype)
+        if rule is None:
+            print(f"{description!r}: no rule ({FALLBACK_CATEGORY})")
+        else:
+            print(f"{description!r}: {rule.category} (rule {rule.id}, {rule.match} {rule.pattern!r}, priority {rule.priority})")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,141 @@
+"""
+Exchange rates and currency conversion.
+
+Rates live in the exchange_rates table and are loaded from a local CSV file
+(no network): one row per `date,currency,rate`, where rate is the value of one
+unit of `currency` in settings.DEFAULT_CURRENCY from that date on.
+
+Aggregations (balance, monthly summary, category totals) convert inside SQL;
+the in-memory RateCache below is for converting single amounts in Python.
+
+Load the rates file with:
+  python -m finance.currency [path/to/rates.csv]
+"""
+
+import bisect
+import csv
+import os
+import threading
+from datetime import date
+from typing import Dict, List, Optional, Tuple
+
+from config import settings
+from database.db import get_exchange_rates, save_exchange_rates
+from utils import metrics
+
+_CACHE_LOOKUPS = metrics.counter("finance_rate_cache_lookups_total", "Exchange-rate cache lookups", ["result"])
+
+
+def normalize_currency(code: Optional[str]) -> Optional[str]:
+    """
+    Upper-case a 3-letter ISO 4217 code, or return None if it doesn't look like one.
+    """
+    if code is None:
+        return None
+    code = code.strip().upper()
+    if len(code) != 3 or not code.isalpha():
+        return None
+    return code
+
+
+def load_rates_from_file(path: Optional[str] = None) -> Tuple[bool, str]:
+    """
+    Load a `date,currency,rate` CSV (header optional) into the database and refresh the cache.
+    Returns (success, message).
+    """
+    path = path or settings.EXCHANGE_RATES_FILE
+    if not os.path.exists(path):
+        return False, f"Rates file not found: {path}"
+
+    rates = []
+    try:
+        with open(path, newline="", encoding="utf-8") as f:
+            for row in csv.reader(f):
+                if not row or row[0].startswith("#") or row[0].strip().lower() == "date":
+                    continue
+                day, code, rate = row[0].strip(), normalize_currency(row[1]), float(row[2])
+                date.fromisoformat(day)
+                if code is None or rate <= 0:
+                    raise ValueError(f"bad row: {row}")
+                rates.append((code, day, rate))
+    except Exception as e:
+        return False, f"Error reading rates: {e}"
+
+    save_exchange_rates(rates)
+    rate_cache.invalidate()
+    return True, f"Loaded {len(rates)} rates"
+
+
+class RateCache:
+    """
+    Date-indexed in-memory view of exchange_rates: per currency, parallel sorted
+    lists of dates and rates, looked up with bisect. Loaded lazily on first use.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._rates: Optional[Dict[str, Tuple[List[str], List[float]]]] = None
+
+    def invalidate(self) -> None:
+        with self._lock:
+            self._rates = None
+
+    def _load(self) -> Dict[str, Tuple[List[str], List[float]]]:
+        rates = self._rates
+        if rates is not None:
+            _CACHE_LOOKUPS.inc("hit")
+            return rates
+        with self._lock:
+            if self._rates is None:
+                _CACHE_LOOKUPS.inc("miss")
+                loaded: Dict[str, Tuple[List[str], List[float]]] = {}
+                for code, day, rate in get_exchange_rates():  # ordered by currency, date
+                    dates, values = loaded.setdefault(code, ([], []))
+                    dates.append(day)
+                    values.append(rate)
+                self._rates = loaded
+            return self._rates
+
+    def rate(self, currency: str, on_date: Optional[str] = None) -> Optional[float]:
+        """
+        Value of one unit of `currency` in the base currency on `on_date` (default: today).
+        Uses the latest rate on or before the date, or the earliest rate for older dates.
+        """
+        currency = currency.upper()
+        if currency == settings.DEFAULT_CURRENCY:
+            return 1.0
+        series = self._load().get(currency)
+        if not series:
+            return None
+        dates, values = series
+        i = bisect.bisect_right(dates, on_date or date.today().isoformat())
+        return values[i - 1] if i else values[0]
+
+    def convert(self, amount: float, from_currency: str, to_currency: str, on_date: Optional[str] = None) -> Optional[float]:
+        """
+        Convert an amount between currencies on a date. None if either rate is unknown.
+        """
+        if from_currency.upper() == to_currency.upper():
+            return amount
+        src = self.rate(from_currency, on_date)
+        dst = self.rate(to_currency, on_date)
+        if src is None or dst is None:
+            return None
+        return amount * src / dst
+
+
+rate_cache = RateCache()
+
+
+def convert(amount: float, from_currency: str, to_currency: Optional[str] = None, on_date: Optional[str] = None) -> Optional[float]:
+    return rate_cache.convert(amount, from_currency, to_currency or settings.DEFAULT_CURRENCY, on_date)
+
+
+if __name__ == "__main__":
+    import sys
+
+    from database.db import init_db
+    init_db()
+    ok, msg = load_rates_from_file(sys.argv[1] if len(sys.argv) > 1 else None)
+    print(msg)
+    sys.exit(0 if ok else 1)
@@ -3,108 +3,245 @@ Higher-level finance helpers that validate input and provide filtering/export ca
 They wrap the lower-level database functions (so UI stays simple).
 """
 
-from typing import List, Tuple, Optional
+from typing import Dict, List, Tuple, Optional
 from datetime import datetime, date
 import csv
 import os
 
-from database.db import add_transaction as db_add_transaction, get_transactions_by_user, get_balance, get_monthly_summary, update_transaction as db_update_transaction, delete_transaction as db_delete_transaction
-from database.models import Transaction as DBTransaction
+from database.db import add_transaction_with_id as db_add_transaction_with_id, add_transactions as db_add_transactions, get_transactions_by_user, search_transactions, get_balance, get_monthly_summary, update_transaction as db_update_transaction, delete_transaction as db_delete_transaction
+from database.db import preview_transactions, bulk_update_transactions as db_bulk_update_transactions, bulk_delete_transactions as db_bulk_delete_transactions
+from database.models import Transaction as DBTransaction, TransactionFilter
 from config import settings
 from .transaction import to_dict
+from .currency import normalize_currency
+from . import anomalies
+from . import categorize
 
 
-def add_transaction_validated(user_id: int, date_iso: str, amount: float, category: str, ttype: str, description: Optional[str] = None) -> Tuple[bool, str]:
+def _validation_error(user_id: int, date_iso: str, amount, category: str, ttype: str, currency: Optional[str]) -> Optional[str]:
     """
-    Validate transaction data (simple checks) then call DB insert.
+    Simple checks shared by inserts and updates; None when the input is valid.
     """
     # Validate user_id
     if user_id is None:
-        return False, "User not authenticated."
+        return "User not authenticated."
 
     # Validate date
     try:
         # Accept YYYY-MM-DD
         datetime.fromisoformat(date_iso)
     except Exception:
-        return False, "Invalid date format. Use YYYY-MM-DD."
+        return "Invalid date format. Use YYYY-MM-DD."
 
     # Validate amount
     try:
-        amount = float(amount)
-        if amount <= 0:
-            return False, "Amount must be greater than zero."
+        if float(amount) <= 0:
+            return "Amount must be greater than zero."
     except Exception:
-        return False, "Invalid amount."
+        return "Invalid amount."
 
     if ttype not in ("income", "expense"):
-        return False, "Type must be 'income' or 'expense'."
+        return "Type must be 'income' or 'expense'."
 
     if not category or not category.strip():
-        return False, "Category is required."
+        return "Category is required."
+
+    if currency is not None and normalize_currency(currency) is None:
+        return "Currency must be a 3-letter code."
+    return None
+
+
+def add_transaction_validated(user_id: int, date_iso: str, amount: float, category: str, ttype: str, description: Optional[str] = None, currency: Optional[str] = None) -> Tuple[bool, str]:
+    """
+    Validate transaction data (simple checks) then call DB insert.
+    """
+    ok, msg, _anomaly = add_transaction_checked(user_id, date_iso, amount, category, ttype, description, currency)
+    return ok, msg
+
+
+def add_transaction_checked(user_id: int, date_iso: str, amount: float, category: Optional[str], ttype: str, description: Optional[str] = None, currency: Optional[str] = None) -> Tuple[bool, str, Optional[Dict]]:
+    """
+    add_transaction_validated, plus the anomaly check of an expense (see finance.anomalies)
+    as a third value: {"anomaly": bool, "score": ..., "ratio": ...} or None.
+    Without a category, the user's categorization rules pick one (see finance.categorize).
+    """
+    auto = not category or not category.strip()
+    error = _validation_error(user_id, date_iso, amount, categorize.FALLBACK_CATEGORY if auto else category, ttype, currency)
+    if error:
+        return False, error, None
+    if auto:
+        category = categorize.categorize(user_id, [(description, float(amount), ttype)])[0]
+    category, currency = category.strip(), normalize_currency(currency)
+    checks = []
+    observe = None
+    if ttype == "expense" and settings.ANOMALY_DETECTION:
+        def observe(stats, tx_id):
+            checks.append(anomalies.observe(stats, user_id, tx_id, date_iso, float(amount), category, currency))
+    ok, msg, _tx_id = db_add_transaction_with_id(user_id, date_iso, float(amount), category, ttype, description, currency, then=observe)
+    return ok, msg, checks[0] if ok and checks else None
+
 
-    return db_add_transaction(user_id, date_iso, amount, category.strip(), ttype, description)
+def add_transactions_checked(user_id: int, items: List[Dict]) -> Tuple[bool, str, List[int], List[str], List[Optional[Dict]]]:
+    """
+    Validate and insert a batch of transactions (dicts with the add_transaction_checked
+    arguments) in one commit, all or nothing. Items without a category are categorized by
+    the user's rules in one pass. Returns (ok, message, ids, categories, anomaly checks),
+    the lists in item order.
+    """
+    if user_id is None:
+        return False, "User not authenticated.", [], [], []
+    if not items:
+        return False, "No transactions given.", [], [], []
+    if len(items) > settings.BATCH_MAX_TRANSACTIONS:
+        return False, f"At most {settings.BATCH_MAX_TRANSACTIONS} transactions per batch.", [], [], []
+    for i, item in enumerate(items):
+        category = item.get("category")
+        error = _validation_error(user_id, item.get("date_iso"), item.get("amount"), category if category and category.strip() else categorize.FALLBACK_CATEGORY,
+                                  item.get("ttype"), item.get("currency"))
+        if error:
+            return False, f"Transaction {i + 1}: {error}", [], [], []
+
+    auto = [i for i, item in enumerate(items) if not item.get("category") or not item["category"].strip()]
+    categories = [(item.get("category") or "").strip() for item in items]
+    if auto:
+        found = categorize.categorize(user_id, [(items[i].get("description"), float(items[i]["amount"]), items[i]["ttype"]) for i in auto])
+        for i, category in zip(auto, found):
+            categories[i] = category
+    rows = [
+        (item["date_iso"], float(item["amount"]), category, item["ttype"], item.get("description"), normalize_currency(item.get("currency")))
+        for item, category in zip(items, categories)
+    ]
+    checks: List[Optional[Dict]] = [None] * len(rows)
+    expenses = [i for i, row in enumerate(rows) if row[3] == "expense"]
+
+    def observe(stats, ids):
+        observed = anomalies.observe_batch(stats, user_id, [(ids[i], rows[i][0], rows[i][1], rows[i][2], rows[i][5]) for i in expenses])
+        for i, check in zip(expenses, observed):
+            checks[i] = check
+
+    ok, msg, ids = db_add_transactions(user_id, rows, then=observe if expenses and settings.ANOMALY_DETECTION else None)
+    if not ok:
+        return False, msg, [], [], []
+    return True, msg, ids, categories, checks
 
 
 def get_transactions_filtered(user_id: int, limit: int = 500, start_date: Optional[str] = None, end_date: Optional[str] = None, category: Optional[str] = None) -> List[DBTransaction]:
     """
     Get transactions by user and optionally filter by date range and category.
-    Dates must be ISO YYYY-MM-DD if provided.
+    Dates must be ISO YYYY-MM-DD if provided. Filters run in the query, so `limit`
+    counts matching transactions and old ranges are served from the archive.
     """
-    txs = get_transactions_by_user(user_id, limit=limit)
-    filtered = []
-    for t in txs:
-        ok = True
-        if start_date:
-            try:
-                ok &= (t.date >= start_date)
-            except Exception:
-                pass
-        if end_date:
-            try:
-                ok &= (t.date <= end_date)
-            except Exception:
-                pass
-        if category:
-            ok &= (t.category == category)
-        if ok:
-            filtered.append(t)
-    return filtered
+    return search_transactions(user_id, start_date=start_date, end_date=end_date, category=category, limit=limit)
+
+
+def update_transaction_validated(user_id: int, tx_id: int, date_iso: str, amount: float, category: str, ttype: str, description: Optional[str] = None, currency: Optional[str] = None) -> Tuple[bool, str]:
+    ok, msg, _anomaly = update_transaction_checked(user_id, tx_id, date_iso, amount, category, ttype, description, currency)
+    return ok, msg
+
 
+def update_transaction_checked(user_id: int, tx_id: int, date_iso: str, amount: float, category: str, ttype: str, description: Optional[str] = None, currency: Optional[str] = None) -> Tuple[bool, str, Optional[Dict]]:
+    """
+    update_transaction_validated, plus the anomaly check of the updated expense (see add_transaction_checked).
+    """
+    error = _validation_error(user_id, date_iso, amount, category, ttype, currency)
+    if error:
+        return False, error, None
+    category, currency = category.strip(), normalize_currency(currency)
+    checks = []
+
+    def replace(stats, old):
+        anomalies.forget(stats, old)
+        if ttype == "expense":
+            # A None currency keeps the stored one
+            checks.append(anomalies.observe(stats, user_id, tx_id, date_iso, float(amount), category, currency or old.currency))
+
+    ok, msg = db_update_transaction(tx_id, user_id, date_iso, float(amount), category, ttype, description, currency,
+                                    then=replace if settings.ANOMALY_DETECTION else None)
+    return ok, msg, checks[0] if ok and checks else None
 
-def update_transaction_validated(user_id: int, tx_id: int, date_iso: str, amount: float, category: str, ttype: str, description: Optional[str] = None) -> Tuple[bool, str]:
+
+def delete_transaction(user_id: int, tx_id: int) -> Tuple[bool, str]:
     if user_id is None:
         return False, "User not authenticated."
+    return db_delete_transaction(tx_id, user_id, then=anomalies.forget if settings.ANOMALY_DETECTION else None)
 
-    try:
-        datetime.fromisoformat(date_iso)
-    except Exception:
-        return False, "Invalid date format. Use YYYY-MM-DD."
 
-    try:
-        amount = float(amount)
-        if amount <= 0:
-            return False, "Amount must be greater than zero."
-    except Exception:
-        return False, "Invalid amount."
+# Columns a bulk update may set, and how many matching transactions a dry run returns
+BULK_FIELDS = ("category", "ttype", "description")
+BULK_PREVIEW_LIMIT = 20
 
-    if ttype not in ("income", "expense"):
-        return False, "Type must be 'income' or 'expense'."
 
-    if not category or not category.strip():
-        return False, "Category is required."
+def _filter_error(flt: TransactionFilter) -> Optional[str]:
+    if flt.is_empty():
+        return "Give at least one filter (start_date, end_date, category, ttype or description)."
+    for value in (flt.start_date, flt.end_date):
+        if value is not None:
+            try:
+                datetime.fromisoformat(value)
+            except Exception:
+                return "Invalid date format. Use YYYY-MM-DD."
+    if flt.ttype is not None and flt.ttype not in ("income", "expense"):
+        return "Type must be 'income' or 'expense'."
+    return None
 
-    return db_update_transaction(tx_id, user_id, date_iso, amount, category.strip(), ttype, description)
 
+def _bulk_stats(user_id: int, stats_changed: bool):
+    # Expense statistics are recomputed once from the history, in the bulk write, instead of row by row
+    if not stats_changed or not settings.ANOMALY_DETECTION:
+        return None
+    return lambda stats: anomalies.recompute(stats, user_id)
 
-def delete_transaction(user_id: int, tx_id: int) -> Tuple[bool, str]:
+
+def bulk_update_transactions(user_id: int, flt: TransactionFilter, changes: Dict[str, Optional[str]], dry_run: bool = False) -> Tuple[bool, str, int, List[DBTransaction]]:
+    """
+    Set `changes` (category, ttype and/or description) on every transaction of the user that
+    matches `flt`, in one statement. Returns (ok, message, count, preview): with dry_run nothing
+    changes, count is the number of matching transactions and preview the newest of them.
+    """
     if user_id is None:
-        return False, "User not authenticated."
-    return db_delete_transaction(tx_id, user_id)
+        return False, "User not authenticated.", 0, []
+    error = _filter_error(flt)
+    if error:
+        return False, error, 0, []
+    if not changes:
+        return False, "Nothing to change.", 0, []
+    unknown = set(changes) - set(BULK_FIELDS)
+    if unknown:
+        return False, f"Only {', '.join(BULK_FIELDS)} can be changed in bulk.", 0, []
+    changes = dict(changes)
+    if "category" in changes:
+        if not changes["category"] or not changes["category"].strip():
+            return False, "Category is required.", 0, []
+        changes["category"] = changes["category"].strip()
+    if "ttype" in changes and changes["ttype"] not in ("income", "expense"):
+        return False, "Type must be 'income' or 'expense'.", 0, []
+
+    if dry_run:
+        count, preview = preview_transactions(user_id, flt, BULK_PREVIEW_LIMIT)
+        return True, f"{count} transaction(s) match", count, preview
+    ok, msg, count = db_bulk_update_transactions(user_id, flt, changes, then=_bulk_stats(user_id, "category" in changes or "ttype" in changes))
+    return ok, msg, count, []
+
+
+def bulk_delete_transactions(user_id: int, flt: TransactionFilter, dry_run: bool = False) -> Tuple[bool, str, int, List[DBTransaction]]:
+    """
+    Delete every transaction of the user that matches `flt`, in one statement. Returns
+    (ok, message, count, preview) like bulk_update_transactions.
+    """
+    if user_id is None:
+        return False, "User not authenticated.", 0, []
+    error = _filter_error(flt)
+    if error:
+        return False, error, 0, []
+    if dry_run:
+        count, preview = preview_transactions(user_id, flt, BULK_PREVIEW_LIMIT)
+        return True, f"{count} transaction(s) match", count, preview
+    ok, msg, count = db_bulk_delete_transactions(user_id, flt, then=_bulk_stats(user_id, True))
+    return ok, msg, count, []
 
 
-def calculate_balance(user_id: int) -> float:
-    return get_balance(user_id)
+def calculate_balance(user_id: int, currency: Optional[str] = None) -> float:
+    return get_balance(user_id, normalize_currency(currency))
 
 
 def export_transactions_csv(user_id: int, filepath: Optional[str] = None, txs: Optional[List[DBTransaction]] = None) -> Tuple[bool, str]:
@@ -122,10 +259,10 @@ def export_transactions_csv(user_id: int, filepath: Optional[str] = None, txs: O
     try:
         with open(filepath, "w", newline="", encoding="utf-8") as csvfile:
             writer = csv.writer(csvfile)
-            writer.writerow(["id", "user_id", "date", "amount", "category", "type", "description"])
+            writer.writerow(["id", "user_id", "date", "amount", "currency", "category", "type", "description"])
             for t in txs:
                 writer.writerow([
-                    t.id, t.user_id, t.date, t.amount, t.category, t.ttype, t.description or ""
+                    t.id, t.user_id, t.date, t.amount, t.currency or settings.DEFAULT_CURRENCY, t.category, t.ttype, t.description or ""
                 ])
         return True, filepath
     except Exception as e:
@@ -0,0 +1,394 @@
+"""
+Background jobs for heavy exports and reports.
+
+A job is submitted with a kind and parameters, runs on a process pool and
+writes its result to a file; the API process only does bookkeeping, so heavy
+work never occupies a request worker. Each job is a JSON record in
+settings.JOBS_DIR (default data/jobs) next to its result file, so status
+survives restarts and is visible to every API worker process.
+
+  queued -> running -> succeeded | failed | cancelled
+                       succeeded -> expired (result deleted after JOB_RESULT_TTL_SECONDS)
+
+The worker process marks the job "running" when it picks it up. A failed
+attempt puts the job in "retrying" and queues it again after an exponential
+backoff, up to JOB_MAX_ATTEMPTS attempts. Jobs of an API process that died
+are queued again by the next one to start (see recover()); an interrupted run
+counts as an attempt.
+Cancelling a queued job removes it from the pool; a running job finishes
+but its result is discarded. Records are rewritten from several processes, so
+a cancel is also recorded in a marker file created atomically next to the
+record: once it exists the job reads as cancelled, whatever a worker writes.
+
+Workers are started with the "spawn" method: the API process runs scheduler and
+writer threads, which a forked child would inherit in an undefined state.
+"""
+
+import json
+import multiprocessing
+import os
+import threading
+import uuid
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from datetime import datetime, timedelta
+from typing import Callable, Dict, List, Optional
+
+from config import settings
+
+TERMINAL = ("succeeded", "failed", "cancelled", "expired")
+
+
+# ----------------- Job kinds (run in the worker processes) -----------------
+def _export_csv(user_id: int, params: Dict, result_path: str) -> Dict:
+    from .finance_service import export_transactions_csv
+
+    ok, msg = export_transactions_csv(user_id, filepath=result_path)
+    if not ok:
+        raise RuntimeError(msg)
+    return {"media_type": "text/csv", "filename": f"transactions_export_{user_id}.csv"}
+
+
+KINDS: Dict[str, Callable[[int, Dict, str], Dict]] = {
+    "export_csv": _export_csv,
+}
+
+# Settings a worker needs to open the same databases as the API process
+_INHERITED_SETTINGS = ("DATA_DIR", "DB_PATH", "SHARD_COUNT", "SHARD_DIR", "STORAGE_BACKEND", "DATABASE_URL", "JOBS_DIR")
+
+
+def _init_worker(overrides: Dict) -> None:
+    for name, value in overrides.items():
+        setattr(settings, name, value)
+
+
+def _execute(job_id: str, kind: str, user_id: int, params: Dict, result_path: str) -> Dict:
+    if not _mark_running(job_id):
+        return {}  # cancelled before it started; _finished discards it
+    return KINDS[kind](user_id, params, result_path)
+
+
+# ----------------- Records -----------------
+def _now() -> str:
+    return datetime.utcnow().strftime("%Y-%m-%d %H:%M:%S")
+
+
+def jobs_dir() -> str:
+    path = settings.JOBS_DIR or os.path.join(settings.DATA_DIR, "jobs")
+    os.makedirs(path, exist_ok=True)
+    return path
+
+
+def _record_path(job_id: str) -> str:
+    return os.path.join(jobs_dir(), f"{job_id}.json")
+
+
+def _result_path(job_id: str) -> str:
+    return os.path.join(jobs_dir(), f"{job_id}.result")
+
+
+def _cancel_path(job_id: str) -> str:
+    return os.path.join(jobs_dir(), f"{job_id}.cancel")
+
+
+def _save(job: Dict) -> None:
+    path = _record_path(job["id"])
+    tmp = path + ".tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(job, f)
+    os.replace(tmp, path)
+
+
+def _load(job_id: str) -> Optional[Dict]:
+    if not job_id.isalnum():  # ids are uuid hex; never let one name a path
+        return None
+    try:
+        with open(_record_path(job_id), "r", encoding="utf-8") as f:
+            job = json.load(f)
+    except (FileNotFoundError, ValueError):
+        return None
+    if job["status"] != "cancelled":
+        try:
+            with open(_cancel_path(job_id), "r", encoding="utf-8") as f:
+                job.update(status="cancelled", finished_at=f.read() or job["finished_at"])
+        except FileNotFoundError:
+            pass
+    return job
+
+
+def _remove_result(job_id: str) -> None:
+    try:
+        os.remove(_result_path(job_id))
+    except FileNotFoundError:
+        pass
+
+
+# ----------------- Runner -----------------
+_lock = threading.Lock()
+_pool: Optional[ProcessPoolExecutor] = None
+_futures: Dict[str, object] = {}
+
+
+def _get_pool() -> ProcessPoolExecutor:
+    global _pool
+    with _lock:
+        if _pool is None:
+            overrides = {name: getattr(settings, name) for name in _INHERITED_SETTINGS}
+            _pool = ProcessPoolExecutor(
+                max_workers=settings.JOB_WORKERS,
+                mp_context=multiprocessing.get_context("spawn"),
+                initializer=_init_worker,
+                initargs=(overrides,),
+            )
+        return _pool
+
+
+def _dispatch(job: Dict) -> None:
+    global _pool
+    job.update(status="queued", pid=os.getpid())
+    _save(job)
+    args = (_execute, job["id"], job["kind"], job["user_id"], job["params"], _result_path(job["id"]))
+    pool = _get_pool()
+    try:
+        future = pool.submit(*args)
+    except BrokenProcessPool:
+        # A worker died (killed, out of memory); replace the pool once
+        with _lock:
+            if _pool is pool:
+                _pool = None
+        pool.shutdown(wait=False)
+        future = _get_pool().submit(*args)
+    with _lock:
+        _futures[job["id"]] = future
+    future.add_done_callback(lambda f, job_id=job["id"]: _finished(job_id, f))
+
+
+def _finished(job_id: str, future) -> None:
+    with _lock:
+        _futures.pop(job_id, None)
+    job = _load(job_id)
+    if job is None or job["status"] in TERMINAL:  # cancelled while running
+        _remove_result(job_id)
+        return
+    if future.cancelled():
+        return
+    error = future.exception()
+    job["attempts"] += 1
+    if error is None:
+        finished = datetime.utcnow()
+        job.update(future.result())
+        job.update(
+            status="succeeded",
+            finished_at=finished.strftime("%Y-%m-%d %H:%M:%S"),
+            expires_at=(finished + timedelta(seconds=settings.JOB_RESULT_TTL_SECONDS)).strftime("%Y-%m-%d %H:%M:%S"),
+            error=None,
+        )
+        _save(job)
+        if os.path.exists(_cancel_path(job_id)):  # cancelled while this was being saved
+            _remove_result(job_id)
+        return
+    job["error"] = str(error) or error.__class__.__name__
+    _remove_result(job_id)
+    if job["attempts"] >= job["max_attempts"]:
+        job.update(status="failed", finished_at=_now())
+        _save(job)
+        return
+    job["status"] = "retrying"
+    _save(job)
+    timer = threading.Timer(2 ** (job["attempts"] - 1), _retry, args=(job_id,))
+    timer.daemon = True
+    timer.start()
+
+
+def _retry(job_id: str) -> None:
+    job = _load(job_id)
+    if job is None or job["status"] != "retrying":
+        return
+    try:
+        _dispatch(job)
+    except Exception as e:
+        job.update(status="failed", error=f"Could not requeue: {e}", finished_at=_now())
+        _save(job)
+
+
+def _mark_running(job_id: str) -> bool:
+    """
+    Called by the worker process as it starts the job. False if it was cancelled (or forgotten) meanwhile.
+    """
+    job = _load(job_id)
+    if job is None or job["status"] != "queued":
+        return False
+    job.update(status="running", started_at=job.get("started_at") or _now())
+    _save(job)
+    return not os.path.exists(_cancel_path(job_id))  # a cancel that came in between still wins
+
+
+# ----------------- Public API -----------------
+def submit(kind: str, user_id: int, params: Optional[Dict] = None) -> Dict:
+    """
+    Queue a job of `kind` for `user_id` and return its record. Raises ValueError for unknown kinds.
+    """
+    if kind not in KINDS:
+        raise ValueError(f"Unknown job kind: {kind!r}")
+    expire_results()
+    job = {
+        "id": uuid.uuid4().hex,
+        "kind": kind,
+        "user_id": user_id,
+        "params": params or {},
+        "status": "queued",
+        "attempts": 0,
+        "max_attempts": settings.JOB_MAX_ATTEMPTS,
+        "created_at": _now(),
+        "started_at": None,
+        "finished_at": None,
+        "expires_at": None,
+        "error": None,
+    }
+    _dispatch(job)
+    return job
+
+
+def get_job(job_id: str, user_id: int) -> Optional[Dict]:
+    """
+    The job record, or None if it doesn't exist or belongs to another user.
+    """
+    job = _load(job_id)
+    if job is None or job["user_id"] != user_id:
+        return None
+    if job["status"] == "succeeded" and job["expires_at"] and job["expires_at"] <= _now():
+        _expire(job)
+    return job
+
+
+def result_path(job: Dict) -> Optional[str]:
+    """
+    Path of a succeeded job's result file, None if it isn't available (yet or any more).
+    """
+    if job["status"] != "succeeded":
+        return None
+    path = _result_path(job["id"])
+    return path if os.path.exists(path) else None
+
+
+def cancel(job_id: str, user_id: int) -> Optional[Dict]:
+    """
+    Cancel a job that hasn't finished. Returns the updated record (None if not found).
+    """
+    job = get_job(job_id, user_id)
+    if job is None or job["status"] in TERMINAL:
+        return job
+    with _lock:
+        future = _futures.get(job_id)
+    if future is not None:
+        future.cancel()  # no-op once the job is running; its result is then discarded
+    job.update(status="cancelled", finished_at=_now())
+    try:
+        fd = os.open(_cancel_path(job_id), os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+    except FileExistsError:
+        pass
+    else:
+        os.write(fd, job["finished_at"].encode("utf-8"))
+        os.close(fd)
+    _save(job)
+    _remove_result(job_id)
+    return job
+
+
+def _expire(job: Dict) -> None:
+    _remove_result(job["id"])
+    job["status"] = "expired"
+    _save(job)
+
+
+def expire_results() -> int:
+    """
+    Delete results past their expiry and records finished more than a TTL ago. Returns the number of jobs touched.
+    """
+    now = _now()
+    forget_before = (datetime.utcnow() - timedelta(seconds=settings.JOB_RESULT_TTL_SECONDS)).strftime("%Y-%m-%d %H:%M:%S")
+    touched = 0
+    for name in os.listdir(jobs_dir()):
+        if not name.endswith(".json"):
+            continue
+        job = _load(name[:-5])
+        if job is None:
+            continue
+        if job["status"] == "succeeded" and job["expires_at"] and job["expires_at"] <= now:
+            _expire(job)
+            touched += 1
+        elif job["status"] in TERMINAL and (job["finished_at"] or job["created_at"]) <= forget_before:
+            _remove_result(job["id"])
+            os.remove(_record_path(job["id"]))
+            _remove_markers(job["id"])
+            touched += 1
+    return touched
+
+
+def _alive(pid: Optional[int]) -> bool:
+    if not pid:
+        return False
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+
+def _claim(job: Dict) -> bool:
+    # Every API worker runs recover() on startup: only the first takes over a given dead process's job
+    try:
+        fd = os.open(os.path.join(jobs_dir(), f"{job['id']}.{job.get('pid')}.claim"), os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+    except FileExistsError:
+        return False
+    os.close(fd)
+    return True
+
+
+def _remove_markers(job_id: str) -> None:
+    for name in os.listdir(jobs_dir()):
+        if name.startswith(job_id + ".") and name.endswith((".claim", ".cancel")):
+            os.remove(os.path.join(jobs_dir(), name))
+
+
+def recover() -> List[str]:
+    """
+    Queue again the jobs left unfinished by a server process that no longer runs. A run it
+    interrupted counts as an attempt: a job out of attempts is marked failed instead (so one
+    that keeps taking its server down stops there). Returns the ids of the jobs taken over.
+    """
+    interrupted = []
+    for name in os.listdir(jobs_dir()):
+        if not name.endswith(".json"):
+            continue
+        job = _load(name[:-5])
+        if job is None or job["status"] in TERMINAL or job["id"] in _futures:
+            continue
+        if job.get("pid") != os.getpid() and _alive(job.get("pid")):
+            continue
+        if not _claim(job):
+            continue
+        interrupted.append(job["id"])
+        _remove_result(job["id"])
+        if job["status"] == "running":
+            job["attempts"] += 1
+        if job["attempts"] >= job["max_attempts"]:
+            job.update(status="failed", error="Interrupted by a server restart", finished_at=_now())
+            _save(job)
+            continue
+        try:
+            _dispatch(job)
+        except Exception as e:
+            job.update(status="failed", error=f"Could not requeue: {e}", finished_at=_now())
+            _save(job)
+    return interrupted
+
+
+def shutdown(wait: bool = True) -> None:
+    global _pool
+    with _lock:
+        pool, _pool = _pool, None
+    if pool is not None:
+        pool.shutdown(wait=wait, cancel_futures=True)
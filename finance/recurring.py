@@ -0,0 +1,318 @@
+"""
+Recurring transactions (rent, salary, subscriptions).
+
+A rule describes a schedule; occurrences are generated lazily from it. The
+materializer turns due occurrences into real transactions in batched inserts,
+and balance projections walk future occurrences without storing them.
+
+Run one materialization pass from the command line with:
+  python -m finance.recurring [--as-of YYYY-MM-DD]
+"""
+
+import calendar
+import heapq
+import logging
+import threading
+from datetime import date, datetime, timedelta
+from itertools import islice
+from typing import Iterator, Optional, Tuple
+
+from config import settings
+from database.db import (
+    add_recurring_rule as db_add_recurring_rule,
+    get_recurring_rules,
+    get_due_recurring_rules,
+    materialize_recurring,
+    get_balance,
+    ledger_shards,
+)
+from database.models import RecurringRule, Transaction
+from .currency import normalize_currency, convert
+
+logger = logging.getLogger(__name__)
+
+FREQUENCIES = ("daily", "weekly", "monthly", "cron")
+
+
+# ----------------- Schedules -----------------
+def _add_months(d: date, months: int, day: int) -> date:
+    """
+    Move `d` by `months` and pin it to `day`, clamped to the month length (31 -> 28/29/30).
+    """
+    idx = d.year * 12 + (d.month - 1) + months
+    year, month = divmod(idx, 12)
+    month += 1
+    return date(year, month, min(day, calendar.monthrange(year, month)[1]))
+
+
+def _parse_cron_field(field: str, low: int, high: int) -> Optional[set]:
+    """
+    Parse one cron field ("*", "5", "1-5", "*/2", "1,15") into a set of values, or None for "*".
+    """
+    if field == "*":
+        return None
+    values = set()
+    for part in field.split(","):
+        step = 1
+        if "/" in part:
+            part, step_s = part.split("/", 1)
+            step = int(step_s)
+            if step <= 0:
+                raise ValueError("cron step must be positive")
+        if part == "*":
+            start, end = low, high
+        elif "-" in part:
+            a, b = part.split("-", 1)
+            start, end = int(a), int(b)
+        else:
+            start = end = int(part)
+        if start < low or end > high or start > end:
+            raise ValueError(f"cron value out of range {low}-{high}: {part}")
+        values.update(range(start, end + 1, step))
+    return values
+
+
+def parse_cron(expr: str) -> Tuple[Optional[set], Optional[set], Optional[set]]:
+    """
+    Parse a day-granular cron expression into (days of month, months, days of week).
+    Accepts "dom mon dow" or a standard 5-field expression (minute and hour are ignored).
+    Days of week use cron numbering: 0 or 7 = Sunday.
+    """
+    fields = expr.split()
+    if len(fields) == 5:
+        fields = fields[2:]
+    if len(fields) != 3:
+        raise ValueError("cron expression must have 3 (dom mon dow) or 5 fields")
+    dom = _parse_cron_field(fields[0], 1, 31)
+    mon = _parse_cron_field(fields[1], 1, 12)
+    dow = _parse_cron_field(fields[2], 0, 7)
+    if dow is not None and 7 in dow:
+        dow = (dow - {7}) | {0}
+    return dom, mon, dow
+
+
+def _cron_matches(d: date, dom, mon, dow) -> bool:
+    if mon is not None and d.month not in mon:
+        return False
+    cron_dow = (d.weekday() + 1) % 7
+    # Like cron: when both day fields are restricted, either one may match
+    if dom is not None and dow is not None:
+        return d.day in dom or cron_dow in dow
+    if dom is not None:
+        return d.day in dom
+    if dow is not None:
+        return cron_dow in dow
+    return True
+
+
+def iter_occurrences(rule: RecurringRule, start: str, end: str) -> Iterator[date]:
+    """
+    Lazily yield the rule's occurrence dates within [start, end] (ISO dates, inclusive),
+    respecting the rule's own start and end dates.
+    """
+    first = date.fromisoformat(rule.start_date)
+    lo = max(first, date.fromisoformat(start))
+    hi = date.fromisoformat(end)
+    if rule.end_date:
+        hi = min(hi, date.fromisoformat(rule.end_date))
+    if lo > hi:
+        return
+
+    interval = max(int(rule.interval or 1), 1)
+    if rule.frequency in ("daily", "weekly"):
+        step = interval * (7 if rule.frequency == "weekly" else 1)
+        # Jump straight to the first occurrence >= lo instead of walking from the start date
+        k = -(-(lo - first).days // step)
+        d = first + timedelta(days=k * step)
+        while d <= hi:
+            yield d
+            d += timedelta(days=step)
+    elif rule.frequency == "monthly":
+        months = (lo.year - first.year) * 12 + (lo.month - first.month)
+        k = max(months // interval, 0)
+        d = _add_months(first, k * interval, first.day)
+        while d <= hi:
+            if d >= lo:
+                yield d
+            k += 1
+            d = _add_months(first, k * interval, first.day)
+    elif rule.frequency == "cron":
+        dom, mon, dow = parse_cron(rule.cron or "")
+        d = lo
+        while d <= hi:
+            if _cron_matches(d, dom, mon, dow):
+                yield d
+            d += timedelta(days=1)
+    else:
+        raise ValueError(f"Unknown frequency: {rule.frequency}")
+
+
+def next_occurrence(rule: RecurringRule, after: str) -> Optional[str]:
+    """
+    First occurrence strictly after the given ISO date, or None when the rule is exhausted.
+    """
+    start = (date.fromisoformat(after) + timedelta(days=1)).isoformat()
+    # Cron rules may have long gaps (e.g. "29 2 *"); look ahead a few years at most
+    horizon = rule.end_date or (date.fromisoformat(start) + timedelta(days=366 * 8)).isoformat()
+    for d in iter_occurrences(rule, start, horizon):
+        return d.isoformat()
+    return None
+
+
+# ----------------- Rules -----------------
+def add_recurring_rule_validated(user_id: int, amount: float, category: str, ttype: str, frequency: str, start_date: str, interval: int = 1, cron: Optional[str] = None, end_date: Optional[str] = None, description: Optional[str] = None, currency: Optional[str] = None) -> Tuple[bool, str]:
+    """
+    Validate a recurring rule then store it. The first occurrence on/after start_date becomes next_due.
+    """
+    if user_id is None:
+        return False, "User not authenticated."
+
+    try:
+        date.fromisoformat(start_date)
+        if end_date:
+            date.fromisoformat(end_date)
+    except Exception:
+        return False, "Invalid date format. Use YYYY-MM-DD."
+
+    try:
+        amount = float(amount)
+        if amount <= 0:
+            return False, "Amount must be greater than zero."
+    except Exception:
+        return False, "Invalid amount."
+
+    if ttype not in ("income", "expense"):
+        return False, "Type must be 'income' or 'expense'."
+
+    if not category or not category.strip():
+        return False, "Category is required."
+
+    if currency is not None and normalize_currency(currency) is None:
+        return False, "Currency must be a 3-letter code."
+
+    if frequency not in FREQUENCIES:
+        return False, f"Frequency must be one of: {', '.join(FREQUENCIES)}."
+
+    try:
+        interval = int(interval or 1)
+        if interval < 1:
+            return False, "Interval must be at least 1."
+    except Exception:
+        return False, "Invalid interval."
+
+    if frequency == "cron":
+        try:
+            parse_cron(cron or "")
+        except Exception as e:
+            return False, f"Invalid cron expression: {e}"
+
+    currency = normalize_currency(currency)
+    rule = RecurringRule(None, user_id, amount, category.strip(), ttype, description, frequency, interval, cron, start_date, end_date, None, currency)
+    first = next_occurrence(rule, (date.fromisoformat(start_date) - timedelta(days=1)).isoformat())
+    if first is None:
+        return False, "Rule has no occurrences."
+
+    return db_add_recurring_rule(user_id, amount, category.strip(), ttype, description, frequency, interval, cron, start_date, end_date, first, currency)
+
+
+# ----------------- Materialization -----------------
+def materialize_due(as_of: Optional[str] = None, batch_size: Optional[int] = None, max_per_rule: Optional[int] = None) -> int:
+    """
+    Turn every occurrence due on or before `as_of` (default: today) into a transaction.
+
+    Rules are processed in pages of `batch_size`, each page in one batched insert
+    and one commit, so a run over thousands of users stays bounded. A rule that
+    was down for a long time catches up at most `max_per_rule` occurrences per
+    run; the rest is picked up by the next run. Running twice is safe: inserts
+    are deduplicated on (rule, date) and next_due only moves forward.
+    Returns the number of transactions created.
+    """
+    as_of = as_of or date.today().isoformat()
+    batch_size = batch_size or settings.RECURRING_BATCH_SIZE
+    max_per_rule = max_per_rule or settings.RECURRING_MAX_PER_RULE
+
+    created = 0
+    for shard in ledger_shards():
+        last_id = 0
+        while True:
+            rules = get_due_recurring_rules(as_of, after_id=last_id, limit=batch_size, shard=shard)
+            if not rules:
+                break
+            occurrences = []
+            advances = []
+            for rule in rules:
+                dates = list(islice(iter_occurrences(rule, rule.next_due, as_of), max_per_rule))
+                for d in dates:
+                    occurrences.append((rule.user_id, d.isoformat(), rule.amount, rule.category, rule.ttype, rule.description, rule.currency or settings.DEFAULT_CURRENCY, rule.id))
+                last = dates[-1].isoformat() if dates else as_of
+                advances.append((next_occurrence(rule, last), rule.id, rule.next_due))
+            created += materialize_recurring(occurrences, advances, shard=shard)
+            last_id = rules[-1].id
+    return created
+
+
+def start_scheduler(interval_seconds: Optional[int] = None) -> Optional[threading.Thread]:
+    """
+    Run materialize_due periodically in a daemon thread. Returns None when disabled.
+    """
+    interval_seconds = settings.RECURRING_INTERVAL_SECONDS if interval_seconds is None else interval_seconds
+    if interval_seconds <= 0:
+        return None
+    stop = threading.Event()
+
+    def _loop():
+        while not stop.is_set():
+            try:
+                materialize_due()
+            except Exception:
+                logger.exception("Recurring materialization failed")
+            stop.wait(interval_seconds)
+
+    thread = threading.Thread(target=_loop, name="recurring-scheduler", daemon=True)
+    thread.stop_event = stop
+    thread.start()
+    return thread
+
+
+# ----------------- Projections -----------------
+def iter_upcoming(user_id: int, until: str, since: Optional[str] = None) -> Iterator[Transaction]:
+    """
+    Lazily yield the user's not-yet-materialized occurrences up to `until`, merged in date order.
+    Yielded transactions have id None; nothing is written to the database.
+    """
+    def _rule_stream(rule: RecurringRule):
+        start = max(rule.next_due, since) if since else rule.next_due
+        for d in iter_occurrences(rule, start, until):
+            yield Transaction(None, user_id, d.isoformat(), rule.amount, rule.category, rule.ttype, rule.description, rule.currency)
+
+    streams = [_rule_stream(r) for r in get_recurring_rules(user_id) if r.next_due]
+    return heapq.merge(*streams, key=lambda t: t.date)
+
+
+def project_balance(user_id: int, until: str, currency: Optional[str] = None) -> float:
+    """
+    Current balance plus every recurring occurrence still to come up to `until`, in `currency`.
+    Occurrences in other currencies are converted at the latest known rate.
+    """
+    currency = normalize_currency(currency) or settings.DEFAULT_CURRENCY
+    balance = get_balance(user_id, currency)
+    for t in iter_upcoming(user_id, until):
+        amount = convert(t.amount, t.currency or settings.DEFAULT_CURRENCY, currency)
+        if amount is None:
+            continue
+        balance += amount if t.ttype == "income" else -amount
+    return balance
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Materialize due recurring transactions")
+    parser.add_argument("--as-of", default=None, help="ISO date (default: today)")
+    args = parser.parse_args()
+
+    from database.db import init_db
+    init_db()
+    started = datetime.now()
+    n = materialize_due(args.as_of)
+    print(f"Created {n} transactions in {(datetime.now() - started).total_seconds():.2f}s")
@@ -0,0 +1,60 @@
+"""
+Delta sync for transaction lists.
+
+Clients keep the watermark returned by each call and pass it back as `since`;
+they then receive only what changed (see database.db.get_transaction_changes).
+The change log is compacted by a background thread (start_compactor), which
+keeps one entry per live transaction and drops old tombstones.
+"""
+
+import logging
+import threading
+from typing import Dict, Optional
+
+from config import settings
+from database.db import get_transaction_changes, compact_transaction_changes
+
+logger = logging.getLogger(__name__)
+
+MAX_PAGE = 5000
+
+
+def changes_since(user_id: int, since: int = 0, limit: int = 1000) -> Dict:
+    """
+    One page of changes for `user_id` after `since` (limit clamped to 1..MAX_PAGE).
+    """
+    return get_transaction_changes(user_id, max(int(since), 0), min(max(int(limit), 1), MAX_PAGE))
+
+
+def start_compactor(interval_seconds: Optional[int] = None) -> Optional[threading.Thread]:
+    """
+    Run compact_transaction_changes periodically in a daemon thread. Returns None when disabled.
+    """
+    interval_seconds = settings.CHANGE_LOG_COMPACT_INTERVAL_SECONDS if interval_seconds is None else interval_seconds
+    if interval_seconds <= 0:
+        return None
+    stop = threading.Event()
+
+    def _loop():
+        while not stop.wait(interval_seconds):
+            try:
+                compact_transaction_changes()
+            except Exception:
+                logger.exception("Change log compaction failed")
+
+    thread = threading.Thread(target=_loop, name="change-log-compactor", daemon=True)
+    thread.stop_event = stop
+    thread.start()
+    return thread
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Compact the transaction change log")
+    parser.add_argument("--retention-days", type=int, default=None, help="tombstone retention (default: settings)")
+    args = parser.parse_args()
+
+    from database.db import init_db
+    init_db()
+    print(f"Removed {compact_transaction_changes(args.retention_days)} change-log entries")
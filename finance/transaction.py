@@ -16,6 +16,7 @@ def to_dict(tx: DBTransaction) -> Dict:
         "user_id": tx.user_id,
         "date": tx.date,
         "amount": tx.amount,
+        "currency": tx.currency,
         "category": tx.category,
         "type": tx.ttype,
         "description": tx.description
@@ -1,114 +1,27 @@
 import streamlit as st
-import requests
 from datetime import datetime, timedelta
 
-from visualization.charts import (
-    plot_monthly_summary,
-    pie_expense_by_category,
-    plot_income_vs_expense_bars,
-    plot_category_income_expense,
-    plot_cumulative_balance
-)
+from client import ApiError, ClientError, FinanceClient
 
 # API base URL
 BASE_URL = "http://localhost:8001"
 
-# API helper functions
-def api_login(username, password):
-    try:
-        response = requests.post(f"{BASE_URL}/auth/login", json={"username": username, "password": password})
-        if response.status_code == 200:
-            data = response.json()
-            return data.get("success", False), data.get("user")
-        return False, None
-    except:
-        return False, None
-
-def api_register(username, password):
-    try:
-        response = requests.post(f"{BASE_URL}/auth/register", json={"username": username, "password": password})
-        if response.status_code == 200:
-            data = response.json()
-            return data.get("success", False), data.get("message", "Error")
-        return False, "API error"
-    except:
-        return False, "Connection error"
-
-def api_get_categories(ttype):
-    try:
-        response = requests.get(f"{BASE_URL}/categories", params={"ttype": ttype})
-        if response.status_code == 200:
-            data = response.json()
-            return data.get("categories", [])
-        return []
-    except:
-        return []
-
-def api_add_transaction(user_id, date_iso, amount, category, ttype, description=None):
-    try:
-        response = requests.post(f"{BASE_URL}/transactions", params={"user_id": user_id}, json={
-            "date_iso": date_iso,
-            "amount": amount,
-            "category": category,
-            "ttype": ttype,
-            "description": description
-        })
-        if response.status_code == 200:
-            data = response.json()
-            return data.get("success", False), data.get("message", "Error")
-        return False, "API error"
-    except:
-        return False, "Connection error"
-
-def api_get_transactions(user_id):
-    try:
-        response = requests.get(f"{BASE_URL}/transactions", params={"user_id": user_id})
-        if response.status_code == 200:
-            data = response.json()
-            if data.get("success"):
-                # Convert to objects similar to DBTransaction
-                transactions = []
-                for t in data.get("transactions", []):
-                    # Create a simple dict or object
-                    transactions.append(type('Transaction', (), t)())
-                return transactions
-        return []
-    except:
-        return []
-
-def api_get_balance(user_id):
-    try:
-        response = requests.get(f"{BASE_URL}/balance", params={"user_id": user_id})
-        if response.status_code == 200:
-            data = response.json()
-            if data.get("success"):
-                return data.get("balance", 0)
-        return 0
-    except:
-        return 0
-
-def api_get_monthly_summary(user_id):
-    try:
-        response = requests.get(f"{BASE_URL}/monthly-summary", params={"user_id": user_id})
-        if response.status_code == 200:
-            data = response.json()
-            if data.get("success"):
-                return data.get("summary", {})
-        return {}
-    except:
-        return {}
 
+@st.cache_resource
+def get_client() -> FinanceClient:
+    # One pooled client per Streamlit server, shared by every session and rerun
+    return FinanceClient(BASE_URL)
 
-def api_export_csv(user_id):
+
+def _fetch(call, *args, default=None):
+    """
+    Result of a read call, or `default` after showing why it failed.
+    """
     try:
-        response = requests.get(f"{BASE_URL}/export-csv", params={"user_id": user_id})
-        if response.status_code == 200:
-            data = response.json()
-            if data.get("success"):
-                return True, data.get("csv"), data.get("filename")
-        return False, "API error", None
-    except:
-        return False, "Connection error", None
+        return call(*args)
+    except ClientError as e:
+        st.error(f"Could not load data: {e}")
+        return default
 
 
 st.set_page_config(page_title="Personal Finance Tracker", layout="wide", initial_sidebar_state="expanded")
@@ -137,13 +50,16 @@ if st.session_state.user is None:
         password = st.text_input("Password", type="password")
 
         if st.button("Login"):
-            success, user = api_login(username, password)
-            if success and user:
+            try:
+                user = get_client().login(username, password)
+            except ApiError:
+                st.error("Login failed. Check credentials.")
+            except ClientError as e:
+                st.error(f"Login failed: {e}")
+            else:
                 st.session_state.user = user
                 st.success(f"Logged in as {user['username']}")
                 st.rerun()
-            else:
-                st.error("Login failed. Check credentials.")
 
     with tab2:
         st.subheader("Register")
@@ -151,11 +67,12 @@ if st.session_state.user is None:
         new_password = st.text_input("New password", type="password")
 
         if st.button("Register"):
-            success, message = api_register(new_username, new_password)
-            if success:
-                st.success(message)
-            else:
-                st.error(message)
+            try:
+                st.success(get_client().register(new_username, new_password))
+            except ApiError as e:
+                st.error(e.detail)
+            except ClientError as e:
+                st.error(f"Registration failed: {e}")
 
     st.stop()
 
@@ -170,8 +87,10 @@ if st.sidebar.button("Logout"):
 # ========== DASHBOARD SECTION ==========
 st.header("📈 Dashboard")
 
-transactions = api_get_transactions(st.session_state.user["id"]) if st.session_state.user else []
-balance = api_get_balance(st.session_state.user["id"]) if st.session_state.user else 0
+api = get_client()
+user_id = st.session_state.user["id"]
+transactions = _fetch(api.transactions, user_id, default=[])
+balance = _fetch(api.balance, user_id, default=0.0)
 
 # Calculate metrics
 total_income = sum(t.amount for t in transactions if t.ttype == "income")
@@ -200,31 +119,33 @@ st.header("➕ Add Transaction")
 with st.form("transaction_form"):
     amount = st.number_input("Amount", min_value=0.01, step=0.01)
     ttype = st.selectbox("Type", ["income", "expense"])
-    category = st.selectbox("Category", api_get_categories(ttype))
+    category = st.selectbox("Category", _fetch(api.categories, ttype, default=[]))
     date = st.date_input("Date")
     description = st.text_input("Description")
 
     submitted = st.form_submit_button("Add")
 
     if submitted:
-        success, message = api_add_transaction(
-            user_id=st.session_state.user["id"],
-            date_iso=str(date),
-            amount=amount,
-            category=category,
-            ttype=ttype,
-            description=description
-        )
-
-        if success:
-            st.success(message)
+        try:
+            result = api.add_transaction(
+                user_id=user_id,
+                date_iso=str(date),
+                amount=amount,
+                category=category,
+                ttype=ttype,
+                description=description
+            )
+        except ApiError as e:
+            st.error(e.detail)
+        except ClientError as e:
+            st.error(f"Could not save the transaction: {e}")
         else:
-            st.error(message)
+            st.success(result.message)
 
 
 st.header("📄 Transactions")
 
-transactions = api_get_transactions(st.session_state.user["id"]) if st.session_state.user else []
+transactions = _fetch(api.transactions, user_id, default=[])
 
 if transactions:
     st.dataframe([
@@ -239,12 +160,11 @@ if transactions:
     ])
 
     if st.button("Export to CSV"):
-        ok, csv_content, filename = api_export_csv(st.session_state.user["id"])
-        if ok:
+        exported = _fetch(api.export_csv, user_id)
+        if exported:
+            csv_content, filename = exported
             st.download_button("Download CSV", csv_content, filename, "text/csv")
             st.success(f"Exported to {filename}")
-        else:
-            st.error(csv_content)
 else:
     st.info("No transactions yet")
 
@@ -252,7 +172,16 @@ else:
 st.header("📊 Analytics")
 
 if transactions:
-    summary = api_get_monthly_summary(st.session_state.user["id"])
+    # matplotlib is only loaded once there is something to chart
+    from visualization.charts import (
+        plot_monthly_summary,
+        pie_expense_by_category,
+        plot_income_vs_expense_bars,
+        plot_category_income_expense,
+        plot_cumulative_balance
+    )
+
+    summary = _fetch(api.monthly_summary, user_id, default=[])
     
     # Create tabs for different views
     tab1, tab2, tab3, tab4, tab5 = st.tabs([
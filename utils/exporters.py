@@ -1,4 +1,3 @@
-import pandas as pd
 from pathlib import Path
 
 
@@ -6,6 +5,8 @@ def export_to_csv(transactions, filename: str) -> str:
     """
     Exports a list of transaction objects to CSV.
     """
+    import pandas as pd  # heavy; only needed here
+
     data = [
         {
             "date": t.date,
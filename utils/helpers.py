@@ -1,16 +1,33 @@
 from datetime import datetime
-from dateutil.parser import parse
 
 
 def parse_date(date_str: str) -> str:
     """
     Parses any valid date string and returns ISO format (YYYY-MM-DD)
     """
+    from dateutil.parser import parse  # imported on first use: dateutil is slow to load
+
     return parse(date_str).date().isoformat()
 
 
-def format_currency(amount: float, currency: str) -> str:
-    return f"{currency} {amount:.2f}"
+_CURRENCY_SYMBOLS = {"USD": "$", "EUR": "€", "GBP": "£", "JPY": "¥", "INR": "₹"}
+_ZERO_DECIMAL_CURRENCIES = {"JPY", "KRW"}
+
+
+def format_currency(amount: float, currency: str = None) -> str:
+    """
+    Format an amount with its currency symbol and thousands separators, e.g. "$1,234.50" or "CHF 12.00".
+    """
+    from config import settings
+
+    currency = (currency or settings.DEFAULT_CURRENCY).upper()
+    decimals = 0 if currency in _ZERO_DECIMAL_CURRENCIES else 2
+    sign = "-" if amount < 0 else ""
+    number = f"{abs(amount):,.{decimals}f}"
+    symbol = _CURRENCY_SYMBOLS.get(currency)
+    if symbol:
+        return f"{sign}{symbol}{number}"
+    return f"{sign}{currency} {number}"
 
 
 def safe_str(value) -> str:
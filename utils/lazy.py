@@ -0,0 +1,25 @@
+"""
+Lazy package exports.
+
+A package __init__ that re-exports names from its submodules would import all
+of them (and their heavy dependencies) as soon as any submodule is imported.
+lazy_exports() builds a module-level __getattr__ (PEP 562) that imports the
+submodule on first access to one of its names instead.
+"""
+
+import importlib
+from typing import Callable, Dict
+
+
+def lazy_exports(package: str, exports: Dict[str, str]) -> Callable[[str], object]:
+    """
+    exports: exported name -> module it lives in (relative names are resolved against `package`).
+    """
+    def __getattr__(name: str):
+        module = exports.get(name)
+        if module is None:
+            raise AttributeError(f"module {package!r} has no attribute {name!r}")
+        value = getattr(importlib.import_module(module, package), name)
+        setattr(importlib.import_module(package), name, value)  # later lookups skip __getattr__
+        return value
+    return __getattr__
@@ -1,4 +1,11 @@
 # visualization package initializer
-from .charts import plot_monthly_summary, pie_expense_by_category
+# matplotlib is only imported when a chart function is first used.
+from utils.lazy import lazy_exports
 
-__all__ = ["plot_monthly_summary", "pie_expense_by_category"]
+_EXPORTS = {
+    "plot_monthly_summary": ".charts",
+    "pie_expense_by_category": ".charts",
+}
+__getattr__ = lazy_exports(__name__, _EXPORTS)
+
+__all__ = list(_EXPORTS)